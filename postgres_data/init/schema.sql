@@ -115,12 +115,20 @@ CREATE TABLE IF NOT EXISTS wb_indicator_country_year_value (
 	country_iso3code TEXT NOT NULL REFERENCES thi_miniproject.country_general_info(country_iso3code),
 	year INTEGER NOT NULL REFERENCES thi_miniproject.year(year),
 	value NUMERIC,
+	last_modified TIMESTAMPTZ NOT NULL DEFAULT NOW(), -- change data capture: set on insert and on every actual change of the value
+	load_batch_id BIGINT, -- load_batch which wrote the current value
+	change_xid XID8 NOT NULL DEFAULT pg_current_xact_id(), -- transaction which wrote the current value (the watermark of incremental refreshes)
 	PRIMARY KEY (indicator_id, country_iso3code, year)
 );
 
--- indexes for faster queries
-CREATE INDEX IF NOT EXISTS idx_wb_indicator_id ON wb_indicator_country_year_value (indicator_id);
-CREATE INDEX IF NOT EXISTS idx_wb_year ON wb_indicator_country_year_value (year);
+-- indexes for faster queries (benchmarked with postgres_data/workload.sql, see src/benchmarks/bench_indexes.py)
+-- - the primary key serves the indicator-first queries (one indicator, some countries / years), so no separate indicator_id index
+-- - country pages / comparisons: country-first covering index, INCLUDE (value) allows index-only scans
+-- - year ranges over all indicators: BRIN instead of a B-tree (a few pages instead of one entry per row)
+CREATE INDEX IF NOT EXISTS idx_wb_country_indicator_year ON wb_indicator_country_year_value (country_iso3code, indicator_id, year) INCLUDE (value);
+CREATE INDEX IF NOT EXISTS idx_wb_year_brin ON wb_indicator_country_year_value USING BRIN (year);
+DROP INDEX IF EXISTS idx_wb_indicator_id;
+DROP INDEX IF EXISTS idx_wb_year;
 
 ----------------------------------------------------------
 -- Tables for data from web scraping
@@ -130,6 +138,8 @@ CREATE TABLE IF NOT EXISTS thi_miniproject.staging_cpi_raw(
 	country_name TEXT NOT NULL,
 	year INTEGER NOT NULL,
 	cpi_score NUMERIC(5, 2) CHECK (cpi_score BETWEEN 0 AND 100),
+	source_name TEXT, -- the web source (web_source_state) which staged the row, NULL for manual loads
+	source_priority INTEGER NOT NULL DEFAULT 0, -- a source only overwrites rows of sources with the same or a lower priority
 	CONSTRAINT country_year_unique_check_cpi UNIQUE (country_name, year)
 );
 
@@ -138,6 +148,9 @@ CREATE TABLE IF NOT EXISTS thi_miniproject.corruption_perception_index(
 	country_iso3code TEXT REFERENCES thi_miniproject.country_general_info(country_iso3code),
 	year INTEGER NOT NULL REFERENCES thi_miniproject.year(year),
 	cpi_score NUMERIC(5, 2) CHECK (cpi_score BETWEEN 0 AND 100),
+	last_modified TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+	load_batch_id BIGINT,
+	change_xid XID8 NOT NULL DEFAULT pg_current_xact_id(),
 	PRIMARY KEY(country_iso3code, year)
 );
 
@@ -146,6 +159,8 @@ CREATE TABLE IF NOT EXISTS thi_miniproject.staging_world_happiness_report(
 	country_name TEXT NOT NULL,	
 	year INTEGER NOT NULL,
 	happiness_score NUMERIC,
+	source_name TEXT, -- the web source which staged the row, e.g. 'whr' or a backfill 'whr:<path>'
+	source_priority INTEGER NOT NULL DEFAULT 0, -- the current workbook (0) wins over the backfills (< 0)
 	CONSTRAINT country_year_unique_check_h UNIQUE (country_name, year)
 );
 
@@ -154,9 +169,34 @@ CREATE TABLE IF NOT EXISTS thi_miniproject.world_happiness_report(
 	country_iso3code TEXT REFERENCES thi_miniproject.country_general_info(country_iso3code),
 	year INTEGER NOT NULL REFERENCES thi_miniproject.year(year),
 	happiness_score NUMERIC,
+	last_modified TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+	load_batch_id BIGINT,
+	change_xid XID8 NOT NULL DEFAULT pg_current_xact_id(),
 	PRIMARY KEY(country_iso3code, year)
 );
 
+----------------------------------------------------------
+-- Load batches (change data capture)
+----------------------------------------------------------
+-- one row per load run of api_logger / web_logger (DBPostgres.begin_load_batch / finish_load_batch)
+CREATE TABLE IF NOT EXISTS thi_miniproject.load_batch (
+	batch_id BIGSERIAL PRIMARY KEY,
+	source TEXT NOT NULL, -- e.g. 'api_logger', 'web:cpi'
+	status TEXT NOT NULL DEFAULT 'running', -- running / finished / failed
+	row_count BIGINT,
+	started_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+	finished_at TIMESTAMPTZ
+);
+
+-- the batch id the loader set for its session (NULL for manual edits)
+CREATE OR REPLACE FUNCTION thi_miniproject.current_load_batch_id()
+RETURNS BIGINT
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT NULLIF(current_setting('thi_miniproject.load_batch_id', true), '')::BIGINT;
+$$;
+
 ----------------------------------------------------------
 -- Trigger functions
 ----------------------------------------------------------
@@ -194,12 +234,17 @@ BEGIN
     END IF;
 
     -- 4) upsert into final CPI table (idempotent)
+    -- (last_modified / load_batch_id only move when the score actually changed, see change data capture below)
     INSERT INTO thi_miniproject.corruption_perception_index
-           (country_iso3code, year, cpi_score)
-    VALUES (c_iso3, NEW.year, NEW.cpi_score)
+           (country_iso3code, year, cpi_score, load_batch_id)
+    VALUES (c_iso3, NEW.year, NEW.cpi_score, thi_miniproject.current_load_batch_id())
     ON CONFLICT (country_iso3code, year)
     DO UPDATE SET
-        cpi_score = EXCLUDED.cpi_score;
+        cpi_score = EXCLUDED.cpi_score,
+        last_modified = NOW(),
+        change_xid = pg_current_xact_id(),
+        load_batch_id = EXCLUDED.load_batch_id
+    WHERE corruption_perception_index.cpi_score IS DISTINCT FROM EXCLUDED.cpi_score;
 
     RETURN NEW; -- keep the staging row as audit trail
 END;
@@ -239,38 +284,94 @@ BEGIN
     END IF;
 
     -- 4) upsert into final CPI table (idempotent)
+    -- (last_modified / load_batch_id only move when the score actually changed, see change data capture below)
     INSERT INTO thi_miniproject.world_happiness_report
-           (country_iso3code, year, happiness_score)
-    VALUES (c_iso3, NEW.year, NEW.happiness_score)
+           (country_iso3code, year, happiness_score, load_batch_id)
+    VALUES (c_iso3, NEW.year, NEW.happiness_score, thi_miniproject.current_load_batch_id())
     ON CONFLICT (country_iso3code, year)
     DO UPDATE SET
-        happiness_score = EXCLUDED.happiness_score;
+        happiness_score = EXCLUDED.happiness_score,
+        last_modified = NOW(),
+        change_xid = pg_current_xact_id(),
+        load_batch_id = EXCLUDED.load_batch_id
+    WHERE world_happiness_report.happiness_score IS DISTINCT FROM EXCLUDED.happiness_score;
 
     RETURN NEW; -- keep the staging row as audit trail
 END;
 $$;
 
+-- staging delete trigger (cpi + world happiness report, the final table is the trigger argument)
+-- a country which a source dropped from a year leaves the final table as well
+CREATE OR REPLACE FUNCTION thi_miniproject.staging_delete_from_final()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    c_iso3 TEXT;
+BEGIN
+    SELECT ca.country_iso3code
+      INTO c_iso3
+      FROM thi_miniproject.country_alias AS ca
+     WHERE unaccent(lower(ca.country_name_alias))
+           = unaccent(lower(OLD.country_name))
+     LIMIT 1;
+
+    IF c_iso3 IS NULL THEN
+        SELECT cgi.country_iso3code
+          INTO c_iso3
+          FROM thi_miniproject.country_general_info AS cgi
+         WHERE unaccent(lower(cgi.country_name))
+               = unaccent(lower(OLD.country_name))
+         LIMIT 1;
+    END IF;
+
+    IF c_iso3 IS NOT NULL THEN
+        EXECUTE format('DELETE FROM thi_miniproject.%I WHERE country_iso3code = $1 AND year = $2', TG_ARGV[0])
+          USING c_iso3, OLD.year;
+    END IF;
+
+    RETURN OLD;
+END;
+$$;
+
 ----------------------------------------------------------
 -- Triggers
 ----------------------------------------------------------
 -- cpi
+-- (insert or update: a source re-staging a changed score updates its staging row, see WebDB.add_scores_to_staging)
 DROP TRIGGER IF EXISTS trg_staging_cpi_to_final
     ON thi_miniproject.staging_cpi_raw;
 
 CREATE TRIGGER trg_staging_cpi_to_final
-AFTER INSERT ON thi_miniproject.staging_cpi_raw
+AFTER INSERT OR UPDATE ON thi_miniproject.staging_cpi_raw
 FOR EACH ROW
 EXECUTE FUNCTION thi_miniproject.staging_cpi_to_final();
 
+DROP TRIGGER IF EXISTS trg_staging_cpi_deleted
+    ON thi_miniproject.staging_cpi_raw;
+
+CREATE TRIGGER trg_staging_cpi_deleted
+AFTER DELETE ON thi_miniproject.staging_cpi_raw
+FOR EACH ROW
+EXECUTE FUNCTION thi_miniproject.staging_delete_from_final('corruption_perception_index');
+
 -- world happiness report
 DROP TRIGGER IF EXISTS trg_staging_world_happiness_to_final
     ON thi_miniproject.staging_world_happiness_report;
 
 CREATE TRIGGER trg_staging_world_happiness_to_final
-AFTER INSERT ON thi_miniproject.staging_world_happiness_report
+AFTER INSERT OR UPDATE ON thi_miniproject.staging_world_happiness_report
 FOR EACH ROW
 EXECUTE FUNCTION thi_miniproject.staging_world_happiness_report_to_final();
 
+DROP TRIGGER IF EXISTS trg_staging_world_happiness_deleted
+    ON thi_miniproject.staging_world_happiness_report;
+
+CREATE TRIGGER trg_staging_world_happiness_deleted
+AFTER DELETE ON thi_miniproject.staging_world_happiness_report
+FOR EACH ROW
+EXECUTE FUNCTION thi_miniproject.staging_delete_from_final('world_happiness_report');
+
 ----------------------------------------------------------
 -- Views
 ----------------------------------------------------------
@@ -303,3 +404,273 @@ FROM thi_miniproject.corruption_perception_index AS cpi
 JOIN thi_miniproject.country_general_info AS cgi
 	USING (country_iso3code)
 ORDER BY cpi.country_iso3code, cpi.year DESC;  
+
+----------------------------------------------------------
+-- Analytics (results of src/analytics.py)
+----------------------------------------------------------
+-- per indicator and country trend / growth metrics
+CREATE TABLE IF NOT EXISTS thi_miniproject.wb_indicator_country_trend (
+	indicator_id TEXT NOT NULL REFERENCES thi_miniproject.wb_indicators(indicator_id),
+	country_iso3code TEXT NOT NULL REFERENCES thi_miniproject.country_general_info(country_iso3code),
+	n_obs INTEGER NOT NULL,
+	first_year INTEGER,
+	last_year INTEGER,
+	latest_value NUMERIC,
+	trend_slope NUMERIC, -- OLS slope of value over year (units per year)
+	cagr NUMERIC, -- compound annual growth rate between first and last observation (only for positive values)
+	yoy_change NUMERIC, -- change between the last year and the year before
+	yoy_pct_change NUMERIC,
+	zscore NUMERIC, -- latest value vs. all countries of the same indicator in the same year
+	rolling_mean NUMERIC, -- mean over the last rolling_window years up to last_year
+	rolling_window INTEGER NOT NULL,
+	computed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+	PRIMARY KEY (indicator_id, country_iso3code)
+);
+
+-- change watermark per indicator (see change_watermark()) read before its last computation: the indicator is recomputed once one of its
+-- fact rows / tombstones has a change_xid >= it (to only recompute changed indicators)
+CREATE TABLE IF NOT EXISTS thi_miniproject.wb_indicator_analytics_state (
+	indicator_id TEXT PRIMARY KEY REFERENCES thi_miniproject.wb_indicators(indicator_id),
+	change_watermark XID8 NOT NULL,
+	computed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+----------------------------------------------------------
+-- Indicator coverage statistics
+----------------------------------------------------------
+-- maintained incrementally by ApiDB from the batches it writes (no rescans of the fact table)
+CREATE TABLE IF NOT EXISTS thi_miniproject.wb_indicator_coverage_stats (
+	indicator_id TEXT PRIMARY KEY REFERENCES thi_miniproject.wb_indicators(indicator_id),
+	row_count BIGINT NOT NULL,
+	country_count INTEGER NOT NULL,
+	min_year INTEGER,
+	max_year INTEGER,
+	null_ratio NUMERIC, -- share of empty cells (missing or NULL) in the country x year range covered by the indicator
+	country_iso3codes TEXT[] NOT NULL DEFAULT '{}',
+	last_loaded TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- full rebuild from the fact table (only needed after manual edits / partial loads): CALL thi_miniproject.rebuild_indicator_coverage_stats();
+-- or of some indicators only (e.g. those resumed by the retry pass): CALL thi_miniproject.rebuild_indicator_coverage_stats(ARRAY['SP.POP.TOTL']);
+CREATE OR REPLACE PROCEDURE thi_miniproject.rebuild_indicator_coverage_stats(only_indicator_ids TEXT[] DEFAULT NULL)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO thi_miniproject.wb_indicator_coverage_stats
+           (indicator_id, row_count, country_count, min_year, max_year, null_ratio, country_iso3codes, last_loaded)
+    SELECT v.indicator_id,
+           COUNT(*),
+           COUNT(DISTINCT v.country_iso3code),
+           MIN(v.year),
+           MAX(v.year),
+           1 - COUNT(v.value)::NUMERIC / (COUNT(DISTINCT v.country_iso3code) * (MAX(v.year) - MIN(v.year) + 1)),
+           ARRAY_AGG(DISTINCT v.country_iso3code ORDER BY v.country_iso3code),
+           NOW()
+      FROM thi_miniproject.wb_indicator_country_year_value AS v
+     WHERE only_indicator_ids IS NULL OR v.indicator_id = ANY(only_indicator_ids)
+     GROUP BY v.indicator_id
+    ON CONFLICT (indicator_id)
+    DO UPDATE SET
+        row_count = EXCLUDED.row_count,
+        country_count = EXCLUDED.country_count,
+        min_year = EXCLUDED.min_year,
+        max_year = EXCLUDED.max_year,
+        null_ratio = EXCLUDED.null_ratio,
+        country_iso3codes = EXCLUDED.country_iso3codes,
+        last_loaded = EXCLUDED.last_loaded;
+
+    -- indicators without any fact rows left
+    DELETE FROM thi_miniproject.wb_indicator_coverage_stats AS s
+     WHERE (only_indicator_ids IS NULL OR s.indicator_id = ANY(only_indicator_ids))
+       AND NOT EXISTS (SELECT 1 FROM thi_miniproject.wb_indicator_country_year_value AS v
+                        WHERE v.indicator_id = s.indicator_id);
+END;
+$$;
+
+----------------------------------------------------------
+-- Dead letters of the fact fetching
+----------------------------------------------------------
+-- indicators whose fetch failed (after a few quick attempts), with the first page which wasn't loaded: the retry pass of
+-- api_logger resumes there with fewer workers and more patience, a successful load removes the row
+CREATE TABLE IF NOT EXISTS thi_miniproject.wb_fetch_dead_letter (
+	indicator_id TEXT PRIMARY KEY REFERENCES thi_miniproject.wb_indicators(indicator_id),
+	error_class TEXT NOT NULL, -- e.g. 'WBRequestError', 'ConnectTimeout'
+	error_message TEXT,
+	http_status INTEGER,
+	failed_page INTEGER NOT NULL DEFAULT 1, -- pages before it are loaded
+	attempts INTEGER NOT NULL, -- requests made for the failed page, summed over all failed passes
+	failed_passes INTEGER NOT NULL DEFAULT 1,
+	first_failed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+	last_failed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+----------------------------------------------------------
+-- Dimension state (change detection of the dimension stages of src/api_logger.py)
+----------------------------------------------------------
+-- hash of the rows last written per dimension (countries, country_aliases, topics, sources, indicators): a dimension whose fresh
+-- rows (from the API or the dimension snapshot under /data/dimensions) hash the same isn't upserted again
+CREATE TABLE IF NOT EXISTS thi_miniproject.wb_dimension_state (
+	dimension TEXT PRIMARY KEY,
+	content_hash TEXT NOT NULL, -- sha256 of the sorted rows
+	row_count INTEGER NOT NULL, -- rows written, the table must still hold at least as many
+	updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+----------------------------------------------------------
+-- Scraped source state (change detection of src/web_logger.py)
+----------------------------------------------------------
+-- HTTP validators and content hashes of the last download, so that unchanged pages / workbooks are skipped
+CREATE TABLE IF NOT EXISTS thi_miniproject.web_source_state (
+	source_name TEXT PRIMARY KEY,
+	source_url TEXT NOT NULL,
+	etag TEXT,
+	last_modified TEXT,
+	content_hash TEXT, -- sha256 of the raw downloaded bytes
+	part_hashes JSONB NOT NULL DEFAULT '{}'::JSONB, -- sha256 per year of the parsed rows, to only re-emit the changed years
+	checked_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+	changed_at TIMESTAMPTZ
+);
+
+----------------------------------------------------------
+-- Change data capture
+----------------------------------------------------------
+-- inserts / updates are tracked by the change_xid (+ last_modified, load_batch_id) columns, deletions are kept here as tombstones
+-- watermarks are transaction ids, not timestamps: last_modified = NOW() is the start of the writing transaction, so a transaction
+-- which commits late (concurrent stages, web sources, async writers) can carry an older timestamp than rows a consumer already read
+CREATE TABLE IF NOT EXISTS thi_miniproject.row_deletion_log (
+	deletion_id BIGSERIAL PRIMARY KEY,
+	table_name TEXT NOT NULL,
+	old_row JSONB NOT NULL, -- the deleted row (without the change data capture columns)
+	load_batch_id BIGINT,
+	deleted_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+	change_xid XID8 NOT NULL DEFAULT pg_current_xact_id()
+);
+
+DROP INDEX IF EXISTS thi_miniproject.idx_row_deletion_log_table_deleted_at;
+CREATE INDEX IF NOT EXISTS idx_row_deletion_log_table_change_xid ON thi_miniproject.row_deletion_log (table_name, change_xid);
+
+-- 'since watermark' queries (and the MAX() of v_change_watermarks) only read the changed rows
+DROP INDEX IF EXISTS thi_miniproject.idx_wb_last_modified;
+DROP INDEX IF EXISTS thi_miniproject.idx_cpi_last_modified;
+DROP INDEX IF EXISTS thi_miniproject.idx_whr_last_modified;
+CREATE INDEX IF NOT EXISTS idx_wb_change_xid ON wb_indicator_country_year_value (change_xid);
+CREATE INDEX IF NOT EXISTS idx_cpi_change_xid ON thi_miniproject.corruption_perception_index (change_xid);
+CREATE INDEX IF NOT EXISTS idx_whr_change_xid ON thi_miniproject.world_happiness_report (change_xid);
+
+-- one statement-level trigger per delete statement (transition table), not one per row
+CREATE OR REPLACE FUNCTION thi_miniproject.log_deleted_rows()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO thi_miniproject.row_deletion_log (table_name, old_row, load_batch_id)
+    SELECT TG_TABLE_NAME, to_jsonb(d) - 'last_modified' - 'load_batch_id' - 'change_xid', thi_miniproject.current_load_batch_id()
+      FROM deleted_rows AS d;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_wb_value_deleted ON wb_indicator_country_year_value;
+CREATE TRIGGER trg_wb_value_deleted
+AFTER DELETE ON wb_indicator_country_year_value
+REFERENCING OLD TABLE AS deleted_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION thi_miniproject.log_deleted_rows();
+
+DROP TRIGGER IF EXISTS trg_cpi_deleted ON thi_miniproject.corruption_perception_index;
+CREATE TRIGGER trg_cpi_deleted
+AFTER DELETE ON thi_miniproject.corruption_perception_index
+REFERENCING OLD TABLE AS deleted_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION thi_miniproject.log_deleted_rows();
+
+DROP TRIGGER IF EXISTS trg_whr_deleted ON thi_miniproject.world_happiness_report;
+CREATE TRIGGER trg_whr_deleted
+AFTER DELETE ON thi_miniproject.world_happiness_report
+REFERENCING OLD TABLE AS deleted_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION thi_miniproject.log_deleted_rows();
+
+-- the watermark of an incremental refresh: every transaction with a lower id has committed or aborted, so no row with a lower
+-- change_xid can show up later
+-- how a consumer advances it (see DBPostgres.get_changes_since):
+--   1) read the new watermark first: SELECT thi_miniproject.change_watermark();
+--   2) then the rows changed since the previous one: SELECT * FROM thi_miniproject.wb_values_changed_since('<previous watermark>');
+--   3) store the watermark of 1) for the next refresh (start with '0')
+-- rows of transactions still running in 1) are returned again next time (at least once, the rows carry their keys --> upsert them)
+CREATE OR REPLACE FUNCTION thi_miniproject.change_watermark()
+RETURNS XID8
+LANGUAGE sql
+VOLATILE
+AS $$
+    SELECT pg_snapshot_xmin(pg_current_snapshot());
+$$;
+
+-- rows changed (inserted / updated / deleted) by transactions from the watermark on, e.g. SELECT * FROM thi_miniproject.wb_values_changed_since('0');
+DROP FUNCTION IF EXISTS thi_miniproject.wb_values_changed_since(TIMESTAMPTZ);
+DROP FUNCTION IF EXISTS thi_miniproject.cpi_changed_since(TIMESTAMPTZ);
+DROP FUNCTION IF EXISTS thi_miniproject.whr_changed_since(TIMESTAMPTZ);
+
+CREATE OR REPLACE FUNCTION thi_miniproject.wb_values_changed_since(watermark XID8)
+RETURNS TABLE (indicator_id TEXT, country_iso3code TEXT, year INTEGER, value NUMERIC, is_deleted BOOLEAN, last_modified TIMESTAMPTZ, load_batch_id BIGINT, change_xid XID8)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT v.indicator_id, v.country_iso3code, v.year, v.value, FALSE, v.last_modified, v.load_batch_id, v.change_xid
+      FROM thi_miniproject.wb_indicator_country_year_value AS v
+     WHERE v.change_xid >= watermark
+    UNION ALL
+    SELECT d.old_row ->> 'indicator_id', d.old_row ->> 'country_iso3code', (d.old_row ->> 'year')::INTEGER, NULL, TRUE, d.deleted_at, d.load_batch_id, d.change_xid
+      FROM thi_miniproject.row_deletion_log AS d
+     WHERE d.table_name = 'wb_indicator_country_year_value' AND d.change_xid >= watermark;
+$$;
+
+CREATE OR REPLACE FUNCTION thi_miniproject.cpi_changed_since(watermark XID8)
+RETURNS TABLE (country_iso3code TEXT, year INTEGER, cpi_score NUMERIC, is_deleted BOOLEAN, last_modified TIMESTAMPTZ, load_batch_id BIGINT, change_xid XID8)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT c.country_iso3code, c.year, c.cpi_score, FALSE, c.last_modified, c.load_batch_id, c.change_xid
+      FROM thi_miniproject.corruption_perception_index AS c
+     WHERE c.change_xid >= watermark
+    UNION ALL
+    SELECT d.old_row ->> 'country_iso3code', (d.old_row ->> 'year')::INTEGER, NULL, TRUE, d.deleted_at, d.load_batch_id, d.change_xid
+      FROM thi_miniproject.row_deletion_log AS d
+     WHERE d.table_name = 'corruption_perception_index' AND d.change_xid >= watermark;
+$$;
+
+CREATE OR REPLACE FUNCTION thi_miniproject.whr_changed_since(watermark XID8)
+RETURNS TABLE (country_iso3code TEXT, year INTEGER, happiness_score NUMERIC, is_deleted BOOLEAN, last_modified TIMESTAMPTZ, load_batch_id BIGINT, change_xid XID8)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT w.country_iso3code, w.year, w.happiness_score, FALSE, w.last_modified, w.load_batch_id, w.change_xid
+      FROM thi_miniproject.world_happiness_report AS w
+     WHERE w.change_xid >= watermark
+    UNION ALL
+    SELECT d.old_row ->> 'country_iso3code', (d.old_row ->> 'year')::INTEGER, NULL, TRUE, d.deleted_at, d.load_batch_id, d.change_xid
+      FROM thi_miniproject.row_deletion_log AS d
+     WHERE d.table_name = 'world_happiness_report' AND d.change_xid >= watermark;
+$$;
+
+-- latest change per table, so that a consumer can check cheaply whether a refresh is needed at all: it is, if last_change_xid >= its stored
+-- watermark (last_modified is informational only, it is no safe watermark)
+DROP VIEW IF EXISTS thi_miniproject.v_change_watermarks;
+CREATE VIEW thi_miniproject.v_change_watermarks AS
+SELECT 'wb_indicator_country_year_value' AS table_name,
+       GREATEST((SELECT MAX(change_xid) FROM thi_miniproject.wb_indicator_country_year_value),
+                (SELECT MAX(change_xid) FROM thi_miniproject.row_deletion_log WHERE table_name = 'wb_indicator_country_year_value')) AS last_change_xid,
+       GREATEST((SELECT MAX(last_modified) FROM thi_miniproject.wb_indicator_country_year_value),
+                (SELECT MAX(deleted_at) FROM thi_miniproject.row_deletion_log WHERE table_name = 'wb_indicator_country_year_value')) AS last_modified
+UNION ALL
+SELECT 'corruption_perception_index',
+       GREATEST((SELECT MAX(change_xid) FROM thi_miniproject.corruption_perception_index),
+                (SELECT MAX(change_xid) FROM thi_miniproject.row_deletion_log WHERE table_name = 'corruption_perception_index')),
+       GREATEST((SELECT MAX(last_modified) FROM thi_miniproject.corruption_perception_index),
+                (SELECT MAX(deleted_at) FROM thi_miniproject.row_deletion_log WHERE table_name = 'corruption_perception_index'))
+UNION ALL
+SELECT 'world_happiness_report',
+       GREATEST((SELECT MAX(change_xid) FROM thi_miniproject.world_happiness_report),
+                (SELECT MAX(change_xid) FROM thi_miniproject.row_deletion_log WHERE table_name = 'world_happiness_report')),
+       GREATEST((SELECT MAX(last_modified) FROM thi_miniproject.world_happiness_report),
+                (SELECT MAX(deleted_at) FROM thi_miniproject.row_deletion_log WHERE table_name = 'world_happiness_report'));
@@ -59,13 +59,12 @@ GROUP BY s.source_id, s.source_name
 SELECT * FROM wb_indicators
 WHERE indicator_name ILIKE '%gdp%';
 
--- 5/. total row count for each indicator in the selected indicators list
-SELECT i.indicator_id, i.indicator_name, COUNT(*) AS total_row_count
-FROM wb_indicator_country_year_value AS fact
+-- 5/. total row count for each indicator in the selected indicators list (read from the coverage statistics instead of counting the fact table)
+SELECT i.indicator_id, i.indicator_name, s.row_count AS total_row_count, s.country_count, s.min_year, s.max_year, s.null_ratio, s.last_loaded
+FROM wb_indicator_coverage_stats AS s
 JOIN wb_indicators AS i
-	ON i.indicator_id = fact.indicator_id
-WHERE fact.indicator_id IN ('SP.POP.TOTL', 'NY.GDP.PCAP.CD', 'NY.GDP.MKTP.KD.ZG')
-GROUP BY i.indicator_id;
+	ON i.indicator_id = s.indicator_id
+WHERE s.indicator_id IN ('SP.POP.TOTL', 'NY.GDP.PCAP.CD', 'NY.GDP.MKTP.KD.ZG');
 
 -- 6/. indicators ranked according to total_topics_count
 SELECT it.indicator_id,
@@ -77,16 +76,15 @@ JOIN thi_miniproject.wb_indicators i
 GROUP BY it.indicator_id, i.indicator_name
 ORDER BY topic_count DESC, it.indicator_id;
 
--- 7/. rank indicators by total data coverage
+-- 7/. rank indicators by total data coverage (from the coverage statistics; to recount from the fact table: CALL rebuild_indicator_coverage_stats();)
 SELECT
     i.indicator_id,
     i.indicator_name,
-    COUNT(v.*) AS total_rows,
-    RANK() OVER (ORDER BY COUNT(v.*) DESC) AS indicator_rank
+    s.row_count AS total_rows,
+    RANK() OVER (ORDER BY s.row_count DESC) AS indicator_rank
 FROM thi_miniproject.wb_indicators AS i
-JOIN thi_miniproject.wb_indicator_country_year_value AS v
-    ON i.indicator_id = v.indicator_id
-GROUP BY i.indicator_id, i.indicator_name
+JOIN thi_miniproject.wb_indicator_coverage_stats AS s
+    ON i.indicator_id = s.indicator_id
 ORDER BY indicator_rank;
 
 -- 8/. indicators grouped by specific topics
@@ -104,6 +102,22 @@ JOIN thi_miniproject.wb_indicators AS i
 WHERE t.topic_id IN (3, 4, 6, 7, 8, 10, 11, 14, 15, 17, 18, 19)
 ORDER BY it.topic_id, i.indicator_name;
 
+-- 9/. fastest growing countries for one indicator (results of src/analytics.py)
+SELECT t.country_iso3code, c.country_name, t.first_year, t.last_year, t.cagr, t.trend_slope, t.zscore
+FROM thi_miniproject.wb_indicator_country_trend AS t
+JOIN thi_miniproject.country_general_info AS c
+	ON c.country_iso3code = t.country_iso3code
+WHERE t.indicator_id = 'NY.GDP.PCAP.CD'
+ORDER BY t.cagr DESC NULLS LAST;
+
+-- 10/. incremental refresh (change data capture): watermarks, load runs and the rows changed since the last refresh
+-- (read the new watermark first, then the changes since the stored one - '0' = everything - and store the new watermark afterwards)
+SELECT * FROM thi_miniproject.v_change_watermarks;
+SELECT * FROM thi_miniproject.load_batch ORDER BY batch_id DESC LIMIT 10;
+SELECT thi_miniproject.change_watermark();
+SELECT * FROM thi_miniproject.wb_values_changed_since('0');
+SELECT * FROM thi_miniproject.cpi_changed_since('0');
+
 ------------------------------------------------------------------
 -- Data from web scraping (e.g. Corruption Perception Index & World Happiness Report)
 ------------------------------------------------------------------
@@ -0,0 +1,75 @@
+-- query workload of the fact table wb_indicator_country_year_value (access patterns of queries.sql, panel_builder.py and the Power BI report)
+-- - run by src/benchmarks/bench_indexes.py with EXPLAIN (ANALYZE, BUFFERS) before and after applying the curated index set
+-- - every query starts with a '-- name: <name>' line; %(...)s are parameters which the tool picks from the loaded data
+--   (the country / indicators with the most rows, the last years): to run a query by hand, replace them with values
+SET search_path TO thi_miniproject;
+
+-- name: country_profile
+-- country page: all indicators of one country over a year range
+SELECT indicator_id, year, value
+FROM wb_indicator_country_year_value
+WHERE country_iso3code = %(country)s
+	AND year BETWEEN %(start_year)s AND %(end_year)s;
+
+-- name: country_indicator_series
+-- line chart: one indicator of one country over the years
+SELECT year, value
+FROM wb_indicator_country_year_value
+WHERE country_iso3code = %(country)s
+	AND indicator_id = %(indicator)s
+ORDER BY year;
+
+-- name: country_comparison
+-- slicers: some countries x some indicators over a year range (the filter of panel_builder.py with countries)
+SELECT country_iso3code, year, indicator_id, value
+FROM wb_indicator_country_year_value
+WHERE indicator_id = ANY(%(indicators)s)
+	AND country_iso3code = ANY(%(countries)s)
+	AND year BETWEEN %(start_year)s AND %(end_year)s;
+
+-- name: indicator_cross_section
+-- map visual: one indicator for all countries in one year
+SELECT country_iso3code, value
+FROM wb_indicator_country_year_value
+WHERE indicator_id = %(indicator)s
+	AND year = %(end_year)s;
+
+-- name: indicator_panel
+-- panel_builder.py without a country filter: some indicators of all countries since a year
+SELECT country_iso3code, year, indicator_id, value
+FROM wb_indicator_country_year_value
+WHERE indicator_id = ANY(%(indicators)s)
+	AND year >= %(start_year)s;
+
+-- name: latest_value_per_country
+-- KPI cards: the latest non-empty value of one indicator per country
+SELECT DISTINCT ON (country_iso3code) country_iso3code, year, value
+FROM wb_indicator_country_year_value
+WHERE indicator_id = %(indicator)s
+	AND value IS NOT NULL
+ORDER BY country_iso3code, year DESC;
+
+-- name: region_average
+-- regional comparison (joins as in queries.sql): average of one indicator per region and year
+SELECT r.region_name, f.year, AVG(f.value) AS avg_value, COUNT(f.value) AS country_count
+FROM wb_indicator_country_year_value AS f
+JOIN country_general_info AS c
+	ON c.country_iso3code = f.country_iso3code
+JOIN region AS r
+	ON r.region_id = c.region_id
+WHERE f.indicator_id = %(indicator)s
+	AND f.year BETWEEN %(start_year)s AND %(end_year)s
+GROUP BY r.region_name, f.year
+ORDER BY r.region_name, f.year;
+
+-- name: year_range_summary
+-- year slicer over everything: number of values and average per indicator in a year range
+SELECT indicator_id, year, COUNT(value) AS value_count, AVG(value) AS avg_value
+FROM wb_indicator_country_year_value
+WHERE year BETWEEN %(start_year)s AND %(end_year)s
+GROUP BY indicator_id, year;
+
+-- name: powerbi_import
+-- Power BI import mode: the whole table (no index helps here, it shows the cost of a full scan)
+SELECT indicator_id, country_iso3code, year, value
+FROM wb_indicator_country_year_value;
@@ -0,0 +1,267 @@
+# imports
+import os # part of python standard library
+import time # part of python standard library
+import argparse # part of python standard library
+from save_data import DBPostgres, DatabaseError
+import psycopg
+from psycopg import sql
+import pandas as pd
+import numpy as np
+
+#######################################
+# Vectorised trend & growth metrics
+#######################################
+def build_series_matrix(df: pd.DataFrame):
+    """
+    this function pivots long fact rows into one (indicator, country) x year matrix without any python loop
+    - the year axis is the full consecutive range between the min and max year, so column i + 1 is always the year after column i
+    :param df: long df with columns ['indicator_id', 'country_iso3code', 'year', 'value']
+    :return: series_keys (df with indicator_id, country_iso3code per matrix row), years (1d int array), values (2d float array, NaN = no data)
+    """
+    if df.empty:
+        return pd.DataFrame(columns = ["indicator_id", "country_iso3code"]), np.array([], dtype = int), np.empty((0, 0))
+
+    series_codes, series_uniques = pd.MultiIndex.from_arrays([df["indicator_id"], df["country_iso3code"]]).factorize()
+    year_array = df["year"].to_numpy(dtype = np.int64)
+    first_year = int(year_array.min())
+    years = np.arange(first_year, int(year_array.max()) + 1)
+
+    values = np.full((len(series_uniques), len(years)), np.nan)
+    values[series_codes, year_array - first_year] = pd.to_numeric(df["value"], errors = "coerce").to_numpy(dtype = float)
+
+    series_keys = series_uniques.to_frame(index = False, name = ["indicator_id", "country_iso3code"])
+    return series_keys, years, values
+
+def _rolling_nanmean(values: np.ndarray, window: int):
+    """rolling mean over the year axis which ignores missing years (NaN if the window holds no data at all)"""
+    observed = ~np.isnan(values)
+    zero_padded = np.zeros((values.shape[0], 1))
+    cum_sum = np.concatenate([zero_padded, np.cumsum(np.where(observed, values, 0.0), axis = 1)], axis = 1)
+    cum_count = np.concatenate([zero_padded, np.cumsum(observed, axis = 1)], axis = 1)
+
+    end = np.arange(1, values.shape[1] + 1)
+    start = np.maximum(end - window, 0)
+    window_sum = cum_sum[:, end] - cum_sum[:, start]
+    window_count = cum_count[:, end] - cum_count[:, start]
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        return np.where(window_count > 0, window_sum / window_count, np.nan)
+
+def compute_trend_metrics(series_keys: pd.DataFrame, years: np.ndarray, values: np.ndarray, rolling_window: int = 5):
+    """
+    this function computes trend & growth metrics for every (indicator, country) series in one vectorised pass
+    :param series_keys, years, values: output of build_series_matrix()
+    :param rolling_window: number of years for the rolling mean
+    :return: df with one row per (indicator, country) - n_obs, first/last year, latest value, OLS trend slope, CAGR,
+             year-over-year change (absolute and %), cross-country z-score of the latest value and rolling mean up to the latest year
+    """
+    n_series = values.shape[0]
+    if n_series == 0:
+        return pd.DataFrame(columns = ["indicator_id", "country_iso3code", "n_obs", "first_year", "last_year", "latest_value",
+                                       "trend_slope", "cagr", "yoy_change", "yoy_pct_change", "zscore", "rolling_mean", "rolling_window"])
+
+    observed = ~np.isnan(values)
+    n_obs = observed.sum(axis = 1)
+    rows = np.arange(n_series)
+
+    # first / last observed year per series (argmax gives the first True)
+    first_idx = observed.argmax(axis = 1)
+    last_idx = values.shape[1] - 1 - observed[:, ::-1].argmax(axis = 1)
+    first_value = values[rows, first_idx]
+    latest_value = values[rows, last_idx]
+
+    # OLS slope of value over year with missing years masked out: (n*Sxy - Sx*Sy) / (n*Sxx - Sx^2)
+    x = (years - years[0]).astype(float) # shift years to keep the sums small and precise
+    x_masked = np.where(observed, x, 0.0)
+    y_masked = np.where(observed, values, 0.0)
+    sum_x = x_masked.sum(axis = 1)
+    sum_y = y_masked.sum(axis = 1)
+    sum_xy = (x_masked * y_masked).sum(axis = 1)
+    sum_xx = (x_masked * x_masked).sum(axis = 1)
+    denominator = n_obs * sum_xx - sum_x ** 2
+
+    with np.errstate(invalid = "ignore", divide = "ignore", over = "ignore"):
+        trend_slope = np.where((n_obs >= 2) & (denominator > 0), (n_obs * sum_xy - sum_x * sum_y) / denominator, np.nan)
+
+        # compound annual growth rate between the first and last observation (only defined for positive values)
+        span = (last_idx - first_idx).astype(float)
+        cagr_valid = (span > 0) & (first_value > 0) & (latest_value > 0)
+        cagr = np.where(cagr_valid, np.power(latest_value / first_value, 1.0 / np.where(span > 0, span, 1.0)) - 1.0, np.nan)
+
+        # year-over-year change of the latest year (needs the directly preceding year, columns are consecutive years)
+        previous_value = np.where(last_idx > 0, values[rows, np.maximum(last_idx - 1, 0)], np.nan)
+        yoy_change = latest_value - previous_value
+        yoy_pct_change = np.where(previous_value != 0, yoy_change / np.abs(previous_value) * 100, np.nan)
+
+        # z-score of the latest value vs. all countries with the same indicator in the same year
+        indicator_codes, _ = pd.factorize(series_keys["indicator_id"])
+        n_indicators = indicator_codes.max() + 1
+        group_count = np.zeros((n_indicators, values.shape[1]))
+        group_sum = np.zeros_like(group_count)
+        group_sum_sq = np.zeros_like(group_count)
+        np.add.at(group_count, indicator_codes, observed)
+        np.add.at(group_sum, indicator_codes, y_masked)
+        np.add.at(group_sum_sq, indicator_codes, y_masked * y_masked)
+        group_mean = group_sum / np.where(group_count > 0, group_count, 1)
+        group_var = group_sum_sq / np.where(group_count > 0, group_count, 1) - group_mean ** 2
+        group_std = np.sqrt(np.clip(group_var, 0, None))
+        latest_mean = group_mean[indicator_codes, last_idx]
+        latest_std = group_std[indicator_codes, last_idx]
+        zscore = np.where((group_count[indicator_codes, last_idx] >= 2) & (latest_std > 0), (latest_value - latest_mean) / latest_std, np.nan)
+
+    rolling_mean = _rolling_nanmean(values, rolling_window)[rows, last_idx]
+
+    result = series_keys.copy()
+    result["n_obs"] = n_obs
+    result["first_year"] = years[first_idx]
+    result["last_year"] = years[last_idx]
+    result["latest_value"] = latest_value
+    result["trend_slope"] = trend_slope
+    result["cagr"] = cagr
+    result["yoy_change"] = yoy_change
+    result["yoy_pct_change"] = yoy_pct_change
+    result["zscore"] = zscore
+    result["rolling_mean"] = rolling_mean
+    result["rolling_window"] = rolling_window
+
+    # series without a single observation carry no information
+    return result[n_obs > 0].reset_index(drop = True)
+
+#######################################
+# Read facts / persist results to db
+#######################################
+class AnalyticsDB(DBPostgres):
+    """child class of DBPostgres: reads the long fact table and writes the trend / growth results"""
+    result_columns = ["indicator_id", "country_iso3code", "n_obs", "first_year", "last_year", "latest_value", "trend_slope",
+                      "cagr", "yoy_change", "yoy_pct_change", "zscore", "rolling_mean", "rolling_window"]
+
+    def get_changed_indicators(self, full_refresh: bool = False, table_name: str = "wb_indicator_country_year_value"):
+        """
+        find the indicators whose facts changed since their last computation through the change data capture of the fact table
+        (change_xid of the rows + tombstones in row_deletion_log, see change_watermark() in schema.sql)
+        - incremental runs only read the rows changed since the oldest stored watermark (idx_wb_change_xid), no scan of the fact table
+        - the first run (no state yet) and full_refresh take every indicator of the fact table
+        :return: watermark to store with the results (read before any fact), list of indicator ids to (re)compute,
+                 list of indicator ids which no longer have any data
+        """
+        try:
+            # the watermark is read first: whatever commits after it is found again by the next run
+            self.cursor.execute("SELECT change_watermark()::TEXT;")
+            watermark = int(self.cursor.fetchone()[0])
+            self.connection.commit()
+
+            self.cursor.execute("SELECT MIN(change_watermark)::TEXT FROM wb_indicator_analytics_state;")
+            oldest_watermark = self.cursor.fetchone()[0]
+            if full_refresh or oldest_watermark is None:
+                self.cursor.execute(sql.SQL("SELECT DISTINCT indicator_id FROM {};").format(sql.Identifier(table_name)))
+                changed = sorted(row[0] for row in self.cursor.fetchall())
+                self.cursor.execute("SELECT indicator_id FROM wb_indicator_analytics_state WHERE NOT (indicator_id = ANY(%s));", (changed,))
+                removed = sorted(row[0] for row in self.cursor.fetchall())
+            else:
+                # an indicator changed if one of its rows / tombstones is from its own watermark on (or it has no state yet)
+                self.cursor.execute("""
+                                    SELECT DISTINCT c.indicator_id
+                                    FROM wb_values_changed_since(%s::TEXT::XID8) AS c
+                                    LEFT JOIN wb_indicator_analytics_state AS s ON s.indicator_id = c.indicator_id
+                                    WHERE s.indicator_id IS NULL OR c.change_xid >= s.change_watermark;
+                                    """, (oldest_watermark,))
+                candidates = [row[0] for row in self.cursor.fetchall()]
+                # changed indicators without a single fact row left were deleted (primary key lookups)
+                self.cursor.execute(sql.SQL("""
+                                            SELECT u.indicator_id
+                                            FROM unnest(%s::TEXT[]) AS u(indicator_id)
+                                            WHERE NOT EXISTS (SELECT 1 FROM {} AS v WHERE v.indicator_id = u.indicator_id);
+                                            """).format(sql.Identifier(table_name)), (candidates,))
+                removed = sorted(row[0] for row in self.cursor.fetchall())
+                changed = sorted(set(candidates) - set(removed))
+            self.connection.commit()
+        except (Exception, psycopg.DatabaseError) as e:
+            self.connection.rollback()
+            raise DatabaseError(f"Something went wrong with finding the changed indicators of '{table_name}'. Error type: {type(e).__name__}, error message: '{e}'.")
+        return watermark, changed, removed
+
+    def get_fact_rows(self, indicator_ids: list[str], table_name: str = "wb_indicator_country_year_value"):
+        """fetch the long fact rows of the given indicators (served by the primary key index)"""
+        query = sql.SQL("""
+                        SELECT indicator_id, country_iso3code, year, value::DOUBLE PRECISION
+                        FROM {}
+                        WHERE indicator_id = ANY(%s) AND value IS NOT NULL;
+                        """).format(sql.Identifier(table_name))
+        try:
+            self.cursor.execute(query, (indicator_ids,))
+            return pd.DataFrame(self.cursor.fetchall(), columns = ["indicator_id", "country_iso3code", "year", "value"])
+        except (Exception, psycopg.DatabaseError) as e:
+            self.connection.rollback()
+            raise DatabaseError(f"Something went wrong with fetching the fact rows for {len(indicator_ids)} indicators. Error type: {type(e).__name__}, error message: '{e}'.")
+
+    def replace_indicator_results(self, indicator_ids: list[str], results: pd.DataFrame, watermark: int,
+                                  table_name: str = "wb_indicator_country_trend"):
+        """replace the results and the stored watermarks of the given indicators in one transaction"""
+        results_db = results[self.result_columns].astype(object).where(results[self.result_columns].notna(), None)
+        result_rows = results_db.itertuples(index = False, name = None)
+        state_rows = [(indicator_id, str(watermark)) for indicator_id in indicator_ids]
+
+        try:
+            self._execute_write(sql.SQL("DELETE FROM {} WHERE indicator_id = ANY(%s);").format(sql.Identifier(table_name)), (indicator_ids,))
+            self.cursor.executemany("""
+                                    INSERT INTO wb_indicator_analytics_state (indicator_id, change_watermark, computed_at)
+                                    VALUES (%s, %s::TEXT::XID8, NOW())
+                                    ON CONFLICT (indicator_id)
+                                    DO UPDATE SET change_watermark = EXCLUDED.change_watermark,
+                                                  computed_at = EXCLUDED.computed_at;
+                                    """, state_rows)
+            self.invalidate_cache("wb_indicator_analytics_state")
+            self._copy_rows(table_name, self.result_columns, result_rows) # commits the delete, the state upsert and the copy together
+        except (Exception, psycopg.DatabaseError) as e:
+            self.connection.rollback()
+            raise DatabaseError(f"Something went wrong with saving the analytics results to the table '{table_name}'. Error type: {type(e).__name__}, error message: '{e}'.")
+
+    def remove_indicator_results(self, indicator_ids: list[str], table_name: str = "wb_indicator_country_trend"):
+        """drop results and state of indicators which no longer have any fact rows"""
+        if not indicator_ids:
+            return
+        try:
+            self._execute_write(sql.SQL("DELETE FROM {} WHERE indicator_id = ANY(%s);").format(sql.Identifier(table_name)), (indicator_ids,))
+            self._execute_write("DELETE FROM wb_indicator_analytics_state WHERE indicator_id = ANY(%s);", (indicator_ids,))
+            self.connection.commit()
+        except (Exception, psycopg.DatabaseError) as e:
+            self.connection.rollback()
+            raise DatabaseError(f"Something went wrong with removing stale analytics results. Error type: {type(e).__name__}, error message: '{e}'.")
+
+    def run_analytics(self, full_refresh: bool = False, batch_size: int = 500, rolling_window: int = 5):
+        """
+        (re)compute the trend & growth metrics of all indicators whose data changed since the last run
+        - indicators are processed in batches of batch_size: one query, one matrix and one vectorised pass per batch
+        :return: number of recomputed indicators
+        """
+        start = time.perf_counter()
+        watermark, indicator_ids, removed = self.get_changed_indicators(full_refresh = full_refresh)
+        self.remove_indicator_results(removed)
+        print(f"\n--- Analytics: {len(indicator_ids)} indicators changed since the last run, {len(removed)} indicators removed ---\n")
+
+        result_count = 0
+        for i in range(0, len(indicator_ids), batch_size):
+            batch_ids = indicator_ids[i:i + batch_size]
+            facts = self.get_fact_rows(batch_ids)
+            series_keys, years, values = build_series_matrix(facts)
+            results = compute_trend_metrics(series_keys, years, values, rolling_window = rolling_window)
+            self.replace_indicator_results(batch_ids, results, watermark)
+            result_count += len(results)
+            print(f"Batch {i // batch_size + 1}: {len(batch_ids)} indicators, {len(facts)} fact rows --> {len(results)} result rows ദ്ദി（• ˕ •マ.ᐟ")
+
+        print(f"\n--- Analytics finished: {len(indicator_ids)} indicators, {result_count} result rows in {time.perf_counter() - start:.1f}s ₍^. .^₎⟆ ---\n")
+        return len(indicator_ids)
+
+#######################################
+# Run the analytics
+#######################################
+if __name__ == "__main__":
+    print("Hello from analytics!")
+    parser = argparse.ArgumentParser(description = "compute trend & growth metrics for all World Bank indicators")
+    parser.add_argument("--full", action = "store_true", help = "recompute all indicators, not only the changed ones")
+    parser.add_argument("--batch-size", type = int, default = int(os.getenv("ANALYTICS_BATCH_SIZE", "500")), help = "number of indicators per vectorised batch")
+    parser.add_argument("--rolling-window", type = int, default = int(os.getenv("ANALYTICS_ROLLING_WINDOW", "5")), help = "number of years for the rolling mean")
+    args = parser.parse_args()
+
+    analytics_db = AnalyticsDB()
+    analytics_db.run_analytics(full_refresh = args.full, batch_size = args.batch_size, rolling_window = args.rolling_window)
+    analytics_db.close_connection()
@@ -1,8 +1,21 @@
 # imports
 import os # part of python standard library -> no need to add to requirements.txt
 import time # part of python standard library
+import argparse # part of python standard library
+from datetime import datetime # part of python standard library
+from functools import partial # part of python standard library
 import requests
 from save_data import DBPostgres, DatabaseError
+from metrics import registry, start_metrics_server_from_env
+from profiling import StageProfiler
+from memory_governor import MemoryGovernor, chunk_bytes
+from wb_fetch import (WBRequestError, headers_default, wb_api_base, wb_fetch_attempts, indicator_data_url, api_refused, transform_indicator_page,
+                      _endpoint_name, http_request_seconds, http_responses_total, http_bytes_total, queue_depth, queue_depth_samples,
+                      db_batch_seconds, db_rows_total)
+from stage_runner import Stage, Channel, run_stages
+from politeness import DomainGate
+from bulk_ingest import ingest_bulk_archive
+from dimension_snapshot import DimensionSnapshot, catalogue_fingerprint, dimension_hash, plain_rows
 import psycopg
 from psycopg import sql
 import pandas as pd
@@ -10,24 +23,46 @@ import numpy as np
 from tqdm.auto import tqdm
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from queue import Queue
-from threading import Event
-
-headers_default = {
-    "User-Agent": (
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:143.0) "
-        "Gecko/20100101 Firefox/143.0 "
-    "(compatible; violettalitiScraper/1.0; +https://github.com/violettaliti)"
-    )
-}
+from threading import Event, Thread
+from contextlib import nullcontext
 
 #######################################
 # API: World Bank
 #######################################
-wb_api_base = "https://api.worldbank.org/v2"
+# the pieces shared with the async engine (base url, page urls / transform, WBRequestError, hot-path metrics) are in wb_fetch.py
+wb_source_pause = float(os.getenv("WB_SOURCE_PAUSE", "0.1")) # seconds between the starts of two catalogue requests (be polite to the real API)
+wb_catalogue_workers = int(os.getenv("WB_CATALOGUE_WORKERS", "4")) # sources crawled at once
+wb_catalogue_per_page = int(os.getenv("WB_CATALOGUE_PER_PAGE", "1000")) # indicators per catalogue page
+# fact fetching: a failing indicator gets a few quick attempts, then goes to the dead-letter table and the worker moves on,
+# the retry pass at the end of the run (or of a later run) resumes it with fewer workers and more patience (main pass: WB_FETCH_ATTEMPTS, see wb_fetch.py)
+wb_retry_attempts = int(os.getenv("WB_RETRY_ATTEMPTS", "5")) # requests per page in the retry pass
+wb_retry_workers = int(os.getenv("WB_RETRY_WORKERS", "2")) # indicators retried at once
+# multi-indicator requests: small indicators of the same source are fetched with one request (/indicator/A;B;C?source=N)
+wb_batch_indicators = os.getenv("WB_BATCH_INDICATORS", "false").strip().lower() in ("1", "true", "yes")
+wb_batch_max_rows = int(os.getenv("WB_BATCH_MAX_ROWS", "20000")) # estimated rows of one combined request (every entity x year is a row, also null ones)
+wb_batch_max_indicators = int(os.getenv("WB_BATCH_MAX_INDICATORS", "20")) # indicators of one combined request
+# fact engine: 'threads' (a thread pool of blocking requests, see stream_indicator_facts) or 'async' (one event loop with hundreds
+# of requests in flight and async db connections, see async_engine.py)
+wb_engine = os.getenv("WB_ENGINE", "threads").strip().lower()
+
+# metrics of the catalogue / threaded engine only
+batched_indicators_total = registry.counter("wb_batched_indicators_total", "indicators fetched within a combined multi-indicator request")
+batch_fallbacks_total = registry.counter("wb_batch_fallbacks_total", "combined requests which fell back to one request per indicator")
+dimension_upserts_skipped_total = registry.counter("wb_dimension_upserts_skipped_total", "dimension upserts skipped because the rows are the ones written last time", ["dimension"])
 
 def _get_with_timeoff(url, attempts = 5, base_sleep = 1.0, timeout = 30):
+    endpoint = _endpoint_name(url)
     for i in range(attempts):
-        response = requests.get(url, timeout = timeout, headers = headers_default)
+        start = time.perf_counter()
+        try:
+            response = requests.get(url, timeout = timeout, headers = headers_default)
+        except requests.exceptions.RequestException:
+            http_responses_total.inc(endpoint = endpoint, status = "error")
+            raise
+        http_request_seconds.observe(time.perf_counter() - start, endpoint = endpoint)
+        http_responses_total.inc(endpoint = endpoint, status = response.status_code)
+        http_bytes_total.inc(len(response.content), endpoint = endpoint)
+        response.attempts = i + 1 # for the dead-letter records
         if response.status_code == 200:
             return response
         if response.status_code == 429:
@@ -51,7 +86,7 @@ def get_country_general_info():
     :return: countries general info
     """
     try:
-        url = "https://api.worldbank.org/v2/country/?per_page=20000&format=json"
+        url = f"{wb_api_base}/country/?per_page=20000&format=json"
         response = requests.get(url, timeout=5)
         print("\nQueried URL:", response.url, "\n")
 
@@ -105,7 +140,7 @@ def get_all_wb_topics():
     :return: World Bank topics
     """
     try:
-        url = "https://api.worldbank.org/v2/topic?format=json"
+        url = f"{wb_api_base}/topic?format=json"
         response = requests.get(url, timeout = 5)
         print("\nQueried URL (for getting all WB topics):", response.url, "\n")
 
@@ -157,7 +192,7 @@ def get_all_wb_sources():
     :return: World Bank sources
     """
     try:
-        url = "https://api.worldbank.org/v2/source?format=json&per_page=500"
+        url = f"{wb_api_base}/source?format=json&per_page=500"
         response = requests.get(url, timeout = 5)
         print("\nQueried URL (for getting all WB sources):", response.url, "\n")
 
@@ -202,10 +237,62 @@ def get_all_wb_sources():
     except requests.exceptions.RequestException as e:
         print(f"Something went wrong ૮₍•᷄  ༝ •᷅₎ა --> Error message: {type(e).__name__} - {e}.")
 
-def get_all_wb_indicators(source_ids_list):
+def _indicator_topic_rows(indicators_df):
+    """
+    flatten the nested list of topics per indicator into unique (indicator_id, topic_id) rows - vectorised: one explode, no python loop over rows
+    """
+    exploded = indicators_df[["indicator_id", "topics"]].explode("topics")
+    # astype(object): a source without any topics gives an all-NaN float column, which has no .str accessor
+    topic_ids = pd.to_numeric(exploded["topics"].astype(object).str.get("id"), errors = "coerce") # missing / empty / non-numeric topic ids --> NaN
+    topic_rows = pd.DataFrame({"indicator_id": exploded["indicator_id"], "topic_id": topic_ids}).dropna().drop_duplicates()
+    return list(topic_rows.astype({"topic_id": int}).itertuples(index = False, name = None))
+
+def _indicators_frame(wb_indicators: list):
+    return pd.DataFrame([
+        {
+            "indicator_id": indicator["id"], # []: mandatory fields - strict dict access -> it doesn’t exist, Python raises a KeyError
+            "indicator_name": indicator["name"],
+            "source_id": int(indicator["source"]["id"]),
+            "description": indicator.get("sourceNote"),
+            "topics": indicator.get("topics") or []
+        } for indicator in wb_indicators
+    ], columns = ["indicator_id", "indicator_name", "source_id", "description", "topics"])
+
+def _fetch_source_indicators(source_id, gate: DomainGate, per_page: int):
+    """
+    all indicators of one source, page by page (every request goes through the shared gate)
+    :return: (status, list of indicator dicts) with status 'ok', 'no_data' or 'failed'
+    """
+    wb_indicators, page, pages = [], 1, 1
+    while page <= pages:
+        url = f"{wb_api_base}/source/{source_id}/indicators?format=json&per_page={per_page}&page={page}"
+        with gate.request():
+            response = _get_with_timeoff(url)
+        if response.status_code != 200:
+            print(f"..!!.. Source {source_id} returned status {response.status_code} on page {page} ---> skipping!\n")
+            return "failed", []
+        json_data = response.json()
+        # some sources return empty datasets
+        if len(json_data) < 2 or not json_data[1]:
+            if page == 1:
+                return "no_data", []
+            break
+        pages = int(json_data[0].get("pages", 1) or 1)
+        wb_indicators.extend(json_data[1])
+        page += 1
+    return "ok", wb_indicators
+
+def get_all_wb_indicators(source_ids_list, on_source = None, max_workers: int = wb_catalogue_workers, per_page: int = wb_catalogue_per_page,
+                          gate: DomainGate | None = None):
     """
     this function fetch all World Bank indicators across multiple sources (e.g., WDI, IDS, GEM, etc.)
+    - the sources are crawled concurrently (max_workers), every source page by page (per_page), all requests under one shared
+      politeness gate (at most max_workers at once, WB_SOURCE_PAUSE seconds between two request starts)
+    - indicators listed by several sources are kept once, with the lowest source id (like the sequential crawl of the past)
     :param source_ids_list: list of source ids obtained from the get_all_wb_sources function
+    :param on_source: optional callback(source_id, indicators_df) called on the calling thread as soon as a source's indicators are
+                      collected (for streaming them on while the rest of the catalogue is still loading), the df has the columns of
+                      wb_indicators + 'topics'
     :return:
         wb_indicators_rows: list of tuples for DB insert into wb_indicators
         indicator_ids: list of all unique indicator IDs
@@ -215,47 +302,33 @@ def get_all_wb_indicators(source_ids_list):
     all_indicators_df = []
     failed_sources = []
     no_data_sources = []
-    print(f"\n ... Fetching indicators from {len(source_ids_list)} WB sources ...\n")
-
-    # tqdm wraps the iterable, one tick per source
-    for source_id in tqdm(source_ids_list, desc = "WB sources", unit = "src"):
-        url = f"https://api.worldbank.org/v2/source/{source_id}/indicators?format=json&per_page=20000"
-        print(f"\n... Querying source ID {source_id}: {url} ... ₍^. .^₎Ⳋ\n")
-
-        try:
-            response = _get_with_timeoff(url)
-            if response.status_code != 200:
-                print(f"..!!.. Source {source_id} returned status {response.status_code} ---> skipping!\n")
+    gate = gate or DomainGate(max_workers, wb_source_pause)
+    print(f"\n ... Fetching indicators from {len(source_ids_list)} WB sources ({max_workers} at a time, {per_page} per page) ...\n")
+
+    with ThreadPoolExecutor(max_workers = max(1, max_workers), thread_name_prefix = "catalogue") as ex:
+        futures = {ex.submit(_fetch_source_indicators, source_id, gate, per_page): source_id for source_id in source_ids_list}
+        # tqdm wraps the iterable, one tick per source
+        for future in tqdm(as_completed(futures), total = len(futures), desc = "WB sources", unit = "src"):
+            source_id = futures[future]
+            try:
+                status, wb_indicators = future.result()
+            except requests.exceptions.RequestException as e:
+                print(f"... Failed to fetch source {source_id}: ૮₍•᷄  ༝ •᷅₎ა --> Error message: {type(e).__name__} - {e}.\n")
                 failed_sources.append(source_id)
                 continue
-
-            json_data = response.json()
-            # some sources return empty datasets
-            if len(json_data) < 2 or not json_data[1]:
+            if status == "failed":
+                failed_sources.append(source_id)
+                continue
+            if status == "no_data":
                 print(f"..!!.. Source {source_id} returned no indicators --> skipping!\n")
                 no_data_sources.append(source_id)
                 continue
 
-            wb_indicators = json_data[1]
-            indicators_df = pd.DataFrame([
-                {
-                    "indicator_id": indicator["id"], # []: mandatory fields - strict dict access -> it doesn’t exist, Python raises a KeyError
-                    "indicator_name": indicator["name"],
-                    "source_id": int(indicator["source"]["id"]),
-                    "description": indicator.get("sourceNote"),
-                    "topics": indicator.get("topics", [])
-                } for indicator in wb_indicators
-            ])
+            indicators_df = _indicators_frame(wb_indicators).drop_duplicates(subset = ["indicator_id"])
             print(f"--- Source {source_id}: {len(indicators_df)} indicators have been collected!  --- ദ്ദി（• ˕ •マ.ᐟ\n")
             all_indicators_df.append(indicators_df)
-
-            # avoid suspicion :D
-            time.sleep(0.5)
-
-        except requests.exceptions.RequestException as e:
-            print(f"... Failed to fetch source {source_id}: ૮₍•᷄  ༝ •᷅₎ა --> Error message: {type(e).__name__} - {e}.\n")
-            failed_sources.append(source_id)
-            continue
+            if on_source:
+                on_source(source_id, indicators_df)
 
     # combine all sources into one df
     if not all_indicators_df:
@@ -263,8 +336,10 @@ def get_all_wb_indicators(source_ids_list):
         return [], [], [], [], []
 
     combined_df = pd.concat(all_indicators_df, ignore_index = True)
-    print(f"\n--- Combined total indicators: {len(combined_df)} indicators collected across {len(source_ids_list)} sources! (•˕ •マ.ᐟ ---\n")
-    print(f"-- Sources skipped: {failed_sources}; or have no data: {no_data_sources}--\n")
+    topics_df = combined_df[["indicator_id", "topics"]] # the topics of every source listing an indicator
+    combined_df = combined_df.sort_values("source_id", kind = "stable").drop_duplicates(subset = ["indicator_id"]) # shared indicators: lowest source id
+    print(f"\n--- Combined total indicators: {len(combined_df)} unique indicators collected across {len(source_ids_list)} sources! (•˕ •マ.ᐟ ---\n")
+    print(f"-- Sources skipped: {sorted(failed_sources)}; or have no data: {sorted(no_data_sources)}--\n")
 
     # replace NaN with None for postgreSQL
     wb_indicators_db = combined_df.replace({np.nan: None})
@@ -272,108 +347,97 @@ def get_all_wb_indicators(source_ids_list):
     wb_indicators_rows = list(wb_indicators_db.drop(columns = ["topics"]).itertuples(index = False, name = None))
 
     # list of all indicator ids for looping later
-    indicator_ids = combined_df["indicator_id"].unique().tolist()
+    indicator_ids = combined_df["indicator_id"].tolist()
 
     # get the indicator-topic list, and flatten the nested list of topics per indicator
-    indicator_topics_rows = []
-    for _, row in combined_df.iterrows(): # _ ignore the numeric index, and iterrows() iterates over each row of the combined df
-        indicator_id = row["indicator_id"]
-        topics = row["topics"] or [] # safe / fallback for empty lists / None
-        for topic in topics:
-            topic_id = topic.get("id")
-            if not topic_id:
-                continue # if None or empty str then skip
-            try:
-                indicator_topics_rows.append([indicator_id, topic_id])
-            except (TypeError, ValueError):
-                continue
+    indicator_topics_rows = _indicator_topic_rows(topics_df)
 
     return wb_indicators_rows, indicator_ids, indicator_topics_rows, failed_sources, no_data_sources
 
-def get_indicator_allcountries(indicator_id: str, date: str | None = None, valid_country_iso3codes: list[str] | None = None, on_chunk = None): # on_chunck: callback(df_chunk) for streaming
+def get_indicator_allcountries(indicator_id: str | list[str], date: str | None = None, valid_country_iso3codes: list[str] | None = None, on_chunk = None,
+                               page_slot = None, source_id: int | None = None, raise_errors: bool = False,
+                               countries: list[str] | None = None, start_page: int = 1, attempts: int = 5): # on_chunck: callback(df_chunk) for streaming
     """
     this function requests data in JSON format
     wb api mixes real countries and aggregates / regions --> this function also filters by the list of country_iso3codes from the get_country_general_info()
+    :param indicator_id: one indicator id, or a list of indicators of the source source_id fetched with one combined request
+                         ('/indicator/A;B;C?source=N') - the rows carry their own indicator ids, so the chunks may mix indicators
+    :param page_slot: optional context manager factory held while one page is downloaded, transformed and handed to on_chunk (MemoryGovernor.fetch_slot)
+    :param raise_errors: raise WBRequestError / the request exception instead of returning an empty df (lets a caller fall back)
+    :param countries: iso3 codes to request ('/country/AUT;DEU/indicator/...'), default: all countries and aggregates
+    :param start_page: resume a partially loaded indicator at this page (the pages before it are skipped)
+    :param attempts: requests per page (see _get_with_timeoff)
     :return: tidy df: columns = ['indicator_id', 'country_iso3code', 'year', 'value'] (value is float or NaN)
     if on_chunk is given, stream transformed page dfs to it, otherwise returns the concatenated df
     """
-    def _transform(df):
-        try:
-            # json uses keys: indicator{id}, countryiso3code, date, value
-            df["indicator_id"] = df["indicator"].apply(lambda x: (x or {}).get("id"))
-            df = df.rename(columns = {"countryiso3code": "country_iso3code"})
-            df["year"] = pd.to_numeric(df["date"], errors = "coerce").astype("Int64")
-            df["value"] = pd.to_numeric(df["value"], errors = "coerce")
-
-            if valid_country_iso3codes is not None:
-                before = len(df)
-                df = df[df["country_iso3code"].isin(valid_country_iso3codes)]
-                after = len(df)
-                print(f"\nFiltered out {before - after} region/aggregate rows for indicator {indicator_id}.")
-
-            print(f"Indicator {indicator_id}: collected {len(df)} country–year rows for the long fact table --- ദ്ദി（• ˕ •マ.ᐟ\n")
-            return df[["indicator_id", "country_iso3code", "year", "value"]]
-        except Exception as e:
-            print(f"... Post-processing failed for indicator {indicator_id}: {type(e).__name__} - {e}...\n")
-            return pd.DataFrame(columns = ["indicator_id", "country_iso3code", "year", "value"])
+    page_slot = page_slot or nullcontext
+    if not isinstance(indicator_id, str):
+        indicator_id = ";".join(indicator_id)
 
     frames = []
+    page = start_page
     try:
         # first page (to learn page count)
-        if date:
-            url_json = (f"{wb_api_base}/country/all/indicator/{indicator_id}"
-                        f"?date={date}&format=json&per_page=20000&page=1")
-        else:
-            url_json = (f"{wb_api_base}/country/all/indicator/{indicator_id}"
-                        f"?format=json&per_page=20000&page=1")
-
-        response_json_1 = _get_with_timeoff(url_json)
-        if response_json_1.status_code != 200:
-            return pd.DataFrame(columns = ["indicator_id", "country_iso3code", "year", "value"])
-
-        response_1 = response_json_1.json()
-        if len(response_1) < 2 or not response_1[1]: # if the response has no data
-            return pd.DataFrame(columns = ["indicator_id", "country_iso3code", "year", "value"])
-
-        meta, rows = response_1[0], response_1[1]
-        pages = int(meta.get("pages", 1))
-
-        # progress bar over pages
-        with tqdm(total = pages, desc = f"{indicator_id} pages", unit = "page", leave = False) as progress_bar:
-            df1 = _transform(pd.DataFrame(rows))
+        url_json = indicator_data_url(indicator_id, start_page, date, source_id, countries)
+
+        with page_slot(): # raw json, parsed rows and the intermediate frame of the page are alive until it's handed over
+            response_json_1 = _get_with_timeoff(url_json, attempts = attempts)
+            if response_json_1.status_code != 200:
+                if raise_errors:
+                    raise WBRequestError(f"status {response_json_1.status_code} for {indicator_id} on page {page}", page = page,
+                                         status = response_json_1.status_code, attempts = getattr(response_json_1, "attempts", 1))
+                return pd.DataFrame(columns = ["indicator_id", "country_iso3code", "year", "value"])
+
+            response_1 = response_json_1.json()
+            if raise_errors and api_refused(response_1):
+                raise WBRequestError(f"the API refused {indicator_id}: {response_1[0]['message']}", page = page, status = 200)
+            if len(response_1) < 2 or not response_1[1]: # if the response has no data
+                return pd.DataFrame(columns = ["indicator_id", "country_iso3code", "year", "value"])
+
+            meta, rows = response_1[0], response_1[1]
+            pages = int(meta.get("pages", 1))
+            df1 = transform_indicator_page(pd.DataFrame(rows), indicator_id, valid_country_iso3codes)
+            del response_json_1, response_1, rows
             if on_chunk:
                 if not df1.empty:
                     on_chunk(df1)
             else:
                 frames.append(df1)
 
-            progress_bar.update(1) # we already fetched page 1
-
-            # fetch remaining pages 2 ... pages
-            for page in range(2, pages + 1):
-                if date:
-                    url_json = (f"{wb_api_base}/country/all/indicator/{indicator_id}"
-                                f"?date={date}&format=json&per_page=20000&page={page}")
-                else:
-                    url_json = (f"{wb_api_base}/country/all/indicator/{indicator_id}"
-                                f"?format=json&per_page=20000&page={page}")
-
-                response_js = _get_with_timeoff(url_json)
-                if response_js.status_code != 200:
-                    break
-                response_json = response_js.json()
-                if len(response_json) < 2 or not response_json[1]:
-                    break
-
-                dfi = _transform(pd.DataFrame(response_json[1]))
-                if on_chunk:
-                    if not dfi.empty:
-                        on_chunk(dfi)
-                else:
-                    frames.append(dfi)
+        # progress bar over pages
+        with tqdm(total = pages - start_page + 1, desc = f"{indicator_id} pages", unit = "page", leave = False) as progress_bar:
+            progress_bar.update(1) # we already fetched the first page
+
+            # fetch remaining pages start_page + 1 ... pages
+            for page in range(start_page + 1, pages + 1):
+                url_json = indicator_data_url(indicator_id, page, date, source_id, countries)
+
+                with page_slot():
+                    response_js = _get_with_timeoff(url_json, attempts = attempts)
+                    if response_js.status_code != 200:
+                        if raise_errors:
+                            raise WBRequestError(f"status {response_js.status_code} for {indicator_id} on page {page}", page = page,
+                                                 status = response_js.status_code, attempts = getattr(response_js, "attempts", 1))
+                        print(f"..!!.. Status {response_js.status_code} for {indicator_id} on page {page} --> only pages {start_page}-{page - 1} were loaded\n")
+                        break
+                    response_json = response_js.json()
+                    if raise_errors and api_refused(response_json):
+                        raise WBRequestError(f"the API refused {indicator_id} on page {page}: {response_json[0]['message']}", page = page, status = 200)
+                    if len(response_json) < 2 or not response_json[1]:
+                        break
+
+                    dfi = transform_indicator_page(pd.DataFrame(response_json[1]), indicator_id, valid_country_iso3codes)
+                    del response_js, response_json
+                    if on_chunk:
+                        if not dfi.empty:
+                            on_chunk(dfi)
+                    else:
+                        frames.append(dfi)
                 progress_bar.update(1)
 
     except requests.exceptions.RequestException as e:
+        if raise_errors:
+            raise WBRequestError(f"{type(e).__name__} - {e}", page = page, error_class = type(e).__name__) from e
         print(f"... Something went wrong while fetching indicator {indicator_id}: {type(e).__name__} - {e}")
         # return empty df to avoid breaking higher loops
         return pd.DataFrame(columns = ["indicator_id", "country_iso3code", "year", "value"])
@@ -392,33 +456,100 @@ def get_indicator_allcountries(indicator_id: str, date: str | None = None, valid
         print(f"...Failed to concatenate frames for {indicator_id}: {type(e).__name__} - {e}..\n")
         return pd.DataFrame(columns = ["indicator_id", "country_iso3code", "year", "value"])
 
-def _producer_fetch_indicator(indicator_id: str, out_q: Queue, stop_ev: Event,
-                              valid_country_iso3codes: list[str] | None, date: str | None = None):
+def _queue_chunk(out_q: Queue, indicator_id: str, chunk: pd.DataFrame, governor: MemoryGovernor | None):
+    """put one indicator's chunk on the queue (the consumer releases its bytes from the governor after writing)"""
+    nbytes = chunk_bytes(chunk) if governor else 0
+    if governor:
+        governor.reserve(nbytes) # backpressure on bytes in flight, not only on the number of chunks
+    out_q.put((indicator_id, chunk, nbytes))
+    queue_depth.set(out_q.qsize())
+
+def _producer_fetch_indicator(indicator_id: str, out_q: Queue, stop_ev: Event, valid_country_iso3codes: list[str] | None,
+                              date: str | None = None, governor: MemoryGovernor | None = None, countries: list[str] | None = None,
+                              start_page: int = 1, attempts: int = wb_fetch_attempts):
+    """
+    queue items: (indicator_id, chunk, approximate bytes of the chunk), (indicator_id, None, 0) ends the indicator's stream
+    - a failed fetch puts (indicator_id, WBRequestError, 0) before the end marker --> dead-letter table, the worker moves on
+    - an error message of the API instead of data (e.g. an archived indicator) is an answer, not a failure: no data
+    """
     def _emit(chunk: pd.DataFrame):
         if stop_ev.is_set():
             return
         # drop null values early (saves db work and storage)
         chunk = chunk.dropna(subset = ["value"])
         if not chunk.empty:
-            out_q.put((indicator_id, chunk))
+            _queue_chunk(out_q, indicator_id, chunk, governor)
     try:
         get_indicator_allcountries(
             indicator_id = indicator_id,
             date = date,
             valid_country_iso3codes = valid_country_iso3codes,
             on_chunk = _emit, # streaming callback
+            page_slot = governor.fetch_slot if governor else None,
+            countries = countries, # None = country/all
+            start_page = start_page,
+            attempts = attempts,
+            raise_errors = True,
         )
+    except WBRequestError as e:
+        print(f"[worker] {indicator_id}: {e.error_class} - {e}")
+        if e.status != 200:
+            out_q.put((indicator_id, e, 0))
     except Exception as e:
         print(f"[worker] {indicator_id}: {type(e).__name__} - {e}")
+        out_q.put((indicator_id, WBRequestError(str(e), page = start_page, error_class = type(e).__name__), 0)) # restart the indicator
     finally:
         # signal end of this indicator’s stream
-        out_q.put((indicator_id, None))
+        out_q.put((indicator_id, None, 0))
+
+restart_stream = "restart" # queue item (indicator_id, restart_stream, 0): forget what was counted of the indicator, it's fetched again
+
+def _producer_fetch_indicator_batch(indicator_ids: list[str], source_id: int, date: str, out_q: Queue, stop_ev: Event,
+                                    valid_country_iso3codes: list[str] | None, governor: MemoryGovernor | None = None,
+                                    countries: list[str] | None = None):
+    """
+    one combined request for several small indicators of the same source, demultiplexed into per-indicator chunks
+    - every indicator of the batch gets its own chunks and its own end marker, exactly like a single fetch, so the coverage
+      statistics, the load checkpoints and the error handling stay per indicator
+    - if the API refuses the combined request (or it fails half way), the indicators are fetched one by one (full range)
+    """
+    batch = set(indicator_ids)
+    emitted = set()
+
+    def _emit(chunk: pd.DataFrame):
+        if stop_ev.is_set():
+            return
+        chunk = chunk.dropna(subset = ["value"])
+        for indicator, part in chunk.groupby("indicator_id", sort = False):
+            if indicator in batch:
+                emitted.add(indicator)
+                _queue_chunk(out_q, indicator, part, governor)
+    try:
+        get_indicator_allcountries(indicator_ids, date = date, valid_country_iso3codes = valid_country_iso3codes, on_chunk = _emit,
+                                   page_slot = governor.fetch_slot if governor else None, source_id = source_id, raise_errors = True,
+                                   countries = countries, attempts = wb_fetch_attempts)
+    except Exception as e:
+        print(f"[worker] batch of {len(indicator_ids)} indicators of source {source_id}: {type(e).__name__} - {e} --> fetching them one by one")
+        batch_fallbacks_total.inc()
+        for indicator in indicator_ids:
+            if indicator in emitted:
+                out_q.put((indicator, restart_stream, 0))
+            _producer_fetch_indicator(indicator, out_q, stop_ev, valid_country_iso3codes, None, governor, countries)
+        return
+    batched_indicators_total.inc(len(indicator_ids))
+    for indicator in indicator_ids:
+        out_q.put((indicator, None, 0))
 
 #######################################
 # Save / persist to db
 #######################################
 class ApiDB(DBPostgres):
     """child class of DBPostgres"""
+    def __init__(self):
+        super().__init__()
+        # running coverage aggregates per indicator, built from the fact batches written in this run (see flush_indicator_coverage)
+        self._coverage = {}
+
     def add_data_to_staging_country_general_info_table(self, data: list, table_name: str = "staging_country_general_info"):
         """persist acquired raw data into staging_db"""
         if not data:
@@ -556,12 +687,10 @@ class ApiDB(DBPostgres):
         ).format(codes = eu_country_iso2codes)
 
         try:
-            self.cursor.execute(query, europe_countries_iso2codes)
-            all_countries_rows = self.cursor.fetchall()
+            category, all_countries_rows = self._fetch_cached(query, europe_countries_iso2codes)
             if not all_countries_rows:
                 print(f"No European country info available for {self}.")
                 return
-            category = [row[0] for row in self.cursor.description]
             print(f"\n--- Printing {len(all_countries_rows)} European countries' general info for {self}: ---")
             for idx, row in enumerate(all_countries_rows, start = 1):
                 print(f"\n{idx}. Country info of '{row[2]}' is:")
@@ -585,12 +714,10 @@ class ApiDB(DBPostgres):
 
             print(f"\n--- Printing country info for the following countries of interest: {', '.join(country_names)} (to update or change this list, go to 'docker compose' - service 'app_base' environment) ---")
 
-            self.cursor.execute("SELECT * FROM staging_country_general_info WHERE country_name ILIKE ANY(%s) ORDER BY country_name;", (country_names,))
-            country_rows = self.cursor.fetchall()
+            category, country_rows = self._fetch_cached("SELECT * FROM staging_country_general_info WHERE country_name ILIKE ANY(%s) ORDER BY country_name;", (country_names,))
             if not country_rows:
                 print(f"No country info found for: {', '.join(country_names)}.")
                 return
-            category = [row[0] for row in self.cursor.description]
 
             for idx, row in enumerate(country_rows, start = 1):
                 print(f"\n{idx}. Country info of '{row[2]}' is:")
@@ -600,6 +727,19 @@ class ApiDB(DBPostgres):
         except (Exception, psycopg.DatabaseError) as e:
             raise DatabaseError(f"Something went wrong with getting the country info of '{', '.join(country_names)}'. Error type: {type(e).__name__}, error message: '{e}'.")
 
+    def stream_fact_rows(self, indicator_ids: list[str] | None = None, itersize: int = 50000, cancel_event = None,
+                         table_name: str = "wb_indicator_country_year_value"):
+        """
+        scan the long fact table (or the rows of some indicators) in constant memory via a server-side cursor
+        :return: generator of columnar batches {'indicator_id', 'country_iso3code', 'year', 'value'} -> numpy arrays
+        """
+        query = sql.SQL("SELECT indicator_id, country_iso3code, year, value::DOUBLE PRECISION AS value FROM {}").format(sql.Identifier(table_name))
+        params = None
+        if indicator_ids is not None:
+            query = query + sql.SQL(" WHERE indicator_id = ANY(%s)")
+            params = (list(indicator_ids),)
+        return self.stream_query_batches(query, params, itersize = itersize, dtypes = {"year": "int32", "value": "float64"}, cancel_event = cancel_event)
+
     def add_data_to_wb_topics_table(self, data: list, table_name: str = "wb_topics"):
         """persist normalised acquired data into db"""
         if not data:
@@ -647,11 +787,13 @@ class ApiDB(DBPostgres):
             return
 
         query = sql.SQL("""
-                        INSERT INTO {} (indicator_id, indicator_name, source_id, description)
+                        INSERT INTO {table} (indicator_id, indicator_name, source_id, description)
                         VALUES (%s, %s, %s, %s)
-                        ON CONFLICT (indicator_id) DO NOTHING;
-                        """).format(sql.Identifier(table_name))
-        # on conflict do nothing to prevent throwing errors and creating duplicates
+                        ON CONFLICT (indicator_id) DO UPDATE
+                        SET indicator_name = EXCLUDED.indicator_name, source_id = EXCLUDED.source_id, description = EXCLUDED.description
+                        WHERE EXCLUDED.source_id < {table}.source_id;
+                        """).format(table = sql.Identifier(table_name))
+        # on conflict no duplicates: an indicator listed by several sources keeps the lowest source id, whichever source arrives first
 
         try:
             self._executemany(query, data)
@@ -695,142 +837,441 @@ class ApiDB(DBPostgres):
             raise ValueError(f"DataFrame missing required columns: {missing}!\n")
 
         df_copy = df[required_cols].copy()
-        normalised_df = df_copy.replace({np.nan: None})
+        rows = self.fact_rows(df_copy)
+        query = self.fact_upsert_query(table_name)
 
-        rows = [
-            (r.indicator_id, r.country_iso3code, int(r.year) if r.year else None, r.value)
+        try:
+            for i in range(0, len(rows), batch_size):
+                batch = rows[i:i + batch_size]
+                with db_batch_seconds.time():
+                    self._executemany(query, batch)
+                db_rows_total.inc(len(batch))
+            print(f"Successfully added or updated {len(rows)} normalised rows into '{table_name}' (batch size={batch_size}) ദ്ദി（•˕•マ.ᐟ\n")
+        except (Exception, psycopg.DatabaseError) as e:
+            self.connection.rollback()
+            raise DatabaseError(f"Something went wrong with adding the normalised API-data to the table '{table_name}'. Error type: {type(e).__name__}, error message: '{e}'.")
+
+        self._track_coverage(df_copy)
+
+    def fact_rows(self, df: pd.DataFrame):
+        """the parameter tuples of the fact upsert (tagged with the running load batch), df with the columns of the fact table"""
+        normalised_df = df.replace({np.nan: None})
+        return [
+            (r.indicator_id, r.country_iso3code, int(r.year) if r.year else None, r.value, self.load_batch_id)
             for r in normalised_df.itertuples(index = False)
         ]
 
+    @staticmethod
+    def fact_upsert_query(table_name: str = "wb_indicator_country_year_value", from_arrays: bool = False):
+        """
+        the upsert of the fact loader: one row per execution (executemany with fact_rows)
+        :param from_arrays: all rows of a batch in one statement instead - params: one array per column (indicator ids, iso3 codes, years,
+                            values) and the batch id (for connections without a fast executemany, e.g. the async ones)
+        """
+        if from_arrays:
+            # the last row of a key wins, like with executemany (one statement can't update a row twice)
+            rows = sql.SQL("""
+                           SELECT DISTINCT ON (indicator_id, country_iso3code, year) indicator_id, country_iso3code, year, value, %s::BIGINT
+                           FROM unnest(%s::TEXT[], %s::TEXT[], %s::INTEGER[], %s::FLOAT8[]) WITH ORDINALITY
+                                AS batch (indicator_id, country_iso3code, year, value, position)
+                           ORDER BY indicator_id, country_iso3code, year, position DESC
+                           """)
+        else:
+            rows = sql.SQL("VALUES (%s, %s, %s, %s, %s)")
+        # on conflict: take the latest inserted values (unchanged values are left alone, so last_modified only moves on actual changes)
+        return sql.SQL("""
+                       INSERT INTO {table} (indicator_id, country_iso3code, year, value, load_batch_id)
+                       {rows}
+                       ON CONFLICT (indicator_id, country_iso3code, year)
+                       DO UPDATE SET value = EXCLUDED.value,
+                                     last_modified = NOW(),
+                                     change_xid = pg_current_xact_id(),
+                                     load_batch_id = EXCLUDED.load_batch_id
+                       WHERE {table}.value IS DISTINCT FROM EXCLUDED.value;
+                       """).format(table = sql.Identifier(table_name), rows = rows)
+
+    def _track_coverage(self, df: pd.DataFrame):
+        """add a written fact batch to the running coverage aggregates of its indicator(s)"""
+        grouped = df.groupby("indicator_id", sort = False)
+        summary = grouped.agg(row_count = ("year", "size"), non_null_count = ("value", "count"), min_year = ("year", "min"), max_year = ("year", "max"))
+        countries = grouped["country_iso3code"].unique()
+
+        for indicator_id, row in summary.iterrows(): # one row per indicator in the batch (usually exactly one)
+            stats = self._coverage.setdefault(indicator_id, {"row_count": 0, "non_null_count": 0, "min_year": None, "max_year": None, "countries": set()})
+            stats["row_count"] += int(row.row_count)
+            stats["non_null_count"] += int(row.non_null_count)
+            stats["min_year"] = int(row.min_year) if stats["min_year"] is None else min(stats["min_year"], int(row.min_year))
+            stats["max_year"] = int(row.max_year) if stats["max_year"] is None else max(stats["max_year"], int(row.max_year))
+            stats["countries"].update(countries[indicator_id])
+
+    def flush_indicator_coverage(self, indicator_ids: list[str] | None = None, table_name: str = "wb_indicator_coverage_stats"):
+        """
+        write the coverage statistics of fully loaded indicators (call this when an indicator's stream has ended)
+        - a (re)loaded indicator replaces its previous statistics, use rebuild_indicator_coverage_stats() after partial loads
+        :param indicator_ids: indicators to flush, default: all indicators tracked so far
+        """
+        indicator_ids = list(self._coverage) if indicator_ids is None else [i for i in indicator_ids if i in self._coverage]
+        if not indicator_ids:
+            return
+
+        rows = []
+        for indicator_id in indicator_ids:
+            stats = self._coverage[indicator_id]
+            country_count = len(stats["countries"])
+            cells = country_count * (stats["max_year"] - stats["min_year"] + 1)
+            null_ratio = 1 - stats["non_null_count"] / cells if cells else None
+            rows.append((indicator_id, stats["row_count"], country_count, stats["min_year"], stats["max_year"], null_ratio, sorted(stats["countries"])))
+
         query = sql.SQL("""
-                        INSERT INTO {} (indicator_id, country_iso3code, year, value)
-                        VALUES (%s, %s, %s, %s)
-                        ON CONFLICT (indicator_id, country_iso3code, year)
-                        DO UPDATE SET value = EXCLUDED.value;
+                        INSERT INTO {} (indicator_id, row_count, country_count, min_year, max_year, null_ratio, country_iso3codes, last_loaded)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())
+                        ON CONFLICT (indicator_id)
+                        DO UPDATE SET
+                            row_count = EXCLUDED.row_count,
+                            country_count = EXCLUDED.country_count,
+                            min_year = EXCLUDED.min_year,
+                            max_year = EXCLUDED.max_year,
+                            null_ratio = EXCLUDED.null_ratio,
+                            country_iso3codes = EXCLUDED.country_iso3codes,
+                            last_loaded = EXCLUDED.last_loaded;
                         """).format(sql.Identifier(table_name))
-        # on conflict: take the latest inserted values
 
         try:
-            for i in range(0, len(rows), batch_size):
-                batch = rows[i:i + batch_size]
-                self._executemany(query, batch)
-            print(f"Successfully added or updated {len(rows)} normalised rows into '{table_name}' (batch size={batch_size}) ദ്ദി（•˕•マ.ᐟ\n")
+            self._executemany(query, rows)
+            for indicator_id in indicator_ids:
+                del self._coverage[indicator_id]
         except (Exception, psycopg.DatabaseError) as e:
             self.connection.rollback()
-            raise DatabaseError(f"Something went wrong with adding the normalised API-data to the table '{table_name}'. Error type: {type(e).__name__}, error message: '{e}'.")
+            raise DatabaseError(f"Something went wrong with updating the coverage statistics in '{table_name}'. Error type: {type(e).__name__}, error message: '{e}'.")
 
-#######################################
-# Run the API requests
-#######################################
-if __name__ == "__main__":
-    print("Hello from api_logger!")
-    country_rows, country_iso3codes = get_country_general_info()
-    wb_api_db = ApiDB()
-    wb_api_db.add_data_to_staging_country_general_info_table(country_rows)
+    def rebuild_indicator_coverage_stats(self, indicator_ids: list[str] | None = None):
+        """rebuild the coverage statistics of all indicators (one full scan) or of some indicators from the fact table"""
+        try:
+            self._execute_write("CALL rebuild_indicator_coverage_stats(%s::TEXT[]);", (list(indicator_ids) if indicator_ids is not None else None,),
+                                tables = ["wb_indicator_coverage_stats"])
+            self.connection.commit()
+            which = "all indicators" if indicator_ids is None else f"{len(indicator_ids)} indicators"
+            print(f"Rebuilt the coverage statistics of {which} from the fact table ദ്ദി（•˕•マ.ᐟ\n")
+        except (Exception, psycopg.DatabaseError) as e:
+            self.connection.rollback()
+            raise DatabaseError(f"Something went wrong with rebuilding the coverage statistics. Error type: {type(e).__name__}, error message: '{e}'.")
 
-    display_all = os.getenv("DISPLAY_ALL_EU_COUNTRIES_INFO", "false").strip().lower() in ("1", "true", "yes")
-    if display_all:
-        wb_api_db.get_all_eu_countries_info()
-    else:
-        print(f"\n--- The user does not wish to display all European countries' general info (•́ ᴖ •̀) ---")
-        print("--- (if you changed your mind, change the var DISPLAY_ALL_EU_COUNTRIES_INFO to 'true' in 'docker compose' - service 'app_base' environment.) ---")
+    def add_dead_letter(self, indicator_id: str, error: WBRequestError, failed_page: int | None = None, table_name: str = "wb_fetch_dead_letter"):
+        """record a failed indicator fetch (or one more failed pass of an indicator which is already recorded)"""
+        query = sql.SQL("""
+                        INSERT INTO {} (indicator_id, error_class, error_message, http_status, failed_page, attempts)
+                        VALUES (%s, %s, %s, %s, %s, %s)
+                        ON CONFLICT (indicator_id)
+                        DO UPDATE SET
+                            error_class = EXCLUDED.error_class,
+                            error_message = EXCLUDED.error_message,
+                            http_status = EXCLUDED.http_status,
+                            failed_page = EXCLUDED.failed_page,
+                            attempts = {}.attempts + EXCLUDED.attempts,
+                            failed_passes = {}.failed_passes + 1,
+                            last_failed_at = NOW();
+                        """).format(sql.Identifier(table_name), sql.Identifier(table_name), sql.Identifier(table_name))
+        try:
+            self._execute_write(query, (indicator_id, error.error_class, str(error)[:1000], error.status,
+                                        failed_page if failed_page is not None else error.page, error.attempts))
+            self.connection.commit()
+        except (Exception, psycopg.DatabaseError) as e:
+            self.connection.rollback()
+            raise DatabaseError(f"Something went wrong with recording the failed indicator '{indicator_id}' in '{table_name}'. Error type: {type(e).__name__}, error message: '{e}'.")
 
-    names = os.getenv("COUNTRIES_OF_INTEREST", "").strip()
-    if names:
-        wb_api_db.get_country_info(names)
-    else:
-        print("\n--- Printing general country info for the countries of interest: No info about countries of interest was given ^. .^₎⟆ ---")
+    def get_dead_letters(self, table_name: str = "wb_fetch_dead_letter"):
+        """indicator id -> page to resume at, of the recorded failed indicators (oldest failure first)"""
+        try:
+            self.cursor.execute(sql.SQL("SELECT indicator_id, failed_page FROM {} ORDER BY first_failed_at;").format(sql.Identifier(table_name)))
+            dead_letters = dict(self.cursor.fetchall())
+            self.connection.commit()
+            return dead_letters
+        except (Exception, psycopg.DatabaseError) as e:
+            self.connection.rollback()
+            raise DatabaseError(f"Something went wrong with getting the failed indicators from '{table_name}'. Error type: {type(e).__name__}, error message: '{e}'.")
 
-    normalised_api_data_region = [(country_tuple[4], country_tuple[5], country_tuple[3]) for country_tuple in country_rows]
-    wb_api_db.add_data_to_region_table(normalised_api_data_region)
+    def clear_dead_letters(self, indicator_ids: list[str], table_name: str = "wb_fetch_dead_letter"):
+        """remove the records of indicators which loaded successfully"""
+        try:
+            self._execute_write(sql.SQL("DELETE FROM {} WHERE indicator_id = ANY(%s);").format(sql.Identifier(table_name)), (list(indicator_ids),))
+            self.connection.commit()
+            print(f"Cleared {len(indicator_ids)} recovered indicators from '{table_name}' ദ്ദി（•˕•マ.ᐟ\n")
+        except (Exception, psycopg.DatabaseError) as e:
+            self.connection.rollback()
+            raise DatabaseError(f"Something went wrong with clearing the recovered indicators from '{table_name}'. Error type: {type(e).__name__}, error message: '{e}'.")
 
-    normalised_api_data_country_general = [(country_tuple[0], country_tuple[1], country_tuple[2], country_tuple[4], country_tuple[6], country_tuple[7], country_tuple[8], country_tuple[9]) for country_tuple in country_rows]
-    wb_api_db.add_data_to_country_general_info_table(normalised_api_data_country_general)
+    def dimension_unchanged(self, dimension: str, content_hash: str, table_name: str, state_table: str = "wb_dimension_state"):
+        """
+        compare the hash of a dimension's fresh rows with the hash of the rows written last time (and check that the table wasn't emptied since)
+        :param table_name: table the dimension is written to, its row count must not have dropped below the recorded one
+        :return: True if the upserts can be skipped
+        """
+        query = sql.SQL("""
+                        SELECT s.content_hash = %s AND (SELECT COUNT(*) FROM {table}) >= s.row_count
+                        FROM {state} AS s
+                        WHERE s.dimension = %s;
+                        """).format(table = sql.Identifier(table_name), state = sql.Identifier(state_table))
+        try:
+            self.cursor.execute(query, (content_hash, dimension))
+            row = self.cursor.fetchone()
+            self.connection.commit()
+            return bool(row and row[0])
+        except (Exception, psycopg.DatabaseError) as e:
+            self.connection.rollback()
+            raise DatabaseError(f"Something went wrong with comparing the {dimension} against '{state_table}'. Error type: {type(e).__name__}, error message: '{e}'.")
 
-    normalised_api_data_alias = [(country_tuple[2], country_tuple[0]) for country_tuple in country_rows]
-    wb_api_db.add_data_to_country_alias_table(normalised_api_data_alias)
+    def save_dimension_state(self, dimension: str, content_hash: str, row_count: int, state_table: str = "wb_dimension_state"):
+        """record the hash of the rows of a dimension which were just written"""
+        query = sql.SQL("""
+                        INSERT INTO {} (dimension, content_hash, row_count)
+                        VALUES (%s, %s, %s)
+                        ON CONFLICT (dimension)
+                        DO UPDATE SET content_hash = EXCLUDED.content_hash, row_count = EXCLUDED.row_count, updated_at = NOW();
+                        """).format(sql.Identifier(state_table))
+        try:
+            self._execute_write(query, (dimension, content_hash, row_count))
+            self.connection.commit()
+        except (Exception, psycopg.DatabaseError) as e:
+            self.connection.rollback()
+            raise DatabaseError(f"Something went wrong with recording the state of the {dimension} in '{state_table}'. Error type: {type(e).__name__}, error message: '{e}'.")
 
-    print("Adding additional country aliases...")
-    other_country_aliases = [
-        ('Macedonia', 'MKD'),
-        ('Czech Republic', 'CZE'),
-        ('Czechia', 'CZE'),
-        ('United Kingdom', 'GBR'),
-        ('Great Britain', 'GBR'),
-        ('UK', 'GBR'),
-        ('Russian Federation', 'RUS'),
-        ('Russia', 'RUS'),
-        ('Kosovo', 'XKX'),
-        ('Turkiye', 'TUR'),
-        ('Turkey', 'TUR'),
-        ('Hong Kong', 'HKG'),
-        ('Hong Kong SAR of China', 'HKG'),
-        ("Republic of Korea", "KOR"),
-        ("Republic of Moldova", "MDA"),
-        ("DR Congo", "COD"),
-        ("North Cyprus", "CYP"),
-        ("Somaliland Region", "SOM"),
-        ("Venezuela", "VEN"),
-        ("South Korea", "KOR"),
-        ("Vietnam", "VNM"),
-        ("Egypt", "EGY"),
-        ("Ivory Coast", "CIV"),
-        ("Slovakia", "SVK"),
-        ("Yemen", "YEM"),
-        ("Gambia", "GMB"),
-        ("Iran", "IRN"),
-        ("Kyrgyzstan", "KGZ"),
-        ("Syria", "SYR"),
-        ("Democratic Republic of the Congo", "COD"),
-        ("Laos", "LAO"),
-        ("Somalia", "SOM"),
-        ("Cape Verde", "CPV"),
-        ("Republic of the Congo", "COG"),
-        ("Saint Lucia", "LCA"),
-        ("Saint Vincent and the Grenadines", "VCT"),
-        ("North Korea", "PRK"),
-        ("Bahamas", "BHS"),
-        ("FYR Macedonia", "MKD"),
-        ("Guinea Bissau", "GNB"),
-        ("Swaziland", "SWZ"),
-        ("Timor Leste", "TLS"),
-        ("Macau", "MAC"),
-        ("Congo", "COG"),
-        ("Puerto Rico", "PRI"),
-        ("Palestine", "PSE")
-    ]
-    # unresolved: ("Serbia and Montenegro", ""), ("State of Palestine", ""), ("Taiwan", "TWN"), ("Taiwan Province of China", "TWN"), ("FR Yugoslavia", "YUG"), and ("Congo", "COG / COD")
-    wb_api_db.add_data_to_country_alias_table(other_country_aliases)
+    def get_country_iso3codes(self):
+        """iso3 codes of the countries stored by an earlier run (for runs without the countries stage)"""
+        return self._fetch_column("SELECT country_iso3code FROM country_general_info ORDER BY country_iso3code;", what = "the stored countries")
 
-    wb_topics_rows = get_all_wb_topics()
-    wb_api_db.add_data_to_wb_topics_table(wb_topics_rows)
+    def get_source_ids(self):
+        """ids of the WB sources stored by an earlier run"""
+        return self._fetch_column("SELECT source_id FROM wb_source ORDER BY source_id;", what = "the stored WB sources")
 
-    wb_sources_rows, source_ids = get_all_wb_sources()
-    wb_api_db.add_data_to_wb_source_table(wb_sources_rows)
+    def get_topic_ids(self):
+        """ids of the WB topics stored by an earlier run"""
+        return self._fetch_column("SELECT topic_id FROM wb_topics ORDER BY topic_id;", what = "the stored WB topics")
 
-    wb_indicators_rows, indicator_ids, indicator_topics_rows, failed_sources, no_data_sources = get_all_wb_indicators(source_ids)
-    wb_api_db.add_data_to_wb_indicators_table(wb_indicators_rows)
-    wb_api_db.add_data_to_wb_indicator_topics_table(indicator_topics_rows)
+    def get_indicator_ids(self, indicator_ids: list[str] | None = None):
+        """ids of the indicators stored by an earlier run, optionally only those of a given list"""
+        if indicator_ids is None:
+            return self._fetch_column("SELECT indicator_id FROM wb_indicators ORDER BY indicator_id;", what = "the stored WB indicators")
+        return self._fetch_column("SELECT indicator_id FROM wb_indicators WHERE indicator_id = ANY(%s) ORDER BY indicator_id;",
+                                  (list(indicator_ids),), what = "the stored WB indicators")
+
+    def get_indicator_batch_info(self):
+        """indicator id -> (source id, first year with data) of the indicators with coverage statistics (to size multi-indicator requests)"""
+        try:
+            self.cursor.execute("""
+                SELECT i.indicator_id, i.source_id, c.min_year
+                FROM wb_indicators i
+                JOIN wb_indicator_coverage_stats c ON c.indicator_id = i.indicator_id
+                WHERE c.min_year IS NOT NULL;
+            """)
+            info = {indicator_id: (source_id, min_year) for indicator_id, source_id, min_year in self.cursor.fetchall()}
+            self.connection.commit()
+            return info
+        except (Exception, psycopg.DatabaseError) as e:
+            self.connection.rollback()
+            raise DatabaseError(f"Something went wrong with getting the coverage of the WB indicators. Error type: {type(e).__name__}, error message: '{e}'.")
+
+    def resolve_country_names(self, country_names):
+        """
+        resolve country names (as in COUNTRIES_OF_INTEREST) to iso3 codes, like the db triggers do: via country_alias, then the
+        official WB names (both case- and accent-insensitive), an iso3 code stays itself
+        :param country_names: "Austria, germany" or ["Austria", "gErManY"]
+        :return: (list of iso3 codes in the order of the names, list of names which couldn't be resolved)
+        """
+        if isinstance(country_names, str):
+            country_names = [name.strip() for name in country_names.split(",")]
+        country_names = [name for name in country_names if name]
+        try:
+            self.cursor.execute("""
+                SELECT n.name,
+                       COALESCE(
+                           (SELECT ca.country_iso3code FROM country_alias AS ca
+                             WHERE unaccent(lower(ca.country_name_alias)) = unaccent(lower(n.name)) LIMIT 1),
+                           (SELECT cgi.country_iso3code FROM country_general_info AS cgi
+                             WHERE unaccent(lower(cgi.country_name)) = unaccent(lower(n.name)) OR cgi.country_iso3code = upper(n.name) LIMIT 1)
+                       )
+                FROM unnest(%s::TEXT[]) WITH ORDINALITY AS n(name, position)
+                ORDER BY n.position;
+            """, (country_names,))
+            rows = self.cursor.fetchall()
+            self.connection.commit()
+        except (Exception, psycopg.DatabaseError) as e:
+            self.connection.rollback()
+            raise DatabaseError(f"Something went wrong with resolving the country names '{', '.join(country_names)}'. Error type: {type(e).__name__}, error message: '{e}'.")
+        iso3codes = list(dict.fromkeys(code for _, code in rows if code)) # "UK" and "United Kingdom" are one country
+        return iso3codes, [name for name, code in rows if not code]
+
+    def get_indicators_without_countries(self, country_iso3codes: list[str]):
+        """ids of the indicators whose coverage statistics show no data for any of the countries (indicators without statistics are not included)"""
+        return set(self._fetch_column("SELECT indicator_id FROM wb_indicator_coverage_stats WHERE NOT (country_iso3codes && %s::TEXT[]);",
+                                      (list(country_iso3codes),), what = "the indicators without data for the countries"))
+
+    def discard_indicator_coverage(self, indicator_id: str):
+        """forget the running coverage of an indicator whose stream starts over (its rows are written again)"""
+        self._coverage.pop(indicator_id, None)
+
+    def _fetch_column(self, query: str, params = None, what: str = "the data"):
+        try:
+            self.cursor.execute(query, params)
+            values = [row[0] for row in self.cursor.fetchall()]
+            self.connection.commit()
+            return values
+        except (Exception, psycopg.DatabaseError) as e:
+            self.connection.rollback()
+            raise DatabaseError(f"Something went wrong with getting {what}. Error type: {type(e).__name__}, error message: '{e}'.")
+
+#######################################
+# Fact streaming
+#######################################
+def plan_indicator_batches(indicator_ids, batch_info: dict, entity_count: int, max_rows: int = wb_batch_max_rows,
+                           max_indicators: int = wb_batch_max_indicators, current_year: int | None = None):
+    """
+    this generator groups small indicators of the same source into multi-indicator requests, as the ids arrive
+    - the API returns a row for every entity (countries + aggregates) and year of the requested range, null or not, so a combined
+      request only saves transfer when its date range is bounded: it starts at the earliest first year with data of its indicators
+      (from the coverage statistics of earlier runs) and its size is estimated as indicators x entities x years
+    - indicators without coverage statistics or too large for one request are yielded alone
+    :return: yields (source id, list of indicator ids, date range 'from:to') - source id and date range are None for single indicators
+    """
+    current_year = current_year or datetime.now().year
+    pending = {} # source id -> (indicator ids, earliest first year)
+
+    def _rows(n, first_year):
+        return n * entity_count * (current_year - first_year + 1)
 
-    # threaded fetch + main-thread streaming inserts
-    max_workers = int(os.getenv("WB_MAX_WORKERS", "8"))
+    for indicator in indicator_ids:
+        info = batch_info.get(indicator)
+        if info is None or _rows(1, info[1]) > max_rows:
+            yield None, [indicator], None
+            continue
+        source_id, first_year = info
+        ids, batch_first_year = pending.get(source_id, ([], first_year))
+        if ids and (len(ids) >= max_indicators or _rows(len(ids) + 1, min(batch_first_year, first_year)) > max_rows):
+            yield source_id, ids, f"{batch_first_year}:{current_year}"
+            ids, batch_first_year = [], first_year
+        pending[source_id] = (ids + [indicator], min(batch_first_year, first_year))
+    for source_id, (ids, batch_first_year) in pending.items():
+        if len(ids) == 1:
+            yield None, ids, None
+        else:
+            yield source_id, ids, f"{batch_first_year}:{current_year}"
+
+def stream_indicator_facts(wb_api_db: ApiDB, indicator_ids, country_iso3codes: list[str], max_workers: int = 8, governor: MemoryGovernor | None = None,
+                           batch_indicators: bool = wb_batch_indicators, target_countries: list[str] | None = None,
+                           start_pages: dict | None = None, attempts: int = wb_fetch_attempts, load_source: str = "api_logger"):
+    """
+    this function fetches the facts of many indicators on worker threads and inserts them on the calling thread as they arrive
+    - indicator_ids can be any iterable, also one which is still growing (a Channel fed by the catalogue stage): every id is submitted
+      as soon as it arrives, so the first indicators are streamed while the rest of the catalogue is still loading
+    - every fact row written carries the id of this run's load_batch (change data capture)
+    - batch_indicators (WB_BATCH_INDICATORS): small indicators of the same source share one request (see plan_indicator_batches)
+    - target_countries: only these iso3 codes are requested ('/country/AUT;DEU/...'), and indicators whose coverage statistics
+      show none of them are skipped - such a partial load leaves the coverage statistics as they are
+    - an indicator which fails after a few quick attempts goes to the dead-letter table (wb_fetch_dead_letter) with the page it
+      stopped at, a later successful load of it removes the record
+    :param start_pages: indicator id -> page to resume at (retry pass), the coverage statistics of resumed indicators are rebuilt
+                        from the fact table afterwards
+    :param attempts: requests per page
+    :return: number of rows inserted / updated
+    """
     q = Queue(maxsize = 16) # backpressure to keep memory in check
     stop = Event()
+    # memory governor: byte budget for the chunks in flight (WB_INFLIGHT_MB) + fewer concurrent page fetches near the RSS budget (WB_RSS_BUDGET_MB)
+    governor = governor or MemoryGovernor.from_env(max_fetches = max_workers)
+    futures = []
+
+    def _feed(ex):
+        """submit every indicator (or batch) as it arrives, then put (None, None, number of indicators) --> the consumer knows when it's done"""
+        seen = set()
+        submitted = 0
+
+        def _new_ids():
+            for indicator in indicator_ids:
+                if stop.is_set():
+                    break
+                if indicator in skipped:
+                    continue
+                if indicator not in seen:
+                    seen.add(indicator)
+                    yield indicator
+        try:
+            if batch_info is not None:
+                for source_id, ids, date in plan_indicator_batches(_new_ids(), batch_info, entity_count = entity_count):
+                    if source_id is None:
+                        futures.append(ex.submit(_producer_fetch_indicator, ids[0], q, stop, country_iso3codes, None, governor, target_countries,
+                                                 start_pages.get(ids[0], 1), attempts))
+                    else:
+                        futures.append(ex.submit(_producer_fetch_indicator_batch, ids, source_id, date, q, stop, country_iso3codes, governor,
+                                                 target_countries))
+                    submitted += len(ids)
+            else:
+                for indicator in _new_ids():
+                    futures.append(ex.submit(_producer_fetch_indicator, indicator, q, stop, country_iso3codes, None, governor, target_countries,
+                                             start_pages.get(indicator, 1), attempts))
+                    submitted += 1
+        finally:
+            q.put((None, None, submitted)) # every submitted indicator ends with its own end marker, also within a batch
+
+    # read on this thread, the db connection belongs to the consumer
+    start_pages = start_pages or {}
+    batch_info = wb_api_db.get_indicator_batch_info() if batch_indicators else None
+    dead_letters = wb_api_db.get_dead_letters() # to clear the records of indicators which load now
+    # all countries: countries + ~50 aggregates (the API doesn't leave the aggregates out), targeted: only the requested countries
+    entity_count = len(target_countries) if target_countries else len(country_iso3codes) + 50
+    skipped = set()
+    if target_countries:
+        country_iso3codes = [code for code in country_iso3codes if code in set(target_countries)]
+        skipped = wb_api_db.get_indicators_without_countries(target_countries)
+        print(f"--- Targeted ingest of {len(target_countries)} countries ({', '.join(target_countries)}): "
+              f"{len(skipped)} indicators without data for them are skipped ₍^. .^₎⟆ ---\n")
+
+    # change data capture: every fact row written by this run carries the batch id
+    wb_api_db.begin_load_batch(load_source)
 
     # start producers (fetchers)
     with ThreadPoolExecutor(max_workers = max_workers) as ex:
-        futures = [
-            ex.submit(_producer_fetch_indicator, ind, q, stop, country_iso3codes, None)
-            for ind in indicator_ids
-        ]
+        Thread(target = _feed, args = (ex,), name = "indicator-feeder", daemon = True).start()
 
         finished = 0
+        expected = None # number of indicator streams, known once the feeder has seen all indicators
         total_rows = 0
+        failed, recovered, resumed = set(), [], []
         with tqdm(desc = "DB inserts", unit = "rows") as pbar:
-            while finished < len(futures):
-                indicator, df_chunk = q.get()
+            while expected is None or finished < expected:
+                indicator, df_chunk, chunk_nbytes = q.get()
+                queue_depth.set(q.qsize())
+                queue_depth_samples.observe(q.qsize())
+                if indicator is None:
+                    expected = chunk_nbytes
+                    continue
+                if df_chunk is restart_stream: # a failed batch fetches the indicator again on its own
+                    wb_api_db.discard_indicator_coverage(indicator)
+                    continue
+                if isinstance(df_chunk, WBRequestError): # the fetch failed, its end marker follows
+                    failed.add(indicator)
+                    try:
+                        # page numbers of a targeted run don't match those of country/all --> a targeted retry starts over
+                        wb_api_db.add_dead_letter(indicator, df_chunk, failed_page = 1 if target_countries else df_chunk.page)
+                    except DatabaseError as e:
+                        print(f"[DB] {indicator}: {type(e).__name__} - {e}")
+                    continue
                 if df_chunk is None:
                     finished += 1
+                    if indicator in failed: # partially loaded, the statistics of this stream are incomplete
+                        wb_api_db.discard_indicator_coverage(indicator)
+                        continue
+                    if indicator in dead_letters:
+                        recovered.append(indicator)
+                    if start_pages.get(indicator, 1) > 1: # resumed: this run saw only the last pages
+                        wb_api_db.discard_indicator_coverage(indicator)
+                        resumed.append(indicator)
+                        continue
+                    if target_countries:
+                        wb_api_db.discard_indicator_coverage(indicator) # only some countries were loaded, the statistics describe all
+                        continue
+                    try:
+                        wb_api_db.flush_indicator_coverage([indicator]) # the indicator's stream is complete
+                    except DatabaseError as e:
+                        print(f"[DB] {indicator}: {type(e).__name__} - {e}")
                     continue
                 try:
                     wb_api_db.add_data_to_wb_indicator_country_year_value_table(df_chunk)
@@ -839,35 +1280,418 @@ if __name__ == "__main__":
                     pbar.update(n)
                 except (Exception, psycopg.DatabaseError) as e:
                     print(f"[DB] {indicator}: {type(e).__name__} - {e}")
+                finally:
+                    del df_chunk
+                    governor.release(chunk_nbytes)
 
         # surface any worker exceptions after consumption
         for f in futures:
             ex_err = f.exception()
             if ex_err:
                 stop.set()
+                wb_api_db.finish_load_batch(total_rows, status = "failed")
                 raise ex_err
 
-    print(f"\nStreaming insert complete. Total rows inserted/updated: {total_rows} ദ്ദി（• ˕ •マ.ᐟ \n")
-
-    # for indicator in indicator_ids:
-    #     df = get_indicator_allcountries(
-    #         indicator_id = indicator,
-    #         # date = "1960:2024",
-    #         valid_country_iso3codes = country_iso3codes
-    #     )
-    #     df = df.dropna(subset = ["value"]) # drop nulls to keep table clean and save storage
-    #
-    #     if df is None or df.empty:
-    #         print(f"Indicator {indicator} returned no data --> skipping.")
-    #         continue
-    #
-    #     print(f"Inserting {len(df)} rows for indicator {indicator} ...")
-    #     try:
-    #         wb_api_db.add_data_to_wb_indicator_country_year_value_table(df)
-    #     except (Exception, psycopg.DatabaseError) as e:
-    #         print(f"Something went wrong with adding the data for the indicator {indicator} to the table. Error type: {type(e).__name__}, error message: '{e}'.")
-    #         continue # skip this indicator and move on
-
-    wb_api_db.close_connection()
+    wb_api_db.finish_load_batch(total_rows)
+    if recovered:
+        wb_api_db.clear_dead_letters(recovered)
+    if resumed and not target_countries:
+        wb_api_db.rebuild_indicator_coverage_stats(resumed)
+    print(f"\nStreaming insert complete. Total rows inserted/updated of {expected} indicators: {total_rows} ദ്ദി（• ˕ •マ.ᐟ \n")
+    if failed:
+        print(f"..!!.. {len(failed)} indicators failed and were recorded in 'wb_fetch_dead_letter' (the 'retry_failed' stage retries them) ₍^. .^₎Ⳋ\n")
+    governor.print_report() # high-water marks of the run
+    return total_rows
 
+#######################################
+# Pipeline stages
+#######################################
+other_country_aliases = [
+    ('Macedonia', 'MKD'),
+    ('Czech Republic', 'CZE'),
+    ('Czechia', 'CZE'),
+    ('United Kingdom', 'GBR'),
+    ('Great Britain', 'GBR'),
+    ('UK', 'GBR'),
+    ('Russian Federation', 'RUS'),
+    ('Russia', 'RUS'),
+    ('Kosovo', 'XKX'),
+    ('Turkiye', 'TUR'),
+    ('Turkey', 'TUR'),
+    ('Hong Kong', 'HKG'),
+    ('Hong Kong SAR of China', 'HKG'),
+    ("Republic of Korea", "KOR"),
+    ("Republic of Moldova", "MDA"),
+    ("DR Congo", "COD"),
+    ("North Cyprus", "CYP"),
+    ("Somaliland Region", "SOM"),
+    ("Venezuela", "VEN"),
+    ("South Korea", "KOR"),
+    ("Vietnam", "VNM"),
+    ("Egypt", "EGY"),
+    ("Ivory Coast", "CIV"),
+    ("Slovakia", "SVK"),
+    ("Yemen", "YEM"),
+    ("Gambia", "GMB"),
+    ("Iran", "IRN"),
+    ("Kyrgyzstan", "KGZ"),
+    ("Syria", "SYR"),
+    ("Democratic Republic of the Congo", "COD"),
+    ("Laos", "LAO"),
+    ("Somalia", "SOM"),
+    ("Cape Verde", "CPV"),
+    ("Republic of the Congo", "COG"),
+    ("Saint Lucia", "LCA"),
+    ("Saint Vincent and the Grenadines", "VCT"),
+    ("North Korea", "PRK"),
+    ("Bahamas", "BHS"),
+    ("FYR Macedonia", "MKD"),
+    ("Guinea Bissau", "GNB"),
+    ("Swaziland", "SWZ"),
+    ("Timor Leste", "TLS"),
+    ("Macau", "MAC"),
+    ("Congo", "COG"),
+    ("Puerto Rico", "PRI"),
+    ("Palestine", "PSE")
+]
+# unresolved: ("Serbia and Montenegro", ""), ("State of Palestine", ""), ("Taiwan", "TWN"), ("Taiwan Province of China", "TWN"), ("FR Yugoslavia", "YUG"), and ("Congo", "COG / COD")
+
+def _with_own_db(stage_function):
+    """every stage runs on its own thread --> its own db connection (psycopg connections must not be shared between threads)"""
+    def run(ctx):
+        wb_api_db = ApiDB()
+        try:
+            return stage_function(ctx, wb_api_db)
+        finally:
+            wb_api_db.close_connection()
+    return run
+
+def _snapshot_rows(snapshot: DimensionSnapshot, dimension: str):
+    """the rows of the dimension snapshot when the API request failed"""
+    rows = snapshot.get(dimension)
+    if not rows:
+        raise ValueError(f"Couldn't fetch the WB {dimension} and there's no dimension snapshot of them!")
+    print(f"..!!.. Couldn't fetch the WB {dimension}, using the {len(rows)} rows of the dimension snapshot {snapshot.version}\n")
+    return rows
+
+def _persist_dimension(wb_api_db, dimension: str, rows, table_name: str, persist):
+    """
+    run persist() (the upserts of a dimension) only if the rows differ from the ones written last time (wb_dimension_state)
+    :return: True if the rows were written
+    """
+    content_hash = dimension_hash(dimension, rows)
+    if wb_api_db.dimension_unchanged(dimension, content_hash, table_name):
+        dimension_upserts_skipped_total.inc(dimension = dimension)
+        print(f"--- The {dimension} are unchanged since they were written last time --> no upserts (•˕•マ.ᐟ ---\n")
+        return False
+    persist()
+    wb_api_db.save_dimension_state(dimension, content_hash, len(rows[0] if dimension == "indicators" else rows))
+    return True
+
+def _persist_countries(wb_api_db, country_rows):
+    wb_api_db.add_data_to_staging_country_general_info_table(country_rows)
 
+    normalised_api_data_region = [(country_tuple[4], country_tuple[5], country_tuple[3]) for country_tuple in country_rows]
+    wb_api_db.add_data_to_region_table(normalised_api_data_region)
+
+    normalised_api_data_country_general = [(country_tuple[0], country_tuple[1], country_tuple[2], country_tuple[4], country_tuple[6], country_tuple[7], country_tuple[8], country_tuple[9]) for country_tuple in country_rows]
+    wb_api_db.add_data_to_country_general_info_table(normalised_api_data_country_general)
+
+    normalised_api_data_alias = [(country_tuple[2], country_tuple[0]) for country_tuple in country_rows]
+    wb_api_db.add_data_to_country_alias_table(normalised_api_data_alias)
+
+def _persist_other_country_aliases(wb_api_db):
+    print("Adding additional country aliases...")
+    wb_api_db.add_data_to_country_alias_table(other_country_aliases)
+
+def stage_snapshot(ctx):
+    return {"dimension_snapshot": DimensionSnapshot.from_env()}
+
+def stage_countries(ctx, wb_api_db):
+    snapshot = ctx["dimension_snapshot"]
+    fetched = get_country_general_info()
+    if fetched and fetched[0]:
+        country_rows = fetched[0]
+        snapshot.set("countries", country_rows)
+    else:
+        country_rows = _snapshot_rows(snapshot, "countries")
+    _persist_dimension(wb_api_db, "countries", country_rows, "staging_country_general_info", partial(_persist_countries, wb_api_db, country_rows))
+    _persist_dimension(wb_api_db, "country_aliases", other_country_aliases, "country_alias", partial(_persist_other_country_aliases, wb_api_db))
+    return {"country_iso3codes": list(dict.fromkeys(country_tuple[0] for country_tuple in country_rows))}
+
+def stage_country_report(ctx, wb_api_db):
+    display_all = os.getenv("DISPLAY_ALL_EU_COUNTRIES_INFO", "false").strip().lower() in ("1", "true", "yes")
+    if display_all:
+        wb_api_db.get_all_eu_countries_info()
+    else:
+        print(f"\n--- The user does not wish to display all European countries' general info (•́ ᴖ •̀) ---")
+        print("--- (if you changed your mind, change the var DISPLAY_ALL_EU_COUNTRIES_INFO to 'true' in 'docker compose' - service 'app_base' environment.) ---")
+
+    names = os.getenv("COUNTRIES_OF_INTEREST", "").strip()
+    if names:
+        wb_api_db.get_country_info(names)
+    else:
+        print("\n--- Printing general country info for the countries of interest: No info about countries of interest was given ^. .^₎⟆ ---")
+
+def stage_topics(ctx, wb_api_db):
+    snapshot = ctx["dimension_snapshot"]
+    wb_topics_rows = get_all_wb_topics()
+    if wb_topics_rows:
+        snapshot.set("topics", wb_topics_rows)
+    else:
+        wb_topics_rows = _snapshot_rows(snapshot, "topics")
+    _persist_dimension(wb_api_db, "topics", wb_topics_rows, "wb_topics", partial(wb_api_db.add_data_to_wb_topics_table, wb_topics_rows))
+    return {"topic_ids": [row[0] for row in wb_topics_rows]}
+
+def stage_sources(ctx, wb_api_db):
+    snapshot = ctx["dimension_snapshot"]
+    fetched = get_all_wb_sources()
+    if fetched and fetched[0]:
+        wb_sources_rows = fetched[0]
+        snapshot.set("sources", wb_sources_rows)
+    else:
+        wb_sources_rows = _snapshot_rows(snapshot, "sources")
+    _persist_dimension(wb_api_db, "sources", wb_sources_rows, "wb_source", partial(wb_api_db.add_data_to_wb_source_table, wb_sources_rows))
+    return {"source_ids": list(dict.fromkeys(row[0] for row in wb_sources_rows))}
+
+def _persist_indicators(wb_api_db, wb_indicators_rows, indicator_topics_rows):
+    wb_api_db.add_data_to_wb_indicators_table(wb_indicators_rows)
+    wb_api_db.add_data_to_wb_indicator_topics_table(indicator_topics_rows)
+
+def stage_indicators(ctx, wb_api_db):
+    """
+    the indicator catalogue, handed to the fact streaming as soon as its indicators exist in wb_indicators
+    - the catalogue of the dimension snapshot is taken as it is while the sources are unchanged since it was crawled (catalogue_fingerprint)
+    - otherwise it's crawled again while the facts of the snapshot's indicators already load: sources whose indicators changed are
+      persisted, and their new indicators are handed on right after
+    """
+    snapshot = ctx["dimension_snapshot"]
+    indicator_ids = Channel()
+    ctx.publish("indicator_ids", indicator_ids) # the fact streaming starts with the snapshot / the first source
+    fingerprint = catalogue_fingerprint(snapshot.get("sources")) if "sources" in snapshot.refreshed else None # not refreshed: crawl to be sure
+
+    known_rows, known_topic_rows = snapshot.get("indicators") or ([], [])
+    if known_rows:
+        _persist_dimension(wb_api_db, "indicators", (known_rows, known_topic_rows), "wb_indicators",
+                           partial(_persist_indicators, wb_api_db, known_rows, known_topic_rows))
+        indicator_ids.extend(list(dict.fromkeys(row[0] for row in known_rows)))
+        if fingerprint is not None and fingerprint == snapshot.fingerprint:
+            print(f"--- The WB sources are unchanged since the catalogue of the dimension snapshot was crawled ({len(known_rows)} indicators) --> no crawl ദ്ദി（• ˕ •マ.ᐟ ---\n")
+            return {"indicator_catalogue": len(known_rows)}
+        print(f"--- The WB sources changed since the catalogue of the dimension snapshot was crawled: crawling it again while the facts of its "
+              f"{len(known_rows)} indicators load ₍^. .^₎⟆ ---\n")
+    known_ids = {row[0] for row in known_rows}
+    known_keys = {(row[0], row[1], row[3]) for row in known_rows} # without the source: shared indicators are stored with the lowest source id
+    known_topics = set(known_topic_rows)
+    unpersisted_sources = [] # sources whose indicators couldn't be written: the catalogue state must not claim them
+
+    def _on_source(source_id, indicators_df):
+        wb_indicators_rows = plain_rows(indicators_df.drop(columns = ["topics"]).replace({np.nan: None}).itertuples(index = False, name = None))
+        indicator_topics_rows = _indicator_topic_rows(indicators_df)
+        if any((row[0], row[1], row[3]) not in known_keys for row in wb_indicators_rows) or not known_topics.issuperset(plain_rows(indicator_topics_rows)):
+            try:
+                _persist_indicators(wb_api_db, wb_indicators_rows, indicator_topics_rows)
+            except DatabaseError as e:
+                print(f"[DB] source {source_id}: {type(e).__name__} - {e}")
+                unpersisted_sources.append(source_id)
+                return
+        # only once they exist (the facts reference wb_indicators), the snapshot's indicators are already on their way
+        indicator_ids.extend([indicator for indicator in indicators_df["indicator_id"].unique().tolist() if indicator not in known_ids])
+
+    wb_indicators_rows, _, indicator_topics_rows, failed_sources, _ = get_all_wb_indicators(ctx["source_ids"], on_source = _on_source)
+    if not wb_indicators_rows:
+        return {"indicator_catalogue": len(known_rows)}
+    if failed_sources: # keep the snapshot's indicators of the sources which failed, and crawl again next time (no fingerprint)
+        crawled = {row[0] for row in wb_indicators_rows}
+        kept = [row for row in known_rows if row[2] in failed_sources and row[0] not in crawled]
+        kept_ids = {row[0] for row in kept}
+        wb_indicators_rows = list(wb_indicators_rows) + kept
+        indicator_topics_rows = list(indicator_topics_rows) + [row for row in known_topic_rows if row[0] in kept_ids]
+        fingerprint = None
+    if unpersisted_sources:
+        fingerprint = None # crawl again next time
+    catalogue = (wb_indicators_rows, indicator_topics_rows)
+    snapshot.set("indicators", catalogue, fingerprint)
+    if unpersisted_sources: # no state: the next run upserts the whole catalogue instead of skipping it as unchanged
+        print(f"..!!.. The indicators of {len(unpersisted_sources)} sources ({', '.join(map(str, unpersisted_sources))}) couldn't be written, "
+              f"they are written again in the next run ₍^. .^₎Ⳋ\n")
+    else:
+        wb_api_db.save_dimension_state("indicators", dimension_hash("indicators", catalogue), len(wb_indicators_rows)) # persisted source by source
+    return {"indicator_catalogue": len(wb_indicators_rows)}
+
+def stage_snapshot_save(ctx):
+    """write a new version of the dimension snapshot once all dimensions are refreshed (only if something changed)"""
+    try:
+        ctx["dimension_snapshot"].save()
+    except OSError as e:
+        print(f"..!!.. Couldn't write the dimension snapshot: {type(e).__name__} - {e}\n")
+
+def _target_countries(wb_api_db):
+    """iso3 codes of the COUNTRIES_OF_INTEREST (resolved in the fact stages, after the countries stage has stored the aliases)"""
+    names = os.getenv("COUNTRIES_OF_INTEREST", "").strip()
+    target_countries, unresolved = wb_api_db.resolve_country_names(names)
+    if unresolved:
+        print(f"--- Couldn't resolve the countries of interest {unresolved} (add them to the country aliases), they're left out (•́ ᴖ •̀) ---")
+    if not target_countries:
+        raise ValueError(f"None of the countries of interest '{names}' could be resolved, nothing to load for a targeted ingest!")
+    return target_countries
+
+def stage_facts(ctx, wb_api_db, indicator_filter: set | None = None, max_workers: int = 8, target_countries_only: bool = False):
+    indicator_ids = ctx["indicator_ids"]
+    if indicator_filter is not None:
+        indicator_ids = (indicator for indicator in indicator_ids if indicator in indicator_filter)
+    target_countries = _target_countries(wb_api_db) if target_countries_only else None
+    if wb_engine == "async":
+        from async_engine import stream_indicator_facts_async # only imported when selected (needs httpx)
+        if wb_batch_indicators:
+            print("--- WB_BATCH_INDICATORS is a feature of the threaded engine, the async engine requests every indicator on its own ---\n")
+        return {"fact_rows": stream_indicator_facts_async(wb_api_db, indicator_ids, ctx["country_iso3codes"], target_countries = target_countries)}
+    if wb_engine != "threads":
+        raise ValueError(f"Unknown WB_ENGINE '{wb_engine}' (expected 'threads' or 'async')!")
+    return {"fact_rows": stream_indicator_facts(wb_api_db, indicator_ids, ctx["country_iso3codes"], max_workers, target_countries = target_countries)}
+
+def stage_bulk_facts(ctx, wb_api_db, archive: str, member: str | None = None, indicator_filter: set | None = None,
+                     target_countries_only: bool = False):
+    """the facts from a bulk archive (one sequential read) instead of one request per indicator page"""
+    indicator_ids = set(ctx["indicator_ids"]) # the whole catalogue, the fact table references it
+    if indicator_filter is not None:
+        indicator_ids &= indicator_filter
+    countries = _target_countries(wb_api_db) if target_countries_only else ctx["country_iso3codes"]
+    return {"fact_rows": ingest_bulk_archive(wb_api_db, archive, countries, indicator_ids, member, headers = headers_default,
+                                             update_coverage = not target_countries_only)}
+
+def stage_retry_failed(ctx, wb_api_db, target_countries_only: bool = False):
+    """the deferred retry pass: the dead-letter indicators resume at their failed page, with fewer workers and more attempts"""
+    dead_letters = wb_api_db.get_dead_letters()
+    if not dead_letters:
+        print("--- No failed indicators to retry ദ്ദി（• ˕ •マ.ᐟ ---\n")
+        return {"retried_rows": 0}
+    print(f"--- Retrying {len(dead_letters)} failed indicators ({wb_retry_workers} at a time, {wb_retry_attempts} attempts per page) ₍^. .^₎⟆ ---\n")
+    target_countries = _target_countries(wb_api_db) if target_countries_only else None
+    return {"retried_rows": stream_indicator_facts(wb_api_db, list(dead_letters), ctx["country_iso3codes"], wb_retry_workers,
+                                                   batch_indicators = False, target_countries = target_countries, start_pages = dead_letters,
+                                                   attempts = wb_retry_attempts, load_source = "api_logger:retry")}
+
+def stage_coverage_rebuild(ctx, wb_api_db):
+    wb_api_db.rebuild_indicator_coverage_stats()
+
+# fallbacks: what an earlier run stored, for runs without the stages which fetch it
+def stage_previous_facts(ctx):
+    """the facts were loaded by earlier runs (e.g. '--stages retry_failed' alone), nothing was loaded in this run"""
+    return {"fact_rows": 0}
+
+def stage_stored_countries(ctx, wb_api_db):
+    return {"country_iso3codes": wb_api_db.get_country_iso3codes()}
+
+def stage_stored_topics(ctx, wb_api_db):
+    return {"topic_ids": wb_api_db.get_topic_ids()}
+
+def stage_stored_sources(ctx, wb_api_db):
+    return {"source_ids": wb_api_db.get_source_ids()}
+
+def stage_stored_indicators(ctx, wb_api_db, indicator_filter: set | None = None):
+    indicator_ids = wb_api_db.get_indicator_ids(sorted(indicator_filter) if indicator_filter is not None else None)
+    if indicator_filter is not None and len(indicator_ids) < len(indicator_filter):
+        print(f"..!!.. Indicators which aren't in the catalogue (run the 'indicators' stage first) --> skipping: {sorted(indicator_filter - set(indicator_ids))}\n")
+    channel = Channel()
+    channel.extend(indicator_ids)
+    return {"indicator_ids": channel}
+
+stage_groups = {
+    "dimensions": ["countries", "country_report", "topics", "sources", "indicators", "snapshot_save"],
+    "facts": ["facts", "retry_failed"],
+}
+
+def api_logger_stages(indicator_filter: set | None = None, max_workers: int = 8, rebuild_coverage: bool = False, target_countries_only: bool = False,
+                      bulk_archive: str | None = None, bulk_member: str | None = None):
+    """
+    the stages of an api_logger run and what they need / provide:
+    snapshot loads the dimension snapshot, which countries, topics, sources and indicators start from / refresh (snapshot_save writes it);
+    countries, topics and sources are independent; indicators need sources and topics; facts need countries and the (streamed) indicator ids;
+    retry_failed retries the dead-letter indicators after the facts (or alone, for those of earlier runs)
+    - bulk_archive: the facts stage reads this bulk archive (local path or url) instead of the API
+    """
+    if bulk_archive:
+        facts = partial(stage_bulk_facts, archive = bulk_archive, member = bulk_member, indicator_filter = indicator_filter,
+                        target_countries_only = target_countries_only)
+    else:
+        facts = partial(stage_facts, indicator_filter = indicator_filter, max_workers = max_workers, target_countries_only = target_countries_only)
+    stages = [
+        Stage("snapshot", stage_snapshot, outputs = ["dimension_snapshot"]),
+        Stage("countries", _with_own_db(stage_countries), inputs = ["dimension_snapshot"], outputs = ["country_iso3codes"]),
+        Stage("country_report", _with_own_db(stage_country_report), inputs = ["country_iso3codes"]),
+        Stage("topics", _with_own_db(stage_topics), inputs = ["dimension_snapshot"], outputs = ["topic_ids"]),
+        Stage("sources", _with_own_db(stage_sources), inputs = ["dimension_snapshot"], outputs = ["source_ids"]),
+        Stage("indicators", _with_own_db(stage_indicators), inputs = ["dimension_snapshot", "source_ids", "topic_ids"],
+              outputs = ["indicator_ids", "indicator_catalogue"]),
+        Stage("snapshot_save", stage_snapshot_save, inputs = ["dimension_snapshot", "country_iso3codes", "topic_ids", "source_ids", "indicator_catalogue"]),
+        Stage("facts", _with_own_db(facts), inputs = ["country_iso3codes", "indicator_ids"], outputs = ["fact_rows"]),
+        Stage("retry_failed", _with_own_db(partial(stage_retry_failed, target_countries_only = target_countries_only)),
+              inputs = ["country_iso3codes", "fact_rows"], outputs = ["retried_rows"]), # after the main pass
+        Stage("previous_facts", stage_previous_facts, outputs = ["fact_rows"], fallback = True),
+        Stage("stored_countries", _with_own_db(stage_stored_countries), outputs = ["country_iso3codes"], fallback = True),
+        Stage("stored_topics", _with_own_db(stage_stored_topics), outputs = ["topic_ids"], fallback = True),
+        Stage("stored_sources", _with_own_db(stage_stored_sources), outputs = ["source_ids"], fallback = True),
+        Stage("stored_indicators", _with_own_db(partial(stage_stored_indicators, indicator_filter = indicator_filter)),
+              outputs = ["indicator_ids"], fallback = True),
+    ]
+    if rebuild_coverage: # full rebuild of the coverage statistics (e.g. after manual edits of the fact table)
+        stages.append(Stage("coverage_rebuild", _with_own_db(stage_coverage_rebuild), inputs = ["fact_rows"]))
+    return stages
+
+def select_stages(stages_arg: str | None, indicators_arg: str | None):
+    """
+    --stages: comma-separated stage or group names ('dimensions', 'facts'), default: everything
+    --indicators alone: only the facts of these indicators (the rest is read from the db)
+    """
+    if stages_arg:
+        selected = []
+        for name in [name.strip() for name in stages_arg.split(",") if name.strip()]:
+            selected.extend(stage_groups.get(name, [name]))
+        return list(dict.fromkeys(selected))
+    if indicators_arg:
+        return ["facts"]
+    return None
+
+#######################################
+# Run the API requests
+#######################################
+if __name__ == "__main__":
+    print("Hello from api_logger!")
+    parser = argparse.ArgumentParser(description = "load the World Bank dimensions and facts (independent stages run concurrently)")
+    parser.add_argument("--stages", default = None,
+                        help = f"comma-separated stages or groups {sorted(stage_groups)} to run, default: all (missing inputs are read from the db)")
+    parser.add_argument("--indicators", default = None, help = "comma-separated indicator ids: only load the facts of these indicators")
+    parser.add_argument("--workers", type = int, default = int(os.getenv("WB_MAX_WORKERS", "8")), help = "concurrent indicator fetches")
+    parser.add_argument("--bulk-archive", default = os.getenv("WB_BULK_ARCHIVE", "") or None,
+                        help = "path or url of a WB bulk csv / zip archive (e.g. WDI_CSV.zip): the facts are read from it instead of the API")
+    parser.add_argument("--bulk-member", default = None, help = "csv of the archive to read, default: the largest one with year columns")
+    parser.add_argument("--list-stages", action = "store_true", help = "print the stages and exit")
+    args = parser.parse_args()
+
+    indicator_filter = {indicator.strip() for indicator in args.indicators.split(",") if indicator.strip()} if args.indicators else None
+    # change the following var to true/yes/1 to rebuild the indicator coverage statistics from the whole fact table after the load
+    rebuild_coverage = os.getenv("REBUILD_COVERAGE_STATS", "false").strip().lower() in ("1", "true", "yes")
+    # change the following var to true/yes/1 to load the facts of the COUNTRIES_OF_INTEREST only (instead of all countries)
+    target_countries_only = os.getenv("WB_COUNTRIES_OF_INTEREST_ONLY", "false").strip().lower() in ("1", "true", "yes")
+    stages = api_logger_stages(indicator_filter, args.workers, rebuild_coverage, target_countries_only, args.bulk_archive, args.bulk_member)
+    if args.list_stages:
+        for stage in stages:
+            print(f"{stage.name:<20} {'(fallback) ' if stage.fallback else ''}needs {list(stage.inputs)} --> provides {list(stage.outputs)}")
+        raise SystemExit(0)
+
+    start_metrics_server_from_env()
+    # change the env var PROFILE_MODE (e.g. 'timing' or 'all') to profile every stage of the run into PROFILE_DIR
+    profiler = StageProfiler.from_env("api_logger")
+
+    ctx, results = run_stages(stages, select_stages(args.stages, args.indicators), profiler = profiler)
+
+    # final metrics summary (json) next to the prometheus endpoint
+    metrics_summary_path = os.getenv("METRICS_SUMMARY_PATH", "/data/metrics/api_logger_summary.json")
+    if metrics_summary_path:
+        registry.write_summary(metrics_summary_path)
+        print(f"--- Metrics summary written to '{metrics_summary_path}' ₍^. .^₎⟆ ---\n")
+    profiler.finish()
+
+    if any(result["status"] != "ok" for result in results.values()):
+        raise SystemExit(1)
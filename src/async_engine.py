@@ -0,0 +1,313 @@
+# imports
+import os # part of python standard library
+import time # part of python standard library
+import asyncio # part of python standard library
+from threading import Event, Thread # part of python standard library
+import httpx
+import psycopg
+import pandas as pd
+from tqdm.auto import tqdm
+from save_data import DBPostgres, DatabaseError
+from politeness import AsyncDomainGate
+from memory_governor import AsyncMemoryGovernor, chunk_bytes
+from wb_fetch import (WBRequestError, headers_default, wb_fetch_attempts, indicator_data_url, api_refused, transform_indicator_page,
+                      _endpoint_name, http_request_seconds, http_responses_total, http_bytes_total, db_batch_seconds, db_rows_total,
+                      queue_depth, queue_depth_samples)
+
+#######################################
+# Async ingestion engine (WB_ENGINE=async)
+#######################################
+# alternative to the thread pool of stream_indicator_facts: one event loop keeps hundreds of page requests in flight (the pages of an
+# indicator are requested at once as soon as its first page tells how many there are), a few async db connections write the facts
+# - same page transform, same upsert, same load batch, coverage statistics and dead-letter records as the threaded engine
+wb_async_concurrency = int(os.getenv("WB_ASYNC_CONCURRENCY", "100")) # max. requests in flight (the gate starts lower and adapts to 429s), indicators loaded at once
+wb_async_rps = float(os.getenv("WB_ASYNC_RPS", "0")) # max. request starts per second, 0 = no limit besides the concurrency
+wb_async_db_connections = int(os.getenv("WB_ASYNC_DB_CONNECTIONS", "4")) # async connections which write the fact batches
+wb_async_queue_chunks = 64 # parsed pages waiting for a writer (besides the byte budget of the memory governor)
+
+def _resolve(written: asyncio.Future, rows: int):
+    if not written.done(): # cancelled together with its fetcher
+        written.set_result(rows)
+
+class AsyncFactIngest:
+    """
+    one async fact load: a fetcher task per indicator puts its parsed pages on a queue, writer tasks upsert them
+    - all tasks run in asyncio task groups: an unexpected error (or a cancelled run) cancels every request and write in flight,
+      an indicator which fails after its attempts only ends up in the dead-letter table (like in the threaded engine)
+    - bookkeeping through the sync ApiDB of the stage (coverage statistics, dead letters) runs on a worker thread, one call at a time
+    - memory: the pages of all indicators share the fetch slots of an AsyncMemoryGovernor (WB_RSS_BUDGET_MB shrinks them), a page keeps
+      its slot until its parsed chunk fits into the byte budget of the chunks waiting for the writers (WB_INFLIGHT_MB) - so at most
+      fetch-limit pages are downloaded / parsed / held back at once, no matter how many indicators and pages are requested
+    """
+    def __init__(self, wb_api_db, country_iso3codes: list[str], concurrency: int = wb_async_concurrency, rps: float = wb_async_rps,
+                 db_connections: int = wb_async_db_connections, target_countries: list[str] | None = None, start_pages: dict | None = None,
+                 attempts: int = wb_fetch_attempts, dead_letters: dict | None = None, skipped: set | None = None, batch_size: int = 5000,
+                 governor: AsyncMemoryGovernor | None = None):
+        self.wb_api_db = wb_api_db
+        self.country_iso3codes = country_iso3codes
+        self.concurrency = max(concurrency, 1)
+        self.db_connections = max(db_connections, 1)
+        self.target_countries = target_countries
+        self.start_pages = start_pages or {}
+        self.attempts = attempts
+        self.dead_letters = dead_letters or {}
+        self.skipped = skipped or set()
+        self.batch_size = batch_size
+        self.gate = AsyncDomainGate(self.concurrency, 1 / rps if rps > 0 else 0.0)
+        self.governor = governor or AsyncMemoryGovernor.from_env(max_fetches = self.concurrency)
+        self.stop = Event() # ends the thread which reads the indicator ids
+        self.queue = None # created on the event loop (see run)
+        self._db_lock = None
+        self.indicators = 0
+        self.total_rows = 0
+        self.failed, self.recovered, self.resumed = set(), [], []
+
+    # fetch
+    async def _get(self, client: httpx.AsyncClient, url: str, page: int, base_sleep: float = 1.0):
+        """one request with the retries of _get_with_timeoff (429: every request of the loop waits Retry-After and the pace slows down)"""
+        endpoint = _endpoint_name(url)
+        for i in range(self.attempts):
+            async with self.gate.request() as started_at:
+                start = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                except httpx.HTTPError as e:
+                    http_responses_total.inc(endpoint = endpoint, status = "error")
+                    raise WBRequestError(f"{type(e).__name__} - {e}", page = page, attempts = i + 1, error_class = type(e).__name__) from e
+            http_request_seconds.observe(time.perf_counter() - start, endpoint = endpoint)
+            http_responses_total.inc(endpoint = endpoint, status = response.status_code)
+            http_bytes_total.inc(len(response.content), endpoint = endpoint)
+            if response.status_code == 200:
+                self.gate.relax()
+                return response
+            if response.status_code == 429:
+                retry_after = response.headers.get("Retry-After")
+                sleep_s = float(retry_after) if retry_after else base_sleep * (2 ** i)
+                print(f"\n---- HTTP response status 429 received (indicating 'too many requests'). Holding back all requests for {sleep_s:.1f}s and retrying... ----\n")
+                self.gate.back_off(sleep_s, started_at)
+                continue
+            raise WBRequestError(f"status {response.status_code} for {url}", page = page, status = response.status_code, attempts = i + 1)
+        raise WBRequestError(f"gave up after {self.attempts} throttled attempts for {url}", page = page, status = 429, attempts = self.attempts)
+
+    def _parse(self, response: httpx.Response, indicator_id: str, page: int):
+        """json --> fact rows without null values (runs on a worker thread, the loop stays free for the requests)"""
+        response_json = response.json()
+        if api_refused(response_json):
+            raise WBRequestError(f"the API refused {indicator_id} on page {page}: {response_json[0]['message']}", page = page, status = 200)
+        if len(response_json) < 2 or not response_json[1]: # no data
+            return None, None
+        chunk = transform_indicator_page(pd.DataFrame(response_json[1]), indicator_id, self.country_iso3codes)
+        return response_json[0], chunk.dropna(subset = ["value"])
+
+    async def _load_page(self, client: httpx.AsyncClient, indicator_id: str, page: int):
+        """
+        fetch and parse one page and hand it to the writers
+        :return: (meta of the page or None, future of its write or None)
+        """
+        async with self.governor.fetch_slot():
+            response = await self._get(client, indicator_data_url(indicator_id, page, countries = self.target_countries), page)
+            meta, chunk = await asyncio.to_thread(self._parse, response, indicator_id, page)
+            del response
+            if chunk is None or chunk.empty:
+                return meta, None
+            nbytes = chunk_bytes(chunk)
+            await self.governor.reserve(nbytes) # the slot is held until the chunk is admitted: backpressure on the fetches
+        written = asyncio.get_running_loop().create_future()
+        await self.queue.put((indicator_id, chunk, nbytes, written))
+        queue_depth.set(self.queue.qsize())
+        return meta, written
+
+    async def _load_indicator(self, client: httpx.AsyncClient, indicator_id: str, slots: asyncio.Semaphore):
+        """first page (to learn the page count), then all other pages (they wait for the fetch slots of the governor) - a failed page stops the indicator at the lowest failed page"""
+        start_page = self.start_pages.get(indicator_id, 1)
+        writes, error = [], None
+        try:
+            meta, written = await self._load_page(client, indicator_id, start_page)
+            writes.append(written)
+            pages = int(meta.get("pages", 1)) if meta else start_page
+            results = await asyncio.gather(*(self._load_page(client, indicator_id, page) for page in range(start_page + 1, pages + 1)),
+                                           return_exceptions = True)
+            failures = []
+            for result in results:
+                if isinstance(result, WBRequestError):
+                    failures.append(result)
+                elif isinstance(result, Exception):
+                    failures.append(WBRequestError(str(result), page = start_page, error_class = type(result).__name__)) # restart the indicator
+                else:
+                    writes.append(result[1])
+            if failures:
+                raise min(failures, key = lambda failure: failure.page) # the pages before it are loaded
+        except WBRequestError as e:
+            print(f"[worker] {indicator_id}: {e.error_class} - {e}")
+            error = e if e.status != 200 else None # an error message of the API instead of data is an answer: no data
+        except Exception as e:
+            print(f"[worker] {indicator_id}: {type(e).__name__} - {e}")
+            error = WBRequestError(str(e), page = start_page, error_class = type(e).__name__)
+        finally:
+            slots.release()
+        await asyncio.gather(*(written for written in writes if written is not None)) # the indicator's stream ends with its last write
+        await self._finish_indicator(indicator_id, error)
+
+    async def _finish_indicator(self, indicator_id: str, error: WBRequestError | None):
+        """what the consumer of the threaded engine does at the end marker of an indicator"""
+        wb_api_db = self.wb_api_db
+        try:
+            if error is not None:
+                self.failed.add(indicator_id)
+                wb_api_db.discard_indicator_coverage(indicator_id) # partially loaded, the statistics of this stream are incomplete
+                # page numbers of a targeted run don't match those of country/all --> a targeted retry starts over
+                await self._bookkeeping(wb_api_db.add_dead_letter, indicator_id, error, 1 if self.target_countries else error.page)
+                return
+            if indicator_id in self.dead_letters:
+                self.recovered.append(indicator_id)
+            if self.start_pages.get(indicator_id, 1) > 1: # resumed: this run saw only the last pages
+                wb_api_db.discard_indicator_coverage(indicator_id)
+                self.resumed.append(indicator_id)
+                return
+            if self.target_countries:
+                wb_api_db.discard_indicator_coverage(indicator_id) # only some countries were loaded, the statistics describe all
+                return
+            await self._bookkeeping(wb_api_db.flush_indicator_coverage, [indicator_id])
+        except DatabaseError as e:
+            print(f"[DB] {indicator_id}: {type(e).__name__} - {e}")
+
+    async def _bookkeeping(self, func, *args):
+        """a call of the stage's ApiDB on a worker thread (its sync connection must not be used by two threads at once)"""
+        async with self._db_lock:
+            return await asyncio.to_thread(func, *args)
+
+    # write
+    async def _writer(self, connection: psycopg.AsyncConnection, progress_bar, table_name: str = "wb_indicator_country_year_value"):
+        """
+        upsert the queued pages with the fact loader's rows and query (ApiDB.fact_rows / fact_upsert_query) until the end marker (None)
+        - one statement per batch (the rows as column arrays): an async executemany waits for the loop after every row
+        """
+        query = self.wb_api_db.fact_upsert_query(table_name, from_arrays = True)
+        while True:
+            item = await self.queue.get()
+            queue_depth.set(self.queue.qsize())
+            queue_depth_samples.observe(self.queue.qsize())
+            if item is None:
+                return
+            indicator_id, chunk, nbytes, written = item
+            rows = self.wb_api_db.fact_rows(chunk)
+            try:
+                for i in range(0, len(rows), self.batch_size):
+                    batch = rows[i:i + self.batch_size]
+                    columns = [list(column) for column in zip(*batch)][:4] # the batch id is the same in every row
+                    with db_batch_seconds.time():
+                        async with connection.cursor() as cursor:
+                            await cursor.execute(query, [self.wb_api_db.load_batch_id, *columns])
+                        await connection.commit()
+                    db_rows_total.inc(len(batch))
+            except (Exception, psycopg.DatabaseError) as e:
+                await connection.rollback()
+                print(f"[DB] {indicator_id}: DatabaseError - Something went wrong with adding the normalised API-data to the table '{table_name}'. "
+                      f"Error type: {type(e).__name__}, error message: '{e}'.")
+                _resolve(written, 0)
+                continue
+            finally:
+                await self.governor.release(nbytes)
+            self.wb_api_db._track_coverage(chunk)
+            self.total_rows += len(rows)
+            progress_bar.update(len(rows))
+            _resolve(written, len(rows))
+
+    # run
+    async def _feed(self, fetchers: asyncio.TaskGroup, client: httpx.AsyncClient, indicator_ids):
+        """
+        start a fetcher task per indicator as the ids arrive - the ids may come from a Channel which is still growing, so they are
+        read on their own thread (its get blocks) and handed to the loop
+        """
+        loop = asyncio.get_running_loop()
+        arrived = asyncio.Queue()
+        end = object()
+
+        def _read():
+            try:
+                for indicator_id in indicator_ids:
+                    if self.stop.is_set():
+                        return
+                    loop.call_soon_threadsafe(arrived.put_nowait, indicator_id)
+            finally:
+                if not self.stop.is_set():
+                    loop.call_soon_threadsafe(arrived.put_nowait, end)
+
+        Thread(target = _read, name = "indicator-reader", daemon = True).start()
+        slots = asyncio.Semaphore(self.concurrency) # indicators loaded at once
+        seen = set()
+        while (indicator_id := await arrived.get()) is not end:
+            if indicator_id in self.skipped or indicator_id in seen:
+                continue
+            seen.add(indicator_id)
+            await slots.acquire()
+            fetchers.create_task(self._load_indicator(client, indicator_id, slots))
+        self.indicators = len(seen)
+
+    async def run(self, indicator_ids):
+        self.queue = asyncio.Queue(maxsize = wb_async_queue_chunks)
+        self._db_lock = asyncio.Lock()
+        limits = httpx.Limits(max_connections = self.concurrency, max_keepalive_connections = self.concurrency)
+        connections = []
+        try:
+            try:
+                for _ in range(self.db_connections):
+                    connections.append(await psycopg.AsyncConnection.connect(**DBPostgres.connection_params()))
+            except (Exception, psycopg.DatabaseError) as e:
+                raise DatabaseError(f"Something went wrong with the async connections ≽^- ˕ -^≼ Error type: {type(e).__name__}, error message: '{e}'.")
+            async with httpx.AsyncClient(headers = headers_default, timeout = 30, limits = limits) as client:
+                with tqdm(desc = "DB inserts", unit = "rows") as progress_bar:
+                    async with asyncio.TaskGroup() as writers:
+                        for connection in connections:
+                            writers.create_task(self._writer(connection, progress_bar))
+                        async with asyncio.TaskGroup() as fetchers:
+                            await self._feed(fetchers, client, indicator_ids)
+                        for _ in connections: # all pages are written once the writers got their end markers
+                            await self.queue.put(None)
+        finally:
+            self.stop.set()
+            for connection in connections:
+                await connection.close()
+
+def stream_indicator_facts_async(wb_api_db, indicator_ids, country_iso3codes: list[str], concurrency: int = wb_async_concurrency,
+                                 target_countries: list[str] | None = None, start_pages: dict | None = None, attempts: int = wb_fetch_attempts,
+                                 load_source: str = "api_logger"):
+    """
+    this function is the async counterpart of stream_indicator_facts (WB_ENGINE=async): same arguments, same rows, load batch,
+    coverage statistics and dead-letter records - only the fetching and writing run on one event loop
+    - combined multi-indicator requests (WB_BATCH_INDICATORS) are a feature of the threaded engine, here every indicator is requested on its own
+    :param wb_api_db: ApiDB of the stage (load batch, bookkeeping), the facts are written through their own async connections
+    :param concurrency: requests in flight at once (WB_ASYNC_CONCURRENCY)
+    :return: number of rows inserted / updated
+    """
+    start_pages = start_pages or {}
+    dead_letters = wb_api_db.get_dead_letters() # to clear the records of indicators which load now
+    skipped = set()
+    if target_countries:
+        country_iso3codes = [code for code in country_iso3codes if code in set(target_countries)]
+        skipped = wb_api_db.get_indicators_without_countries(target_countries)
+        print(f"--- Targeted ingest of {len(target_countries)} countries ({', '.join(target_countries)}): "
+              f"{len(skipped)} indicators without data for them are skipped ₍^. .^₎⟆ ---\n")
+
+    ingest = AsyncFactIngest(wb_api_db, country_iso3codes, concurrency, target_countries = target_countries, start_pages = start_pages,
+                             attempts = attempts, dead_letters = dead_letters, skipped = skipped)
+    # change data capture: every fact row written by this run carries the batch id
+    wb_api_db.begin_load_batch(load_source)
+    try:
+        asyncio.run(ingest.run(indicator_ids))
+    except BaseException:
+        wb_api_db.finish_load_batch(ingest.total_rows, status = "failed")
+        raise
+    wb_api_db.finish_load_batch(ingest.total_rows)
+    wb_api_db.invalidate_cache("wb_indicator_country_year_value") # written past the ApiDB connection
+    ingest.governor.print_report() # high-water marks of the run
+
+    if ingest.recovered:
+        wb_api_db.clear_dead_letters(ingest.recovered)
+    if ingest.resumed and not target_countries:
+        wb_api_db.rebuild_indicator_coverage_stats(ingest.resumed)
+    print(f"\nStreaming insert complete (async engine, up to {ingest.concurrency} requests in flight). "
+          f"Total rows inserted/updated of {ingest.indicators} indicators: {ingest.total_rows} ദ്ദി（• ˕ •マ.ᐟ \n")
+    if ingest.failed:
+        print(f"..!!.. {len(ingest.failed)} indicators failed and were recorded in 'wb_fetch_dead_letter' (the 'retry_failed' stage retries them) ₍^. .^₎Ⳋ\n")
+    return ingest.total_rows
@@ -0,0 +1,243 @@
+# imports
+import os # part of python standard library
+import sys # part of python standard library
+import json # part of python standard library
+import time # part of python standard library
+import argparse # part of python standard library
+import platform # part of python standard library
+import statistics # part of python standard library
+from datetime import datetime, timezone # part of python standard library
+
+src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, src_dir) # so that the src modules are importable when run as a script
+import psycopg
+from save_data import DBPostgres
+from benchmarks.bench_pipeline import benchmark_dir, _git_commit
+
+#######################################
+# Benchmark: indexes of the fact table against a query workload
+#######################################
+fact_table = "wb_indicator_country_year_value"
+workload_path = os.path.join(os.path.dirname(src_dir), "postgres_data", "workload.sql")
+
+# index sets of the fact table (besides the primary key (indicator_id, country_iso3code, year) and idx_wb_change_xid)
+# - baseline: the indexes of the original schema
+# - curated: country-first covering index for the country pages / comparisons (index-only scans thanks to INCLUDE (value)), BRIN on
+#   year instead of the B-tree (a fraction of the size), no separate indicator_id index (the primary key starts with indicator_id)
+index_sets = {
+    "baseline": {
+        "idx_wb_indicator_id": f"CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_wb_indicator_id ON {fact_table} (indicator_id);",
+        "idx_wb_year": f"CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_wb_year ON {fact_table} (year);",
+    },
+    "curated": {
+        "idx_wb_country_indicator_year": f"CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_wb_country_indicator_year ON {fact_table} (country_iso3code, indicator_id, year) INCLUDE (value);",
+        "idx_wb_year_brin": f"CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_wb_year_brin ON {fact_table} USING BRIN (year);",
+    },
+}
+
+def read_workload(path: str = workload_path):
+    """
+    read the named queries of a workload file ('-- name: <name>' starts a query, it runs until the next name or the end)
+    :return: dict name -> query text (without the trailing ';')
+    """
+    queries, name, lines = {}, None, []
+    with open(path, encoding = "utf-8") as f:
+        for line in f.read().splitlines() + ["-- name: "]:
+            if line.startswith("-- name:"):
+                if name:
+                    queries[name] = "\n".join(lines).strip().rstrip(";")
+                name, lines = line.split(":", 1)[1].strip(), []
+            elif name and not line.startswith("--"):
+                lines.append(line)
+    return queries
+
+def workload_params(conn, n: int = 5, years: int = 10):
+    """parameters of the workload picked from the loaded data: the countries / indicators with the most rows and the last years"""
+    countries = [row[0] for row in conn.execute(f"SELECT country_iso3code FROM {fact_table} GROUP BY 1 ORDER BY COUNT(*) DESC, 1 LIMIT %s;", (n,))]
+    indicators = [row[0] for row in conn.execute(f"SELECT indicator_id FROM {fact_table} GROUP BY 1 ORDER BY COUNT(*) DESC, 1 LIMIT %s;", (n,))]
+    end_year = conn.execute(f"SELECT MAX(year) FROM {fact_table} WHERE value IS NOT NULL;").fetchone()[0]
+    if not countries or end_year is None:
+        raise ValueError(f"The table '{fact_table}' has no data, load the facts first!")
+    return {"country": countries[0], "countries": countries, "indicator": indicators[0], "indicators": indicators,
+            "start_year": end_year - years + 1, "end_year": end_year}
+
+def _plan_nodes(plan: dict):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _plan_nodes(child)
+
+def explain(conn, query: str, params: dict):
+    """run a query with EXPLAIN (ANALYZE, BUFFERS) --> execution time, rows, buffers, scan nodes and indexes of the plan"""
+    result = conn.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}", params).fetchone()[0][0]
+    plan = result["Plan"]
+    nodes = list(_plan_nodes(plan))
+    return {
+        "execution_ms": result["Execution Time"],
+        "planning_ms": result["Planning Time"],
+        "rows": plan["Actual Rows"],
+        "shared_hit_blocks": plan.get("Shared Hit Blocks", 0),
+        "shared_read_blocks": plan.get("Shared Read Blocks", 0),
+        "scans": sorted({node["Node Type"] for node in nodes if "Scan" in node["Node Type"]}),
+        "indexes": sorted({node["Index Name"] for node in nodes if "Index Name" in node}),
+    }
+
+def measure_queries(conn, queries: dict, params: dict, repeat: int = 5):
+    """every query once to warm the cache, then repeat times: median / min execution time, buffers and plan of the last run"""
+    results = {}
+    for name, query in queries.items():
+        explain(conn, query, params)
+        runs = [explain(conn, query, params) for _ in range(repeat)]
+        timings = [run["execution_ms"] for run in runs]
+        results[name] = dict(runs[-1], execution_ms = round(statistics.median(timings), 3), execution_min_ms = round(min(timings), 3))
+        print(f"{name:<28} {results[name]['execution_ms']:10.2f} ms  {results[name]['rows']:>9} rows  "
+              f"{results[name]['shared_hit_blocks'] + results[name]['shared_read_blocks']:>8} buffers  {', '.join(results[name]['indexes']) or '-'}")
+    return results
+
+def index_sizes(conn):
+    """size, access method and validity of the fact table's indexes, size of the table and the physical order of year"""
+    rows = conn.execute("""
+                        SELECT i.relname, am.amname, pg_relation_size(i.oid), x.indisvalid, pg_get_indexdef(i.oid)
+                        FROM pg_index AS x
+                        JOIN pg_class AS i ON i.oid = x.indexrelid
+                        JOIN pg_am AS am ON am.oid = i.relam
+                        WHERE x.indrelid = %s::REGCLASS
+                        ORDER BY i.relname;
+                        """, (fact_table,)).fetchall()
+    correlation = conn.execute("SELECT correlation FROM pg_stats WHERE schemaname = 'thi_miniproject' AND tablename = %s AND attname = 'year';",
+                               (fact_table,)).fetchone()
+    return {
+        "table_bytes": conn.execute("SELECT pg_relation_size(%s::REGCLASS);", (fact_table,)).fetchone()[0],
+        "indexes": {name: {"method": method, "bytes": size, "valid": valid, "definition": definition} for name, method, size, valid, definition in rows},
+        "index_bytes": sum(row[2] for row in rows),
+        "year_correlation": correlation[0] if correlation else None, # ~ +-1: rows are stored in year order, BRIN ranges are selective
+    }
+
+def measure_load(conn, sample_rows: int = 20000, batch_size: int = 5000):
+    """
+    load throughput with the current indexes: a spread-out sample of fact rows is deleted and written back with the upsert of the
+    loader (inserts), then upserted again with changed values (updates) - all in one transaction which is rolled back
+    :return: dict with rows and rows/s of both phases
+    """
+    query = f"""
+            INSERT INTO {fact_table} (indicator_id, country_iso3code, year, value, load_batch_id)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (indicator_id, country_iso3code, year)
+            DO UPDATE SET value = EXCLUDED.value,
+                          last_modified = NOW(),
+                          change_xid = pg_current_xact_id(),
+                          load_batch_id = EXCLUDED.load_batch_id
+            WHERE {fact_table}.value IS DISTINCT FROM EXCLUDED.value;
+            """
+    result = {}
+    with conn.transaction(force_rollback = True):
+        sample = conn.execute(f"""
+                              SELECT indicator_id, country_iso3code, year, value FROM {fact_table}
+                              ORDER BY hashtext(indicator_id || country_iso3code || year::TEXT) LIMIT %s;
+                              """, (sample_rows,)).fetchall()
+        conn.execute(f"""
+                     DELETE FROM {fact_table}
+                     WHERE (indicator_id, country_iso3code, year) IN (SELECT * FROM unnest(%s::TEXT[], %s::TEXT[], %s::INTEGER[]));
+                     """, [list(column) for column in list(zip(*sample))[:3]])
+        for phase, rows in (("insert", [(*row, None) for row in sample]),
+                            ("update", [(*row[:3], row[3] + 1 if row[3] is not None else 1, None) for row in sample])):
+            start = time.perf_counter()
+            with conn.cursor() as cursor:
+                for i in range(0, len(rows), batch_size):
+                    cursor.executemany(query, rows[i:i + batch_size])
+            seconds = time.perf_counter() - start
+            result[f"{phase}_rows"] = len(rows)
+            result[f"{phase}_rows_per_s"] = round(len(rows) / seconds, 1) if seconds else None
+    return result
+
+def measure(conn, queries: dict, params: dict, repeat: int = 5, sample_rows: int = 20000):
+    """one phase: VACUUM ANALYZE (same visibility map / statistics on both sides), query timings, index sizes, load throughput"""
+    conn.execute(f"VACUUM (ANALYZE) {fact_table};")
+    sizes = index_sizes(conn)
+    print(f"{'query':<28} {'median':>13}  {'rows':>14}  {'buffers':>15}  indexes")
+    timings = measure_queries(conn, queries, params, repeat)
+    load = measure_load(conn, sample_rows) if sample_rows else {}
+    per_index = ", ".join(f"{name} {index['bytes'] / 2**20:.1f}" for name, index in sizes["indexes"].items())
+    print(f"\nindexes {sizes['index_bytes'] / 2**20:.1f} MiB ({per_index}), "
+          f"table {sizes['table_bytes'] / 2**20:.1f} MiB, year correlation {sizes['year_correlation']}")
+    if load:
+        print(f"load: {load['insert_rows_per_s']} inserted rows/s, {load['update_rows_per_s']} updated rows/s\n")
+    return {"queries": timings, "sizes": sizes, "load": load}
+
+def apply_index_set(conn, name: str):
+    """
+    switch the fact table to one of the index_sets: create its indexes (CONCURRENTLY, the table stays writable), then drop the ones
+    of the other sets - an invalid leftover of an interrupted build is dropped first, IF NOT EXISTS would keep it
+    """
+    wanted = index_sets[name]
+    others = [index for set_name, indexes in index_sets.items() if set_name != name for index in indexes if index not in wanted]
+    invalid = {row[0] for row in conn.execute("""
+                                              SELECT i.relname FROM pg_index AS x JOIN pg_class AS i ON i.oid = x.indexrelid
+                                              WHERE x.indrelid = %s::REGCLASS AND NOT x.indisvalid;
+                                              """, (fact_table,))}
+    for index, statement in wanted.items():
+        if index in invalid:
+            conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index};")
+        start = time.perf_counter()
+        conn.execute(statement)
+        print(f"Created the index '{index}' in {time.perf_counter() - start:.2f}s")
+    for index in others:
+        conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index};")
+        print(f"Dropped the index '{index}'")
+    conn.execute(f"ANALYZE {fact_table};")
+    print()
+
+def _comparison(before: dict, after: dict):
+    """per query and for sizes / load: before, after and the ratio"""
+    def ratio(old, new):
+        return round(old / new, 2) if old and new else None
+    rows = {name: {"before_ms": before["queries"][name]["execution_ms"], "after_ms": after["queries"][name]["execution_ms"],
+                   "speedup": ratio(before["queries"][name]["execution_ms"], after["queries"][name]["execution_ms"])}
+            for name in before["queries"]}
+    print(f"{'query':<28} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+    for name, row in rows.items():
+        print(f"{name:<28} {row['before_ms']:10.2f} {row['after_ms']:10.2f} {row['speedup'] or float('nan'):7.2f}x")
+    summary = {"queries": rows, "index_bytes": {"before": before["sizes"]["index_bytes"], "after": after["sizes"]["index_bytes"]}}
+    print(f"\nindex size {before['sizes']['index_bytes'] / 2**20:.1f} --> {after['sizes']['index_bytes'] / 2**20:.1f} MiB")
+    if before["load"] and after["load"]:
+        summary["load"] = {phase: {"before": before["load"][f"{phase}_rows_per_s"], "after": after["load"][f"{phase}_rows_per_s"]} for phase in ("insert", "update")}
+        print(f"load throughput: inserts {before['load']['insert_rows_per_s']} --> {after['load']['insert_rows_per_s']} rows/s, "
+              f"updates {before['load']['update_rows_per_s']} --> {after['load']['update_rows_per_s']} rows/s")
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "run the fact table workload with EXPLAIN (ANALYZE, BUFFERS) against the loaded database, "
+                                                   "optionally before and after switching to an index set")
+    parser.add_argument("--workload", default = workload_path, help = "sql file with '-- name: <name>' queries")
+    parser.add_argument("--apply", choices = sorted(index_sets), default = None, help = "switch to this index set between the two measurements")
+    parser.add_argument("--repeat", type = int, default = 5, help = "timed runs per query (after one warm-up run)")
+    parser.add_argument("--load-sample", type = int, default = 20000, help = "rows of the load throughput test (0 = skip it)")
+    parser.add_argument("--queries", default = "", help = "comma-separated query names (default: all)")
+    parser.add_argument("--output", default = "", help = f"json report path (default: {benchmark_dir}/indexes_<timestamp>.json)")
+    args = parser.parse_args()
+
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    output = args.output or os.path.join(benchmark_dir, f"indexes_{timestamp}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok = True)
+    queries = read_workload(args.workload)
+    if args.queries:
+        selected = [name.strip() for name in args.queries.split(",") if name.strip()]
+        unknown = [name for name in selected if name not in queries]
+        if unknown:
+            raise ValueError(f"Unknown query name(s) {unknown}! Available: {list(queries)}.")
+        queries = {name: queries[name] for name in selected}
+
+    with psycopg.connect(**DBPostgres.connection_params(), autocommit = True) as conn: # VACUUM and CREATE INDEX CONCURRENTLY can't run in a transaction
+        params = workload_params(conn)
+        print(f"\n--- Index benchmark of '{fact_table}': {len(queries)} queries x {args.repeat} runs, parameters {params} ₍^. .^₎⟆ ---\n")
+        report = {"benchmark": "indexes", "timestamp": timestamp, "commit": _git_commit(), "python": platform.python_version(),
+                  "postgres": conn.info.server_version, "config": {key: value for key, value in vars(args).items() if key != "output"},
+                  "params": params, "before": measure(conn, queries, params, args.repeat, args.load_sample)}
+        if args.apply:
+            print(f"--- Switching to the '{args.apply}' index set ---\n")
+            apply_index_set(conn, args.apply)
+            report["after"] = measure(conn, queries, params, args.repeat, args.load_sample)
+            report["comparison"] = _comparison(report["before"], report["after"])
+
+    with open(output, "w", encoding = "utf-8") as f:
+        json.dump(report, f, indent = 2, default = str)
+    print(f"\nSaved the report to '{output}' ᓚ₍^..^₎")
@@ -0,0 +1,210 @@
+# imports
+import os # part of python standard library
+import sys # part of python standard library
+import json # part of python standard library
+import time # part of python standard library
+import shutil # part of python standard library
+import argparse # part of python standard library
+import platform # part of python standard library
+import tempfile # part of python standard library
+import subprocess # part of python standard library
+from contextlib import nullcontext # part of python standard library
+from datetime import datetime, timezone # part of python standard library
+
+src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, src_dir) # so that the src modules are importable when run as a script
+import psycopg
+from save_data import DBPostgres
+from benchmarks.wb_api_stub import WorldBankStub
+
+#######################################
+# Benchmark: api_logger end to end against the local WB API stub
+#######################################
+benchmark_dir = os.getenv("BENCH_DIR", "/data/benchmarks")
+# the pipeline writes the stub's synthetic countries / indicators / facts: it runs against a dedicated database with the schema of
+# postgres_data/init/schema.sql (e.g. createdb worldbank_bench && psql -d worldbank_bench -f postgres_data/init/schema.sql), never DB_NAME
+bench_db_name = os.getenv("BENCH_DB_NAME", "")
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd = src_dir, capture_output = True, text = True, timeout = 5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def bench_connection_params(db_name: str = bench_db_name):
+    """
+    the connection settings of the benchmark database (DB_HOST, DB_USER, ... with BENCH_DB_NAME as database)
+    - raises if BENCH_DB_NAME is missing or names the pipeline's own database
+    """
+    params = DBPostgres.connection_params()
+    if not db_name:
+        raise ValueError("Set BENCH_DB_NAME to a dedicated benchmark database, the benchmark loads synthetic data!")
+    if db_name == params["dbname"]:
+        raise ValueError(f"BENCH_DB_NAME must not be the pipeline's database '{params['dbname']}' (DB_NAME)!")
+    return {**params, "dbname": db_name}
+
+def check_bench_db(db_name: str = bench_db_name, reset: bool = False):
+    """
+    refuse a benchmark database which already holds facts (e.g. a restored production dump), unless reset empties it first
+    :param reset: truncate the loaded tables of the benchmark database (fact table, dimensions, load batches, source state)
+    """
+    with psycopg.connect(**bench_connection_params(db_name)) as conn:
+        if reset:
+            conn.execute("""
+                         TRUNCATE wb_indicator_country_year_value, wb_indicator_topics, wb_indicators, wb_source, wb_topics,
+                                  staging_country_general_info, country_general_info, wb_dimension_state, wb_fetch_dead_letter,
+                                  load_batch, row_deletion_log CASCADE;
+                         """)
+        elif conn.execute("SELECT EXISTS (SELECT 1 FROM wb_indicator_country_year_value);").fetchone()[0]:
+            raise ValueError(f"The fact table of the benchmark database '{db_name}' is not empty! Use a fresh database or --reset-db.")
+
+def _latest_load_batch(source: str = "api_logger", db_name: str = bench_db_name):
+    """row count and duration of the last load run (written by DBPostgres.finish_load_batch)"""
+    with psycopg.connect(**bench_connection_params(db_name)) as conn:
+        row = conn.execute("""
+                           SELECT batch_id, status, row_count, EXTRACT(EPOCH FROM finished_at - started_at)
+                           FROM load_batch WHERE source = %s ORDER BY batch_id DESC LIMIT 1;
+                           """, (source,)).fetchone()
+    if row is None:
+        return None
+    return {"batch_id": row[0], "status": row[1], "row_count": row[2], "seconds": float(row[3]) if row[3] is not None else None}
+
+def run_pipeline_benchmark(stub: WorldBankStub, engine_env: dict | None = None, log_path: str | None = None, script: str = "api_logger.py",
+                           work_dir: str | None = None, db_name: str = bench_db_name):
+    """
+    run the real api_logger pipeline as a child process against the stub and measure it
+    - rows: the row count of its load_batch, wall time: the whole process (catalogue + facts)
+    - peak RSS of this child (os.wait4, so that several runs of one benchmark don't report the highest of all of them)
+    - the child writes into the benchmark database (db_name) and keeps its dimension snapshot / metrics in work_dir, not under /data
+    :param engine_env: extra environment variables for the pipeline (e.g. WB_MAX_WORKERS, WB_ENGINE)
+    :param work_dir: directory for the child's files, default: a temporary directory removed afterwards (pass one to share the snapshot between runs)
+    :return: dict with the measurements
+    """
+    with tempfile.TemporaryDirectory(prefix = "wb_bench_") if work_dir is None else nullcontext(work_dir) as work_dir:
+        return _run_pipeline(stub, engine_env, log_path, script, work_dir, db_name)
+
+def _run_pipeline(stub: WorldBankStub, engine_env: dict | None, log_path: str | None, script: str, work_dir: str, db_name: str):
+    bench_connection_params(db_name) # never let the child load into the pipeline's own database
+    env = dict(os.environ)
+    env.update({"WB_API_BASE": stub.base_url, "WB_SOURCE_PAUSE": "0", "PYTHONUNBUFFERED": "1", "DB_NAME": db_name,
+                "WB_DIMENSION_SNAPSHOT_DIR": os.path.join(work_dir, "dimensions"),
+                "METRICS_SUMMARY_PATH": os.path.join(work_dir, "metrics", "api_logger_summary.json")})
+    env.update(engine_env or {})
+
+    previous_batch = _latest_load_batch(db_name = db_name)
+    start = time.perf_counter()
+    with open(log_path or os.devnull, "w", encoding = "utf-8") as log:
+        process = subprocess.Popen([sys.executable, os.path.join(src_dir, script)], cwd = src_dir, env = env, stdout = log, stderr = subprocess.STDOUT)
+        _, wait_status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(wait_status)
+    wall_seconds = time.perf_counter() - start
+    peak_rss_mb = usage.ru_maxrss / 1024 # KiB on linux
+
+    batch = _latest_load_batch(db_name = db_name)
+    if batch is not None and previous_batch is not None and batch["batch_id"] == previous_batch["batch_id"]:
+        batch = None # the run didn't get to the fact load
+    rows = (batch or {}).get("row_count") or 0
+    fact_seconds = (batch or {}).get("seconds") or wall_seconds
+    http = stub.stats()
+    return {
+        "exit_code": process.returncode,
+        "wall_s": round(wall_seconds, 3),
+        "fact_load_s": round(fact_seconds, 3),
+        "rows": rows,
+        "expected_rows": sum(stub.expected_fact_rows(indicator) for indicator in stub.indicator_ids),
+        "rows_per_s": round(rows / fact_seconds, 1) if fact_seconds else None,
+        "requests": http["overall"]["requests"],
+        "requests_per_s": round(http["overall"]["requests"] / wall_seconds, 1) if wall_seconds else None,
+        "http_429": http["overall"]["status_counts"].get("429", 0),
+        "latency_p50_ms": round(http["overall"]["latency_p50_ms"], 2),
+        "latency_p99_ms": round(http["overall"]["latency_p99_ms"], 2),
+        "bytes_served": http["overall"]["bytes"],
+        "peak_rss_mb": round(peak_rss_mb, 1),
+        "load_batch": batch,
+        "endpoints": http["endpoints"],
+    }
+
+def _print_result(result: dict, label: str = ""):
+    print(f"{label}exit code {result['exit_code']}, {result['rows']} of {result['expected_rows']} expected rows in {result['fact_load_s']:.2f}s "
+          f"({result['rows_per_s']} rows/s), wall {result['wall_s']:.2f}s")
+    print(f"{label}{result['requests']} requests ({result['requests_per_s']} req/s, {result['http_429']} x 429), "
+          f"latency p50 {result['latency_p50_ms']:.1f} ms / p99 {result['latency_p99_ms']:.1f} ms, peak RSS {result['peak_rss_mb']:.0f} MiB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "benchmark the api_logger pipeline end to end against a local World Bank API stub")
+    parser.add_argument("--countries", type = int, default = 200)
+    parser.add_argument("--aggregates", type = int, default = 20)
+    parser.add_argument("--years", type = int, default = 60)
+    parser.add_argument("--sources", type = int, default = 2)
+    parser.add_argument("--indicators-per-source", type = int, default = 10)
+    parser.add_argument("--shared-indicators", type = int, default = 0, help = "first indicators of source 1 listed by every other source as well")
+    parser.add_argument("--page-cap", type = int, default = 1000, help = "max rows per indicator data page (forces pagination)")
+    parser.add_argument("--latency-ms", type = float, default = 20.0)
+    parser.add_argument("--jitter-ms", type = float, default = 10.0)
+    parser.add_argument("--rate-429", type = float, default = 0.02, help = "share of throttled answers (indicator lists and data)")
+    parser.add_argument("--max-rps", type = float, default = 0.0, help = "rate limit of the stub in requests per second, the same for every engine (0 = none)")
+    parser.add_argument("--null-ratio", type = float, default = 0.1)
+    parser.add_argument("--workers", type = int, default = int(os.getenv("WB_MAX_WORKERS", "8")), help = "threads of the threaded engine")
+    parser.add_argument("--concurrency", type = int, default = int(os.getenv("WB_ASYNC_CONCURRENCY", "100")), help = "requests in flight of the async engine")
+    parser.add_argument("--engines", default = "threads",
+                        help = "comma-separated fact engines (WB_ENGINE) to run one after the other against identical stubs, e.g. 'threads,async'")
+    parser.add_argument("--seed", type = int, default = 42)
+    parser.add_argument("--reset-db", action = "store_true", help = "empty the loaded tables of the benchmark database (BENCH_DB_NAME) first")
+    parser.add_argument("--output", default = "", help = f"json report path (default: {benchmark_dir}/pipeline_<timestamp>.json)")
+    args = parser.parse_args()
+    engines = [engine.strip() for engine in args.engines.split(",") if engine.strip()]
+
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    output = args.output or os.path.join(benchmark_dir, f"pipeline_{timestamp}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok = True)
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    check_bench_db(reset = args.reset_db) # refuses a missing BENCH_DB_NAME, the pipeline's own database and a filled fact table
+    work_dir = tempfile.mkdtemp(prefix = "wb_bench_") # dimension snapshot + metrics of all runs of this benchmark
+
+    def _stub():
+        """a fresh stub per run (same seed = same data), so that every run starts with the same rate limit bucket and request records"""
+        return WorldBankStub(n_countries = args.countries, n_aggregates = args.aggregates, n_years = args.years, n_sources = args.sources,
+                             indicators_per_source = args.indicators_per_source, shared_indicators = args.shared_indicators, data_page_cap = args.page_cap, latency_ms = args.latency_ms,
+                             jitter_ms = args.jitter_ms, rate_429 = args.rate_429, max_rps = args.max_rps, null_ratio = args.null_ratio, seed = args.seed)
+
+    def _engine_env(engine: str):
+        return {"WB_ENGINE": engine, "WB_MAX_WORKERS": str(args.workers), "WB_ASYNC_CONCURRENCY": str(args.concurrency)}
+
+    print(f"\n--- Benchmarking api_logger against the local WB API stub ({args.sources * args.indicators_per_source} indicators x "
+          f"{(args.countries + args.aggregates) * args.years} cells, engines {engines}: {args.workers} threads / {args.concurrency} requests "
+          f"in flight, rate limit {args.max_rps or 'none'} req/s) ... ₍^. .^₎⟆ ---\n")
+    results = {}
+    if len(engines) > 1:
+        # warm-up: the first run inserts the rows and writes the dimension snapshot, the measured runs all find the same state (unchanged rows)
+        with _stub() as stub:
+            run_pipeline_benchmark(stub, _engine_env(engines[0]), log_path = f"{os.path.splitext(output)[0]}_warmup.log", work_dir = work_dir)
+    for engine in engines:
+        with _stub() as stub:
+            log_path = f"{os.path.splitext(output)[0]}{'' if len(engines) == 1 else '_' + engine}.log"
+            results[engine] = run_pipeline_benchmark(stub, _engine_env(engine), log_path = log_path, work_dir = work_dir)
+    shutil.rmtree(work_dir, ignore_errors = True)
+
+    report = {
+        "benchmark": "pipeline",
+        "timestamp": timestamp,
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "config": config,
+        "database": bench_db_name,
+    }
+    if len(engines) == 1:
+        report["result"] = results[engines[0]]
+    else:
+        report["results"] = results
+        baseline = results[engines[0]]["rows_per_s"]
+        # throughput of every engine relative to the first one (same stub, same rate limit)
+        report["speedup"] = {engine: round(result["rows_per_s"] / baseline, 2) if baseline and result["rows_per_s"] else None
+                             for engine, result in results.items()}
+    with open(output, "w", encoding = "utf-8") as f:
+        json.dump(report, f, indent = 2)
+
+    for engine, result in results.items():
+        _print_result(result, f"[{engine}] " if len(engines) > 1 else "")
+    if "speedup" in report:
+        print(f"fact throughput relative to '{engines[0]}': {report['speedup']}")
+    print(f"\nSaved the report to '{output}' ᓚ₍^..^₎")
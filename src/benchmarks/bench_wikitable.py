@@ -0,0 +1,120 @@
+# imports
+import os # part of python standard library
+import sys # part of python standard library
+import time # part of python standard library
+import random # part of python standard library
+import argparse # part of python standard library
+import statistics # part of python standard library
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # so that the src modules are importable when run as a script
+import requests
+import pandas as pd
+from bs4 import BeautifulSoup
+from bs4.element import Tag
+from wikitable import find_wikitables, extract_table, parser_backend
+from web_logger import extract_cpi_tables, wiki_url, headers_default
+
+#######################################
+# Benchmark: CPI wikitable extraction
+#######################################
+def synthetic_cpi_page(n_tables = 5, n_rows = 180, years_per_table = 6, seed = 42):
+    """
+    build a page shaped like the wiki CPI page (for offline runs without a saved copy):
+    2 header rows, year headers spanning a score + rank column, '—' cells spanning both when there is no score
+    """
+    rng = random.Random(seed)
+    year = 2024
+    tables = []
+    for _ in range(n_tables):
+        years = list(range(year, year - years_per_table, -1))
+        year -= years_per_table
+        head = ('<tr><th rowspan="2">#</th><th rowspan="2">Nation\xa0or\xa0Territory</th>'
+                + "".join(f'<th colspan="2">{y}<sup>[{y % 7}]</sup></th>' for y in years) + "</tr>"
+                + "<tr>" + "<th>Score</th><th>Δ</th>" * len(years) + "</tr>")
+        body = []
+        for r in range(n_rows):
+            cells = "".join(
+                '<td colspan="2">—\n</td>' if rng.random() < 0.1 else f"<td>{rng.randint(8, 90)}</td><td>{rng.randint(1, 180)}</td>"
+                for _ in years
+            )
+            body.append(f'<tr><td>{r + 1}</td><td><span class="flag"></span> <a href="#">Country {r}</a></td>{cells}</tr>')
+        tables.append(f'<table class="wikitable sortable"><tbody>{head}{"".join(body)}</tbody></table>')
+    filler = "<p>" + "lorem ipsum " * 2000 + "</p>"
+    return f"<html><body>{filler}{''.join(tables)}{filler}</body></html>".encode("utf-8")
+
+def legacy_extract(html):
+    """the previous approach (html.parser, repeated find_all('th'), one df.loc append per row) - kept here only as the baseline"""
+    soup = BeautifulSoup(html, "html.parser")
+    dfs = []
+    for table in soup.find_all("table", {"class": "wikitable"}):
+        headers_list = [th.get_text(strip = True) for th in table.find_all("th")]
+        if not any("Nation" in h for h in headers_list):
+            continue
+        categories = ["Country"] + [h[:4] for h in headers_list if h and h[0] in {"1", "2"}]
+        years = categories[1:]
+        df = pd.DataFrame(columns = categories)
+        for row in table.find_all("tr")[2:]:
+            row_data = row.find_all("td")
+            if len(row_data) < 2:
+                continue
+            data = {"Country": row_data[1].get_text(" ", strip = True) if isinstance(row_data[1], Tag) else None}
+            year_index, skip_next = 0, False
+            for col_count, col in enumerate(row_data):
+                if col_count < 2 or skip_next:
+                    skip_next = False
+                    continue
+                text = col.get_text()
+                data[years[year_index]] = text if text != "—\n" else None
+                skip_next = text != "—\n"
+                year_index += 1
+            df.loc[len(df)] = data
+        dfs.append(df)
+    return dfs
+
+def _time(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "benchmark the CPI wikitable extraction")
+    parser.add_argument("--html", default = "", help = "path to a saved copy of the CPI wiki page (default: synthetic page)")
+    parser.add_argument("--save", default = "", help = "download the live CPI page to this path first")
+    parser.add_argument("--repeat", type = int, default = 5)
+    args = parser.parse_args()
+
+    if args.save:
+        response = requests.get(wiki_url, headers = headers_default, timeout = 10)
+        response.raise_for_status()
+        with open(args.save, "wb") as f:
+            f.write(response.content)
+        print(f"Saved the CPI page ({len(response.content)} bytes) to '{args.save}' ₍^. .^₎⟆")
+        args.html = args.save
+
+    if args.html:
+        with open(args.html, "rb") as f:
+            html = f.read()
+        page = args.html
+    else:
+        html = synthetic_cpi_page()
+        page = "synthetic CPI page"
+    print(f"\n--- Benchmarking CPI table extraction on {page} ({len(html) / 1024:.0f} KiB, {args.repeat} runs each) ---\n")
+
+    results = {}
+    seconds, dfs = _time(lambda: legacy_extract(html), args.repeat)
+    results["legacy (html.parser + df.loc)"] = (seconds, sum(len(df) for df in dfs))
+
+    backends = ["html.parser"] + (["lxml"] if parser_backend() == "lxml" else [])
+    for backend in backends:
+        seconds, dfs = _time(lambda: [extract_table(t) for t in find_wikitables(html, header_filter = "Nation", parser = backend)], args.repeat)
+        results[f"engine ({backend})"] = (seconds, sum(len(df) for df in dfs))
+
+    seconds, dfs = _time(lambda: extract_cpi_tables(html), args.repeat)
+    results[f"extract_cpi_tables ({parser_backend()})"] = (seconds, sum(len(df) for df in dfs))
+
+    baseline = results["legacy (html.parser + df.loc)"][0]
+    for name, (seconds, rows) in results.items():
+        print(f"{name:<40} {seconds * 1000:9.1f} ms  {rows:6d} rows  {rows / seconds:10.0f} rows/s  x{baseline / seconds:5.1f}")
@@ -0,0 +1,352 @@
+# imports
+import io # part of python standard library
+import re # part of python standard library
+import csv # part of python standard library
+import json # part of python standard library
+import time # part of python standard library
+import zlib # part of python standard library
+import random # part of python standard library
+import zipfile # part of python standard library
+from threading import Thread, Lock # part of python standard library
+from urllib.parse import urlsplit, parse_qs # part of python standard library
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler # part of python standard library
+import numpy as np
+
+#######################################
+# Local stand-in of the World Bank v2 API
+#######################################
+stub_regions = [
+    ("ECS", "Z7", "Europe & Central Asia"),
+    ("EAS", "Z4", "East Asia & Pacific"),
+    ("SSF", "ZG", "Sub-Saharan Africa"),
+    ("LCN", "ZJ", "Latin America & Caribbean"),
+]
+# real iso3 codes first: api_logger adds a fixed list of country aliases which reference these countries
+stub_core_countries = [
+    "AUT", "DEU", "MKD", "CZE", "GBR", "RUS", "XKX", "TUR", "HKG", "KOR", "MDA", "COD", "CYP", "SOM", "VEN", "VNM", "EGY", "CIV",
+    "SVK", "YEM", "GMB", "IRN", "KGZ", "SYR", "LAO", "CPV", "COG", "LCA", "VCT", "PRK", "BHS", "GNB", "SWZ", "TLS", "MAC", "PRI", "PSE",
+]
+stub_topics = ["Agriculture & Rural Development", "Aid Effectiveness", "Economy & Growth", "Education", "Energy & Mining"]
+
+def _entity_codes(n: int, prefix: str):
+    """n distinct 3 letter codes, e.g. QAA, QAB, ... (prefix letters keep them apart from real iso3 codes)"""
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    return [f"{prefix}{letters[(i // 26) % 26]}{letters[i % 26]}" for i in range(n)]
+
+class WorldBankStub:
+    """
+    a local HTTP server which answers the WB v2 endpoints used by api_logger with synthetic, deterministic data:
+    /country, /topic, /source, /source/<id>/indicators and /country/all/indicator/<id> (paginated)
+    - like the real API, several indicators of one source can be requested at once (/country/all/indicator/A;B;C?source=<id>,
+      optionally with date=<from>:<to>), and only some countries (/country/AUT;DEU/indicator/...) - the values are the same as those
+      of the full single indicator requests
+    - at least the stub_core_countries are served (n_countries is topped up with synthetic codes)
+    - the country / topic / source lists are served in one page, the indicator lists of the sources are paginated by per_page
+      (capped at catalogue_page_cap) and indicator series are split into pages of at most data_page_cap rows
+    - shared_indicators: the first indicators of source 1 are listed by every other source as well (like WDI series re-published
+      in other WB sources)
+    - latency_ms (+ up to jitter_ms) is added to every response, rate_429 is the share of throttled (429 + Retry-After) answers
+      of the endpoints which api_logger retries (indicator lists and indicator data)
+    - max_rps: rate limit of those endpoints like that of the real API (token bucket with one second of burst), requests beyond it
+      are throttled as well - the same limit for every client, e.g. to compare the threaded and the async engine (0 = no limit)
+    - every request is recorded (endpoint, status, seconds, bytes) for the benchmark report
+    """
+    def __init__(self, n_countries: int = 50, n_aggregates: int = 5, n_years: int = 30, n_sources: int = 2, indicators_per_source: int = 5,
+                 data_page_cap: int = 1000, catalogue_page_cap: int = 20000, shared_indicators: int = 0,
+                 latency_ms: float = 0.0, jitter_ms: float = 0.0, rate_429: float = 0.0, retry_after: float = 0.05, max_rps: float = 0.0,
+                 null_ratio: float = 0.1, last_year: int = 2024, seed: int = 42, host: str = "127.0.0.1", port: int = 0):
+        self.countries = stub_core_countries + _entity_codes(max(n_countries - len(stub_core_countries), 0), "Q")
+        self.aggregates = _entity_codes(n_aggregates, "X")
+        self.years = list(range(last_year, last_year - n_years, -1))
+        self.source_ids = list(range(1, n_sources + 1))
+        self.indicators = {source_id: [f"BENCH.S{source_id}.I{i}" for i in range(indicators_per_source)] for source_id in self.source_ids}
+        self.listed_indicators = {source_id: self.indicators[source_id] + (self.indicators[1][:shared_indicators] if source_id != 1 else [])
+                                  for source_id in self.source_ids}
+        self.data_page_cap = data_page_cap
+        self.catalogue_page_cap = catalogue_page_cap
+        self.latency_ms, self.jitter_ms = latency_ms, jitter_ms
+        self.rate_429, self.retry_after = rate_429, retry_after
+        self.max_rps = max_rps
+        self._tokens, self._refilled_at = max_rps, time.monotonic()
+        self.null_ratio = null_ratio
+        self.seed = seed
+        self._rng = random.Random(seed)
+        self._rng_lock = Lock()
+        self._records = []
+        self._records_lock = Lock()
+        self._multi_cache = {} # (indicator ids, date) -> rows of a multi-indicator request
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    # lifecycle
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v2"
+
+    def start(self):
+        self._thread = Thread(target = self._server.serve_forever, name = "wb-api-stub", daemon = True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # expected results
+    @property
+    def indicator_ids(self):
+        return [indicator for source_id in self.source_ids for indicator in self.indicators[source_id]]
+
+    def expected_fact_rows(self, indicator_id: str, countries: list[str] | None = None):
+        """number of non-null country (not aggregate) rows of an indicator, i.e. what ends up in the fact table (of all or some countries)"""
+        countries = set(countries or self.countries)
+        return sum(
+            1 for page in range(1, self._pages(indicator_id) + 1) for row in self._indicator_page(indicator_id, page)[1]
+            if row["value"] is not None and row["countryiso3code"] in countries
+        )
+
+    # payloads
+    def _meta(self, page: int, pages: int, per_page: int, total: int):
+        return {"page": page, "pages": pages, "per_page": per_page, "total": total, "sourceid": None, "lastupdated": "2025-01-01"}
+
+    def _countries_payload(self):
+        rows = []
+        for i, code in enumerate(self.countries):
+            region_id, region_iso2, region_name = stub_regions[i % len(stub_regions)]
+            rows.append({
+                "id": code, "iso2Code": code[:2], "name": f"Benchland {code}",
+                "region": {"id": region_id, "iso2code": region_iso2, "value": region_name},
+                "adminregion": {"id": "", "iso2code": "", "value": ""},
+                "incomeLevel": {"id": "HIC", "iso2code": "XD", "value": "High income"},
+                "lendingType": {"id": "LNX", "iso2code": "XX", "value": "Not classified"},
+                "capitalCity": f"Capital {code}", "longitude": f"{(i * 7) % 360 - 180:.4f}", "latitude": f"{(i * 3) % 180 - 90:.4f}",
+            })
+        for code in self.aggregates:
+            rows.append({
+                "id": code, "iso2Code": code[:2], "name": f"Aggregate {code}",
+                "region": {"id": "NA", "iso2code": "NA", "value": "Aggregates"},
+                "adminregion": {"id": "", "iso2code": "", "value": ""},
+                "incomeLevel": {"id": "NA", "iso2code": "NA", "value": "Aggregates"},
+                "lendingType": {"id": "", "iso2code": "", "value": "Aggregates"},
+                "capitalCity": "", "longitude": "", "latitude": "",
+            })
+        return [self._meta(1, 1, len(rows), len(rows)), rows]
+
+    def _topics_payload(self):
+        rows = [{"id": str(i), "value": name, "sourceNote": f"Synthetic topic {name}"} for i, name in enumerate(stub_topics, start = 1)]
+        return [self._meta(1, 1, len(rows), len(rows)), rows]
+
+    def _sources_payload(self):
+        rows = [{"id": str(source_id), "lastupdated": "2025-01-01", "name": f"Bench source {source_id}", "code": f"BS{source_id}",
+                 "description": "", "url": "", "dataavailability": "Y", "metadataavailability": "Y",
+                 "concepts": "3"} for source_id in self.source_ids]
+        return [self._meta(1, 1, len(rows), len(rows)), rows]
+
+    def _source_indicators_payload(self, source_id: int, page: int = 1, per_page: int = 50):
+        indicators = self.listed_indicators.get(source_id)
+        if indicators is None:
+            return [{"message": [{"id": "120", "key": "Invalid value", "value": "The provided parameter value is not valid"}]}]
+        page_size = max(min(per_page, self.catalogue_page_cap), 1)
+        pages = max(1, -(-len(indicators) // page_size))
+        rows = [{
+            "id": indicator, "name": f"Synthetic indicator {indicator}", "unit": "",
+            "source": {"id": str(source_id), "value": f"Bench source {source_id}"},
+            "sourceNote": f"Synthetic series {indicator} of the offline benchmark", "sourceOrganization": "",
+            "topics": [{"id": str(1 + (i + source_id) % len(stub_topics)), "value": ""}, {"id": str(1 + i % len(stub_topics)), "value": ""}],
+        } for i, indicator in enumerate(indicators) if (page - 1) * page_size <= i < page * page_size]
+        return [self._meta(page, pages, page_size, len(indicators)), rows]
+
+    def _series_length(self):
+        return (len(self.countries) + len(self.aggregates)) * len(self.years)
+
+    def _pages(self, indicator_id: str, per_page: int | None = None):
+        page_size = min(per_page or self.data_page_cap, self.data_page_cap)
+        return max(1, -(-self._series_length() // page_size))
+
+    def _indicator_page(self, indicator_id: str, page: int, per_page: int | None = None):
+        """one page of an indicator series: rows are (entity, year) cells, values derived from a seed of (indicator, page)"""
+        page_size = min(per_page or self.data_page_cap, self.data_page_cap)
+        total = self._series_length()
+        pages = max(1, -(-total // page_size))
+        rng = random.Random(zlib.crc32(f"{self.seed}|{indicator_id}|{page_size}|{page}".encode("utf-8")))
+        entities = self.countries + self.aggregates
+        rows = []
+        for cell in range((page - 1) * page_size, min(page * page_size, total)):
+            code, year = entities[cell // len(self.years)], self.years[cell % len(self.years)]
+            value = None if rng.random() < self.null_ratio else round(rng.uniform(0, 1000), 3)
+            rows.append({
+                "indicator": {"id": indicator_id, "value": f"Synthetic indicator {indicator_id}"},
+                "country": {"id": code[:2], "value": f"Benchland {code}"},
+                "countryiso3code": code, "date": str(year), "value": value, "unit": "", "obs_status": "", "decimal": 1,
+            })
+        return self._meta(page, pages, page_size, total), rows
+
+    def _multi_indicator_page(self, indicator_ids: list[str], page: int, per_page: int | None = None, date: str | None = None,
+                              countries: list[str] | None = None):
+        """
+        one page of a multi-indicator / country subset request: the series of all indicators one after the other, optionally only
+        the years of date and the entities of countries
+        """
+        key = (tuple(indicator_ids), date, tuple(countries or ()))
+        rows = self._multi_cache.get(key)
+        if rows is None:
+            first_year, last_year = (int(year) for year in date.split(":")) if date else (min(self.years), max(self.years))
+            entities = set(countries or (self.countries + self.aggregates))
+            rows = [row for indicator_id in indicator_ids for p in range(1, self._pages(indicator_id) + 1)
+                    for row in self._indicator_page(indicator_id, p)[1]
+                    if first_year <= int(row["date"]) <= last_year and row["countryiso3code"] in entities]
+            self._multi_cache[key] = rows
+        page_size = min(per_page or self.data_page_cap, self.data_page_cap)
+        pages = max(1, -(-len(rows) // page_size))
+        return self._meta(page, pages, page_size, len(rows)), rows[(page - 1) * page_size:page * page_size]
+
+    # request handling
+    def _route(self, path: str, query: dict):
+        """:return: (endpoint name, status, payload, throttleable)"""
+        path = re.sub(r"^/v2", "", path).rstrip("/") or "/"
+        if path == "/country":
+            return "country", 200, self._countries_payload(), False
+        if path == "/topic":
+            return "topic", 200, self._topics_payload(), False
+        if path == "/source":
+            return "source", 200, self._sources_payload(), False
+        match = re.fullmatch(r"/source/(\d+)/indicators", path)
+        if match:
+            page, per_page = int(query.get("page", [1])[0]), int(query.get("per_page", [50])[0])
+            return "source_indicators", 200, self._source_indicators_payload(int(match.group(1)), page, per_page), True
+        match = re.fullmatch(r"/country/([^/]+)/indicator/([^/]+)", path)
+        if match and (";" in match.group(2) or match.group(1) != "all"):
+            countries = None if match.group(1) == "all" else match.group(1).upper().split(";")
+            indicator_ids, source = match.group(2).split(";"), query.get("source", [None])[0]
+            if len(indicator_ids) > 1 and (source is None or not source.isdigit() or not set(indicator_ids) <= set(self.indicators.get(int(source), []))):
+                return "indicator_data", 200, [{"message": [{"id": "160", "key": "Invalid format", "value": "Indicators of one source (source=...) expected"}]}], True
+            if not set(indicator_ids) <= set(self.indicator_ids):
+                return "indicator_data", 200, [{"message": [{"id": "120", "key": "Invalid value", "value": "The indicator was not found"}]}], True
+            per_page, page = int(query.get("per_page", [50])[0]), int(query.get("page", [1])[0])
+            meta, rows = self._multi_indicator_page(indicator_ids, page, per_page, query.get("date", [None])[0], countries)
+            return "indicator_data", 200, [meta, rows], True
+        if match:
+            indicator_id = match.group(2)
+            if indicator_id not in set(self.indicator_ids):
+                return "indicator_data", 200, [{"message": [{"id": "120", "key": "Invalid value", "value": "The indicator was not found"}]}], True
+            per_page = int(query.get("per_page", [50])[0])
+            page = int(query.get("page", [1])[0])
+            meta, rows = self._indicator_page(indicator_id, page, per_page)
+            return "indicator_data", 200, [meta, rows if page <= meta["pages"] else []], True
+        return "unknown", 404, [{"message": [{"id": "404", "key": "Not found", "value": path}]}], False
+
+    def _over_rate_limit(self):
+        """take a token of the rate limit bucket (call with _rng_lock held), True if there's none left"""
+        if self.max_rps <= 0:
+            return False
+        now = time.monotonic()
+        self._tokens = min(self.max_rps, self._tokens + (now - self._refilled_at) * self.max_rps)
+        self._refilled_at = now
+        if self._tokens < 1:
+            return True
+        self._tokens -= 1
+        return False
+
+    def _handler_class(stub):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # keep-alive, like the real API behind its CDN
+
+            def do_GET(self):
+                start = time.perf_counter()
+                parsed = urlsplit(self.path) # not urlparse, which cuts ";B;C" off the path as parameters
+                endpoint, status, payload, throttleable = stub._route(parsed.path, parse_qs(parsed.query))
+                with stub._rng_lock:
+                    delay = (stub.latency_ms + stub._rng.random() * stub.jitter_ms) / 1000
+                    throttled = throttleable and (stub._rng.random() < stub.rate_429 or stub._over_rate_limit())
+                if delay > 0:
+                    time.sleep(delay)
+
+                if throttled:
+                    status, body = 429, b'{"message": "Too many requests"}'
+                else:
+                    body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json;charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                if throttled:
+                    self.send_header("Retry-After", str(stub.retry_after))
+                self.end_headers()
+                self.wfile.write(body)
+                with stub._records_lock:
+                    stub._records.append((endpoint, status, time.perf_counter() - start, len(body)))
+
+            def log_message(self, format, *args): # no access log on stderr
+                pass
+        return Handler
+
+    # bulk archive
+    def write_bulk_archive(self, path: str, member: str = "WDICSV.csv"):
+        """
+        write the series of all indicators as a WB bulk download: a zip with the wide csv (one row per entity x indicator, one column
+        per year, like WDICSV.csv of WDI_CSV.zip) next to a series metadata csv - the values are those of the API endpoints
+        """
+        entities = self.countries + self.aggregates
+        years = sorted(self.years)
+        with zipfile.ZipFile(path, "w", compression = zipfile.ZIP_DEFLATED) as archive:
+            with archive.open(member, "w") as raw, io.TextIOWrapper(raw, encoding = "utf-8-sig", newline = "") as f:
+                writer = csv.writer(f, quoting = csv.QUOTE_ALL)
+                writer.writerow(["Country Name", "Country Code", "Indicator Name", "Indicator Code"] + [str(year) for year in years])
+                cells = {}
+                for indicator_id in self.indicator_ids:
+                    for page in range(1, self._pages(indicator_id) + 1):
+                        for row in self._indicator_page(indicator_id, page)[1]:
+                            cells[(row["countryiso3code"], indicator_id, int(row["date"]))] = row["value"]
+                for code in entities:
+                    for indicator_id in self.indicator_ids:
+                        values = [cells.get((code, indicator_id, year)) for year in years]
+                        writer.writerow([f"Benchland {code}", code, f"Synthetic indicator {indicator_id}", indicator_id]
+                                        + ["" if value is None else value for value in values])
+            with archive.open("WDISeries.csv", "w") as raw, io.TextIOWrapper(raw, encoding = "utf-8-sig", newline = "") as f:
+                writer = csv.writer(f, quoting = csv.QUOTE_ALL)
+                writer.writerow(["Series Code", "Topic", "Indicator Name"])
+                writer.writerows([indicator_id, stub_topics[0], f"Synthetic indicator {indicator_id}"] for indicator_id in self.indicator_ids)
+        return path
+
+    # statistics
+    def stats(self):
+        """request counts, status counts, bytes and latency percentiles (overall and per endpoint)"""
+        with self._records_lock:
+            records = list(self._records)
+
+        def _summary(subset):
+            seconds = np.array([record[2] for record in subset]) if subset else np.array([0.0])
+            statuses = {}
+            for record in subset:
+                statuses[str(record[1])] = statuses.get(str(record[1]), 0) + 1
+            return {
+                "requests": len(subset),
+                "status_counts": statuses,
+                "bytes": int(sum(record[3] for record in subset)),
+                "latency_p50_ms": float(np.percentile(seconds, 50) * 1000),
+                "latency_p99_ms": float(np.percentile(seconds, 99) * 1000),
+                "latency_max_ms": float(seconds.max() * 1000),
+            }
+
+        per_endpoint = {}
+        for endpoint in sorted({record[0] for record in records}):
+            per_endpoint[endpoint] = _summary([record for record in records if record[0] == endpoint])
+        return {"overall": _summary(records), "endpoints": per_endpoint}
+
+if __name__ == "__main__":
+    # serve the stub on its own, e.g. to point a manually started api_logger to it: WB_API_BASE=http://127.0.0.1:8099/v2
+    stub = WorldBankStub(port = 8099)
+    print(f"Serving the World Bank API stub on {stub.start()} (Ctrl+C to stop) ₍^. .^₎⟆")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub.stop()
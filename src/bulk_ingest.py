@@ -0,0 +1,159 @@
+# imports
+import io # part of python standard library
+import os # part of python standard library
+import re # part of python standard library
+import csv # part of python standard library
+import time # part of python standard library
+import zipfile # part of python standard library
+import tempfile # part of python standard library
+from contextlib import contextmanager, nullcontext # part of python standard library
+from urllib.parse import urlsplit # part of python standard library
+import requests
+import pandas as pd
+from metrics import registry
+
+#######################################
+# Bulk archives of the World Bank (CSV / ZIP dumps)
+#######################################
+# e.g. https://databank.worldbank.org/data/download/WDI_CSV.zip (data in WDICSV.csv) or the csv downloads of single indicators
+# (https://api.worldbank.org/v2/en/indicator/SP.POP.TOTL?downloadformat=csv, data in API_SP.POP.TOTL_DS2_*.csv after 4 preamble lines)
+# - wide format: one row per country x indicator, one column per year
+bulk_chunk_rows = int(os.getenv("WB_BULK_CHUNK_ROWS", "2000")) # wide rows per chunk (x the number of year columns long rows)
+id_columns = ("Country Code", "Indicator Code")
+_year_column = re.compile(r"^\d{4}$")
+_max_preamble_lines = 10
+
+bulk_rows_total = registry.counter("wb_bulk_rows_total", "long fact rows reshaped from bulk archives")
+
+def _header_offset(raw):
+    """number of preamble lines before the header of a wide WB csv (binary stream), None if it's no such csv (e.g. metadata)"""
+    for i in range(_max_preamble_lines):
+        line = raw.readline()
+        if not line:
+            return None
+        columns = next(csv.reader([line.decode("utf-8-sig", errors = "replace")]), [])
+        if all(column in columns for column in id_columns) and any(_year_column.match(column) for column in columns):
+            return i
+    return None
+
+def _data_member(archive: zipfile.ZipFile, member: str | None = None):
+    """the wide data csv of an archive: the given member, or the largest csv with country / indicator codes and year columns"""
+    if member:
+        return member
+    candidates = []
+    for info in archive.infolist():
+        if not info.filename.lower().endswith(".csv"):
+            continue
+        with archive.open(info) as raw:
+            if _header_offset(raw) is not None:
+                candidates.append(info)
+    if not candidates:
+        raise ValueError(f"No csv with the columns {list(id_columns)} and year columns in the archive (members: {archive.namelist()})!")
+    return max(candidates, key = lambda info: info.file_size).filename
+
+def _download(url: str, headers: dict | None = None, chunk_size: int = 2**20):
+    """stream a remote archive into an anonymous temporary file (a zip needs random access, its directory is at the end)"""
+    tmp = tempfile.TemporaryFile()
+    with requests.get(url, stream = True, timeout = 60, headers = headers) as response:
+        response.raise_for_status()
+        for block in response.iter_content(chunk_size):
+            tmp.write(block)
+    tmp.seek(0)
+    return tmp
+
+@contextmanager
+def open_bulk_csv(source: str, member: str | None = None, headers: dict | None = None):
+    """
+    open the wide data csv of a bulk archive as a text stream - nothing is extracted to disk, the member is decompressed while it's read
+    :param source: local path or url of a zip archive (or of a plain csv)
+    :return: (name of the csv, text stream, number of preamble lines before the header)
+    """
+    tmp = _download(source, headers) if re.match(r"^https?://", source) else None
+    target = tmp if tmp is not None else source
+    try:
+        if zipfile.is_zipfile(target):
+            with zipfile.ZipFile(target) as archive:
+                name = _data_member(archive, member)
+                with archive.open(name) as raw:
+                    skiprows = _header_offset(raw)
+                with archive.open(name) as raw:
+                    yield name, io.TextIOWrapper(raw, encoding = "utf-8-sig", newline = ""), skiprows or 0
+        else:
+            with open(source, "rb") if tmp is None else nullcontext(tmp) as raw:
+                raw.seek(0)
+                skiprows = _header_offset(raw)
+                raw.seek(0)
+                yield os.path.basename(urlsplit(source).path), io.TextIOWrapper(raw, encoding = "utf-8-sig", newline = ""), skiprows or 0
+    finally:
+        if tmp is not None:
+            tmp.close()
+
+def iter_long_chunks(stream, skiprows: int = 0, valid_country_iso3codes = None, indicator_ids = None, chunk_rows: int = bulk_chunk_rows):
+    """
+    this generator reshapes the wide csv to long fact rows on the fly, chunk by chunk (constant memory for any file size)
+    - only the code and year columns are parsed (names are long repeated strings), empty cells are dropped
+    :param valid_country_iso3codes: keep only these countries (aggregates and regions drop out)
+    :param indicator_ids: keep only these indicators
+    :return: yields (df ['indicator_id', 'country_iso3code', 'year', 'value'], set of indicator codes which were left out)
+    """
+    valid_countries = set(valid_country_iso3codes) if valid_country_iso3codes is not None else None
+    valid_indicators = set(indicator_ids) if indicator_ids is not None else None
+    reader = pd.read_csv(stream, skiprows = skiprows, chunksize = chunk_rows, dtype = {column: str for column in id_columns},
+                         usecols = lambda column: column in id_columns or bool(_year_column.match(str(column))))
+    for wide in reader:
+        left_out = set()
+        if valid_countries is not None:
+            wide = wide[wide["Country Code"].isin(valid_countries)]
+        if valid_indicators is not None:
+            known = wide["Indicator Code"].isin(valid_indicators)
+            left_out = set(wide.loc[~known, "Indicator Code"].unique())
+            wide = wide[known]
+        long = wide.melt(id_vars = list(id_columns), var_name = "year", value_name = "value").dropna(subset = ["value"])
+        long = long.rename(columns = {"Country Code": "country_iso3code", "Indicator Code": "indicator_id"})
+        long["year"] = long["year"].astype("int32")
+        bulk_rows_total.inc(len(long))
+        yield long[["indicator_id", "country_iso3code", "year", "value"]], left_out
+
+def ingest_bulk_archive(wb_api_db, source: str, valid_country_iso3codes, indicator_ids = None, member: str | None = None,
+                        chunk_rows: int = bulk_chunk_rows, headers: dict | None = None, update_coverage: bool = True):
+    """
+    this function loads the facts of a bulk archive with the fact loader of ApiDB: same upsert, own load batch, coverage statistics
+    - indicators are filtered against indicator_ids (the catalogue in wb_indicators, which the fact table references): run the
+      'indicators' stage first
+    :param wb_api_db: ApiDB
+    :param update_coverage: write the coverage statistics of the loaded indicators (the archive holds their complete series)
+    :return: number of rows inserted / updated
+    """
+    start = time.perf_counter()
+    dead_letters = wb_api_db.get_dead_letters()
+    wb_api_db.begin_load_batch("api_logger:bulk")
+    total_rows, loaded, left_out = 0, set(), set()
+    try:
+        with open_bulk_csv(source, member, headers) as (name, stream, skiprows):
+            print(f"--- Bulk ingest of '{name}' from '{source}' ₍^. .^₎⟆ ---\n")
+            for chunk, chunk_left_out in iter_long_chunks(stream, skiprows, valid_country_iso3codes, indicator_ids, chunk_rows):
+                left_out |= chunk_left_out
+                if chunk.empty:
+                    continue
+                wb_api_db.add_data_to_wb_indicator_country_year_value_table(chunk)
+                loaded.update(chunk["indicator_id"].unique())
+                total_rows += len(chunk)
+    except Exception:
+        wb_api_db.finish_load_batch(total_rows, status = "failed")
+        raise
+    wb_api_db.finish_load_batch(total_rows)
+
+    if update_coverage:
+        wb_api_db.flush_indicator_coverage() # complete only now: the rows of an indicator are spread over the whole file
+    else:
+        for indicator in loaded:
+            wb_api_db.discard_indicator_coverage(indicator)
+    recovered = [indicator for indicator in dead_letters if indicator in loaded]
+    if recovered:
+        wb_api_db.clear_dead_letters(recovered)
+
+    seconds = time.perf_counter() - start
+    if left_out:
+        print(f"..!!.. {len(left_out)} indicators of the archive aren't in the catalogue and were left out, e.g. {sorted(left_out)[:10]}\n")
+    print(f"Bulk ingest complete: {total_rows} rows of {len(loaded)} indicators in {seconds:.1f}s ({total_rows / seconds if seconds else 0:.0f} rows/s) ദ്ദി（• ˕ •マ.ᐟ \n")
+    return total_rows
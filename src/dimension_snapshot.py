@@ -0,0 +1,166 @@
+# imports
+import os # part of python standard library
+import json # part of python standard library
+import glob # part of python standard library
+import time # part of python standard library
+import pickle # part of python standard library
+import hashlib # part of python standard library
+import argparse # part of python standard library
+from threading import Lock # part of python standard library
+from datetime import datetime, timezone # part of python standard library
+
+#######################################
+# Dimension snapshot
+#######################################
+# versioned local copy of the World Bank dimensions (countries, topics, sources, indicator catalogue), so that a run starts from
+# it in milliseconds instead of re-crawling the ~29k indicators first
+# - <snapshot_dir>/dimensions_<version>.pkl + manifest.json (the current version), the last keep_versions versions are kept
+dimension_snapshot_enabled = os.getenv("WB_DIMENSION_SNAPSHOT", "true").strip().lower() in ("1", "true", "yes")
+dimension_snapshot_dir = os.getenv("WB_DIMENSION_SNAPSHOT_DIR", "/data/dimensions")
+dimensions = ("countries", "topics", "sources", "indicators")
+keep_versions = 3
+
+def _plain(value):
+    """numpy scalars --> python values (same pickle and repr whether the rows come from a data frame or from the snapshot)"""
+    return value.item() if hasattr(value, "item") else value
+
+def plain_rows(rows):
+    return [tuple(_plain(value) for value in row) for row in rows or []]
+
+def content_hash(rows):
+    """order-independent hash of a list of row tuples (the catalogue arrives in a different order every crawl)"""
+    digest = hashlib.sha256()
+    for line in sorted(repr(row) for row in plain_rows(rows)):
+        digest.update(line.encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+def dimension_hash(name: str, value):
+    """content hash of a dimension's rows as stored in the snapshot and in wb_dimension_state"""
+    if name == "indicators":
+        indicator_rows, indicator_topic_rows = value
+        return hashlib.sha256(f"{content_hash(indicator_rows)}{content_hash(indicator_topic_rows)}".encode("utf-8")).hexdigest()
+    return content_hash(value)
+
+def catalogue_fingerprint(source_rows):
+    """
+    fingerprint of the indicator catalogue: the hash of the source list, whose rows carry every source's last update date - as long as
+    it's unchanged, the catalogue of the snapshot is taken as current and not crawled again
+    """
+    return content_hash(source_rows)[:16] if source_rows else None
+
+class DimensionSnapshot:
+    """
+    the dimension rows of one run: loaded from the current snapshot version, replaced by the stages which fetch them again (set()),
+    written as a new version by save() if anything changed
+    - indicators: (wb_indicators rows, wb_indicator_topics rows); the others: the rows their stages persist
+    - fingerprint: catalogue_fingerprint() of the sources the indicator rows were crawled for (None = incomplete, crawl again)
+    - stages run on their own threads, so set() / save() take a lock
+    """
+    def __init__(self, snapshot_dir: str | None = None, data: dict | None = None, fingerprint: str | None = None, version: str | None = None,
+                 created_at: str | None = None):
+        self.snapshot_dir = snapshot_dir
+        self.data = dict(data or {})
+        self.fingerprint = fingerprint
+        self.version = version
+        self.created_at = created_at
+        self.refreshed = set() # dimensions which were fetched again in this run
+        self.dirty = False
+        self._lock = Lock()
+
+    @classmethod
+    def from_env(cls):
+        """the current snapshot of WB_DIMENSION_SNAPSHOT_DIR, an empty in-memory one if WB_DIMENSION_SNAPSHOT is off"""
+        return cls.load(dimension_snapshot_dir) if dimension_snapshot_enabled else cls()
+
+    @classmethod
+    def load(cls, snapshot_dir: str):
+        """read the current version (an empty snapshot if there's none yet or it can't be read)"""
+        start = time.perf_counter()
+        try:
+            with open(os.path.join(snapshot_dir, "manifest.json"), encoding = "utf-8") as f:
+                manifest = json.load(f)
+            with open(os.path.join(snapshot_dir, manifest["file"]), "rb") as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            print(f"--- No dimension snapshot in '{snapshot_dir}' yet, the dimensions are fetched from the API ---\n")
+            return cls(snapshot_dir)
+        except (OSError, KeyError, ValueError, pickle.UnpicklingError, EOFError) as e:
+            print(f"..!!.. The dimension snapshot in '{snapshot_dir}' couldn't be read ({type(e).__name__} - {e}), the dimensions are fetched from the API\n")
+            return cls(snapshot_dir)
+        snapshot = cls(snapshot_dir, data, manifest.get("fingerprint"), manifest.get("version"), manifest.get("created_at"))
+        print(f"--- Loaded the dimension snapshot {snapshot.version} of {snapshot.created_at} ({snapshot.describe()}) "
+              f"in {(time.perf_counter() - start) * 1000:.0f} ms ₍^. .^₎⟆ ---\n")
+        return snapshot
+
+    def get(self, name: str):
+        with self._lock:
+            return self.data.get(name)
+
+    def set(self, name: str, value, fingerprint: str | None = None):
+        """
+        the fresh rows of a dimension (for indicators: (indicator rows, indicator-topic rows) and the fingerprint they were crawled for)
+        :return: True if they differ from the snapshot
+        """
+        value = tuple(plain_rows(part) for part in value) if name == "indicators" else plain_rows(value)
+        with self._lock:
+            previous = self.data.get(name)
+            changed = previous is None or dimension_hash(name, value) != dimension_hash(name, previous)
+            self.data[name] = value
+            self.refreshed.add(name)
+            if name == "indicators" and fingerprint != self.fingerprint:
+                self.fingerprint = fingerprint
+                changed = True
+            self.dirty |= changed
+            return changed
+
+    def describe(self):
+        counts = {name: len(value[0] if name == "indicators" else value) for name, value in self.data.items()}
+        return ", ".join(f"{count} {name}" for name, count in counts.items())
+
+    def save(self):
+        """
+        write the dimensions as a new version (only if something changed and all dimensions are there)
+        :return: path of the written file or None
+        """
+        with self._lock:
+            if not self.snapshot_dir or not self.dirty:
+                return None
+            missing = [name for name in dimensions if name not in self.data]
+            if missing:
+                print(f"..!!.. The dimension snapshot isn't written, {missing} are missing\n")
+                return None
+            hashes = {name: dimension_hash(name, self.data[name]) for name in dimensions}
+            self.version = hashlib.sha256(json.dumps([hashes, self.fingerprint]).encode("utf-8")).hexdigest()[:16]
+            self.created_at = datetime.now(timezone.utc).isoformat()
+            file_name = f"dimensions_{self.version}.pkl"
+            os.makedirs(self.snapshot_dir, exist_ok = True)
+            path = os.path.join(self.snapshot_dir, file_name)
+            with open(f"{path}.tmp", "wb") as f:
+                pickle.dump(self.data, f, protocol = pickle.HIGHEST_PROTOCOL)
+            os.replace(f"{path}.tmp", path) # atomic, so a concurrent reader never sees half a file
+            manifest = {"version": self.version, "file": file_name, "created_at": self.created_at, "fingerprint": self.fingerprint,
+                        "hashes": hashes, "rows": {name: len(self.data[name][0] if name == "indicators" else self.data[name]) for name in dimensions}}
+            manifest_path = os.path.join(self.snapshot_dir, "manifest.json")
+            with open(f"{manifest_path}.tmp", "w", encoding = "utf-8") as f:
+                json.dump(manifest, f, indent = 2)
+            os.replace(f"{manifest_path}.tmp", manifest_path)
+            self.dirty = False
+            self._prune(file_name)
+        print(f"--- Saved the dimension snapshot {self.version} ({self.describe()}) to '{path}' ദ്ദി（• ˕ •マ.ᐟ ---\n")
+        return path
+
+    def _prune(self, current_file: str):
+        """keep the newest keep_versions files (incl. the current one)"""
+        files = sorted(glob.glob(os.path.join(self.snapshot_dir, "dimensions_*.pkl")), key = os.path.getmtime, reverse = True)
+        for path in [path for path in files if os.path.basename(path) != current_file][keep_versions - 1:]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass # removed by a concurrent run
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "show the current dimension snapshot")
+    parser.add_argument("--dir", default = dimension_snapshot_dir)
+    args = parser.parse_args()
+    DimensionSnapshot.load(args.dir)
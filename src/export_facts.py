@@ -0,0 +1,227 @@
+# imports
+import os # part of python standard library
+import re # part of python standard library
+import gzip # part of python standard library
+import json # part of python standard library
+import time # part of python standard library
+import hashlib # part of python standard library
+import argparse # part of python standard library
+from datetime import datetime, timezone # part of python standard library
+from concurrent.futures import ThreadPoolExecutor # part of python standard library
+from save_data import DBPostgres, DatabaseError
+import psycopg
+from psycopg import sql
+
+#######################################
+# Export settings
+#######################################
+export_dir = os.getenv("EXPORT_DIR", "/data/exports")
+fact_table = "wb_indicator_country_year_value"
+export_columns = ["indicator_id", "country_iso3code", "year", "value"]
+file_extensions = {"csv": "csv", "binary": "pgcopy"} # 'binary' is postgres' COPY binary format (COPY ... FROM ... WITH (FORMAT binary) reads it back)
+compression_extensions = {"gzip": "gz", "zstd": "zst"}
+
+def compression_backend(preferred: str = "zstd"):
+    """use zstd when the (optional) zstandard package is installed, otherwise gzip from python's standard library"""
+    if preferred == "zstd":
+        try:
+            import zstandard # noqa: F401 - optional dependency, only checked for availability
+            return "zstd"
+        except ImportError:
+            return "gzip"
+    return "gzip"
+
+def _open_compressed(path: str, compression: str):
+    """binary file object which compresses everything written to it"""
+    if compression == "zstd":
+        import zstandard
+        return zstandard.ZstdCompressor(level = 3).stream_writer(open(path, "wb"))
+    return gzip.open(path, "wb", compresslevel = 6)
+
+def _partition_file_name(partition_key: str, fmt: str, compression: str):
+    safe_key = re.sub(r"[^A-Za-z0-9._-]", "_", partition_key)[:100] # indicator ids may contain anything but dots, letters and digits in theory
+    # short hash of the raw key: two keys which only differ in replaced characters (e.g. 'A/B' and 'A_B') never share a file
+    key_hash = hashlib.sha256(partition_key.encode("utf-8")).hexdigest()[:8]
+    return f"{safe_key}-{key_hash}.{file_extensions[fmt]}.{compression_extensions[compression]}"
+
+#######################################
+# Partitions & signatures
+#######################################
+def partition_signatures(cursor, partition_by: str = "indicator", year_span: int = 10):
+    """
+    this function computes all partitions of the fact table and a cheap data signature per partition inside postgres, in one scan
+    - partition_by 'indicator': one partition per indicator_id
+    - partition_by 'year': one partition per year range of year_span years (e.g. 2000-2009)
+    - signature: row count + order-independent sum of the 64-bit hashes of all rows (DBPostgres.rows_signature_sql)
+    :return: dict partition key -> {'rows', 'signature', 'where'} (where = sql condition selecting the partition)
+    """
+    if partition_by == "indicator":
+        partition_expression = sql.SQL("indicator_id")
+    elif partition_by == "year":
+        partition_expression = sql.SQL("(year / {span}) * {span}").format(span = sql.Literal(int(year_span)))
+    else:
+        raise ValueError(f"Unknown partitioning '{partition_by}'! Available: 'indicator', 'year'.")
+
+    cursor.execute(sql.SQL("""
+                           SELECT {partition} AS partition,
+                                  COUNT(*) AS row_count,
+                                  {signature} AS data_signature
+                           FROM {table}
+                           GROUP BY 1;
+                           """).format(partition = partition_expression, signature = DBPostgres.rows_signature_sql(export_columns),
+                                       table = sql.Identifier(fact_table)))
+
+    partitions = {}
+    for partition, row_count, data_signature in cursor.fetchall():
+        if partition_by == "indicator":
+            key, where = partition, sql.SQL("indicator_id = {}").format(sql.Literal(partition))
+        else:
+            key = f"{partition}-{partition + year_span - 1}"
+            where = sql.SQL("year BETWEEN {} AND {}").format(sql.Literal(partition), sql.Literal(partition + year_span - 1))
+        partitions[key] = {"rows": row_count, "signature": str(data_signature), "where": where} # NUMERIC sum -> text in the manifest
+    return partitions
+
+#######################################
+# Parallel COPY TO export
+#######################################
+def _export_partition(snapshot_id: str, where: sql.Composable, path: str, fmt: str, compression: str):
+    """
+    stream one partition with COPY ... TO STDOUT on its own connection straight into a compressed file
+    - the connection imports the snapshot of the coordinating transaction, so all partitions show the same state of the table
+    - rows are ordered by the primary key, so unchanged data always gives the same checksum
+    :return: dict with the row count, sha256 of the uncompressed data and the file size
+    """
+    options = sql.SQL("FORMAT csv, HEADER") if fmt == "csv" else sql.SQL("FORMAT binary")
+    query = sql.SQL("COPY (SELECT {columns} FROM {table} WHERE {where} ORDER BY indicator_id, country_iso3code, year) TO STDOUT WITH ({options})").format(
+        columns = sql.SQL(", ").join(sql.Identifier(col) for col in export_columns),
+        table = sql.Identifier(fact_table),
+        where = where,
+        options = options
+    )
+    digest = hashlib.sha256()
+    tmp_path = f"{path}.tmp"
+    with psycopg.connect(**DBPostgres.connection_params()) as conn:
+        conn.isolation_level = psycopg.IsolationLevel.REPEATABLE_READ
+        with conn.cursor() as cursor:
+            cursor.execute(sql.SQL("SET TRANSACTION SNAPSHOT {}").format(sql.Literal(snapshot_id)))
+            with _open_compressed(tmp_path, compression) as output, cursor.copy(query) as copy:
+                for block in copy:
+                    digest.update(block)
+                    output.write(block)
+            row_count = cursor.rowcount
+        conn.rollback() # read only
+    os.replace(tmp_path, path) # atomic, so a reader never sees half a file
+    return {"rows": row_count, "sha256": digest.hexdigest(), "bytes": os.path.getsize(path)}
+
+def _read_manifest(manifest_path: str):
+    try:
+        with open(manifest_path, encoding = "utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def export_facts(partition_by: str = "indicator", year_span: int = 10, fmt: str = "csv", compression: str | None = None,
+                 output_dir: str = export_dir, max_workers: int = 4, full: bool = False):
+    """
+    this function exports the fact table as one compressed file per partition, several partitions in parallel
+    - re-exports only rewrite partitions whose signature (row count + hash) changed since the previous manifest
+    - partitions which no longer exist are removed
+    - manifest.json lists every partition with its file, row count, data signature, sha256 (of the uncompressed data) and file size
+    :param partition_by: 'indicator' or 'year' (year ranges of year_span years)
+    :param fmt: 'csv' (with header) or 'binary' (postgres COPY binary format)
+    :param compression: 'zstd' or 'gzip', default: compression_backend()
+    :param full: rewrite every partition
+    :return: the manifest dict
+    """
+    if fmt not in file_extensions:
+        raise ValueError(f"Unknown export format '{fmt}'! Available: {sorted(file_extensions)}.")
+    compression = compression or compression_backend()
+    if compression not in compression_extensions:
+        raise ValueError(f"Unknown compression '{compression}'! Available: {sorted(compression_extensions)}.")
+
+    target_dir = os.path.join(output_dir, f"by_{partition_by}")
+    manifest_path = os.path.join(target_dir, "manifest.json")
+    os.makedirs(target_dir, exist_ok = True)
+    previous = _read_manifest(manifest_path)
+    same_layout = (previous is not None and not full and
+                   (previous.get("format"), previous.get("compression"), previous.get("year_span")) == (fmt, compression, year_span))
+    previous_partitions = previous.get("partitions", {}) if same_layout else {}
+
+    start = time.perf_counter()
+    try:
+        # the coordinating transaction: computes the signatures and exports its snapshot to the worker connections
+        with psycopg.connect(**DBPostgres.connection_params()) as conn:
+            conn.isolation_level = psycopg.IsolationLevel.REPEATABLE_READ
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_export_snapshot();")
+                snapshot_id = cursor.fetchone()[0]
+                partitions = partition_signatures(cursor, partition_by, year_span)
+
+                manifest_partitions, to_export = {}, []
+                for key, partition in sorted(partitions.items()):
+                    file_name = _partition_file_name(key, fmt, compression)
+                    entry = previous_partitions.get(key)
+                    if (entry and entry["rows"] == partition["rows"] and entry["signature"] == partition["signature"]
+                            and entry["file"] == file_name and os.path.exists(os.path.join(target_dir, file_name))):
+                        manifest_partitions[key] = entry
+                    else:
+                        to_export.append((key, file_name, partition))
+
+                print(f"--- Exporting {len(to_export)} of {len(partitions)} '{partition_by}' partitions of '{fact_table}' ({fmt}, {compression}) to '{target_dir}' ... ₍^. .^₎⟆ ---\n")
+                with ThreadPoolExecutor(max_workers = max(1, max_workers)) as ex:
+                    futures = {
+                        key: ex.submit(_export_partition, snapshot_id, partition["where"], os.path.join(target_dir, file_name), fmt, compression)
+                        for key, file_name, partition in to_export
+                    }
+                    for key, file_name, partition in to_export:
+                        exported = futures[key].result()
+                        manifest_partitions[key] = {"file": file_name, "rows": exported["rows"], "signature": partition["signature"],
+                                                    "sha256": exported["sha256"], "bytes": exported["bytes"]}
+            conn.rollback() # read only, the snapshot is released only after all workers are done
+    except (Exception, psycopg.DatabaseError) as e:
+        raise DatabaseError(f"Something went wrong with exporting '{fact_table}'. Error type: {type(e).__name__}, error message: '{e}'.")
+
+    # files of partitions which disappeared (or of a previous layout) are removed
+    kept_files = {entry["file"] for entry in manifest_partitions.values()}
+    for file_name in os.listdir(target_dir):
+        if file_name != "manifest.json" and file_name not in kept_files:
+            os.remove(os.path.join(target_dir, file_name))
+
+    manifest = {
+        "table": fact_table,
+        "columns": export_columns,
+        "partition_by": partition_by,
+        "year_span": year_span,
+        "format": fmt,
+        "compression": compression,
+        "exported_at": datetime.now(timezone.utc).isoformat(),
+        "total_rows": sum(entry["rows"] for entry in manifest_partitions.values()),
+        "partitions": dict(sorted(manifest_partitions.items())),
+    }
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding = "utf-8") as f:
+        json.dump(manifest, f, indent = 2)
+    os.replace(tmp_path, manifest_path)
+
+    print(f"--- Exported {sum(manifest_partitions[key]['rows'] for key, _, _ in to_export)} rows in {len(to_export)} partitions, "
+          f"{len(partitions) - len(to_export)} unchanged partitions kept, {manifest['total_rows']} rows in total, "
+          f"in {time.perf_counter() - start:.2f}s ദ്ദി（• ˕ •マ.ᐟ ---\n")
+    return manifest
+
+#######################################
+# Export from the command line
+#######################################
+if __name__ == "__main__":
+    print("Hello from export_facts!")
+    parser = argparse.ArgumentParser(description = "export the WB fact table into compressed partition files with a manifest")
+    parser.add_argument("--partition-by", choices = ["indicator", "year"], default = "indicator")
+    parser.add_argument("--year-span", type = int, default = 10, help = "number of years per partition for --partition-by year")
+    parser.add_argument("--format", choices = sorted(file_extensions), default = "csv")
+    parser.add_argument("--compression", choices = sorted(compression_extensions), default = None, help = "default: zstd if installed, else gzip")
+    parser.add_argument("--output-dir", default = export_dir)
+    parser.add_argument("--workers", type = int, default = int(os.getenv("EXPORT_MAX_WORKERS", "4")), help = "parallel COPY connections")
+    parser.add_argument("--full", action = "store_true", help = "rewrite every partition, not only the changed ones")
+    args = parser.parse_args()
+
+    export_facts(partition_by = args.partition_by, year_span = args.year_span, fmt = args.format, compression = args.compression,
+                 output_dir = args.output_dir, max_workers = args.workers, full = args.full)
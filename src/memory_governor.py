@@ -0,0 +1,201 @@
+# imports
+import os # part of python standard library
+import time # part of python standard library
+import asyncio # part of python standard library
+import resource # part of python standard library (unix only)
+from threading import Condition # part of python standard library
+from contextlib import contextmanager, asynccontextmanager # part of python standard library
+from metrics import registry
+
+#######################################
+# Memory governor
+#######################################
+inflight_bytes_gauge = registry.gauge("wb_inflight_bytes", "approximate bytes of the fact chunks between the fetch workers and the db writer")
+fetch_limit_gauge = registry.gauge("wb_fetch_limit", "number of pages allowed to be fetched and parsed at once")
+rss_bytes_gauge = registry.gauge("wb_rss_bytes", "resident set size of the process as seen by the memory governor")
+
+_page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def current_rss_bytes():
+    """current resident set size (/proc on linux), otherwise the high-water mark of getrusage (then the governor can only shrink)"""
+    try:
+        with open("/proc/self/statm", encoding = "ascii") as f:
+            return int(f.read().split()[1]) * _page_size
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 # KiB on linux
+
+def chunk_bytes(df):
+    """approximate size of a chunk, incl. the python objects of object-dtype columns (indicator ids, iso3 codes)"""
+    return int(df.memory_usage(index = True, deep = True).sum())
+
+class MemoryGovernor:
+    """
+    this class keeps the memory of the fetch --> parse --> insert pipeline bounded by bytes instead of by number of chunks
+     (i) byte budget: a producer waits in reserve() until the chunks in flight (queued, not yet written) fit into inflight_budget_bytes
+         - a chunk is always admitted when nothing is in flight, so a chunk larger than the budget cannot deadlock the pipeline
+     (ii) fetch slots: a page is downloaded, decoded and transformed inside fetch_slot(), where raw json, the parsed list and the
+         intermediate frame exist at once - the number of slots shrinks by half when the RSS reaches rss_high of rss_budget_bytes,
+         and grows back one by one below rss_low
+    the high-water marks are kept for report()
+    """
+    def __init__(self, inflight_budget_bytes: int, rss_budget_bytes: int = 0, max_fetches: int = 8, min_fetches: int = 1,
+                 rss_high: float = 0.85, rss_low: float = 0.6, check_interval: float = 0.25):
+        self.inflight_budget_bytes = max(int(inflight_budget_bytes), 1)
+        self.rss_budget_bytes = int(rss_budget_bytes) # 0 = no RSS limit
+        self.max_fetches = max(max_fetches, 1)
+        self.min_fetches = max(min(min_fetches, self.max_fetches), 1)
+        self.rss_high, self.rss_low = rss_high, rss_low
+        self.check_interval = check_interval
+        self._cond = Condition()
+        self.inflight_bytes = 0
+        self.active_fetches = 0
+        self.fetch_limit = self.max_fetches
+        self._last_check = 0.0
+        self.stats = {"inflight_bytes_max": 0, "rss_bytes_max": 0, "fetch_limit_min": self.max_fetches, "shrinks": 0,
+                      "reserve_waits": 0, "reserve_wait_s": 0.0, "slot_waits": 0, "slot_wait_s": 0.0, "chunks": 0}
+        fetch_limit_gauge.set(self.fetch_limit)
+
+    @classmethod
+    def from_env(cls, max_fetches: int):
+        """the governor configured by WB_INFLIGHT_MB (chunks in flight) and WB_RSS_BUDGET_MB (0 = no RSS limit)"""
+        return cls(inflight_budget_bytes = float(os.getenv("WB_INFLIGHT_MB", "256")) * 2**20,
+                   rss_budget_bytes = float(os.getenv("WB_RSS_BUDGET_MB", "0")) * 2**20,
+                   max_fetches = max_fetches,
+                   min_fetches = int(os.getenv("WB_MIN_FETCHES", "1")))
+
+    # byte budget
+    def reserve(self, nbytes: int):
+        """block until nbytes more fit into the byte budget, then account them"""
+        with self._cond:
+            if self.inflight_bytes and self.inflight_bytes + nbytes > self.inflight_budget_bytes:
+                start = time.perf_counter()
+                self.stats["reserve_waits"] += 1
+                while self.inflight_bytes and self.inflight_bytes + nbytes > self.inflight_budget_bytes:
+                    self._cond.wait()
+                self.stats["reserve_wait_s"] += time.perf_counter() - start
+            self.inflight_bytes += nbytes
+            self.stats["chunks"] += 1
+            self.stats["inflight_bytes_max"] = max(self.stats["inflight_bytes_max"], self.inflight_bytes)
+            inflight_bytes_gauge.set(self.inflight_bytes)
+
+    def release(self, nbytes: int):
+        """the chunk was written (or dropped): give its bytes back"""
+        with self._cond:
+            self.inflight_bytes = max(self.inflight_bytes - nbytes, 0)
+            inflight_bytes_gauge.set(self.inflight_bytes)
+            self._cond.notify_all()
+
+    # fetch concurrency
+    def _check_rss(self):
+        """shrink / grow the fetch limit according to the RSS (at most every check_interval seconds, called with the lock held)"""
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        rss = current_rss_bytes()
+        rss_bytes_gauge.set(rss)
+        self.stats["rss_bytes_max"] = max(self.stats["rss_bytes_max"], rss)
+        if not self.rss_budget_bytes:
+            return
+        if rss >= self.rss_high * self.rss_budget_bytes and self.fetch_limit > self.min_fetches:
+            self.fetch_limit = max(self.fetch_limit // 2, self.min_fetches)
+            self.stats["shrinks"] += 1
+            self.stats["fetch_limit_min"] = min(self.stats["fetch_limit_min"], self.fetch_limit)
+            print(f"[memory] RSS {rss / 2**20:.0f} MiB of {self.rss_budget_bytes / 2**20:.0f} MiB budget --> {self.fetch_limit} concurrent fetches")
+        elif rss < self.rss_low * self.rss_budget_bytes and self.fetch_limit < self.max_fetches:
+            self.fetch_limit += 1
+        fetch_limit_gauge.set(self.fetch_limit)
+
+    @contextmanager
+    def fetch_slot(self):
+        """hold one of the fetch slots while a page is downloaded, parsed and handed over"""
+        with self._cond:
+            self._check_rss()
+            if self.active_fetches >= self.fetch_limit:
+                start = time.perf_counter()
+                self.stats["slot_waits"] += 1
+                while self.active_fetches >= self.fetch_limit:
+                    self._cond.wait(timeout = self.check_interval) # re-check the RSS, the limit may grow back
+                    self._check_rss()
+                self.stats["slot_wait_s"] += time.perf_counter() - start
+            self.active_fetches += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.active_fetches -= 1
+                self._cond.notify_all()
+
+    def report(self):
+        """high-water marks and waiting times of the run"""
+        with self._cond:
+            self.stats["rss_bytes_max"] = max(self.stats["rss_bytes_max"], current_rss_bytes(),
+                                              resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+            return dict(self.stats, inflight_budget_bytes = self.inflight_budget_bytes, rss_budget_bytes = self.rss_budget_bytes,
+                        max_fetches = self.max_fetches)
+
+    def print_report(self):
+        report = self.report()
+        rss_budget = f" (budget {report['rss_budget_bytes'] / 2**20:.0f} MiB)" if report["rss_budget_bytes"] else ""
+        print(f"--- Memory: peak RSS {report['rss_bytes_max'] / 2**20:.0f} MiB{rss_budget}, "
+              f"peak in flight {report['inflight_bytes_max'] / 2**20:.1f} of {report['inflight_budget_bytes'] / 2**20:.1f} MiB "
+              f"in {report['chunks']} chunks, fetch limit {report['fetch_limit_min']}-{report['max_fetches']} ({report['shrinks']} shrinks), "
+              f"producers waited {report['reserve_wait_s']:.2f}s for bytes / {report['slot_wait_s']:.2f}s for fetch slots ₍^. .^₎⟆ ---\n")
+        return report
+
+class AsyncMemoryGovernor(MemoryGovernor):
+    """
+    MemoryGovernor for coroutines on one event loop (the async ingestion engine): the same byte budget, fetch slots and report,
+    but reserve(), release() and fetch_slot() are awaited instead of blocking the loop
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._changed = asyncio.Condition()
+
+    def _fits(self, nbytes: int):
+        return not self.inflight_bytes or self.inflight_bytes + nbytes <= self.inflight_budget_bytes
+
+    # byte budget
+    async def reserve(self, nbytes: int):
+        """wait until nbytes more fit into the byte budget, then account them"""
+        async with self._changed:
+            if not self._fits(nbytes):
+                start = time.perf_counter()
+                self.stats["reserve_waits"] += 1
+                await self._changed.wait_for(lambda: self._fits(nbytes))
+                self.stats["reserve_wait_s"] += time.perf_counter() - start
+            self.inflight_bytes += nbytes
+            self.stats["chunks"] += 1
+            self.stats["inflight_bytes_max"] = max(self.stats["inflight_bytes_max"], self.inflight_bytes)
+            inflight_bytes_gauge.set(self.inflight_bytes)
+
+    async def release(self, nbytes: int):
+        """the chunk was written (or dropped): give its bytes back"""
+        async with self._changed:
+            self.inflight_bytes = max(self.inflight_bytes - nbytes, 0)
+            inflight_bytes_gauge.set(self.inflight_bytes)
+            self._changed.notify_all()
+
+    # fetch concurrency
+    @asynccontextmanager
+    async def fetch_slot(self):
+        """hold one of the fetch slots while a page is downloaded, parsed and admitted to the byte budget"""
+        async with self._changed:
+            self._check_rss()
+            if self.active_fetches >= self.fetch_limit:
+                start = time.perf_counter()
+                self.stats["slot_waits"] += 1
+                while self.active_fetches >= self.fetch_limit:
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), timeout = self.check_interval) # re-check the RSS, the limit may grow back
+                    except TimeoutError:
+                        pass
+                    self._check_rss()
+                self.stats["slot_wait_s"] += time.perf_counter() - start
+            self.active_fetches += 1
+        try:
+            yield
+        finally:
+            async with self._changed:
+                self.active_fetches -= 1
+                self._changed.notify_all()
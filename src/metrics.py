@@ -0,0 +1,259 @@
+# imports
+import os # part of python standard library
+import json # part of python standard library
+import time # part of python standard library
+from bisect import bisect_left # part of python standard library
+from threading import Lock, Thread # part of python standard library
+from contextlib import contextmanager # part of python standard library
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler # part of python standard library
+
+#######################################
+# Metric types
+#######################################
+# cheap enough to stay on in production: one small lock per metric, histograms only count into fixed buckets (no samples are kept)
+default_latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class _Metric:
+    metric_type = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = Lock()
+        self._series = {} # label values tuple -> state
+
+    def _key(self, labels: dict):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric '{self.name}' expects the labels {list(self.labelnames)}, got {sorted(labels)}!")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _label_text(self, key, extra: dict | None = None):
+        pairs = list(zip(self.labelnames, key)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + "}"
+
+    def _series_name(self, key):
+        return ",".join(f"{name}={value}" for name, value in zip(self.labelnames, key)) or "total"
+
+class Counter(_Metric):
+    """monotonically increasing count (requests, rows, bytes ...)"""
+    metric_type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._series.get(self._key(labels), 0)
+
+    def total(self):
+        with self._lock:
+            return sum(self._series.values())
+
+    def render(self):
+        with self._lock:
+            return [f"{self.name}{self._label_text(key)} {value}" for key, value in sorted(self._series.items())]
+
+    def summary(self):
+        with self._lock:
+            return {self._series_name(key): value for key, value in sorted(self._series.items())}
+
+class Gauge(_Metric):
+    """current value which goes up and down (queue depth ...), the high-water mark is kept for the summary"""
+    metric_type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            _, high_water = self._series.get(key, (0, value))
+            self._series[key] = (value, max(high_water, value))
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            value, high_water = self._series.get(key, (0, 0))
+            self._series[key] = (value + amount, max(high_water, value + amount))
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self):
+        with self._lock:
+            return [f"{self.name}{self._label_text(key)} {value}" for key, (value, _) in sorted(self._series.items())]
+
+    def summary(self):
+        with self._lock:
+            return {self._series_name(key): {"value": value, "max": high_water} for key, (value, high_water) in sorted(self._series.items())}
+
+class Histogram(_Metric):
+    """distribution of observations (latencies, sizes ...) in fixed cumulative buckets, like prometheus' histogram"""
+    metric_type = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames = (), buckets = default_latency_buckets):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value) # first bucket with upper bound >= value (len(buckets) = +Inf)
+        with self._lock:
+            state = self._series.get(key)
+            if state is None:
+                state = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """observe the seconds spent in the with block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _quantile(self, counts, count, q):
+        """estimate a quantile from the bucket counts (linear interpolation inside the bucket, like histogram_quantile())"""
+        if count == 0:
+            return None
+        rank, cumulative = q * count, 0
+        for i, bucket_count in enumerate(counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                if i == len(self.buckets): # +Inf bucket: the best estimate is its lower bound
+                    return lower
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(list(self.buckets) + ["+Inf"], counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{self._label_text(key, {'le': bound})} {cumulative}")
+                lines.append(f"{self.name}_sum{self._label_text(key)} {total}")
+                lines.append(f"{self.name}_count{self._label_text(key)} {count}")
+        return lines
+
+    def summary(self):
+        with self._lock:
+            return {
+                self._series_name(key): {
+                    "count": count,
+                    "sum": total,
+                    "mean": total / count if count else None,
+                    "p50": self._quantile(counts, count, 0.5),
+                    "p99": self._quantile(counts, count, 0.99),
+                }
+                for key, (counts, total, count) in sorted(self._series.items())
+            }
+
+#######################################
+# Registry, exposition & summary
+#######################################
+class MetricsRegistry:
+    """
+    all metrics of a process: get-or-create by name, rendered in the prometheus text format or summarised as json
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._lock = Lock()
+        self.started = time.time()
+
+    def _get_or_create(self, cls, name, help_text, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric '{name}' is already registered as a {metric.metric_type}!")
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames = ()):
+        return self._get_or_create(Counter, name, help_text, labelnames)
+
+    def gauge(self, name: str, help_text: str, labelnames = ()):
+        return self._get_or_create(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name: str, help_text: str, labelnames = (), buckets = default_latency_buckets):
+        return self._get_or_create(Histogram, name, help_text, labelnames, buckets = buckets)
+
+    def render_prometheus(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.metric_type}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """every metric's current state, plus the per-second rate of every counter over the lifetime of the process"""
+        uptime = max(time.time() - self.started, 1e-9)
+        with self._lock:
+            metrics = list(self._metrics.values())
+        summary = {"uptime_s": round(uptime, 3), "counters": {}, "rates_per_s": {}, "gauges": {}, "histograms": {}}
+        for metric in metrics:
+            if isinstance(metric, Counter):
+                summary["counters"][metric.name] = metric.summary()
+                summary["rates_per_s"][metric.name] = metric.total() / uptime
+            elif isinstance(metric, Gauge):
+                summary["gauges"][metric.name] = metric.summary()
+            elif isinstance(metric, Histogram):
+                summary["histograms"][metric.name] = metric.summary()
+        return summary
+
+    def write_summary(self, path: str):
+        """write the json summary atomically"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok = True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding = "utf-8") as f:
+            json.dump(self.summary(), f, indent = 2)
+        os.replace(tmp_path, path)
+
+registry = MetricsRegistry() # the process-wide default registry
+
+def start_metrics_server(port: int, host: str = "0.0.0.0", metrics_registry: MetricsRegistry = registry):
+    """serve GET /metrics (prometheus text format) and GET /metrics.json (summary) on a daemon thread"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith("/metrics.json"):
+                body, content_type = json.dumps(metrics_registry.summary()).encode("utf-8"), "application/json"
+            elif self.path.startswith("/metrics"):
+                body, content_type = metrics_registry.render_prometheus().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args): # no access log for every scrape
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    Thread(target = server.serve_forever, name = "metrics-server", daemon = True).start()
+    print(f"--- Serving metrics on http://{host}:{server.server_address[1]}/metrics ₍^. .^₎⟆ ---\n")
+    return server
+
+def start_metrics_server_from_env():
+    """start the metrics endpoint if METRICS_PORT is set (0 / empty = off)"""
+    port = int(os.getenv("METRICS_PORT", "0") or 0)
+    if port:
+        return start_metrics_server(port)
+    return None
@@ -0,0 +1,198 @@
+# imports
+import os # part of python standard library
+import json # part of python standard library
+import time # part of python standard library
+import hashlib # part of python standard library
+import argparse # part of python standard library
+from concurrent.futures import ThreadPoolExecutor # part of python standard library
+from save_data import DBPostgres, DatabaseError
+import psycopg
+from psycopg import sql
+import pandas as pd
+
+#######################################
+# Panel sources
+#######################################
+# scraped sources which can be joined to the WB indicators: source name -> (final table, score column)
+scraped_sources = {
+    "cpi": ("corruption_perception_index", "cpi_score"),
+    "whr": ("world_happiness_report", "happiness_score"),
+}
+
+panel_cache_dir = os.getenv("PANEL_CACHE_DIR", "/data/panels")
+
+def _filters(countries: list[str] | None, start_year: int | None, end_year: int | None):
+    """build the WHERE conditions shared by all sources, so that postgres only returns the requested country-year cells"""
+    conditions, params = [], []
+    if countries:
+        conditions.append(sql.SQL("country_iso3code = ANY(%s)"))
+        params.append(list(countries))
+    if start_year is not None:
+        conditions.append(sql.SQL("year >= %s"))
+        params.append(int(start_year))
+    if end_year is not None:
+        conditions.append(sql.SQL("year <= %s"))
+        params.append(int(end_year))
+    return conditions, params
+
+def _fetch_frame(query: sql.Composed, params: list, columns: list[str]):
+    """run one query on its own connection (psycopg connections must not be shared between threads)"""
+    with psycopg.connect(**DBPostgres.connection_params()) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+            return pd.DataFrame(cursor.fetchall(), columns = columns)
+
+def _fetch_indicators(indicator_ids: list[str], countries, start_year, end_year):
+    """fetch the long fact rows of a group of indicators and pivot them into country-year x indicator columns"""
+    conditions, params = _filters(countries, start_year, end_year)
+    query = sql.SQL("""
+                    SELECT country_iso3code, year, indicator_id, value::DOUBLE PRECISION
+                    FROM wb_indicator_country_year_value
+                    WHERE {conditions};
+                    """).format(conditions = sql.SQL(" AND ").join([sql.SQL("indicator_id = ANY(%s)")] + conditions))
+    df = _fetch_frame(query, [list(indicator_ids)] + params, ["country_iso3code", "year", "indicator_id", "value"])
+    # the fact table's primary key guarantees one value per (indicator, country, year) --> pivot without aggregation
+    return df.pivot(index = ["country_iso3code", "year"], columns = "indicator_id", values = "value")
+
+def _fetch_scraped_source(source: str, countries, start_year, end_year):
+    """fetch one scraped source (CPI / WHR) as a single country-year column"""
+    table_name, score_column = scraped_sources[source]
+    conditions, params = _filters(countries, start_year, end_year)
+    query = sql.SQL("SELECT country_iso3code, year, {score}::DOUBLE PRECISION FROM {table}{where};").format(
+        score = sql.Identifier(score_column),
+        table = sql.Identifier(table_name),
+        where = sql.SQL(" WHERE ") + sql.SQL(" AND ").join(conditions) if conditions else sql.SQL("")
+    )
+    df = _fetch_frame(query, params, ["country_iso3code", "year", source])
+    return df.set_index(["country_iso3code", "year"])
+
+def _source_watermarks(indicator_ids, sources):
+    """
+    last_change_xid of every table a panel reads (the same value as in v_change_watermarks), as text
+    a cached panel is stale once one of them has moved, i.e. the facts, CPI or WHR were reloaded since it was built
+    - queried per table instead of through the view: the view also computes last_modified, which has no index (full scan of the facts)
+    """
+    tables = (["wb_indicator_country_year_value"] if indicator_ids else []) + [scraped_sources[source][0] for source in sources]
+    query = sql.SQL("""
+                    SELECT GREATEST((SELECT MAX(change_xid) FROM {table}),
+                                    (SELECT MAX(change_xid) FROM row_deletion_log WHERE table_name = %s))::TEXT;
+                    """)
+    watermarks = {}
+    with psycopg.connect(**DBPostgres.connection_params()) as conn:
+        with conn.cursor() as cursor:
+            for table in tables: # both MAX() are index-only scans (idx_*_change_xid, idx_row_deletion_log_table_change_xid)
+                cursor.execute(query.format(table = sql.Identifier(table)), (table,))
+                watermarks[table] = cursor.fetchone()[0]
+    return watermarks
+
+def panel_cache_key(indicator_ids, sources, countries, start_year, end_year):
+    """the panel spec in a canonical form (order of ids / countries doesn't matter) hashed into a short cache key"""
+    spec = {
+        "indicator_ids": sorted(set(indicator_ids or [])),
+        "sources": sorted(set(sources or [])),
+        "countries": sorted(set(countries)) if countries else None,
+        "start_year": int(start_year) if start_year is not None else None,
+        "end_year": int(end_year) if end_year is not None else None,
+    }
+    return hashlib.sha256(json.dumps(spec, sort_keys = True).encode("utf-8")).hexdigest()[:20], spec
+
+def build_panel(indicator_ids: list[str], sources = ("cpi", "whr"), countries: list[str] | None = None,
+                start_year: int | None = None, end_year: int | None = None, max_workers: int = 4,
+                indicators_per_query: int = 25, cache_dir: str | None = panel_cache_dir, refresh: bool = False):
+    """
+    this function builds an aligned, wide country-year panel of WB indicators and scraped sources
+    - year / country filters are pushed down into the SQL of every source
+    - every source (and every group of indicators_per_query indicators) is fetched concurrently on its own connection
+    - results are aligned with index-based outer joins on (country_iso3code, year)
+    - built panels are cached on disk (pickle), keyed by the hash of their spec, and rebuilt once a table they read has changed
+    :param indicator_ids: list of WB indicator ids, e.g. ['NY.GDP.PCAP.CD', 'SP.POP.TOTL']
+    :param sources: scraped sources to join ('cpi', 'whr')
+    :param countries: optional list of country_iso3codes
+    :param start_year, end_year: optional year range (both inclusive)
+    :param refresh: ignore (and overwrite) a cached panel
+    :return: df indexed by (country_iso3code, year) with one column per indicator / source
+    """
+    unknown_sources = set(sources or []) - set(scraped_sources)
+    if unknown_sources:
+        raise ValueError(f"Unknown panel sources: {sorted(unknown_sources)}! Available: {sorted(scraped_sources)}.")
+
+    cache_key, spec = panel_cache_key(indicator_ids, sources, countries, start_year, end_year)
+    cache_path = os.path.join(cache_dir, f"panel_{cache_key}.pkl") if cache_dir else None
+    spec_path = os.path.join(cache_dir, f"panel_{cache_key}.json") if cache_dir else None
+    watermarks = None
+    if cache_path:
+        try:
+            # read before the build: a change committed while the panel is fetched makes the next call rebuild it
+            watermarks = _source_watermarks(spec["indicator_ids"], spec["sources"])
+        except (Exception, psycopg.DatabaseError) as e:
+            raise DatabaseError(f"Something went wrong with reading the change watermarks of panel {cache_key}. Error type: {type(e).__name__}, error message: '{e}'.")
+    if cache_path and not refresh and os.path.exists(cache_path):
+        try:
+            with open(spec_path, encoding = "utf-8") as f:
+                cached_watermarks = json.load(f).get("source_watermarks")
+        except (OSError, ValueError):
+            cached_watermarks = None
+        if cached_watermarks == watermarks:
+            print(f"--- Loading cached panel {cache_key} from '{cache_path}' ₍^. .^₎⟆ ---\n")
+            return pd.read_pickle(cache_path)
+        print(f"--- Cached panel {cache_key} is stale (its tables changed since it was built), rebuilding... ---\n")
+
+    start = time.perf_counter()
+    indicator_ids = spec["indicator_ids"]
+    indicator_groups = [indicator_ids[i:i + indicators_per_query] for i in range(0, len(indicator_ids), indicators_per_query)]
+
+    try:
+        with ThreadPoolExecutor(max_workers = max_workers) as ex:
+            futures = [ex.submit(_fetch_indicators, group, countries, start_year, end_year) for group in indicator_groups]
+            futures += [ex.submit(_fetch_scraped_source, source, countries, start_year, end_year) for source in spec["sources"]]
+            frames = [future.result() for future in futures]
+    except (Exception, psycopg.DatabaseError) as e:
+        raise DatabaseError(f"Something went wrong with building the panel {cache_key}. Error type: {type(e).__name__}, error message: '{e}'.")
+
+    frames = [frame for frame in frames if not frame.empty]
+    if frames:
+        panel = pd.concat(frames, axis = 1, join = "outer").sort_index()
+    else:
+        panel = pd.DataFrame(index = pd.MultiIndex.from_arrays([[], []], names = ["country_iso3code", "year"]))
+    # keep the requested column order (indicators first, then scraped sources), also for columns without any data
+    panel = panel.reindex(columns = indicator_ids + spec["sources"])
+    panel.columns.name = None
+
+    print(f"--- Built panel {cache_key}: {panel.shape[0]} country-years x {panel.shape[1]} columns in {time.perf_counter() - start:.2f}s ദ്ദി（• ˕ •マ.ᐟ ---\n")
+
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok = True)
+        tmp_path = f"{cache_path}.tmp"
+        panel.to_pickle(tmp_path)
+        os.replace(tmp_path, cache_path) # atomic, so a concurrent reader never sees half a file
+        with open(spec_path, "w", encoding = "utf-8") as f:
+            json.dump({**spec, "source_watermarks": watermarks}, f, indent = 2)
+    return panel
+
+#######################################
+# Build a panel from the command line
+#######################################
+if __name__ == "__main__":
+    print("Hello from panel_builder!")
+    parser = argparse.ArgumentParser(description = "build an aligned country-year panel of WB indicators, CPI and WHR scores")
+    parser.add_argument("indicator_ids", nargs = "*", help = "WB indicator ids, e.g. NY.GDP.PCAP.CD SP.POP.TOTL")
+    parser.add_argument("--sources", default = "cpi,whr", help = "comma-separated scraped sources to join (cpi, whr)")
+    parser.add_argument("--countries", default = "", help = "comma-separated country_iso3codes (default: all)")
+    parser.add_argument("--start-year", type = int, default = None)
+    parser.add_argument("--end-year", type = int, default = None)
+    parser.add_argument("--refresh", action = "store_true", help = "rebuild even if the panel is cached")
+    parser.add_argument("--output", default = "", help = "optional csv path to write the panel to")
+    args = parser.parse_args()
+
+    panel = build_panel(
+        indicator_ids = args.indicator_ids,
+        sources = [s.strip() for s in args.sources.split(",") if s.strip()],
+        countries = [c.strip().upper() for c in args.countries.split(",") if c.strip()] or None,
+        start_year = args.start_year,
+        end_year = args.end_year,
+        refresh = args.refresh,
+    )
+    print(panel.head(10))
+    if args.output:
+        panel.to_csv(args.output)
+        print(f"\nSaved the panel to '{args.output}' ᓚ₍^..^₎")
@@ -0,0 +1,79 @@
+# imports
+import time # part of python standard library
+import asyncio # part of python standard library
+from threading import BoundedSemaphore, Lock # part of python standard library
+from contextlib import contextmanager, asynccontextmanager # part of python standard library
+
+#######################################
+# Politeness towards the crawled hosts
+#######################################
+class DomainGate:
+    """per-domain politeness: at most max_concurrent requests at a time and at least min_delay seconds between the starts of two requests"""
+    def __init__(self, max_concurrent: int = 1, min_delay: float = 1.0):
+        self._slots = BoundedSemaphore(max(max_concurrent, 1))
+        self._lock = Lock()
+        self._next_start = 0.0
+        self.min_delay = min_delay
+
+    @contextmanager
+    def request(self):
+        with self._slots:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._next_start - now
+                self._next_start = max(now, self._next_start) + self.min_delay
+            if wait > 0:
+                time.sleep(wait)
+            yield
+
+class AsyncDomainGate:
+    """
+    DomainGate for coroutines on one event loop (the async ingestion engine): at least min_delay seconds between the starts of two
+    requests and an adaptive number of requests in flight (like the congestion window of tcp), at most max_concurrent
+    - starts with start_concurrent requests, +1 per answer (doubles per round trip) until the first throttled answer
+    - a throttled answer (back_off) halves the requests in flight and holds back every request of the loop for Retry-After seconds,
+      after that +1 request per round trip (1 / limit per answer)
+    - only a request which started after the last back-off halves the limit again (the ones in flight were sent at the old pace)
+    """
+    def __init__(self, max_concurrent: int = 1, min_delay: float = 1.0, start_concurrent: int = 8):
+        self.max_concurrent = max(max_concurrent, 1)
+        self.limit = float(min(max(start_concurrent, 1), self.max_concurrent))
+        self.min_delay = min_delay
+        self._in_flight = 0
+        self._changed = asyncio.Condition()
+        self._next_start = 0.0
+        self._last_back_off = None
+
+    def back_off(self, seconds: float, started_at: float):
+        """
+        :param seconds: Retry-After of the throttled answer
+        :param started_at: start of the throttled request (yielded by request())
+        """
+        now = time.monotonic()
+        if self._last_back_off is None or started_at >= self._last_back_off:
+            self.limit = max(self.limit / 2, 1.0)
+            self._last_back_off = now
+        self._next_start = max(self._next_start, now + seconds)
+
+    def relax(self):
+        """an answer which wasn't throttled"""
+        self.limit = min(self.limit + (1.0 if self._last_back_off is None else 1.0 / self.limit), self.max_concurrent)
+
+    @asynccontextmanager
+    async def request(self):
+        """:return: (as) monotonic start time of the request"""
+        async with self._changed:
+            await self._changed.wait_for(lambda: self._in_flight < int(self.limit))
+            self._in_flight += 1
+        try:
+            # one event loop: nothing runs between reading and moving the next start, no lock needed
+            now = time.monotonic()
+            wait = self._next_start - now
+            self._next_start = max(now, self._next_start) + self.min_delay
+            if wait > 0:
+                await asyncio.sleep(wait)
+            yield time.monotonic()
+        finally:
+            async with self._changed:
+                self._in_flight -= 1
+                self._changed.notify_all()
@@ -0,0 +1,279 @@
+# imports
+import os # part of python standard library
+import re # part of python standard library
+import sys # part of python standard library
+import json # part of python standard library
+import time # part of python standard library
+import pstats # part of python standard library
+import cProfile # part of python standard library
+import argparse # part of python standard library
+import resource # part of python standard library (unix only)
+import tracemalloc # part of python standard library
+import threading # part of python standard library
+from collections import Counter # part of python standard library
+from contextlib import contextmanager # part of python standard library
+from datetime import datetime, timezone # part of python standard library
+
+#######################################
+# Profiling settings
+#######################################
+# PROFILE_MODE: comma-separated list of 'timing', 'cprofile', 'memory', 'sample' or 'all' (empty / 'off' = no profiling at all)
+# - timing: wall time, process CPU time and RSS high-water mark per stage (always on when profiling)
+# - cprofile: deterministic profile of the thread running the stage --> <stage>.pstats
+# - memory: tracemalloc peak of python allocations per stage (slows the run down noticeably)
+# - sample: wall-clock stack sampling of all threads (incl. the fetch workers) --> <stage>.collapsed (flamegraph.pl / speedscope input)
+profile_modes = ("timing", "cprofile", "memory", "sample")
+profile_dir = os.getenv("PROFILE_DIR", "/data/profiles")
+# only one cProfile can be active per process (python >= 3.12 raises otherwise), so concurrent stages take turns:
+# a stage starting while another one is profiled runs without pstats (its timing / memory / samples are still recorded)
+_cprofile_lock = threading.Lock()
+
+def _parse_modes(value: str):
+    modes = {mode.strip().lower() for mode in value.split(",") if mode.strip()}
+    if not modes or modes & {"off", "false", "0", "no"}:
+        return set()
+    if "all" in modes:
+        return set(profile_modes)
+    unknown = modes - set(profile_modes)
+    if unknown:
+        raise ValueError(f"Unknown profiling mode(s) {sorted(unknown)}! Available: {list(profile_modes)} or 'all'.")
+    return modes | {"timing"}
+
+def _safe_name(name: str):
+    return re.sub(r"[^A-Za-z0-9._-]", "_", name)
+
+#######################################
+# Stack sampler
+#######################################
+class _StackSampler(threading.Thread):
+    """
+    samples the python stacks of all threads every interval seconds and counts them in the collapsed format ('thread;file:func;... count')
+    - wall-clock samples: a thread waiting on a socket or a lock shows up in its waiting frame, which tells the network from the CPU apart
+    - samples are counted for every stage which is active at that moment
+    """
+    def __init__(self, interval: float, active_stages):
+        super().__init__(name = "profile-sampler", daemon = True)
+        self.interval = interval
+        self.active_stages = active_stages # callable --> names of the running stages
+        self.counts = {} # stage name -> Counter(collapsed stack -> samples)
+        self.lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own_ident = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            stages = self.active_stages()
+            if not stages:
+                continue
+            thread_names = {thread.ident: re.sub(r"_\d+$", "", thread.name) for thread in threading.enumerate()} # pool workers folded into one root
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                frames = []
+                while frame is not None:
+                    frames.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                    frame = frame.f_back
+                stacks.append(";".join([thread_names.get(ident, "thread")] + frames[::-1]))
+            with self.lock:
+                for stage in stages:
+                    self.counts.setdefault(stage, Counter()).update(stacks)
+
+    def take(self, stage: str):
+        with self.lock:
+            return self.counts.pop(stage, Counter())
+
+    def stop(self):
+        self._stop_event.set()
+
+#######################################
+# Stage profiler
+#######################################
+class StageProfiler:
+    """
+    this class profiles the named stages of a run (country info, topics, ..., fact streaming) and writes one report directory per run:
+    <profile_dir>/<run name>_<utc timestamp>/report.json (+ <stage>.pstats, <stage>.collapsed)
+    - report.json is rewritten after every stage, so a crashed run still leaves its finished stages behind
+    - stages may run concurrently (e.g. one per web source): cProfile covers the thread running the stage and only one stage at a time
+      is cProfiled (the others record 'cprofile': 'skipped'), the process CPU time, the tracemalloc peak (since the first of the
+      overlapping stages started) and the stack samples of overlapping stages include each other
+    """
+    def __init__(self, run_name: str = "run", modes = (), output_dir: str = profile_dir, sample_interval: float = 0.005):
+        self.run_name = run_name
+        self.modes = set(modes)
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+        self.run_dir = None
+        self.stages = []
+        self._active = {} # stage name -> number of running instances
+        self._lock = threading.Lock()
+        self._sampler = None
+
+    @classmethod
+    def from_env(cls, run_name: str):
+        """the profiler configured by PROFILE_MODE, PROFILE_DIR and PROFILE_SAMPLE_INTERVAL_MS (disabled by default)"""
+        return cls(run_name, _parse_modes(os.getenv("PROFILE_MODE", "")), profile_dir, float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5")) / 1000)
+
+    @property
+    def enabled(self):
+        return bool(self.modes)
+
+    def _ensure_started(self):
+        """create the run directory and start tracemalloc / the sampler on the first stage"""
+        with self._lock:
+            if self.run_dir is None:
+                timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+                self.run_dir = os.path.join(self.output_dir, f"{_safe_name(self.run_name)}_{timestamp}")
+                os.makedirs(self.run_dir, exist_ok = True)
+            if "memory" in self.modes and not tracemalloc.is_tracing():
+                tracemalloc.start()
+            if "sample" in self.modes and self._sampler is None:
+                self._sampler = _StackSampler(self.sample_interval, lambda: [name for name, n in list(self._active.items()) if n])
+                self._sampler.start()
+
+    def _unique_name(self, name: str):
+        """a stage which runs more than once gets a numbered name (name, name_2, ...)"""
+        taken = {stage["stage"] for stage in self.stages} | set(self._active)
+        unique, i = name, 1
+        while unique in taken:
+            i += 1
+            unique = f"{name}_{i}"
+        return unique
+
+    @contextmanager
+    def stage(self, name: str):
+        """profile the with block as the stage 'name' (does nothing if profiling is disabled)"""
+        if not self.enabled:
+            yield
+            return
+        self._ensure_started()
+        with self._lock:
+            name = self._unique_name(name)
+            if "memory" in self.modes:
+                if not any(self._active.values()): # resetting the peak while other stages run would lose theirs
+                    tracemalloc.reset_peak()
+                memory_start = tracemalloc.get_traced_memory()[0]
+            self._active[name] = self._active.get(name, 0) + 1
+
+        profile, cprofile_status = None, None
+        started_at = datetime.now(timezone.utc).isoformat()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        failed = False
+        try:
+            if "cprofile" in self.modes:
+                # nested stages find the lock taken as well: the outer stage's profile covers them
+                if _cprofile_lock.acquire(blocking = False):
+                    profile = cProfile.Profile()
+                    try:
+                        profile.enable()
+                    except ValueError: # another profiling tool (e.g. a debugger) is active
+                        profile = None
+                        _cprofile_lock.release()
+                cprofile_status = "ok" if profile is not None else "skipped"
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            wall_s, cpu_s = time.perf_counter() - wall_start, time.process_time() - cpu_start
+            if profile is not None:
+                profile.disable()
+                _cprofile_lock.release()
+            record = {
+                "stage": name,
+                "status": "failed" if failed else "ok",
+                "started_at": started_at,
+                "wall_s": round(wall_s, 4),
+                "cpu_s": round(cpu_s, 4), # process-wide, so the fetch worker threads are included
+                "rss_max_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1), # KiB on linux, high-water mark of the process
+            }
+            if cprofile_status is not None:
+                record["cprofile"] = cprofile_status
+            with self._lock:
+                self._active[name] -= 1
+                if "memory" in self.modes:
+                    record["tracemalloc_peak_mb"] = round(max(tracemalloc.get_traced_memory()[1] - memory_start, 0) / 2**20, 2)
+            self._write_stage_files(name, record, profile)
+            with self._lock:
+                self.stages.append(record)
+                self._write_report()
+
+    def _write_stage_files(self, name: str, record: dict, profile):
+        base = os.path.join(self.run_dir, _safe_name(name))
+        if profile is not None:
+            profile.dump_stats(f"{base}.pstats")
+            record["pstats"] = os.path.basename(f"{base}.pstats")
+        if self._sampler is not None:
+            samples = self._sampler.take(name)
+            with open(f"{base}.collapsed", "w", encoding = "utf-8") as f:
+                for stack, count in sorted(samples.items()):
+                    f.write(f"{stack} {count}\n")
+            record["samples"] = sum(samples.values())
+            record["collapsed"] = os.path.basename(f"{base}.collapsed")
+
+    def _write_report(self):
+        report = {"run": self.run_name, "modes": sorted(self.modes), "sample_interval_s": self.sample_interval, "stages": self.stages}
+        path = os.path.join(self.run_dir, "report.json")
+        with open(f"{path}.tmp", "w", encoding = "utf-8") as f:
+            json.dump(report, f, indent = 2)
+        os.replace(f"{path}.tmp", path)
+
+    def finish(self):
+        """stop the sampler / tracemalloc and print the stage table"""
+        if not self.enabled or self.run_dir is None:
+            return None
+        if self._sampler is not None:
+            self._sampler.stop()
+            self._sampler = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        print(f"\n--- Profile of '{self.run_name}' ({', '.join(sorted(self.modes))}) written to '{self.run_dir}' ₍^. .^₎⟆ ---")
+        for record in self.stages:
+            memory = f"  py peak {record['tracemalloc_peak_mb']:8.1f} MiB" if "tracemalloc_peak_mb" in record else ""
+            print(f"{record['stage']:<30} wall {record['wall_s']:8.2f}s  cpu {record['cpu_s']:8.2f}s  rss max {record['rss_max_mb']:7.0f} MiB{memory}")
+        print()
+        return self.run_dir
+
+#######################################
+# Comparing two runs
+#######################################
+def _load_report(run_dir: str):
+    with open(os.path.join(run_dir, "report.json"), encoding = "utf-8") as f:
+        return json.load(f)
+
+def _top_functions(run_dir: str, pstats_file: str, limit: int):
+    """function -> own (total) time of one stage's pstats file"""
+    stats = pstats.Stats(os.path.join(run_dir, pstats_file))
+    rows = sorted(stats.stats.items(), key = lambda item: item[1][2], reverse = True)[:limit]
+    return {f"{os.path.basename(file)}:{line}({func})": tottime for (file, line, func), (_, _, tottime, _, _) in rows}
+
+def compare_runs(old_dir: str, new_dir: str, top: int = 10):
+    """
+    this function prints the per-stage difference of two profile runs, and for stages with pstats on both sides the functions whose
+    own time changed the most (the .collapsed files can be diffed as flamegraphs, e.g. with difffolded.pl)
+    """
+    old = {record["stage"]: record for record in _load_report(old_dir)["stages"]}
+    new = {record["stage"]: record for record in _load_report(new_dir)["stages"]}
+    print(f"{'stage':<30} {'wall old':>9} {'wall new':>9} {'delta':>9}   {'cpu old':>8} {'cpu new':>8}")
+    for name in list(old) + [name for name in new if name not in old]:
+        o, n = old.get(name, {}), new.get(name, {})
+        wall_delta = n["wall_s"] - o["wall_s"] if o and n else float("nan")
+        print(f"{name:<30} {o.get('wall_s', float('nan')):9.2f} {n.get('wall_s', float('nan')):9.2f} {wall_delta:+9.2f}   "
+              f"{o.get('cpu_s', float('nan')):8.2f} {n.get('cpu_s', float('nan')):8.2f}")
+    for name in old:
+        if name in new and old[name].get("pstats") and new[name].get("pstats"):
+            old_top = _top_functions(old_dir, old[name]["pstats"], top * 3)
+            new_top = _top_functions(new_dir, new[name]["pstats"], top * 3)
+            deltas = sorted(((new_top.get(func, 0.0) - old_top.get(func, 0.0), func) for func in set(old_top) | set(new_top)),
+                            key = lambda item: abs(item[0]), reverse = True)[:top]
+            print(f"\n{name}: largest changes of own time")
+            for delta, func in deltas:
+                print(f"  {delta:+8.3f}s  {func}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "compare two profile runs written by PROFILE_MODE (report.json + pstats)")
+    parser.add_argument("old_run_dir")
+    parser.add_argument("new_run_dir")
+    parser.add_argument("--top", type = int, default = 10, help = "functions listed per stage")
+    args = parser.parse_args()
+    compare_runs(args.old_run_dir, args.new_run_dir, args.top)
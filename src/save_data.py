@@ -1,49 +1,218 @@
 # imports
 import os # part of python standard library -> no need to add to requirements.txt
 import psycopg
+import numpy as np
 import time # part of python standard library
 from psycopg import sql
 from dotenv import load_dotenv
 from decimal import Decimal # part of python standard library
 from datetime import datetime # part of python standard library
+import re # part of python standard library
+import glob # part of python standard library
+import shutil # part of python standard library
+import pickle # part of python standard library
+import hashlib # part of python standard library
+import itertools # part of python standard library
+from threading import Lock # part of python standard library
+from collections import OrderedDict # part of python standard library
 
 class DatabaseError(Exception):
     pass
 
+class QueryCache:
+    """
+    result cache for read queries: in-memory LRU tier with a byte-size limit + optional on-disk tier (pickles)
+    - entries are keyed by the normalised SQL text + parameters and tagged with the tables they read
+    - writing to a table invalidates every entry tagged with it (see DBPostgres._invalidate_cache_for)
+    - disk tier: <key>.pkl per entry + an index directory per table (tables/<table>/<key>) which invalidation lists
+    """
+    _read_tables_pattern = re.compile(r'\b(?:FROM|JOIN)\s+((?:"?\w+"?\.)?"?\w+"?)', re.IGNORECASE)
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, disk_dir: str | None = None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict() # key -> (value, size in bytes, tables), least recently used first
+        self._bytes = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok = True)
+
+    @classmethod
+    def from_env(cls):
+        """build a cache from DB_QUERY_CACHE / DB_CACHE_MAX_MB / DB_CACHE_DIR, returns None if caching is switched off"""
+        if os.getenv("DB_QUERY_CACHE", "false").strip().lower() not in ("1", "true", "yes"):
+            return None
+        return cls(max_bytes = int(float(os.getenv("DB_CACHE_MAX_MB", "64")) * 1024 * 1024), disk_dir = os.getenv("DB_CACHE_DIR") or None)
+
+    @staticmethod
+    def make_key(query_text: str, params = None):
+        """normalise whitespace / trailing semicolons so that the same query written differently hits the same entry"""
+        normalised = " ".join(query_text.split()).rstrip(";").strip()
+        return hashlib.sha256(f"{normalised}\x00{params!r}".encode("utf-8")).hexdigest()
+
+    @classmethod
+    def tables_in(cls, query_text: str):
+        """table / view names a read query touches (schema prefix and quotes stripped)"""
+        return {match.split(".")[-1].strip('"').lower() for match in cls._read_tables_pattern.findall(query_text)}
+
+    def _disk_path(self, key: str):
+        # fixed-length file name: the tables an entry read live in the index, not in the name (a query over many tables would hit the 255 byte limit)
+        return os.path.join(self.disk_dir, f"{key}.pkl")
+
+    def _index_dir(self, table: str):
+        return os.path.join(self.disk_dir, "tables", table)
+
+    def get(self, key: str):
+        """:return: (True, value) on a hit, (False, None) on a miss"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key][0]
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), "rb") as f:
+                    tables, value = pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                pass # not on disk (or half written / removed meanwhile) -> miss
+            else:
+                with self._lock:
+                    self.disk_hits += 1
+                self._put_memory(key, value, tables, len(pickle.dumps(value)))
+                return True, value
+        with self._lock:
+            self.misses += 1
+        return False, None
+
+    def put(self, key: str, value, tables):
+        tables = {t.lower() for t in tables}
+        payload = pickle.dumps(value)
+        self._put_memory(key, value, tables, len(payload))
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                for table in tables: # index first: a pickle is never on disk without the entries which invalidate it
+                    os.makedirs(self._index_dir(table), exist_ok = True)
+                    open(os.path.join(self._index_dir(table), key), "w").close()
+                with open(f"{path}.tmp", "wb") as f:
+                    pickle.dump((tables, value), f)
+                os.replace(f"{path}.tmp", path)
+            except OSError as e:
+                print(f"Query cache: skipped the disk tier for one entry ({type(e).__name__}: {e}).")
+
+    def _put_memory(self, key: str, value, tables, size: int):
+        if size > self.max_bytes:
+            return # a single result bigger than the whole memory tier is not worth caching in memory
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size, set(tables))
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last = False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self, tables):
+        """drop every entry (memory and disk) which read one of the given tables"""
+        tables = {t.lower() for t in tables}
+        with self._lock:
+            stale = [key for key, (_, _, entry_tables) in self._entries.items() if entry_tables & tables]
+            for key in stale:
+                self._bytes -= self._entries.pop(key)[1]
+            self.invalidations += len(stale)
+        if self.disk_dir:
+            for table in tables:
+                try:
+                    keys = os.listdir(self._index_dir(table))
+                except FileNotFoundError:
+                    continue # nothing on disk read this table
+                for key in keys:
+                    for path in (self._disk_path(key), os.path.join(self._index_dir(table), key)):
+                        try:
+                            os.remove(path)
+                        except FileNotFoundError:
+                            pass # already removed by another process
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.disk_dir:
+            for path in glob.glob(os.path.join(self.disk_dir, "*.pkl")):
+                os.remove(path)
+            shutil.rmtree(os.path.join(self.disk_dir, "tables"), ignore_errors = True)
+
+    def stats(self):
+        """hit rates and memory use of the cache"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
 class DBPostgres:
     """
     parent class: handles connection, retries, helpers, and shared utilities
     children: ApiDB, WebDB inherit from this class
     """
+    # writes to a key table also change these tables / views (via triggers or view definitions) --> invalidated together in the query cache
+    cache_dependents = {
+        "staging_cpi_raw": {"corruption_perception_index"},
+        "staging_world_happiness_report": {"world_happiness_report"},
+        "corruption_perception_index": {"v_cpi_with_region", "v_cpi_latest"},
+        "country_general_info": {"v_cpi_with_region", "v_cpi_latest"},
+        "region": {"v_cpi_with_region"},
+    }
+    _written_table_pattern = re.compile(r'\b(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM|TRUNCATE(?:\s+TABLE)?|COPY)\s+((?:"?\w+"?\.)?"?\w+"?)', re.IGNORECASE)
+
     def __init__(self):
         """
         automatically connect to postgres database when a class object is instantiated.
         """
-        load_dotenv()  # this reads .env locally, in docker env is already there / set
-        dbname = os.getenv("DB_NAME", os.getenv("POSTGRES_DB", "worldbank"))  # double fallbacks: if there's no env var name 'DB_NAME', then check for 'POSTGRES_DB', if still fails, use the default 'worldbank'
-        user = os.getenv("DB_USER", os.getenv("POSTGRES_USER", "user"))
-        password = os.getenv("DB_PASSWORD", os.getenv("POSTGRES_PASSWORD", "katzi"))  # in my .env file, I have a different pw but since it's in .gitignore, we can just use the default pw 'katzi'
-        host = os.getenv("DB_HOST", "localhost")  # use 'db' inside docker container, 'localhost' outside (e.g. in locally installed apps such as pgAdmin)
-        port = int(os.getenv("DB_PORT", 5555))  # use 5432 for inside the docker container, 5555 for locally installed apps such as pgAdmin
-        print(f".... Connecting to host '{host}' : port '{port}' .....\n")
+        self.cache = QueryCache.from_env() # optional result cache for repeated reads (None = off)
+        self.load_batch_id = None # change data capture: id of the running load_batch (see begin_load_batch)
+        dsn_kwargs = self.connection_params()
+        print(f".... Connecting to host '{dsn_kwargs['host']}' : port '{dsn_kwargs['port']}' .....\n")
 
         try:
-            self.connection = self.connect_with_retry({
-                "dbname": dbname,
-                "user": user,
-                "password": password,
-                "host": host,
-                "port": port,
-                "options": "-c search_path=thi_miniproject" # applied for the entire session, so that I don't have to manually command 'SET search_path TO thi_miniproject;' for every SQL query
-            })
+            self.connection = self.connect_with_retry(dsn_kwargs)
             self.cursor = self.connection.cursor()
             self.connection.commit()
             print("\n- Connected to database (schema 'thi_miniproject' is set)! -\n")
 
         except (Exception, psycopg.DatabaseError) as e:
-            self.connection = psycopg.connect(dbname = dbname, user = user, password = password, host = host, port = port) # trying one last time
+            self.connection = psycopg.connect(**{key: value for key, value in dsn_kwargs.items() if key != "options"}) # trying one last time
             raise DatabaseError(f"Something went wrong with the connection ≽^- ˕ -^≼ Error type: {type(e).__name__}, error message: '{e}'.")
 
+    @staticmethod
+    def connection_params():
+        """
+        read the connection settings from the environment (shared by every class object and by helpers which open extra connections, e.g. worker threads)
+        """
+        load_dotenv()  # this reads .env locally, in docker env is already there / set
+        return {
+            "dbname": os.getenv("DB_NAME", os.getenv("POSTGRES_DB", "worldbank")),  # double fallbacks: if there's no env var name 'DB_NAME', then check for 'POSTGRES_DB', if still fails, use the default 'worldbank'
+            "user": os.getenv("DB_USER", os.getenv("POSTGRES_USER", "user")),
+            "password": os.getenv("DB_PASSWORD", os.getenv("POSTGRES_PASSWORD", "katzi")),  # in my .env file, I have a different pw but since it's in .gitignore, we can just use the default pw 'katzi'
+            "host": os.getenv("DB_HOST", "localhost"),  # use 'db' inside docker container, 'localhost' outside (e.g. in locally installed apps such as pgAdmin)
+            "port": int(os.getenv("DB_PORT", 5555)),  # use 5432 for inside the docker container, 5555 for locally installed apps such as pgAdmin
+            "options": "-c search_path=thi_miniproject" # applied for the entire session, so that I don't have to manually command 'SET search_path TO thi_miniproject;' for every SQL query
+        }
+
     @staticmethod
     def connect_with_retry(dsn_kwargs, retries = 5, delay = 3): # helper function
         """
@@ -67,23 +236,241 @@ class DBPostgres:
     def _executemany(self, query_sql: sql.SQL | str, rows: list[tuple]):
         """execute many rows at once"""
         try:
-            if isinstance(query_sql, sql.SQL):
-                self.cursor.executemany(query_sql.as_string(self.connection), rows)
-            else:
-                self.cursor.executemany(query_sql, rows)
+            if not isinstance(query_sql, str): # sql.SQL / sql.Composed
+                query_sql = query_sql.as_string(self.connection)
+            self.cursor.executemany(query_sql, rows)
             self.connection.commit()
         except (Exception, psycopg.DatabaseError) as e:
             self.connection.rollback()
             raise
+        self._invalidate_cache_for(query_sql)
+
+    def _execute_write(self, query_sql: sql.Composable | str, params = None, tables = None):
+        """
+        execute one write statement in the caller's transaction (no commit) and invalidate the cached results of the tables it writes
+        :param tables: tables the statement writes, default: parsed from the statement (pass them for e.g. CALL)
+        """
+        if not isinstance(query_sql, str): # sql.SQL / sql.Composed
+            query_sql = query_sql.as_string(self.connection)
+        self.cursor.execute(query_sql, params)
+        if tables is None:
+            self._invalidate_cache_for(query_sql)
+        else:
+            self.invalidate_cache(*tables)
+
+    def _fetch_cached(self, query_sql: sql.Composable | str, params = None, tables = None):
+        """
+        run a read query through the result cache (falls back to a plain execute when the cache is off)
+        :param tables: tables / views the query reads, default: parsed from the FROM / JOIN clauses
+        :return: (column names, rows)
+        """
+        if not isinstance(query_sql, str):
+            query_sql = query_sql.as_string(self.connection)
+        if self.cache is None:
+            self.cursor.execute(query_sql, params)
+            return [col[0] for col in self.cursor.description], self.cursor.fetchall()
+
+        key = QueryCache.make_key(query_sql, params)
+        hit, value = self.cache.get(key)
+        if hit:
+            return value
+        self.cursor.execute(query_sql, params)
+        value = ([col[0] for col in self.cursor.description], self.cursor.fetchall())
+        if not self._has_uncommitted_writes(): # the result may contain rows a later rollback() takes back
+            self.cache.put(key, value, tables if tables is not None else QueryCache.tables_in(query_sql))
+        return value
+
+    def _has_uncommitted_writes(self):
+        """true if the open transaction of self.connection has written something (postgres only assigns a transaction id on the first write)"""
+        if self.connection.info.transaction_status == psycopg.pq.TransactionStatus.IDLE:
+            return False
+        self.cursor.execute("SELECT pg_current_xact_id_if_assigned() IS NOT NULL;")
+        return self.cursor.fetchone()[0]
+
+    @staticmethod
+    def rows_signature_sql(columns: list[str]):
+        """
+        aggregate expression (for a GROUP BY query) of an order-independent signature of the rows of a group, e.g. of an export partition
+        - sum of the 64-bit hashtextextended() of every row: equal row hashes add up instead of cancelling out like with BIT_XOR
+        - the row is hashed as a record, so NULL and '' (or a shifted column boundary) give different hashes
+        """
+        return sql.SQL("SUM(hashtextextended(ROW({})::TEXT, 0)::NUMERIC)").format(sql.SQL(", ").join(sql.Identifier(col) for col in columns))
+
+    def invalidate_cache(self, *tables: str):
+        """invalidate cached results of the given tables and of everything derived from them (triggers, views)"""
+        if self.cache is None or not tables:
+            return
+        pending, affected = [t.lower() for t in tables], set()
+        while pending:
+            table = pending.pop()
+            if table not in affected:
+                affected.add(table)
+                pending.extend(self.cache_dependents.get(table, ()))
+        self.cache.invalidate(affected)
+
+    def _invalidate_cache_for(self, query_text: str):
+        """invalidate the tables a write statement modifies"""
+        if self.cache is not None:
+            self.invalidate_cache(*(match.split(".")[-1].strip('"') for match in self._written_table_pattern.findall(query_text)))
+
+    def cache_stats(self):
+        """hit rates and memory use of the query cache (None if the cache is off)"""
+        return self.cache.stats() if self.cache is not None else None
+
+    _stream_counter = itertools.count(1) # unique names for the server-side cursors
+
+    def stream_query(self, query_sql: sql.Composable | str, params = None, itersize: int = 10000, cancel_event = None):
+        """
+        run a read query on a named (server-side) cursor and yield its rows lazily
+        - postgres keeps the result set, python only ever holds itersize rows --> constant memory for any table size
+        - stops early (and releases the cursor) as soon as cancel_event (threading.Event) is set or the generator is closed
+        :param itersize: number of rows fetched from the server per round trip
+        :return: generator of row tuples
+        """
+        for batch in self._stream_batches(query_sql, params, itersize, cancel_event):
+            yield from batch[1]
+
+    def stream_query_batches(self, query_sql: sql.Composable | str, params = None, itersize: int = 10000, dtypes: dict | None = None, cancel_event = None):
+        """
+        same as stream_query(), but yields one batch of columnar numpy arrays per round trip
+        :param dtypes: optional numpy dtype per column name, e.g. {"year": "int32", "value": "float64"} (other columns are inferred)
+        :return: generator of dicts column name -> numpy array
+        """
+        dtypes = dtypes or {}
+        for columns, rows in self._stream_batches(query_sql, params, itersize, cancel_event):
+            batch = {}
+            for col, values in zip(columns, zip(*rows)):
+                dtype = dtypes.get(col)
+                if dtype is not None and np.dtype(dtype).kind == "f":
+                    values = [np.nan if v is None else v for v in values] # NULL -> NaN for float columns
+                batch[col] = np.array(values, dtype = dtype)
+            yield batch
+
+    def _stream_batches(self, query_sql, params, itersize, cancel_event):
+        """
+        shared generator behind stream_query / stream_query_batches: yields (column names, list of rows) per round trip
+        - the named cursor runs on a connection of its own: ending its read transaction can't commit (or roll back) work which is
+          pending on self.connection, and the caller may keep writing through self.connection while it consumes the stream
+        """
+        cursor_name = f"stream_{os.getpid()}_{next(self._stream_counter)}"
+        connection = None
+        try:
+            connection = psycopg.connect(**self.connection_params())
+            cursor = connection.cursor(name = cursor_name)
+            cursor.itersize = itersize
+            cursor.execute(query_sql, params)
+            columns = None
+            while cancel_event is None or not cancel_event.is_set():
+                rows = cursor.fetchmany(itersize)
+                if not rows:
+                    break
+                if columns is None:
+                    columns = [col[0] for col in cursor.description]
+                yield columns, rows
+        except (Exception, psycopg.DatabaseError) as e:
+            raise DatabaseError(f"Something went wrong with streaming the query. Error type: {type(e).__name__}, error message: '{e}'.")
+        finally:
+            # also runs when the consumer stops iterating (generator closed) or the stream was cancelled
+            if connection is not None:
+                try:
+                    connection.rollback() # read only: ends the transaction which held the server-side cursor
+                except psycopg.Error:
+                    pass
+                connection.close()
+
+    def _copy_rows(self, table_name: str, columns: list[str], rows):
+        """bulk load rows with COPY ... FROM STDIN (much faster than executemany for large batches), commits together with any statement run before it"""
+        query = sql.SQL("COPY {} ({}) FROM STDIN").format(
+            sql.Identifier(table_name),
+            sql.SQL(", ").join(sql.Identifier(col) for col in columns)
+        )
+        try:
+            with self.cursor.copy(query) as copy:
+                for row in rows:
+                    copy.write_row(row)
+            self.connection.commit()
+        except (Exception, psycopg.DatabaseError) as e:
+            self.connection.rollback()
+            raise
+        self.invalidate_cache(table_name)
 
     def _drop_table(self, table_name: str):
         """drop table as needed"""
         try:
             self.cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(table_name)))
             self.connection.commit()
+            self.invalidate_cache(table_name)
         except (Exception, psycopg.DatabaseError) as e:
             raise DatabaseError(f"Something went wrong with dropping the table '{table_name}'. Error type: {type(e).__name__}, error message: '{e}'.")
 
+    # change data capture
+    changes_since_functions = {
+        "wb_indicator_country_year_value": "wb_values_changed_since",
+        "corruption_perception_index": "cpi_changed_since",
+        "world_happiness_report": "whr_changed_since",
+    }
+
+    def begin_load_batch(self, source: str):
+        """
+        register a new load run in load_batch and tag this session with its id
+        - rows written by this connection from now on (also through the staging triggers) carry the id in load_batch_id
+        :param source: name of the loader, e.g. 'api_logger', 'web:cpi'
+        :return: the batch id
+        """
+        try:
+            self._execute_write("INSERT INTO load_batch (source) VALUES (%s) RETURNING batch_id;", (source,))
+            self.load_batch_id = self.cursor.fetchone()[0]
+            # session-wide (is_local = false), so that it survives the commits of the loader's batches
+            self.cursor.execute("SELECT set_config('thi_miniproject.load_batch_id', %s, false);", (str(self.load_batch_id),))
+            self.connection.commit()
+        except (Exception, psycopg.DatabaseError) as e:
+            self.connection.rollback()
+            raise DatabaseError(f"Something went wrong with starting a load batch for '{source}'. Error type: {type(e).__name__}, error message: '{e}'.")
+        return self.load_batch_id
+
+    def finish_load_batch(self, row_count: int | None = None, status: str = "finished"):
+        """close the running load batch (status 'finished' or 'failed') and untag the session"""
+        if self.load_batch_id is None:
+            return
+        try:
+            if self.connection.info.transaction_status == psycopg.pq.TransactionStatus.INERROR:
+                self.connection.rollback()
+            self._execute_write("UPDATE load_batch SET status = %s, row_count = %s, finished_at = NOW() WHERE batch_id = %s;",
+                                (status, row_count, self.load_batch_id))
+            self.cursor.execute("SELECT set_config('thi_miniproject.load_batch_id', '', false);")
+            self.connection.commit()
+        except (Exception, psycopg.DatabaseError) as e:
+            self.connection.rollback()
+            raise DatabaseError(f"Something went wrong with finishing the load batch {self.load_batch_id}. Error type: {type(e).__name__}, error message: '{e}'.")
+        self.load_batch_id = None
+
+    def get_changes_since(self, table_name: str, watermark: int | None = None):
+        """
+        rows of a table which were inserted, updated or deleted since the watermark (for incremental downstream refreshes)
+        - the watermark is a transaction id (change_watermark() in schema.sql): unlike a timestamp it can't skip the rows of a transaction
+          which commits after the read, rows of transactions running during the read come again in the next call (upsert them by key)
+        :param table_name: 'wb_indicator_country_year_value', 'corruption_perception_index' or 'world_happiness_report'
+        :param watermark: the watermark returned by the previous call, None = all rows
+        :return: (list of row dicts incl. 'is_deleted' / 'last_modified' / 'load_batch_id' / 'change_xid', next watermark to pass in on the following call)
+        """
+        function_name = self.changes_since_functions.get(table_name)
+        if function_name is None:
+            raise ValueError(f"No change data capture for the table '{table_name}'! Available: {sorted(self.changes_since_functions)}.")
+        query = sql.SQL("SELECT * FROM {}(%s::TEXT::XID8) ORDER BY change_xid, last_modified;").format(sql.Identifier(function_name))
+        try:
+            # the next watermark is read before the rows: whatever commits in between is in both reads, nothing in neither
+            self.cursor.execute("SELECT change_watermark()::TEXT;")
+            next_watermark = int(self.cursor.fetchone()[0])
+            self.connection.commit()
+            self.cursor.execute(query, (str(watermark or 0),))
+            columns = [col[0] for col in self.cursor.description]
+            rows = [dict(zip(columns, row)) for row in self.cursor.fetchall()]
+            self.connection.commit()
+        except (Exception, psycopg.DatabaseError) as e:
+            self.connection.rollback()
+            raise DatabaseError(f"Something went wrong with getting the changes of '{table_name}' since {watermark}. Error type: {type(e).__name__}, error message: '{e}'.")
+        return rows, next_watermark
+
     @staticmethod
     def _pretty_row(columns, row):
         output = []
@@ -0,0 +1,182 @@
+# imports
+import time # part of python standard library
+from queue import Queue # part of python standard library
+from threading import Condition # part of python standard library
+from contextlib import nullcontext # part of python standard library
+from concurrent.futures import ThreadPoolExecutor # part of python standard library
+
+#######################################
+# Stage DAG runner
+#######################################
+class Channel:
+    """
+    a stream of items between two stages which run at the same time (e.g. indicator ids from the catalogue to the fact streaming)
+    - the producing stage publishes the channel as an output right away and puts items while it works
+    - the runner closes it when the producing stage ends (successfully or not), which ends the consumer's iteration
+    """
+    _closed = object()
+
+    def __init__(self):
+        self._queue = Queue()
+        self.closed = False
+
+    def put(self, item):
+        self._queue.put(item)
+
+    def extend(self, items):
+        for item in items:
+            self._queue.put(item)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._queue.put(self._closed)
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is self._closed:
+                self._queue.put(item) # a second iteration ends as well
+                return
+            yield item
+
+class Stage:
+    """
+    one step of a run: func(ctx) reads its inputs from ctx, may ctx.publish() outputs early and returns a dict of the remaining outputs
+    :param inputs: names of the values the stage needs (it starts as soon as all of them are published)
+    :param outputs: names of the values the stage provides
+    :param fallback: the stage only runs when no selected stage provides its outputs (e.g. read what an earlier run stored in the db)
+    """
+    def __init__(self, name: str, func, inputs = (), outputs = (), fallback: bool = False):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.fallback = fallback
+
+class StageFailed(Exception):
+    """a stage raised, or couldn't run because one of its inputs failed"""
+
+class StageContext:
+    """the values published by the stages of one run, shared by all stage threads"""
+    def __init__(self, initial: dict | None = None):
+        self._values = dict(initial or {})
+        self._failed = {} # output name -> name of the stage which failed to provide it
+        self._cond = Condition()
+
+    def publish(self, name: str, value):
+        with self._cond:
+            self._values[name] = value
+            self._cond.notify_all()
+
+    def fail(self, names, stage_name: str):
+        with self._cond:
+            for name in names:
+                if name not in self._values:
+                    self._failed[name] = stage_name
+            self._cond.notify_all()
+
+    def wait_for(self, names):
+        """block until all names are published (--> None) or one of them failed (--> (name, failed stage))"""
+        with self._cond:
+            while True:
+                for name in names:
+                    if name in self._failed:
+                        return name, self._failed[name]
+                if all(name in self._values for name in names):
+                    return None
+                self._cond.wait()
+
+    def __getitem__(self, name: str):
+        with self._cond:
+            return self._values[name]
+
+    def get(self, name: str, default = None):
+        with self._cond:
+            return self._values.get(name, default)
+
+    def __contains__(self, name: str):
+        with self._cond:
+            return name in self._values
+
+def resolve_stages(stages: list[Stage], selected: list[str] | None = None, provided = ()):
+    """
+    this function picks the stages to run for a selection
+    - every input of a selected stage must be provided: by a selected stage, by a fallback stage (preferred, it's cheap) or else by
+      pulling the stage which provides it into the run (recursively)
+    :param selected: stage names, None = all non-fallback stages
+    :param provided: names of values which are given up front
+    :return: list of stages in declaration order
+    """
+    by_name = {stage.name: stage for stage in stages}
+    unknown = [name for name in (selected or []) if name not in by_name]
+    if unknown:
+        raise ValueError(f"Unknown stage(s) {unknown}! Available: {[stage.name for stage in stages if not stage.fallback]}.")
+    chosen = {name for name in (selected if selected is not None else [stage.name for stage in stages if not stage.fallback])}
+
+    changed = True
+    while changed:
+        changed = False
+        available = set(provided) | {output for name in chosen for output in by_name[name].outputs}
+        for name in list(chosen):
+            for needed in by_name[name].inputs:
+                if needed in available:
+                    continue
+                providers = [stage for stage in stages if needed in stage.outputs]
+                if not providers:
+                    raise ValueError(f"No stage provides '{needed}' for the stage '{name}'!")
+                provider = next((stage for stage in providers if stage.fallback), providers[0])
+                chosen.add(provider.name)
+                available.update(provider.outputs)
+                changed = True
+    return [stage for stage in stages if stage.name in chosen]
+
+def run_stages(stages: list[Stage], selected: list[str] | None = None, initial: dict | None = None, profiler = None):
+    """
+    this function runs the selected stages as a dependency graph: every stage runs on its own thread as soon as its inputs are
+    published, so independent stages (e.g. countries, topics, sources) run concurrently
+    - a failing stage fails only the stages which depend on its outputs, the others finish
+    :param profiler: optional StageProfiler, every stage is profiled as a stage of the same name
+    :return: (context with all published values, dict stage name -> {'status', 'seconds', 'error'})
+    """
+    run = resolve_stages(stages, selected, provided = (initial or {}).keys())
+    ctx = StageContext(initial)
+    results = {}
+    print(f"--- Running the stages: {', '.join(stage.name for stage in run)} ₍^. .^₎⟆ ---\n")
+
+    def run_one(stage: Stage):
+        missing = ctx.wait_for(stage.inputs)
+        if missing is not None:
+            ctx.fail(stage.outputs, stage.name)
+            results[stage.name] = {"status": "skipped", "seconds": 0.0, "error": f"input '{missing[0]}' of the failed stage '{missing[1]}'"}
+            return
+        start = time.perf_counter()
+        try:
+            with profiler.stage(stage.name) if profiler else nullcontext():
+                outputs = stage.func(ctx) or {}
+            for name, value in outputs.items():
+                ctx.publish(name, value)
+            not_published = [name for name in stage.outputs if name not in ctx]
+            if not_published:
+                raise StageFailed(f"the stage '{stage.name}' didn't provide {not_published}")
+            results[stage.name] = {"status": "ok", "seconds": time.perf_counter() - start, "error": None}
+        except Exception as e:
+            print(f"[stage] {stage.name}: {type(e).__name__} - {e}")
+            ctx.fail(stage.outputs, stage.name)
+            results[stage.name] = {"status": "failed", "seconds": time.perf_counter() - start, "error": f"{type(e).__name__}: {e}"}
+        finally:
+            for name in stage.outputs: # ends the consumers' iteration, also if the stage failed half way
+                value = ctx.get(name)
+                if isinstance(value, Channel):
+                    value.close()
+
+    with ThreadPoolExecutor(max_workers = len(run), thread_name_prefix = "stage") as ex:
+        for future in [ex.submit(run_one, stage) for stage in run]:
+            future.result()
+
+    print("\n--- Stages finished ---")
+    for stage in run:
+        result = results[stage.name]
+        print(f"{stage.name:<25} {result['status']:<8} {result['seconds']:8.2f}s  {result['error'] or ''}")
+    print()
+    return ctx, results
@@ -0,0 +1,89 @@
+# imports
+import unittest
+import numpy as np
+import pandas as pd
+from src.analytics import build_series_matrix, compute_trend_metrics
+
+def _facts(rows):
+    """long fact rows as analytics reads them from the fact table"""
+    return pd.DataFrame(rows, columns = ["indicator_id", "country_iso3code", "year", "value"])
+
+class TestTrendMetrics(unittest.TestCase):
+    """this unittest class checks the vectorised trend & growth metrics of analytics.py on small hand-made series (pure numpy, no database)."""
+    def metrics(self, rows, rolling_window: int = 5):
+        """metrics of the given fact rows, indexed by (indicator_id, country_iso3code)"""
+        result = compute_trend_metrics(*build_series_matrix(_facts(rows)), rolling_window = rolling_window)
+        return result.set_index(["indicator_id", "country_iso3code"])
+
+    def test_series_matrix_spans_consecutive_years(self):
+        """one matrix row per (indicator, country), one column per year of the full range, NaN for missing or non-numeric values"""
+        series_keys, years, values = build_series_matrix(_facts([
+            ("A", "AUT", 2000, 1.0), ("A", "AUT", 2003, 4.0), ("A", "DEU", 2001, 2.0), ("B", "AUT", 2002, "n/a"),
+        ]))
+        self.assertEqual(series_keys.values.tolist(), [["A", "AUT"], ["A", "DEU"], ["B", "AUT"]])
+        self.assertEqual(years.tolist(), [2000, 2001, 2002, 2003])
+        np.testing.assert_array_equal(values, [[1.0, np.nan, np.nan, 4.0], [np.nan, 2.0, np.nan, np.nan], [np.nan] * 4])
+
+    def test_empty_facts(self):
+        """no fact rows give an empty matrix and an empty result with all result columns"""
+        series_keys, years, values = build_series_matrix(_facts([]))
+        self.assertEqual(values.shape, (0, 0))
+        result = compute_trend_metrics(series_keys, years, values)
+        self.assertTrue(result.empty)
+        self.assertIn("trend_slope", result.columns)
+
+    def test_trend_slope_ignores_missing_years(self):
+        """the OLS slope of value = 2 * year + c is 2, also with a gap in the series"""
+        result = self.metrics([("A", "AUT", year, 2.0 * (year - 2000) + 1) for year in (2000, 2001, 2003, 2004)])
+        row = result.loc[("A", "AUT")]
+        self.assertAlmostEqual(row["trend_slope"], 2.0)
+        self.assertEqual((row["n_obs"], row["first_year"], row["last_year"], row["latest_value"]), (4, 2000, 2004, 9.0))
+
+    def test_cagr_only_for_positive_values(self):
+        """CAGR between the first and last observation, NaN if one of them is zero or negative"""
+        result = self.metrics([
+            ("A", "AUT", 2000, 100.0), ("A", "AUT", 2002, 121.0),
+            ("A", "DEU", 2000, -5.0), ("A", "DEU", 2002, 10.0),
+            ("A", "FRA", 2000, 0.0), ("A", "FRA", 2002, 10.0),
+            ("A", "ITA", 2002, 10.0), # a single observation has no growth
+        ])
+        self.assertAlmostEqual(result.loc[("A", "AUT"), "cagr"], 0.1)
+        for country in ("DEU", "FRA", "ITA"):
+            self.assertTrue(np.isnan(result.loc[("A", country), "cagr"]), country)
+
+    def test_yoy_change_needs_the_preceding_year(self):
+        """year-over-year change of the latest year, NaN if the year before it is missing or zero"""
+        result = self.metrics([
+            ("A", "AUT", 2001, 7.0), ("A", "AUT", 2002, 9.0),
+            ("A", "DEU", 2000, 7.0), ("A", "DEU", 2002, 9.0),
+            ("A", "FRA", 2001, 0.0), ("A", "FRA", 2002, 3.0),
+        ])
+        self.assertAlmostEqual(result.loc[("A", "AUT"), "yoy_change"], 2.0)
+        self.assertAlmostEqual(result.loc[("A", "AUT"), "yoy_pct_change"], 2.0 / 7.0 * 100)
+        self.assertTrue(np.isnan(result.loc[("A", "DEU"), "yoy_change"]))
+        self.assertAlmostEqual(result.loc[("A", "FRA"), "yoy_change"], 3.0)
+        self.assertTrue(np.isnan(result.loc[("A", "FRA"), "yoy_pct_change"]))
+
+    def test_zscore_against_the_same_indicator_and_year(self):
+        """z-score of the latest value vs. all countries of the same indicator in that year (other indicators don't count)"""
+        result = self.metrics([
+            ("A", "AUT", 2002, 1.0), ("A", "DEU", 2002, 2.0), ("A", "FRA", 2002, 3.0),
+            ("B", "AUT", 2002, 100.0), ("B", "DEU", 2001, 50.0), # B: alone in its latest year each
+        ])
+        self.assertAlmostEqual(result.loc[("A", "FRA"), "zscore"], 1.0 / np.sqrt(2.0 / 3.0))
+        self.assertAlmostEqual(result.loc[("A", "DEU"), "zscore"], 0.0)
+        self.assertTrue(np.isnan(result.loc[("B", "AUT"), "zscore"]))
+
+    def test_rolling_mean_skips_gaps(self):
+        """the rolling mean up to the latest year averages the observed years of the window only"""
+        result = self.metrics([("A", "AUT", 2000, 1.0), ("A", "AUT", 2002, 3.0), ("A", "AUT", 2004, 5.0)], rolling_window = 3)
+        self.assertAlmostEqual(result.loc[("A", "AUT"), "rolling_mean"], 4.0)
+        self.assertEqual(result.loc[("A", "AUT"), "rolling_window"], 3)
+
+    def test_series_without_observations_are_dropped(self):
+        """a series whose values are all missing has no result row"""
+        result = self.metrics([("A", "AUT", 2000, 1.0), ("A", "DEU", 2000, None)])
+        self.assertEqual(result.index.tolist(), [("A", "AUT")])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+# imports
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+from src.api_logger import _indicator_topic_rows, get_all_wb_indicators, plan_indicator_batches
+from src.politeness import DomainGate
+from src.benchmarks.wb_api_stub import WorldBankStub
+
+class TestIndicatorTopicRows(unittest.TestCase):
+    """this unittest class checks how the nested topics of the indicator catalogue are flattened into wb_indicator_topics rows (no network, no database)."""
+    def test_topics_are_flattened_and_deduplicated(self):
+        """one (indicator_id, topic_id) row per topic, duplicates (also across sources) are kept once"""
+        df = pd.DataFrame({"indicator_id": ["A", "B", "A"],
+                           "topics": [[{"id": "1"}, {"id": "2"}, {"id": "1"}], [{"id": "3", "value": "Education"}], [{"id": "2"}, {"id": "5"}]]})
+        self.assertEqual(sorted(_indicator_topic_rows(df)), [("A", 1), ("A", 2), ("A", 5), ("B", 3)])
+
+    def test_missing_empty_and_non_numeric_ids_are_skipped(self):
+        """empty topic lists, missing or empty ids and ids which are no number give no row"""
+        df = pd.DataFrame({"indicator_id": ["A", "B", "C", "D"],
+                           "topics": [[], [{"value": "no id"}, {"id": ""}], [{"id": "x"}, {"id": "4"}], None]})
+        self.assertEqual(_indicator_topic_rows(df), [("C", 4)])
+
+    def test_source_without_any_topics(self):
+        """a source whose topics column is all NaN gives no rows (alone or combined with a source that has topics)"""
+        untagged = pd.DataFrame({"indicator_id": ["A", "B"], "topics": np.nan})
+        self.assertEqual(_indicator_topic_rows(untagged), [])
+        tagged = pd.DataFrame({"indicator_id": ["A"], "topics": [[{"id": "7"}]]})
+        self.assertEqual(_indicator_topic_rows(pd.concat([untagged, tagged], ignore_index = True)), [("A", 7)])
+
+class TestPlanIndicatorBatches(unittest.TestCase):
+    """this unittest class checks how plan_indicator_batches groups indicators into multi-indicator requests (10 entities, current year 2024)."""
+    def plan(self, indicator_ids, batch_info, max_rows = 1000, max_indicators = 20):
+        return list(plan_indicator_batches(indicator_ids, batch_info, entity_count = 10, max_rows = max_rows, max_indicators = max_indicators,
+                                           current_year = 2024))
+
+    def test_indicator_cap(self):
+        """a source's batch is yielded once it holds max_indicators, a single leftover is requested alone"""
+        ids = [f"I{i}" for i in range(7)]
+        batches = self.plan(ids, {indicator: (1, 2020) for indicator in ids}, max_indicators = 3)
+        self.assertEqual(batches, [(1, ["I0", "I1", "I2"], "2020:2024"), (1, ["I3", "I4", "I5"], "2020:2024"), (None, ["I6"], None)])
+
+    def test_row_cap_counts_entities_and_years_from_the_earliest_first_year(self):
+        """estimated rows = indicators x entities x years since the earliest first year of the batch, never more than max_rows"""
+        ids = [f"I{i}" for i in range(6)]
+        batches = self.plan(ids, {indicator: (1, 2020) for indicator in ids}, max_rows = 200) # 50 rows each
+        self.assertEqual(batches, [(1, ["I0", "I1", "I2", "I3"], "2020:2024"), (1, ["I4", "I5"], "2020:2024")])
+
+        # I2 reaches back to 2015: three indicators over 10 years would be 300 rows, so I2 opens a new batch
+        batches = self.plan(["I0", "I1", "I2", "I3"], {"I0": (1, 2020), "I1": (1, 2020), "I2": (1, 2015), "I3": (1, 2022)}, max_rows = 200)
+        self.assertEqual(batches, [(1, ["I0", "I1"], "2020:2024"), (1, ["I2", "I3"], "2015:2024")])
+
+    def test_sources_are_never_mixed(self):
+        """indicators of different sources go into different requests, each with its own date range"""
+        batches = self.plan(["A1", "B1", "A2", "B2"], {"A1": (1, 2020), "A2": (1, 2010), "B1": (2, 2023), "B2": (2, 2023)})
+        self.assertEqual(sorted(batches), [(1, ["A1", "A2"], "2010:2024"), (2, ["B1", "B2"], "2023:2024")])
+
+    def test_indicators_without_coverage_stats_go_single(self):
+        """indicators without coverage statistics are yielded alone as soon as they arrive, before the rest of the ids is read"""
+        def ids():
+            yield "NEW"
+            raise AssertionError("read beyond the first id")
+        self.assertEqual(next(plan_indicator_batches(ids(), {}, entity_count = 10, current_year = 2024)), (None, ["NEW"], None))
+
+        batches = self.plan(["A1", "NEW", "A2"], {"A1": (1, 2020), "A2": (1, 2020)})
+        self.assertEqual(batches, [(None, ["NEW"], None), (1, ["A1", "A2"], "2020:2024")])
+
+    def test_indicator_larger_than_max_rows_gets_its_own_request(self):
+        """an indicator estimated above max_rows is requested alone (undated, paginated) and doesn't break up the batch of its source"""
+        batches = self.plan(["A1", "BIG", "A2"], {"A1": (1, 2020), "BIG": (1, 1960), "A2": (1, 2020)}, max_rows = 200) # BIG: 650 rows
+        self.assertEqual(batches, [(None, ["BIG"], None), (1, ["A1", "A2"], "2020:2024")])
+
+class TestIndicatorCatalogue(unittest.TestCase):
+    """this unittest class crawls the indicator catalogue of the local WB API stub with indicators shared by several sources (no database)."""
+    @classmethod
+    def setUpClass(cls):
+        cls.stub = WorldBankStub(n_sources = 3, indicators_per_source = 4, shared_indicators = 2, catalogue_page_cap = 3)
+        cls.stub.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.stop()
+
+    def crawl(self, source_ids):
+        streamed = {}
+        with mock.patch("src.api_logger.wb_api_base", self.stub.base_url):
+            result = get_all_wb_indicators(source_ids, on_source = lambda source_id, df: streamed.update({source_id: df}),
+                                           max_workers = 3, per_page = 50, gate = DomainGate(3, 0))
+        return result, streamed
+
+    def test_shared_indicators_keep_the_lowest_source_id(self):
+        """an indicator listed by several sources is kept once, with the lowest source id, but with the topics of every source"""
+        (rows, indicator_ids, topic_rows, failed, no_data), streamed = self.crawl(self.stub.source_ids)
+        self.assertEqual((failed, no_data), ([], []))
+        self.assertEqual(sorted(indicator_ids), sorted(self.stub.indicator_ids))
+        source_of = {indicator_id: source_id for indicator_id, _, source_id, _ in rows}
+        self.assertEqual(len(rows), len(source_of))
+        for source_id in self.stub.source_ids:
+            for indicator in self.stub.indicators[source_id]:
+                self.assertEqual(source_of[indicator], source_id, indicator)
+
+        shared = self.stub.indicators[1][:2]
+        for source_id in (2, 3): # every source is streamed on with everything it lists (the shared ones included), paginated
+            self.assertEqual(sorted(streamed[source_id]["indicator_id"]), sorted(self.stub.listed_indicators[source_id]))
+            self.assertTrue(set(shared) <= set(streamed[source_id]["indicator_id"]))
+        listed_topics = {source_id: {int(topic["id"]) for topics in df.loc[df["indicator_id"] == shared[0], "topics"] for topic in topics}
+                         for source_id, df in streamed.items()}
+        self.assertNotEqual(listed_topics[1], listed_topics[2]) # the stub tags a shared indicator differently in every source
+        topics_of_shared = {topic_id for indicator_id, topic_id in topic_rows if indicator_id == shared[0]}
+        self.assertEqual(topics_of_shared, set().union(*listed_topics.values()))
+        self.assertEqual(len(topic_rows), len(set(topic_rows)))
+
+    def test_unknown_source_is_reported(self):
+        """a source id the API doesn't know ends up in the failed or no-data sources, the others are still collected"""
+        (rows, indicator_ids, _, failed, no_data), _ = self.crawl([1, 99])
+        self.assertEqual(failed + no_data, [99])
+        self.assertEqual(sorted(indicator_ids), sorted(self.stub.indicators[1]))
@@ -0,0 +1,61 @@
+# imports
+import os
+import unittest
+import tempfile
+import pandas as pd
+from src.bulk_ingest import open_bulk_csv, iter_long_chunks
+from src.benchmarks.wb_api_stub import WorldBankStub
+
+class TestBulkArchive(unittest.TestCase):
+    """this unittest class reads a bulk archive written by the WB API stub with the streaming reshape of bulk_ingest (no network, no database)."""
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.stub = WorldBankStub(n_countries = 45, n_aggregates = 4, n_years = 12, n_sources = 2, indicators_per_source = 3, data_page_cap = 100)
+        cls.archive = cls.stub.write_bulk_archive(os.path.join(cls.tmp_dir.name, "WDI_CSV.zip"))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub._server.server_close() # the stub only writes the archive, its server is never started
+        cls.tmp_dir.cleanup()
+
+    def read(self, countries = None, indicator_ids = None):
+        """all long rows of the archive (in chunks of 7 wide rows) + the union of the left-out indicators"""
+        chunks, left_out = [], set()
+        with open_bulk_csv(self.archive) as (name, stream, skiprows):
+            self.assertEqual((name, skiprows), ("WDICSV.csv", 0)) # the data csv, not the series metadata next to it
+            for chunk, chunk_left_out in iter_long_chunks(stream, skiprows, countries, indicator_ids, chunk_rows = 7):
+                chunks.append(chunk)
+                left_out |= chunk_left_out
+        return pd.concat(chunks, ignore_index = True), left_out
+
+    def test_rows_match_the_api_series(self):
+        """the archive holds exactly the non-null country rows the API endpoints serve, indicator by indicator"""
+        facts, left_out = self.read(countries = self.stub.countries)
+        self.assertEqual(len(facts), sum(self.stub.expected_fact_rows(indicator) for indicator in self.stub.indicator_ids))
+        counts = facts["indicator_id"].value_counts().to_dict()
+        self.assertEqual(counts, {indicator: self.stub.expected_fact_rows(indicator) for indicator in self.stub.indicator_ids})
+        self.assertEqual(left_out, set())
+        self.assertEqual(list(facts.columns), ["indicator_id", "country_iso3code", "year", "value"])
+        self.assertFalse(facts.duplicated(["indicator_id", "country_iso3code", "year"]).any())
+
+    def test_country_filter_drops_aggregates_and_other_countries(self):
+        """only the given countries are kept (aggregates / regions drop out)"""
+        countries = self.stub.countries[:5]
+        facts, _ = self.read(countries = countries)
+        self.assertEqual(set(facts["country_iso3code"]), set(countries))
+        self.assertEqual(len(facts), sum(self.stub.expected_fact_rows(indicator, countries) for indicator in self.stub.indicator_ids))
+
+        unfiltered, _ = self.read()
+        self.assertTrue(set(self.stub.aggregates) <= set(unfiltered["country_iso3code"]))
+
+    def test_indicator_filter_reports_left_out_indicators(self):
+        """indicators which aren't in the catalogue are left out and reported"""
+        known = self.stub.indicator_ids[:2]
+        facts, left_out = self.read(countries = self.stub.countries, indicator_ids = known)
+        self.assertEqual(set(facts["indicator_id"]), set(known))
+        self.assertEqual(len(facts), sum(self.stub.expected_fact_rows(indicator) for indicator in known))
+        self.assertEqual(left_out, set(self.stub.indicator_ids) - set(known))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,19 @@
+# imports
+import unittest
+from src.export_facts import _partition_file_name
+
+class TestPartitionFileName(unittest.TestCase):
+    """this unittest class checks that every export partition gets a file of its own (no database)."""
+    def test_keys_with_replaced_characters_get_different_files(self):
+        """keys which only differ in characters replaced by '_' don't share a file"""
+        names = {_partition_file_name(key, "csv", "gzip") for key in ("A/B", "A_B", "A B", "A:B")}
+        self.assertEqual(len(names), 4)
+        self.assertTrue(all(name.startswith("A_B-") and name.endswith(".csv.gz") for name in names))
+
+    def test_file_name_is_stable_and_bounded(self):
+        """the same key always gives the same name, a very long key still fits into a file name"""
+        self.assertEqual(_partition_file_name("SP.POP.TOTL", "binary", "zstd"), _partition_file_name("SP.POP.TOTL", "binary", "zstd"))
+        self.assertLess(len(_partition_file_name("X" * 1000, "binary", "zstd")), 255)
+
+if __name__ == "__main__":
+    unittest.main()
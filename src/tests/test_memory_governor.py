@@ -0,0 +1,141 @@
+# imports
+import time
+import unittest
+from unittest import mock
+from threading import Thread, Event
+from src.memory_governor import MemoryGovernor
+
+def _start(target, *args):
+    """run target in a daemon thread, the returned event is set once it returned"""
+    done = Event()
+    def run():
+        target(*args)
+        done.set()
+    Thread(target = run, daemon = True).start()
+    return done
+
+class TestByteBudget(unittest.TestCase):
+    """this unittest class checks the byte budget of MemoryGovernor with producer threads (no network, no database)."""
+    def test_reserve_blocks_at_the_budget(self):
+        """a chunk which doesn't fit next to the chunks in flight waits until enough bytes are released"""
+        governor = MemoryGovernor(inflight_budget_bytes = 100)
+        governor.reserve(60)
+        done = _start(governor.reserve, 50)
+        self.assertFalse(done.wait(0.2))
+        self.assertEqual(governor.inflight_bytes, 60)
+
+        governor.release(60)
+        self.assertTrue(done.wait(2))
+        self.assertEqual(governor.inflight_bytes, 50)
+        self.assertEqual((governor.stats["reserve_waits"], governor.stats["chunks"], governor.stats["inflight_bytes_max"]), (1, 2, 60))
+
+    def test_oversize_chunk_is_admitted_when_nothing_is_in_flight(self):
+        """a chunk larger than the whole budget doesn't deadlock: it's admitted alone, the next chunk waits for it"""
+        governor = MemoryGovernor(inflight_budget_bytes = 100)
+        self.assertTrue(_start(governor.reserve, 500).wait(2))
+        self.assertEqual(governor.inflight_bytes, 500)
+
+        done = _start(governor.reserve, 1)
+        self.assertFalse(done.wait(0.2))
+        governor.release(500)
+        self.assertTrue(done.wait(2))
+        self.assertEqual(governor.inflight_bytes, 1)
+
+    def test_release_wakes_all_waiters(self):
+        """one release lets every waiting producer through whose chunk fits now, the others keep waiting"""
+        governor = MemoryGovernor(inflight_budget_bytes = 100)
+        governor.reserve(100)
+        waiters = [_start(governor.reserve, 40) for _ in range(3)]
+        time.sleep(0.1)
+        self.assertFalse(any(done.is_set() for done in waiters))
+
+        governor.release(100)
+        deadline = time.monotonic() + 2
+        while sum(done.is_set() for done in waiters) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.1)
+        self.assertEqual(sum(done.is_set() for done in waiters), 2) # 2 x 40 fit into 100, the third one doesn't
+        self.assertEqual(governor.inflight_bytes, 80)
+
+        governor.release(40)
+        self.assertTrue(all(done.wait(2) for done in waiters))
+        self.assertEqual(governor.inflight_bytes, 80)
+
+    def test_release_never_goes_below_zero(self):
+        """releasing more than was reserved (a dropped chunk counted twice) leaves nothing in flight, not a negative amount"""
+        governor = MemoryGovernor(inflight_budget_bytes = 100)
+        governor.reserve(10)
+        governor.release(30)
+        self.assertEqual(governor.inflight_bytes, 0)
+
+class TestFetchSlots(unittest.TestCase):
+    """this unittest class checks the RSS-driven fetch slots of MemoryGovernor with a mocked resident set size."""
+    def setUp(self):
+        self.rss = 0
+        patcher = mock.patch("src.memory_governor.current_rss_bytes", lambda: self.rss)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def enter_slot(self, governor):
+        with governor.fetch_slot():
+            pass
+        return governor.fetch_limit
+
+    def test_limit_halves_above_rss_high_and_grows_below_rss_low(self):
+        """the limit halves (down to min_fetches) while the RSS is above rss_high, grows back one by one below rss_low, stays in between"""
+        governor = MemoryGovernor(inflight_budget_bytes = 100, rss_budget_bytes = 1000, max_fetches = 8, min_fetches = 1, check_interval = 0)
+        self.rss = 900 # above 0.85 of the budget
+        self.assertEqual([self.enter_slot(governor) for _ in range(5)], [4, 2, 1, 1, 1])
+        self.rss = 700 # between rss_low and rss_high
+        self.assertEqual(self.enter_slot(governor), 1)
+        self.rss = 100 # below 0.6 of the budget
+        self.assertEqual([self.enter_slot(governor) for _ in range(8)], [2, 3, 4, 5, 6, 7, 8, 8])
+        self.assertEqual((governor.stats["shrinks"], governor.stats["fetch_limit_min"], governor.stats["rss_bytes_max"]), (3, 1, 900))
+
+    def test_no_rss_budget_keeps_the_limit(self):
+        """without an RSS budget the RSS is only recorded"""
+        governor = MemoryGovernor(inflight_budget_bytes = 100, max_fetches = 4, check_interval = 0)
+        self.rss = 10**12
+        self.assertEqual(self.enter_slot(governor), 4)
+        self.assertEqual(governor.stats["shrinks"], 0)
+
+    def test_waiting_fetch_is_admitted_when_the_limit_grows_back(self):
+        """with the only slot taken a fetch waits, and gets in once the RSS drops and the limit grows (the slot still held)"""
+        governor = MemoryGovernor(inflight_budget_bytes = 100, rss_budget_bytes = 1000, max_fetches = 2, check_interval = 0.01)
+        self.rss = 900
+        holding, leave = Event(), Event()
+        def hold():
+            with governor.fetch_slot():
+                holding.set()
+                leave.wait(5)
+        holder = _start(hold)
+        self.assertTrue(holding.wait(2))
+        self.assertEqual(governor.fetch_limit, 1)
+
+        waiter = _start(self.enter_slot, governor)
+        self.assertFalse(waiter.wait(0.2))
+        self.rss = 100
+        self.assertTrue(waiter.wait(2))
+        self.assertEqual(governor.fetch_limit, 2)
+        self.assertEqual(governor.stats["slot_waits"], 1)
+
+        leave.set()
+        self.assertTrue(holder.wait(2))
+        self.assertEqual(governor.active_fetches, 0)
+
+    def test_slot_release_wakes_a_waiting_fetch(self):
+        """leaving a slot lets the next fetch in"""
+        governor = MemoryGovernor(inflight_budget_bytes = 100, max_fetches = 1, check_interval = 10)
+        leave = Event()
+        def hold():
+            with governor.fetch_slot():
+                leave.wait(5)
+        holder = _start(hold)
+        time.sleep(0.05)
+        waiter = _start(self.enter_slot, governor)
+        self.assertFalse(waiter.wait(0.2))
+        leave.set()
+        self.assertTrue(holder.wait(2) and waiter.wait(2))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,8 @@
 # imports
 import unittest
-from src.save_data import DBPostgres
+from src.save_data import DBPostgres, QueryCache
+import tempfile
+from threading import Event
 from datetime import datetime
 from decimal import Decimal
 from psycopg import sql
@@ -148,6 +150,109 @@ class TestDBPostgres(unittest.TestCase):
         self.db.connection.commit()
         print("\n... Recreated test_table successfully... (•˕ •マ.ᐟ")
 
+    def test_query_cache_hit_and_invalidation(self):
+        """repeated reads are served from the cache until a write to the same table invalidates them"""
+        self.db.cache = QueryCache(max_bytes = 1024 * 1024)
+        try:
+            self.db._executemany("INSERT INTO thi_test.test_table (name, score) VALUES (%s, %s);", [("cat 1", 1.5)])
+            query = "SELECT name FROM thi_test.test_table ORDER BY id;"
+            _, first = self.db._fetch_cached(query)
+            _, second = self.db._fetch_cached("SELECT name   FROM thi_test.test_table ORDER BY id") # same query, different whitespace
+            self.assertEqual(first, second)
+            self.assertEqual(self.db.cache_stats()["hits"], 1)
+
+            self.db._executemany("INSERT INTO thi_test.test_table (name, score) VALUES (%s, %s);", [("cat 2", 2.2)])
+            _, third = self.db._fetch_cached(query)
+            print("\n- Cache stats:", self.db.cache_stats())
+            self.assertEqual(len(third), 2) # the insert invalidated the cached result
+            self.assertEqual(self.db.cache_stats()["misses"], 2)
+
+            self.db._execute_write("DELETE FROM thi_test.test_table WHERE name = %s;", ("cat 1",)) # single statement, caller commits
+            self.db.connection.commit()
+            _, fourth = self.db._fetch_cached(query)
+            self.assertEqual(fourth, [("cat 2",)])
+        finally:
+            self.db.cache = None
+
+    def test_query_cache_lru_byte_limit_and_disk_tier(self):
+        """the memory tier evicts least recently used entries beyond its byte limit, the disk tier still serves them"""
+        with tempfile.TemporaryDirectory() as disk_dir:
+            cache = QueryCache(max_bytes = 1500, disk_dir = disk_dir)
+            for i in range(5):
+                cache.put(f"key{i}", (["name"], [("cat" * 100,)]), {"cats"})
+            self.assertLessEqual(cache.stats()["bytes"], 1500)
+            self.assertGreater(cache.stats()["evictions"], 0)
+
+            hit, value = cache.get("key0") # evicted from memory, but still on disk
+            self.assertTrue(hit)
+            self.assertEqual(cache.stats()["disk_hits"], 1)
+
+            cache.invalidate({"cats"})
+            hit, _ = cache.get("key0")
+            self.assertFalse(hit)
+
+    def test_query_cache_disk_tier_with_many_tables(self):
+        """an entry reading more tables than fit into a file name is still stored on disk and invalidated by any of them"""
+        with tempfile.TemporaryDirectory() as disk_dir:
+            tables = {f"a_rather_long_table_name_{i}" for i in range(20)}
+            QueryCache(max_bytes = 0, disk_dir = disk_dir).put("key", (["name"], [("cat",)]), tables) # max_bytes = 0 -> disk only
+            cache = QueryCache(max_bytes = 0, disk_dir = disk_dir)
+            self.assertEqual(cache.get("key"), (True, (["name"], [("cat",)])))
+            cache.invalidate({"a_rather_long_table_name_7"})
+            self.assertEqual(cache.get("key"), (False, None))
+
+    def test_query_cache_skips_reads_of_uncommitted_writes(self):
+        """a read which sees the transaction's own uncommitted rows is not cached, so a rollback can't leave them behind"""
+        self.db.cache = QueryCache(max_bytes = 1024 * 1024)
+        try:
+            query = "SELECT name FROM thi_test.test_table ORDER BY id;"
+            self.db._execute_write("INSERT INTO thi_test.test_table (name, score) VALUES (%s, %s);", ("rolled back cat", 1))
+            _, pending = self.db._fetch_cached(query)
+            self.assertEqual(pending, [("rolled back cat",)])
+            self.db.connection.rollback()
+            _, after = self.db._fetch_cached(query)
+            self.assertEqual(after, [])
+            self.assertEqual(self.db.cache_stats()["entries"], 1) # only the read outside of the write transaction was cached
+        finally:
+            self.db.cache = None
+
+    def test_stream_query_rows_and_batches(self):
+        """stream a result set through a server-side cursor, row by row and as typed numpy batches"""
+        rows = [(f"cat {i}", i / 10) for i in range(25)]
+        self.db._executemany("INSERT INTO thi_test.test_table (name, score) VALUES (%s, %s);", rows)
+
+        streamed = list(self.db.stream_query("SELECT name FROM thi_test.test_table ORDER BY id;", itersize = 10))
+        self.assertEqual(len(streamed), 25)
+        self.assertEqual(streamed[0][0], "cat 0")
+
+        batches = list(self.db.stream_query_batches("SELECT id, score::FLOAT8 AS score FROM thi_test.test_table ORDER BY id;",
+                                                    itersize = 10, dtypes = {"id": "int32", "score": "float64"}))
+        self.assertEqual([len(b["id"]) for b in batches], [10, 10, 5])
+        self.assertEqual(batches[0]["id"].dtype.name, "int32")
+        self.assertAlmostEqual(batches[-1]["score"][-1], 2.4)
+
+    def test_stream_query_cancellation(self):
+        """a set cancel event stops the stream and the connection stays usable"""
+        self.db._executemany("INSERT INTO thi_test.test_table (name, score) VALUES (%s, %s);", [(f"cat {i}", 1) for i in range(30)])
+        cancel = Event()
+        seen = 0
+        for _ in self.db.stream_query("SELECT * FROM thi_test.test_table;", itersize = 10, cancel_event = cancel):
+            seen += 1
+            cancel.set() # stop after the current batch
+        self.assertEqual(seen, 10)
+        self.cursor.execute("SELECT COUNT(*) FROM thi_test.test_table;")
+        self.assertEqual(self.cursor.fetchone()[0], 30)
+
+    def test_stream_query_leaves_pending_work_alone(self):
+        """a stream neither commits nor sees the uncommitted work of the caller's connection"""
+        self.db._executemany("INSERT INTO thi_test.test_table (name, score) VALUES (%s, %s);", [("cat 1", 1)])
+        self.cursor.execute("INSERT INTO thi_test.test_table (name, score) VALUES ('pending cat', 2);")
+        streamed = list(self.db.stream_query("SELECT name FROM thi_test.test_table ORDER BY id;"))
+        self.assertEqual(streamed, [("cat 1",)])
+        self.db.connection.rollback() # the pending insert is still the caller's to roll back
+        self.cursor.execute("SELECT COUNT(*) FROM thi_test.test_table;")
+        self.assertEqual(self.cursor.fetchone()[0], 1)
+
     def test_close_connection(self):
         """ensure connection can close properly"""
         self.db.close_connection()
@@ -0,0 +1,103 @@
+# imports
+import unittest
+from threading import Thread
+from src.stage_runner import Channel, Stage, resolve_stages, run_stages
+
+class TestStageRunner(unittest.TestCase):
+    """this unittest class checks the stage graph of api_logger without a database: stage selection, streaming channels and failure propagation."""
+    def setUp(self):
+        """a small graph like api_logger's: a catalogue stage with a db fallback, a stage reading it and an independent one"""
+        self.stages = [
+            Stage("countries", lambda ctx: {"countries": ["AUT", "DEU"]}, outputs = ["countries"]),
+            Stage("indicators", lambda ctx: {"indicator_ids": ["A", "B"]}, outputs = ["indicator_ids"]),
+            Stage("facts", lambda ctx: {"fact_rows": len(ctx["countries"]) * len(ctx["indicator_ids"])},
+                  inputs = ["countries", "indicator_ids"], outputs = ["fact_rows"]),
+            Stage("stored_indicators", lambda ctx: {"indicator_ids": ["A"]}, outputs = ["indicator_ids"], fallback = True),
+        ]
+
+    def test_resolve_all_stages_without_fallbacks(self):
+        """no selection runs every non-fallback stage in declaration order"""
+        self.assertEqual([stage.name for stage in resolve_stages(self.stages)], ["countries", "indicators", "facts"])
+
+    def test_resolve_prefers_fallback_for_missing_inputs(self):
+        """a missing input is read by the fallback stage instead of re-running the stage which provides it"""
+        chosen = [stage.name for stage in resolve_stages(self.stages, ["facts"])]
+        self.assertEqual(chosen, ["countries", "facts", "stored_indicators"])
+
+    def test_resolve_skips_inputs_given_up_front(self):
+        """values given up front pull no stage into the run"""
+        chosen = [stage.name for stage in resolve_stages(self.stages, ["facts"], provided = ["countries", "indicator_ids"])]
+        self.assertEqual(chosen, ["facts"])
+
+    def test_resolve_rejects_unknown_stages_and_inputs(self):
+        """unknown stage names and inputs no stage provides are reported"""
+        with self.assertRaises(ValueError):
+            resolve_stages(self.stages, ["no_such_stage"])
+        with self.assertRaises(ValueError):
+            resolve_stages([Stage("orphan", lambda ctx: {}, inputs = ["nothing"])])
+
+    def test_channel_close_ends_every_iteration(self):
+        """closing a channel ends the consumer's iteration after the queued items, and a second iteration ends right away"""
+        channel = Channel()
+        received = []
+        consumer = Thread(target = lambda: received.extend(channel))
+        consumer.start()
+        channel.extend([1, 2])
+        channel.put(3)
+        channel.close()
+        channel.close() # closing twice is harmless
+        consumer.join(timeout = 5)
+        self.assertFalse(consumer.is_alive())
+        self.assertEqual(received, [1, 2, 3])
+        self.assertEqual(list(channel), [])
+
+    def test_run_streams_channel_between_concurrent_stages(self):
+        """a stage consumes a published channel while its producer is still running"""
+        def produce(ctx):
+            channel = Channel()
+            ctx.publish("ids", channel)
+            channel.extend(["A", "B", "C"]) # the runner closes the channel when the stage ends
+            return {}
+
+        stages = [
+            Stage("producer", produce, outputs = ["ids"]),
+            Stage("consumer", lambda ctx: {"count": sum(1 for _ in ctx["ids"])}, inputs = ["ids"], outputs = ["count"]),
+        ]
+        ctx, results = run_stages(stages)
+        self.assertEqual(ctx["count"], 3)
+        self.assertEqual({name: result["status"] for name, result in results.items()}, {"producer": "ok", "consumer": "ok"})
+
+    def test_run_skips_stages_with_failed_inputs(self):
+        """a failing stage skips the stages which depend on it, independent stages still finish"""
+        def broken(ctx):
+            raise RuntimeError("catalogue down")
+
+        stages = [
+            Stage("countries", lambda ctx: {"countries": ["AUT"]}, outputs = ["countries"]),
+            Stage("indicators", broken, outputs = ["indicator_ids"]),
+            Stage("facts", lambda ctx: {"fact_rows": 1}, inputs = ["countries", "indicator_ids"], outputs = ["fact_rows"]),
+        ]
+        ctx, results = run_stages(stages)
+        self.assertEqual(results["countries"]["status"], "ok")
+        self.assertEqual(results["indicators"]["status"], "failed")
+        self.assertEqual(results["facts"]["status"], "skipped")
+        self.assertIn("indicators", results["facts"]["error"])
+        self.assertNotIn("fact_rows", ctx)
+
+    def test_run_fails_stage_which_does_not_provide_its_outputs(self):
+        """a stage returning without one of its declared outputs counts as failed, and its failed channel is still closed"""
+        def half_done(ctx):
+            ctx.publish("ids", Channel())
+            return {}
+
+        stages = [
+            Stage("producer", half_done, outputs = ["ids", "count"]),
+            Stage("consumer", lambda ctx: {"seen": list(ctx["ids"])}, inputs = ["ids"], outputs = ["seen"]),
+        ]
+        ctx, results = run_stages(stages)
+        self.assertEqual(results["producer"]["status"], "failed")
+        self.assertEqual(results["consumer"]["status"], "ok")
+        self.assertEqual(ctx["seen"], [])
+
+if __name__ == "__main__":
+    unittest.main()
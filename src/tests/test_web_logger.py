@@ -0,0 +1,32 @@
+# imports
+import unittest
+import pandas as pd
+from src.web_logger import iter_cpi_rows
+
+def _cpi_frame(rows, years):
+    """a frame shaped like the output of _cpi_table_to_frame: 'Country' + one column per year, every cell text or None"""
+    return pd.DataFrame(rows, columns = ["Country"] + years, dtype = object)
+
+class TestIterCpiRows(unittest.TestCase):
+    """this unittest class checks how iter_cpi_rows turns scraped CPI tables into staging rows (no network, no database)."""
+    def test_scores_before_2012_are_scaled_to_0_100(self):
+        """scores before 2012 were on a 0-10 scale and are multiplied by 10, scores from 2012 on are kept as they are"""
+        rows = list(iter_cpi_rows([_cpi_frame([["Austria", "7.8", "69", "67"]], ["2011", "2012", "2024"])]))
+        self.assertEqual(rows, [("Austria", 2011, 78.0), ("Austria", 2012, 69.0), ("Austria", 2024, 67.0)])
+
+    def test_country_year_pairs_are_deduplicated_across_tables(self):
+        """a year listed in two tables is emitted once, from the first table (country names are stripped before comparing)"""
+        first = _cpi_frame([["Austria", "69"], ["Chile ", "66"]], ["2012"])
+        second = _cpi_frame([["Austria ", "70", "75"], ["Chile", "60", "72"]], ["2012", "2013"])
+        rows = list(iter_cpi_rows([first, second]))
+        self.assertEqual(sorted(rows), [("Austria", 2012, 69.0), ("Austria", 2013, 75.0), ("Chile", 2012, 66.0), ("Chile", 2013, 72.0)])
+
+    def test_missing_and_non_numeric_cells_are_skipped(self):
+        """None, empty and non-numeric cells give no row, columns which are no year are ignored, empty tables are skipped"""
+        df = _cpi_frame([["Austria", None, "n/a", "42"], ["Belgium", "", "7.1", None]], ["2010", "2011", "2020"])
+        df["Rank"] = ["1", "2"]
+        rows = list(iter_cpi_rows([pd.DataFrame(columns = ["Country"]), df]))
+        self.assertEqual(rows, [("Belgium", 2011, 71.0), ("Austria", 2020, 42.0)])
+
+if __name__ == "__main__":
+    unittest.main()
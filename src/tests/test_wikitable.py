@@ -0,0 +1,104 @@
+# imports
+import unittest
+from src.wikitable import find_wikitables, extract_table
+
+def _table(rows_html: str):
+    """the single wikitable of a small inline html fixture"""
+    tables = find_wikitables(f'<html><body><table class="wikitable sortable">{rows_html}</table></body></html>')
+    return tables[0]
+
+class TestExtractTable(unittest.TestCase):
+    """this unittest class checks the span expansion and header handling of wikitable.extract_table on inline html (no network, no database)."""
+    def test_rowspan_across_data_rows(self):
+        """a cell spanning down is repeated in every row it covers"""
+        df = extract_table(_table("""
+            <tr><th>Nation</th><th>2020</th><th>2021</th></tr>
+            <tr><td rowspan="3">Austria</td><td>1</td><td>2</td></tr>
+            <tr><td>3</td><td>4</td></tr>
+            <tr><td>5</td><td>6</td></tr>
+        """))
+        self.assertEqual(list(df.columns), ["Nation", "2020", "2021"])
+        self.assertEqual(df.values.tolist(), [["Austria", "1", "2"], ["Austria", "3", "4"], ["Austria", "5", "6"]])
+
+    def test_colspan_missing_marker(self):
+        """a '—' cell spanning several columns becomes None in each of them"""
+        df = extract_table(_table("""
+            <tr><th>Nation</th><th>2020</th><th>2021</th><th>2022</th></tr>
+            <tr><td>Germany</td><td colspan="2">—</td><td>7</td></tr>
+        """))
+        self.assertEqual(df.values.tolist(), [["Germany", None, None, "7"]])
+
+    def test_trailing_rowspan_right_of_the_last_cell(self):
+        """rowspans to the right of a row's last cell still fill their columns (and the gap before them is padded)"""
+        df = extract_table(_table("""
+            <tr><th>Nation</th><th>Score</th><th>Note</th></tr>
+            <tr><td>Austria</td><td>1</td><td rowspan="2">x</td></tr>
+            <tr><td>Belgium</td><td>2</td></tr>
+            <tr><td rowspan="2">Chile</td><td>3</td><td rowspan="2">y</td></tr>
+            <tr></tr>
+        """))
+        self.assertEqual(df.values.tolist(), [["Austria", "1", "x"], ["Belgium", "2", "x"], ["Chile", "3", "y"], ["Chile", None, "y"]])
+
+    def test_multi_row_header(self):
+        """several leading header rows give a MultiIndex, header cells spanning down / across are repeated"""
+        df = extract_table(_table("""
+            <tr><th rowspan="2">Nation</th><th colspan="2">Score</th></tr>
+            <tr><th>2020</th><th>2021</th></tr>
+            <tr><td>Austria</td><td>1</td><td>2</td></tr>
+        """))
+        self.assertEqual(df.columns.nlevels, 2)
+        self.assertEqual(list(df.columns), [("Nation", "Nation"), ("Score", "2020"), ("Score", "2021")])
+        self.assertEqual(df[("Score", "2021")].tolist(), ["2"])
+
+    def test_repeated_body_headers_are_skipped(self):
+        """header rows repeated inside the body (long wikipedia tables) are no data rows"""
+        df = extract_table(_table("""
+            <thead><tr><th>Nation</th><th>Score</th></tr></thead>
+            <tbody>
+                <tr><td>Austria</td><td>1</td></tr>
+                <tr><th>Nation</th><th>Score</th></tr>
+                <tr><td>Belgium</td><td>2</td></tr>
+            </tbody>
+        """))
+        self.assertEqual(list(df.columns), ["Nation", "Score"])
+        self.assertEqual(df["Nation"].tolist(), ["Austria", "Belgium"])
+
+    def test_reference_markers_are_stripped(self):
+        """footnote markers such as [1] / [a] / [note 3] are removed from the cell texts unless asked to keep them"""
+        table = _table("""
+            <tr><th>Nation[note 3]</th><th>Score</th></tr>
+            <tr><td>Austria<sup>[1]</sup></td><td>12.5[a]</td></tr>
+        """)
+        df = extract_table(table)
+        self.assertEqual(list(df.columns), ["Nation", "Score"])
+        self.assertEqual(df.values.tolist(), [["Austria", "12.5"]])
+        self.assertEqual(extract_table(table, strip_references = False).values.tolist(), [["Austria [1]", "12.5[a]"]])
+
+class TestFindWikitables(unittest.TestCase):
+    """this unittest class checks which tables of a page wikitable.find_wikitables returns."""
+    page = """
+        <html><body>
+        <table class="infobox"><tr><th>Nation</th></tr><tr><td>not a wikitable</td></tr></table>
+        <table class="wikitable">
+            <tr><th>Nation</th><th>Score</th></tr>
+            <tr><td>Austria</td><td><table class="wikitable"><tr><th>Nation</th></tr><tr><td>nested</td></tr></table></td></tr>
+        </table>
+        <table class="wikitable"><tr><th>Rank</th><th>Country&nbsp;name</th></tr><tr><td>1</td><td>Belgium</td></tr></table>
+        </body></html>
+    """
+
+    def test_only_top_level_wikitables(self):
+        """non-wikitable tables and wikitables nested inside another table are not returned"""
+        tables = find_wikitables(self.page)
+        self.assertEqual(len(tables), 2)
+        self.assertEqual([th.get_text() for th in tables[0].find_all("th", limit = 2)], ["Nation", "Score"])
+        self.assertEqual(extract_table(tables[0]).shape, (1, 2)) # the nested table's rows don't become rows of the outer one
+
+    def test_header_filter(self):
+        """only tables with a header cell containing the filter text are kept (non-breaking spaces count as spaces)"""
+        self.assertEqual(len(find_wikitables(self.page, header_filter = "Nation")), 1)
+        self.assertEqual(len(find_wikitables(self.page.encode("utf-8"), header_filter = "Country name")), 1)
+        self.assertEqual(find_wikitables(self.page, header_filter = "Happiness"), [])
+
+if __name__ == "__main__":
+    unittest.main()
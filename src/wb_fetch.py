@@ -0,0 +1,97 @@
+# imports
+import os # part of python standard library
+import re # part of python standard library
+import time # part of python standard library
+import pandas as pd
+from metrics import registry
+
+#######################################
+# World Bank fact fetching: shared by both fact engines
+#######################################
+# api_logger.py (threads) runs as __main__ and async_engine.py (WB_ENGINE=async) is imported by it: the pieces both need live here,
+# so they exist once - importing them from api_logger would run that module a second time, with a second WBRequestError class
+# which the isinstance checks of __main__ don't match
+headers_default = {
+    "User-Agent": (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:143.0) "
+        "Gecko/20100101 Firefox/143.0 "
+    "(compatible; violettalitiScraper/1.0; +https://github.com/violettaliti)"
+    )
+}
+
+# the base URL can be pointed to a stand-in of the API (e.g. the local stub of src/benchmarks/wb_api_stub.py)
+wb_api_base = os.getenv("WB_API_BASE", "https://api.worldbank.org/v2").rstrip("/")
+wb_fetch_attempts = int(os.getenv("WB_FETCH_ATTEMPTS", "2")) # requests per page in the main pass (429s are retried, other errors aren't)
+
+# hot-path metrics (served on METRICS_PORT in the prometheus format, summarised as json at the end of the run)
+http_request_seconds = registry.histogram("wb_http_request_seconds", "latency of the World Bank API requests", ["endpoint"])
+http_responses_total = registry.counter("wb_http_responses_total", "World Bank API responses by status (429 = throttled)", ["endpoint", "status"])
+http_bytes_total = registry.counter("wb_http_bytes_total", "bytes downloaded from the World Bank API", ["endpoint"])
+parse_page_seconds = registry.histogram("wb_parse_page_seconds", "time to transform one page of indicator data", buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+parsed_rows_total = registry.counter("wb_parsed_rows_total", "country-year rows produced by the page transform")
+queue_depth = registry.gauge("wb_queue_depth", "chunks waiting in the producer queue")
+queue_depth_samples = registry.histogram("wb_queue_depth_samples", "queue depth seen by the consumer at every chunk (distribution over time)", buckets = (0, 1, 2, 4, 8, 12, 16))
+db_batch_seconds = registry.histogram("wb_db_batch_seconds", "latency of one fact batch write (executemany + commit)")
+db_rows_total = registry.counter("wb_db_rows_written_total", "fact rows inserted or updated")
+
+_endpoint_patterns = [
+    ("indicator_data", re.compile(r"/country/[^/]+/indicator/")),
+    ("source_indicators", re.compile(r"/source/[^/]+/indicators")),
+    ("source", re.compile(r"/source\b")),
+    ("topic", re.compile(r"/topic\b")),
+    ("country", re.compile(r"/country\b")),
+]
+
+def _endpoint_name(url: str):
+    """low-cardinality endpoint label of a WB API url (ids are not part of the label)"""
+    return next((name for name, pattern in _endpoint_patterns if pattern.search(url)), "other")
+
+class WBRequestError(Exception):
+    """
+    the WB API refused a request (non-200 answer or an error message instead of data) or the request itself failed
+    - page: the page which couldn't be loaded (the pages before it are), status: http status if there was an answer,
+      attempts: requests made for the page, error_class: name of the underlying exception
+    """
+    def __init__(self, message: str, page: int = 1, status: int | None = None, attempts: int = 1, error_class: str | None = None):
+        super().__init__(message)
+        self.page, self.status, self.attempts = page, status, attempts
+        self.error_class = error_class or type(self).__name__
+
+def indicator_data_url(indicator_id: str, page: int, date: str | None = None, source_id: int | None = None, countries: list[str] | None = None):
+    """url of one page of indicator data (one indicator, or 'A;B;C' of the source source_id), of all countries or only of some"""
+    country_path = ";".join(countries) if countries else "all"
+    date_param = f"date={date}&" if date else ""
+    source_param = f"&source={source_id}" if source_id is not None else ""
+    return f"{wb_api_base}/country/{country_path}/indicator/{indicator_id}?{date_param}format=json&per_page=20000&page={page}{source_param}"
+
+def api_refused(response_json):
+    """an error message instead of [meta, rows] (e.g. an unknown indicator in a combined request)"""
+    return isinstance(response_json, list) and response_json and isinstance(response_json[0], dict) and "message" in response_json[0]
+
+def transform_indicator_page(df: pd.DataFrame, indicator_id: str, valid_country_iso3codes: list[str] | None = None):
+    """
+    one page of indicator data (the rows of the json answer as df) --> tidy fact rows
+    :param valid_country_iso3codes: keep only these countries (the API mixes real countries and aggregates / regions)
+    :return: df with the columns ['indicator_id', 'country_iso3code', 'year', 'value'] (empty if the page can't be processed)
+    """
+    start = time.perf_counter()
+    try:
+        # json uses keys: indicator{id}, countryiso3code, date, value
+        df["indicator_id"] = df["indicator"].apply(lambda x: (x or {}).get("id"))
+        df = df.rename(columns = {"countryiso3code": "country_iso3code"})
+        df["year"] = pd.to_numeric(df["date"], errors = "coerce").astype("Int64")
+        df["value"] = pd.to_numeric(df["value"], errors = "coerce")
+
+        if valid_country_iso3codes is not None:
+            before = len(df)
+            df = df[df["country_iso3code"].isin(valid_country_iso3codes)]
+            after = len(df)
+            print(f"\nFiltered out {before - after} region/aggregate rows for indicator {indicator_id}.")
+
+        print(f"Indicator {indicator_id}: collected {len(df)} country–year rows for the long fact table --- ദ്ദി（• ˕ •マ.ᐟ\n")
+        parse_page_seconds.observe(time.perf_counter() - start)
+        parsed_rows_total.inc(len(df))
+        return df[["indicator_id", "country_iso3code", "year", "value"]]
+    except Exception as e:
+        print(f"... Post-processing failed for indicator {indicator_id}: {type(e).__name__} - {e}...\n")
+        return pd.DataFrame(columns = ["indicator_id", "country_iso3code", "year", "value"])
@@ -1,12 +1,24 @@
 # imports
 import requests
-from bs4 import BeautifulSoup
-from bs4.element import Tag
 import pandas as pd
 import numpy as np
-from functools import reduce # part of python standard library
 import os # part of python standard library
+import io # part of python standard library
+import json # part of python standard library
+import time # part of python standard library
+import hashlib # part of python standard library
+import importlib # part of python standard library
+from itertools import islice # part of python standard library
+from contextlib import nullcontext # part of python standard library
+from datetime import datetime, timedelta, timezone # part of python standard library
+from threading import BoundedSemaphore # part of python standard library
+from urllib.parse import urlparse # part of python standard library
+from concurrent.futures import ThreadPoolExecutor, as_completed # part of python standard library
+import openpyxl
 from save_data import DBPostgres, DatabaseError
+from profiling import StageProfiler
+from wikitable import find_wikitables, extract_table, parser_backend
+from politeness import DomainGate
 import psycopg
 from psycopg import sql
 
@@ -29,12 +41,35 @@ headers_default = {
 # This site blocks scraping, so I've switched to Wikipedia instead:
 wiki_url = "https://en.wikipedia.org/wiki/List_of_countries_by_Corruption_Perceptions_Index"
 
+def _cpi_table_to_frame(table):
+    """
+    turn one expanded CPI wikitable into the frame ['Country', <year>, <year>, ...] (scores as text)
+    - each year header spans a score and a rank column --> the first grid column of every year holds the score
+    """
+    df = extract_table(table)
+    top_headers = [str(h) for h in (df.columns.get_level_values(0) if isinstance(df.columns, pd.MultiIndex) else df.columns)]
+
+    country_idx = next((i for i, h in enumerate(top_headers) if "Nation" in h), None)
+    if country_idx is None:
+        return pd.DataFrame(columns = ["Country"])
+
+    year_idx = {}
+    for i, header in enumerate(top_headers):
+        if header[:4].isdigit() and header[0] in {"1", "2"} and header[:4] not in year_idx: # e.g. 1995, 2024[1]
+            year_idx[header[:4]] = i
+
+    cpi_df = df.iloc[:, [country_idx] + list(year_idx.values())]
+    cpi_df.columns = ["Country"] + list(year_idx)
+    # only keep rows which have some valid year data
+    has_scores = cpi_df[list(year_idx)].notna().any(axis = 1)
+    return cpi_df[has_scores & cpi_df["Country"].notna()].reset_index(drop = True)
+
 def scrape_country_cpi_tables(url = wiki_url, headers = headers_default):
     """
     this function scrapes the wiki page 'List of countries by Corruption Perceptions Index'.
     :param url: https://en.wikipedia.org/wiki/List_of_countries_by_Corruption_Perceptions_Index
     :param headers: thi's browser cookies' identity using codersbay laptop
-    :return: a pandas dataframe with the country cpi scores over the years
+    :return: a list of pandas dataframes (one per table) with the country cpi scores over the years
     """
     try:
         # make an http request
@@ -46,240 +81,264 @@ def scrape_country_cpi_tables(url = wiki_url, headers = headers_default):
             print(response.content)
             return []
 
-        print("Connected to the website. Web scraping begins ... ₍^. .^₎⟆ ...\n")
-        # raw content to html format
-        soup = BeautifulSoup(response.content, "html.parser")
-
-        # get all tables on the page (with the wikitable class)
-        all_tables = soup.find_all("table", {"class": "wikitable"})
-        print(f"Yay ฅ^>⩊<^ฅ found {len(all_tables)} tables in total on this page!\n")
-
-        valid_tables = []
-
-        for table in all_tables:
-            ths = [th.get_text(strip = True) for th in table.find_all("th")]
-            if any("Nation" in h for h in ths): # only take relevant tables which contains 'Nation'
-                valid_tables.append(table)
-
-        if not valid_tables:
-            raise Exception("No valid tables found! /ᐠ-˕-マⳊ")
-        else:
-            print(f"Among the {len(all_tables)} tables on the site, there are {len(valid_tables)} relevant tables!")
-
-        dfs = []
-
-        for idx, table in enumerate(valid_tables, start = 1):
-            print(f"\n-------------------------- Scraping table #{idx} -----------------------------\n")
-
-            headers_list = [th.get_text(strip = True) for th in table.find_all("th")]
-
-            # only get relevant column names (rank, country, and years)
-            valid_categories = []
-
-            for element in headers_list:
-                if element == "Nation\xa0or\xa0Territory":
-                    valid_categories.append("Country")
-                elif element[0] in {"1", "2"}: # if it's a year column header starting with 1 (e.g. 1995) or 2 (2001)
-                    valid_categories.append(element[:4]) # take only the first 4 digits belonging to the year
-            print(f"Table #{idx} - original categories: {valid_categories}.")
-
-            years = valid_categories[1:]
-            years_count = len(years)
-            if years_count < 1:
-                print("There is no year data on this table!")
-            print(f"Table #{idx} - year range: {years[-1]}-{years[0]}, number of year columns: {years_count}.")
-
-            # create dataframe for each valid table
-            df = pd.DataFrame(columns = valid_categories)
-
-            table_content = table.find_all("tr")
-            for row in table_content[2:]:
-                row_data = row.find_all("td")
-                if not row_data:
-                    continue
-
-                try:
-                    # country name as text
-                    country_td = row_data[1] if len(row_data) > 1 else None
-                    country_name = country_td.get_text(" ", strip = True) if isinstance(country_td, Tag) else None
-                    data = {"Country": country_name}
-
-                    # get cpi scores for each year
-                    current_year_index = 0
-                    skip_next = False
-                    for col_count, col in enumerate(row_data):
-                        if col_count < 2 or skip_next:
-                            skip_next = False
-                            continue
-                        col_text = col.get_text()
-                        if col_text != "—\n":
-                            year = years[current_year_index]
-                            current_year_index += 1
-                            data[year] = col_text
-                            skip_next = True
-                        else:
-                            year = years[current_year_index]
-                            current_year_index += 1
-                            data[year] = None
-
-                    # only append if the row has some valid year data
-                    if any(v for k, v in data.items() if k != "Country"):
-                        df.loc[len(df)] = data # each iteration adds one row in the df --> Append a new row at the next index position, using the dictionary data to fill columns, and assign NaN to any columns that aren’t specified.
-                except IndexError:
-                    continue # just skip rows with no data
-
-            print(f"\nTable #{idx} scraped successfully with {len(df)} rows!\n")
-            print(f"The first 5 rows of table #{idx}:\n", df.head(5), "\n")
-
-            dfs.append(df)
-
-        print("----------- Finished scraping all valid tables! ₍^. .^₎⟆ -------------\n")
-        return dfs
+        print(f"Connected to the website. Web scraping begins (parser: {parser_backend()}) ... ₍^. .^₎⟆ ...\n")
+        return extract_cpi_tables(response.content)
 
     except requests.exceptions.RequestException as e:
         print(f"Something went wrong ૮₍•᷄  ༝ •᷅₎ა --> Error message: {type(e).__name__} - {e}.")
         return []
 
-def normalise_cpi_data(tables_to_normalise):
+def extract_cpi_tables(html):
     """
-    this function normalises the cpi scores data:
-     (i) convert all scores to numeric in df (currently they're str / object)
-     (ii) normalise scores for the years before 2012 (when the scores were 0-10)
-    :return: scores in numeric datatype, normalised cpi scores (0-100) for scores before 2012
+    this function extracts the CPI tables (the wikitables with a 'Nation' column) from the raw wiki page
+    :param html: raw page content (also works on a saved copy of the page)
+    :return: a list of pandas dataframes (one per table) with the country cpi scores over the years
     """
-    print("----------- Normalising the data (scores after 2012 is based on 0-100 scale, before 2012 based on 0-10 scale) -----------\n")
-    for i, df in enumerate(tables_to_normalise, start = 1):
-        year_cols = [col for col in df.columns if str(col).isdigit() and 1995 <= int(col) <= 2024] # identify which columns are year columns
-
-        # convert all years to numeric in df
-        df[year_cols] = df[year_cols].apply(pd.to_numeric, errors = "coerce") # errors="coerce": if it cannot be converted, make it NaN
-
-        # normalise values for years before 2012 (table 3, 4, 5)
-        if i in {3, 4, 5}:
-            df[year_cols] = df[year_cols] * 10 # multiply numeric values by 10 to scale the old CPI scores from 0-10 to 0-100
-    print("--------------- The data has been normalised! ₍^. .^₎Ⳋ ---------------\n")
-    return tables_to_normalise
-
-def merge_tables_by_country(normalised_tables):
-    """
-    this function merges the tables by country
-    :param normalised_tables
-    :return: one merged table
-    """
-    print(f"----------- Merging the {len(normalised_tables)} tables into one table (on the column 'country') -----------\n")
-    # remove duplicate country rows
-    cleaned_tables = [df.drop_duplicates(subset = ["Country"]) for df in normalised_tables]
-
-    # merge one after another by Country, keeping all countries
-    merged_table = reduce(lambda left, right: pd.merge(left, right, on = "Country", how = "outer"), cleaned_tables)
-
-    # identify year columns and sort by year
-    year_cols = [col for col in merged_table.columns if col != "Country"]
-    sorted_year_cols = sorted(year_cols, key = int) # key = int: use the integer value of each item as the sort key
+    # get the relevant tables on the page (wikitables which contain 'Nation')
+    valid_tables = find_wikitables(html, header_filter = "Nation")
+    if not valid_tables:
+        raise Exception("No valid tables found! /ᐠ-˕-マⳊ")
+    print(f"Yay ฅ^>⩊<^ฅ found {len(valid_tables)} relevant tables on this page!")
+
+    dfs = []
+    for idx, table in enumerate(valid_tables, start = 1):
+        df = _cpi_table_to_frame(table)
+        years = [col for col in df.columns if col != "Country"]
+        if not years:
+            print(f"Table #{idx}: there is no year data on this table!")
+        else:
+            print(f"Table #{idx} scraped successfully: {len(df)} rows, year range: {min(years)}-{max(years)}, number of year columns: {len(years)}.")
+        dfs.append(df)
 
-    # reorder columns: country, then ASC years
-    sorted_merged_table = merged_table[["Country"] + sorted_year_cols]
+    print("----------- Finished scraping all valid tables! ₍^. .^₎⟆ -------------\n")
+    return dfs
 
-    print(f"The first 5 rows of the sorted, merged table:\n\n", sorted_merged_table.head(5), "\n")
-    print("NaN_values count per year:\n", sorted_merged_table.isna().sum())
-    print("\nThe merged table description:\n\n", sorted_merged_table.describe())
-    print(f"\n--------------- Finished merging {len(normalised_tables)} tables! ₍^. .^₎Ⳋ -----------------\n")
-    return sorted_merged_table
+cpi_new_scale_from_year = 2012 # CPI scores are on a 0-100 scale since 2012, before that on a 0-10 scale
 
-def transform_and_clean_data(table_to_be_transformed):
+def iter_cpi_rows(cpi_tables):
     """
-    this function transform and clean the scraped data
-    :param table_to_be_transformed
-    :return: transformed and cleaned rows
+    this function streams (country, year, cpi score) triples straight out of the scraped CPI tables in one pass:
+     (i) convert the scores to numeric (they're str / object in the scraped tables), missing scores are skipped
+     (ii) normalise scores for the years before 2012 (when the scores were 0-10) to the 0-100 scale, decided per year
+     (iii) a (country, year) pair which was already emitted (e.g. a year listed in two tables) is skipped via a hash set
+    :param cpi_tables: list of dfs ['Country', <year>, <year>, ...] from scrape_country_cpi_tables()
+    :return: generator of (country_name, year, cpi_score) tuples, ready for the staging table
     """
-    print(f"----------- Transforming and cleaning the table into a 3NF-compliant dataset! -----------\n")
-    transformed_df = table_to_be_transformed.melt(
-        id_vars = ["Country"], # column "country" remains the same / fixed
-        var_name = "Year", # name of the new column for the former headers (e.g. 1995, 2024)
-        value_name = "CPI Score" # name of the new column for the old values (cpi scores)
-    )
-    # enforce types
-    transformed_df["Year"] = transformed_df["Year"].astype(int)
-    transformed_df["Country"] = transformed_df["Country"].str.strip()
-
-    # sanity check
-    # os.makedirs("data", exist_ok = True)  # creates data/ if it doesn’t exist
-    # csv_path = "data/cpi_fixed_transformed.csv"
-    # transformed_df.to_csv(csv_path, index = False, encoding = "utf-8")
-    # print(f"Saved transformed (not cleaned - so NaNs included) CPI data to {csv_path}.\n")
-
-    # drop NaN scores (so that the data saved into db is cleaned)
-    transformed_cleaned_df = transformed_df.dropna(subset = ["CPI Score"])
-
-    print(f"The first 5 rows of the cleaned, transformed, 3NF-compliant table (NaNs removed):\n\n", transformed_cleaned_df.head(5), "\n")
-    print("The cleaned, transformed table description:\n\n", transformed_cleaned_df.describe())
-    print(f"\n--------------- Finished transforming and cleaning the table! ₍^. .^₎Ⳋ -----------------\n")
-
-    # replace NaN with None for postgreSQL
-    cpi_db = transformed_cleaned_df.replace({np.nan: None})
-    # turn the df into a list of tuples for saving into the db later
-    cpi_rows = list(cpi_db.itertuples(index = False, name = None))
-
-    return cpi_rows
+    seen = set()
+    for df in cpi_tables:
+        if df.empty:
+            continue
+        countries = df["Country"].str.strip().to_numpy()
+        for col in df.columns:
+            if col == "Country" or not str(col).isdigit():
+                continue
+            year = int(col)
+            scores = pd.to_numeric(df[col], errors = "coerce").to_numpy(dtype = float) # errors="coerce": if it cannot be converted, make it NaN
+            if year < cpi_new_scale_from_year:
+                scores = scores * 10 # scale the old CPI scores from 0-10 to 0-100
+            has_score = ~np.isnan(scores)
+            for country, score in zip(countries[has_score], scores[has_score]):
+                if (country, year) in seen:
+                    continue
+                seen.add((country, year))
+                yield country, year, round(float(score), 2)
 
 #######################################
 # website:
 # data: World Happiness Report
 #######################################
+def _open_workbook_source(source: str | bytes):
+    """raw bytes (already downloaded) and local paths are opened as is, a URL is downloaded in chunks into memory (openpyxl needs a seekable file)"""
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    if not source.lower().startswith(("http://", "https://")):
+        return source
+    buffer = io.BytesIO()
+    with requests.get(source, headers = headers_default, timeout = 30, stream = True) as response:
+        response.raise_for_status()
+        for chunk in response.iter_content(chunk_size = 1 << 16):
+            buffer.write(chunk)
+    buffer.seek(0)
+    return buffer
+
+def _detect_whr_columns(header_row):
+    """map the WHR header cells to column indices: country name, year and the happiness (life evaluation / ladder) score"""
+    positions = {}
+    for idx, cell in enumerate(header_row):
+        if not isinstance(cell, str):
+            continue
+        lowercase_col = cell.strip().lower()
+        if "country" in lowercase_col: positions.setdefault("country_name", idx)
+        elif lowercase_col.startswith("year"): positions.setdefault("year", idx)
+        elif "life evaluation" in lowercase_col or "ladder score" in lowercase_col or "score" == lowercase_col:
+            positions.setdefault("happiness_score", idx)
+    return positions if len(positions) == 3 else None
+
+def iter_world_happiness_rows(source: str | bytes, sheet_name: str | None = None, header_search_rows: int = 20):
+    """
+    this function streams the world happiness scores out of a WHR workbook (URL, local file path, e.g. older WHR archives, or the raw bytes)
+    - openpyxl read-only mode: the sheet is read row by row, never loaded as a whole
+    - the header row and the three relevant column indices are detected once, then only that column range is read
+    :param sheet_name: default: the first sheet
+    :return: generator of (country_name, year, happiness_score) tuples
+    """
+    workbook = openpyxl.load_workbook(_open_workbook_source(source), read_only = True, data_only = True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+
+        positions, header_row_number = None, None
+        for row_number, row in enumerate(sheet.iter_rows(max_row = header_search_rows, values_only = True), start = 1):
+            positions = _detect_whr_columns(row)
+            if positions:
+                header_row_number = row_number
+                break
+        if not positions:
+            source_label = source if isinstance(source, str) else "the workbook"
+            raise ValueError(f"No country / year / score header found in the first {header_search_rows} rows of '{source_label}' /ᐠ-˕-マ")
+
+        first_col, last_col = min(positions.values()), max(positions.values())
+        country_idx, year_idx, score_idx = (positions[key] - first_col for key in ("country_name", "year", "happiness_score"))
+        for row in sheet.iter_rows(min_row = header_row_number + 1, min_col = first_col + 1, max_col = last_col + 1, values_only = True):
+            country, year, score = row[country_idx], row[year_idx], row[score_idx]
+            if country is None or year is None or (isinstance(country, str) and not country.strip()):
+                continue
+            try:
+                year = int(year)
+                score = float(score) if score not in (None, "") else None
+            except (TypeError, ValueError):
+                continue # e.g. footnote rows below the table
+            yield str(country).strip(), year, score
+    finally:
+        workbook.close()
+
 def get_world_happiness_scores(url):
     """
     this function scrapes the world happiness report and get the world happiness scores
-    :param url
+    :param url: URL, local path or raw bytes of the WHR workbook
     :return: world happiness scores as list of tuples
     """
-    df = pd.read_excel(url)
-    # columns include: year, rank, country name, score, etc.
-    cols = [col for col in df.columns]
-    rename_map = {}
-    for col in cols:
-        lowercase_col = col.lower()
-        if "country" in lowercase_col: rename_map[col] = "country_name"
-        elif lowercase_col.startswith("year"): rename_map[col] = "year"
-        elif "life evaluation" in lowercase_col or "ladder score" in lowercase_col or "score" == lowercase_col:
-            rename_map[col] = "happiness_score"
-    world_happiness_df = df.rename(columns = rename_map)
-    cleaned_world_happiness_df = world_happiness_df[["country_name","year","happiness_score"]].dropna(subset = ["country_name", "year"])
-
-    print(f"The first 5 rows of the world happiness df:\n\n", cleaned_world_happiness_df.head(), "\n")
-    print("NaN_values count:\n", cleaned_world_happiness_df.isna().sum())
-    print("\nThe world happiness df's description:\n\n", cleaned_world_happiness_df.describe())
-
-    # replace NaN with None for postgreSQL
-    world_happiness_db = cleaned_world_happiness_df.replace({np.nan: None})
-    # turn the df into a list of tuples for saving into the db later
-    world_happiness_rows = list(world_happiness_db.itertuples(index = False, name = None))
-
+    world_happiness_rows = list(iter_world_happiness_rows(url))
+    years = [row[1] for row in world_happiness_rows]
+    if years:
+        print(f"The world happiness workbook has {len(world_happiness_rows)} rows ({min(years)}-{max(years)}), "
+              f"{sum(row[2] is None for row in world_happiness_rows)} of them without a score.\n")
     return world_happiness_rows
 
+#######################################
+# Change detection
+#######################################
+def fetch_source_if_changed(source: str, state: dict | None = None, headers = headers_default, timeout: int = 30):
+    """
+    this function downloads a source (URL or local file path) only if it changed since the last run
+    - URLs: conditional GET with the stored ETag / Last-Modified (If-None-Match / If-Modified-Since), a 304 answer ends here
+    - afterwards the raw bytes are hashed (sha256): servers without validators, or pages which are re-rendered unchanged, are caught here
+    :param state: the source's row of web_source_state from the last run (None = first run / forced refresh)
+    :return: (raw bytes or None if unchanged, validators dict {'etag', 'last_modified', 'content_hash'} or None if the download failed)
+    """
+    state = state or {}
+    validators = {key: state.get(key) for key in ("etag", "last_modified", "content_hash")}
+    try:
+        if source.lower().startswith(("http://", "https://")):
+            request_headers = dict(headers)
+            if state.get("etag"):
+                request_headers["If-None-Match"] = state["etag"]
+            if state.get("last_modified"):
+                request_headers["If-Modified-Since"] = state["last_modified"]
+            response = requests.get(source, headers = request_headers, timeout = timeout)
+            if response.status_code == 304:
+                return None, validators
+            response.raise_for_status()
+            content = response.content
+            validators["etag"] = response.headers.get("ETag")
+            validators["last_modified"] = response.headers.get("Last-Modified")
+        else:
+            with open(source, "rb") as f:
+                content = f.read()
+    except (requests.exceptions.RequestException, OSError) as e:
+        print(f"Something went wrong with fetching '{source}' ૮₍•᷄  ༝ •᷅₎ა --> Error message: {type(e).__name__} - {e}.")
+        return None, None
+
+    content_hash = hashlib.sha256(content).hexdigest()
+    if content_hash == state.get("content_hash"):
+        return None, validators
+    validators["content_hash"] = content_hash
+    return content, validators
+
+def hash_rows_by_year(rows):
+    """
+    one sha256 per year over the (country_name, year, score) rows of that year (sorted, so the row order on the page doesn't matter)
+    :return: dict {'<year>': hash} (str keys, as stored in the JSONB column)
+    """
+    rows_by_year = {}
+    for row in rows:
+        rows_by_year.setdefault(row[1], []).append(row)
+    return {
+        str(year): hashlib.sha256(repr(sorted(year_rows, key = lambda row: row[0])).encode("utf-8")).hexdigest()
+        for year, year_rows in rows_by_year.items()
+    }
+
 #######################################
 # Save / persist to db
 #######################################
 class WebDB(DBPostgres):
     """child class of DBPostgres"""
-    def add_data_to_staging_cpi(self, data: list, table_name: str = "staging_cpi_raw"):
-        """persist acquired data into db"""
-        if not data:
-            print("There is no CPI data to add to the database. /ᐠ-˕-マ\n")
-            return
-
-        query = sql.SQL("""
-                        INSERT INTO {} (country_name, year, cpi_score)
-                        VALUES (%s, %s, %s)
-                        ON CONFLICT (country_name, year) DO NOTHING;
-                        """).format(sql.Identifier(table_name))
-        # on conflict do nothing to prevent throwing errors and creating duplicates
+    def get_source_state(self, source_name: str):
+        """the stored validators / hashes of a scraped source (None if it was never loaded)"""
+        try:
+            self.cursor.execute("SELECT etag, last_modified, content_hash, part_hashes, checked_at FROM web_source_state WHERE source_name = %s;", (source_name,))
+            row = self.cursor.fetchone()
+            self.connection.commit()
+        except (Exception, psycopg.DatabaseError) as e:
+            self.connection.rollback()
+            raise DatabaseError(f"Something went wrong with reading the state of the source '{source_name}'. Error type: {type(e).__name__}, error message: '{e}'.")
+        if row is None:
+            return None
+        return dict(zip(["etag", "last_modified", "content_hash", "part_hashes", "checked_at"], row))
 
+    def save_source_state(self, source_name: str, source_url: str, validators: dict, part_hashes: dict | None, changed: bool = True):
+        """upsert the validators / hashes of a scraped source after it was checked (changed_at only moves when the content changed)"""
         try:
-            self._executemany(query, data)
-            print(f"Successfully added or updated {len(data)} raw rows into '{table_name}' ദ്ദി（•˕•マ.ᐟ")
+            self._execute_write("""
+                                INSERT INTO web_source_state (source_name, source_url, etag, last_modified, content_hash, part_hashes, checked_at, changed_at)
+                                VALUES (%s, %s, %s, %s, %s, %s, NOW(), NOW())
+                                ON CONFLICT (source_name)
+                                DO UPDATE SET source_url = EXCLUDED.source_url,
+                                              etag = EXCLUDED.etag,
+                                              last_modified = EXCLUDED.last_modified,
+                                              content_hash = EXCLUDED.content_hash,
+                                              part_hashes = EXCLUDED.part_hashes,
+                                              checked_at = EXCLUDED.checked_at,
+                                              changed_at = CASE WHEN %s THEN EXCLUDED.changed_at ELSE web_source_state.changed_at END;
+                                """, (source_name, source_url, validators.get("etag"), validators.get("last_modified"),
+                                      validators.get("content_hash"), json.dumps(part_hashes or {}), changed))
+            self.connection.commit()
         except (Exception, psycopg.DatabaseError) as e:
             self.connection.rollback()
-            raise DatabaseError(f"Something went wrong with adding the CPI data to the table '{table_name}'. Error type: {type(e).__name__}, error message: '{e}'.")
+            raise DatabaseError(f"Something went wrong with saving the state of the source '{source_name}'. Error type: {type(e).__name__}, error message: '{e}'.")
+
+    def _delete_dropped_rows(self, table_name: str, years, source_name: str | None, staged_keys):
+        """
+        remove the rows a source staged for the replaced years but didn't re-emit (the staging delete trigger drops them from the final table too)
+        - only the source's own rows are touched, rows of other sources sharing the staging table (e.g. the WHR backfills) stay
+        :param staged_keys: (country_name, year) pairs the source just staged
+        :return: number of removed rows
+        """
+        if not years:
+            return 0
+        country_names, staged_years = (list(column) for column in zip(*staged_keys)) if staged_keys else ([], [])
+        self._execute_write(sql.SQL("""
+                                    DELETE FROM {} AS s
+                                    WHERE s.source_name IS NOT DISTINCT FROM %s
+                                      AND s.year = ANY(%s)
+                                      AND NOT EXISTS (SELECT 1 FROM unnest(%s::TEXT[], %s::INTEGER[]) AS k(country_name, year)
+                                                      WHERE k.country_name = s.country_name AND k.year = s.year);
+                                    """).format(sql.Identifier(table_name)),
+                            (source_name, list(years), country_names, staged_years))
+        return self.cursor.rowcount
+
+    def add_data_to_staging_cpi(self, data, table_name: str = "staging_cpi_raw", replace_years = None, source_name: str | None = None):
+        """persist acquired data into db (see add_scores_to_staging)"""
+        self.add_scores_to_staging(data, table_name, "cpi_score", "CPI", replace_years = replace_years, source_name = source_name)
 
     def get_cpi_country_info(self, country_names, start_year, end_year):
         """
@@ -303,8 +362,7 @@ class WebDB(DBPostgres):
 
             for country_idx, country_name in enumerate(country_names, start = 1):
                 print(f"\n{country_idx}. CPI scores of '{country_name}' from {start_year} to {end_year} is:")
-                self.cursor.execute("SELECT * FROM staging_cpi_raw WHERE country_name ILIKE %s AND year BETWEEN %s AND %s ORDER BY year;", (f"%{country_name}%", start_year, end_year))
-                country_rows = self.cursor.fetchall()
+                _, country_rows = self._fetch_cached("SELECT * FROM staging_cpi_raw WHERE country_name ILIKE %s AND year BETWEEN %s AND %s ORDER BY year;", (f"%{country_name}%", start_year, end_year))
                 if not country_rows:
                     print(f"No CPI info found for: {country_name}.")
                     continue
@@ -320,53 +378,264 @@ class WebDB(DBPostgres):
         except (Exception, psycopg.DatabaseError) as e:
             raise DatabaseError(f"Something went wrong with getting the CPI info of '{', '.join(country_names)}'. Error type: {type(e).__name__}, error message: '{e}'.")
 
-    def add_data_to_staging_world_happiness_report(self, data: list, table_name: str = "staging_world_happiness_report"):
-        """persist acquired data into db"""
-        if not data:
-            print("There is no world happiness data to add to the database. /ᐠ-˕-マ\n")
-            return
+    def add_data_to_staging_world_happiness_report(self, data, table_name: str = "staging_world_happiness_report", batch_size: int = 5000,
+                                                   replace_years = None, source_name: str | None = None):
+        """persist acquired data into db (see add_scores_to_staging)"""
+        self.add_scores_to_staging(data, table_name, "happiness_score", "world happiness", batch_size, replace_years, source_name)
 
+    def add_scores_to_staging(self, data, table_name: str, score_column: str, label: str, batch_size: int = 5000, replace_years = None,
+                              source_name: str | None = None, source_priority: int = 0):
+        """
+        persist acquired (country_name, year, score) rows into a staging table - data can be a list or a (streaming) iterable of tuples, it is written in batches
+        - a changed score updates the staged row (the AFTER INSERT OR UPDATE trigger pushes it to the final table)
+        - a row staged by another source is only overwritten if that source has the same or a lower priority (the current WHR workbook beats the backfills)
+        :param score_column: the staging table's score column, e.g. 'cpi_score'
+        :param label: name of the data in the log messages, e.g. 'CPI'
+        :param replace_years: years the source re-emitted completely: its staged rows of these years which are missing from data are removed
+        :param source_name, source_priority: the web source staging the rows (see WebSource)
+        """
         query = sql.SQL("""
-                        INSERT INTO {} (country_name, year, happiness_score)
-                        VALUES (%s, %s, %s)
-                        ON CONFLICT (country_name, year) DO NOTHING;
-                        """).format(sql.Identifier(table_name))
-        # on conflict do nothing to prevent throwing errors and creating duplicates
-
+                        INSERT INTO {table} AS s (country_name, year, {score}, source_name, source_priority)
+                        VALUES (%s, %s, %s, %s, %s)
+                        ON CONFLICT (country_name, year)
+                        DO UPDATE SET {score} = EXCLUDED.{score},
+                                      source_name = EXCLUDED.source_name,
+                                      source_priority = EXCLUDED.source_priority
+                        WHERE s.source_priority <= EXCLUDED.source_priority
+                          AND (s.{score} IS DISTINCT FROM EXCLUDED.{score} OR s.source_name IS DISTINCT FROM EXCLUDED.source_name);
+                        """).format(table = sql.Identifier(table_name), score = sql.Identifier(score_column))
+        # unchanged rows and rows of higher priority sources are left alone (no duplicates, no trigger churn)
+
+        rows = iter(data or [])
+        staged_keys = [] # (country_name, year) of every staged row, to find the rows the source dropped
+        total = removed = 0
         try:
-            self._executemany(query, data)
-            print(f"Successfully added or updated {len(data)} raw rows into '{table_name}' ദ്ദി（•˕•マ.ᐟ")
+            while batch := list(islice(rows, batch_size)):
+                self._executemany(query, [(*row, source_name, source_priority) for row in batch])
+                staged_keys.extend((row[0], row[1]) for row in batch)
+                total += len(batch)
+            removed = self._delete_dropped_rows(table_name, replace_years, source_name, staged_keys)
+            self.connection.commit()
         except (Exception, psycopg.DatabaseError) as e:
             self.connection.rollback()
-            raise DatabaseError(f"Something went wrong with adding the world happiness data to the table '{table_name}'. Error type: {type(e).__name__}, error message: '{e}'.")
+            raise DatabaseError(f"Something went wrong with adding the {label} data to the table '{table_name}'. Error type: {type(e).__name__}, error message: '{e}'.")
+
+        if total == 0 and removed == 0:
+            print(f"There is no {label} data to add to the database. /ᐠ-˕-マ\n")
+        else:
+            print(f"Successfully added or updated {total} raw rows into '{table_name}' ദ്ദി（•˕•マ.ᐟ")
+            if removed:
+                print(f"Removed {removed} rows which '{source_name}' no longer publishes from '{table_name}' ദ്ദി（•˕•マ.ᐟ")
+
+#######################################
+# Source plugins
+#######################################
+class WebSource:
+    """
+    one scraped source (plugin): where it is fetched from, how its raw bytes are parsed, where the rows are staged and how often it is checked
+    :param name: unique source name, also the key of its row in web_source_state
+    :param url: URL or local file path
+    :param parse: function raw bytes -> list of (country_name, year, score) tuples
+    :param staging_table, score_column: target staging table (columns country_name, year, <score_column>) - its trigger promotes the rows
+    :param refresh_interval: sources checked more recently than this are skipped without a request
+    :param priority: sources sharing a staging table overwrite each other's rows only with the same or a higher priority (e.g. backfills < 0)
+    """
+    def __init__(self, name: str, url: str, parse, staging_table: str, score_column: str,
+                 refresh_interval: timedelta = timedelta(hours = 24), label: str | None = None, priority: int = 0):
+        self.name = name
+        self.url = url
+        self.parse = parse
+        self.staging_table = staging_table
+        self.score_column = score_column
+        self.refresh_interval = refresh_interval
+        self.label = label or name
+        self.priority = priority
+        self.domain = urlparse(url).netloc.lower() if url.lower().startswith(("http://", "https://")) else None # None = local file
+
+    def __repr__(self):
+        return f"WebSource({self.name!r}, {self.url!r} -> {self.staging_table})"
+
+source_registry = {} # source name -> WebSource, filled by register_source() (here for CPI / WHR, in plugin modules for further sources)
+
+def register_source(source: WebSource):
+    """add a source plugin to the registry (a later registration with the same name replaces the earlier one)"""
+    source_registry[source.name] = source
+    return source
+
+def load_source_plugins(module_names):
+    """import plugin modules (e.g. 'hdi_source'), which register their sources on import via register_source()"""
+    for module_name in module_names:
+        importlib.import_module(module_name)
+
+def refresh_web_source(web_db, source: WebSource, force: bool = False, domain_gate: DomainGate | None = None, parse_slots: BoundedSemaphore | None = None):
+    """
+    this function runs one source through fetch --> parse --> stage, with change detection on every step:
+     (i) sources checked within their refresh interval are skipped without any request
+     (ii) the download is conditional (ETag / Last-Modified) and compared by content hash (fetch_source_if_changed)
+     (iii) only the years whose row hash changed are re-staged
+    :param force: ignore the stored state (e.g. after the staging tables were truncated)
+    :param domain_gate: politeness limit for the source's domain
+    :param parse_slots: bounds how many sources are parsed at once (the parsed pages are the biggest memory consumers)
+    :return: dict with the status, number of staged rows and the seconds spent per step
+    """
+    result = {"source": source.name, "status": "unchanged", "rows": 0, "fetch_s": 0.0, "parse_s": 0.0, "stage_s": 0.0}
+    state = None if force else web_db.get_source_state(source.name)
+    if state and state["checked_at"] > datetime.now(timezone.utc) - source.refresh_interval:
+        result["status"] = "fresh"
+        return result
+
+    start = time.perf_counter()
+    with domain_gate.request() if domain_gate else nullcontext():
+        content, validators = fetch_source_if_changed(source.url, state)
+    result["fetch_s"] = time.perf_counter() - start
+    if validators is None:
+        result["status"] = "failed"
+        return result
+    if content is None:
+        print(f"--- '{source.name}' is unchanged since the last run, skipping it ₍^. .^₎⟆ ---\n")
+        web_db.save_source_state(source.name, source.url, validators, state["part_hashes"], changed = False)
+        return result
+
+    start = time.perf_counter()
+    with parse_slots or nullcontext():
+        rows = source.parse(content)
+        del content # only the rows are kept from here on
+    part_hashes = hash_rows_by_year(rows)
+    previous_hashes = (state or {}).get("part_hashes") or {}
+    changed_years = sorted(int(year) for year, part_hash in part_hashes.items() if previous_hashes.get(year) != part_hash)
+    changed_years += sorted(int(year) for year in previous_hashes.keys() - part_hashes.keys()) # years the source no longer publishes
+    changed_year_set = set(changed_years)
+    changed_rows = [row for row in rows if row[1] in changed_year_set]
+    result["parse_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if changed_years:
+        print(f"--- '{source.name}': {len(changed_years)} of {len(part_hashes)} years changed ({', '.join(map(str, changed_years))}) ---\n")
+        web_db.begin_load_batch(f"web:{source.name}") # change data capture: the staging triggers tag the final rows with the batch id
+        try:
+            web_db.add_scores_to_staging(changed_rows, source.staging_table, source.score_column, source.label, replace_years = changed_years,
+                                         source_name = source.name, source_priority = source.priority)
+        except DatabaseError:
+            web_db.finish_load_batch(status = "failed")
+            raise
+        web_db.finish_load_batch(len(changed_rows))
+    else:
+        print(f"--- '{source.name}' was re-published without any changed scores, nothing to stage ₍^. .^₎⟆ ---\n")
+    web_db.save_source_state(source.name, source.url, validators, part_hashes, changed = True)
+    result["stage_s"] = time.perf_counter() - start
+    result.update(status = "changed", rows = len(changed_rows))
+    return result
+
+#######################################
+# Scheduler
+#######################################
+def run_web_sources(sources = None, max_workers: int = 4, per_domain_limit: int = 1, min_request_delay: float = 1.0,
+                    max_parsing: int = 2, force: bool = False, profiler: StageProfiler | None = None):
+    """
+    this function refreshes independent sources concurrently
+    - every staging table is one task on its own worker thread with its own db connections (psycopg connections must not be shared between threads)
+    - sources sharing a staging table (e.g. 'whr' and its backfills) run one after the other, lowest priority first, so the staged rows never race
+    - requests to the same domain go through one DomainGate (per_domain_limit at a time, min_request_delay seconds apart)
+    - memory stays bounded: at most max_parsing sources are parsed at once and raw bytes are dropped right after parsing
+    - a failing source is reported and doesn't stop the others
+    :param sources: list of WebSource, default: all registered sources
+    :param profiler: profiles every source as its own stage ('web_source:<name>')
+    :return: list of per-source result dicts (status, rows, seconds per step)
+    """
+    sources = list(source_registry.values()) if sources is None else list(sources)
+    if not sources:
+        print("There are no web sources to refresh. /ᐠ-˕-マ\n")
+        return []
+    gates = {source.domain: DomainGate(per_domain_limit, min_request_delay) for source in sources if source.domain}
+    parse_slots = BoundedSemaphore(max(max_parsing, 1))
+    source_groups = {}
+    for source in sorted(sources, key = lambda source: (source.priority, source.name)):
+        source_groups.setdefault(source.staging_table, []).append(source)
+
+    def run_one(source):
+        start = time.perf_counter()
+        web_db = None
+        try:
+            with profiler.stage(f"web_source:{source.name}") if profiler else nullcontext():
+                web_db = WebDB()
+                result = refresh_web_source(web_db, source, force, gates.get(source.domain), parse_slots)
+        except Exception as e:
+            print(f"Something went wrong with the source '{source.name}' ૮₍•᷄  ༝ •᷅₎ა --> Error message: {type(e).__name__} - {e}.")
+            result = {"source": source.name, "status": "failed", "rows": 0, "fetch_s": 0.0, "parse_s": 0.0, "stage_s": 0.0}
+        finally:
+            if web_db is not None:
+                web_db.close_connection()
+        result["total_s"] = time.perf_counter() - start
+        return result
+
+    def run_group(group):
+        return [run_one(source) for source in group]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers = max(1, min(max_workers, len(source_groups)))) as ex:
+        futures = [ex.submit(run_group, group) for group in source_groups.values()]
+        results = [result for future in as_completed(futures) for result in future.result()]
+    results.sort(key = lambda result: result["source"])
+
+    print(f"\n--- Refreshed {len(sources)} web sources in {time.perf_counter() - start:.2f}s ദ്ദി（• ˕ •マ.ᐟ ---")
+    for result in results:
+        print(f"{result['source']:<30} {result['status']:<10} {result['rows']:7d} rows  fetch {result['fetch_s']:6.2f}s  "
+              f"parse {result['parse_s']:6.2f}s  stage {result['stage_s']:6.2f}s  total {result['total_s']:6.2f}s")
+    print()
+    return results
+
+def parse_cpi_page(content):
+    """raw CPI wiki page -> (country_name, year, cpi_score) rows"""
+    print(f"Web scraping the CPI page begins (parser: {parser_backend()}) ... ₍^. .^₎⟆ ...\n")
+    dfs = extract_cpi_tables(content)
+    cpi_data = list(iter_cpi_rows(dfs))
+    print(f"--- {len(cpi_data)} (country, year, CPI score) rows built from {len(dfs)} tables ₍^. .^₎Ⳋ ---\n")
+    return cpi_data
+
+# url found for WHR 2025 “Data for Figure 2.1” (https://www.worldhappiness.report/data-sharing/)
+whr_xlsx_url = "https://files.worldhappiness.report/WHR25_Data_Figure_2.1v3.xlsx"
+
+register_source(WebSource("cpi", wiki_url, parse_cpi_page, "staging_cpi_raw", "cpi_score", label = "CPI"))
+register_source(WebSource("whr", whr_xlsx_url, get_world_happiness_scores, "staging_world_happiness_report", "happiness_score", label = "world happiness"))
 
 #######################################
 # Run the web crawlers
 #######################################
 if __name__ == "__main__":
     print("Hello from web_logger!")
-    # scraping CPI info
-    dfs = scrape_country_cpi_tables()
-    normalised_dfs = normalise_cpi_data(dfs)
-    sorted_merged_table = merge_tables_by_country(normalised_dfs)
-    cpi_data = transform_and_clean_data(sorted_merged_table)
-    web_db = WebDB()
-    web_db.add_data_to_staging_cpi(cpi_data)
+    # change the env var WEB_FORCE_REFRESH to true/yes/1 to re-scrape and re-stage everything, even if the sources didn't change
+    force_refresh = os.getenv("WEB_FORCE_REFRESH", "false").strip().lower() in {"true", "yes", "1"}
+
+    # further sources: comma-separated plugin modules (on the python path) which call register_source() on import
+    load_source_plugins([module.strip() for module in os.getenv("WEB_SOURCE_MODULES", "").split(",") if module.strip()])
+
+    # optional backfill from older WHR workbooks (comma-separated URLs or local paths, e.g. files under /data)
+    # the current workbook wins over the backfills, and an earlier listed backfill over a later one
+    for backfill_idx, backfill_source in enumerate([src.strip() for src in os.getenv("WHR_BACKFILL_SOURCES", "").split(",") if src.strip()], start = 1):
+        register_source(WebSource(f"whr:{backfill_source}", backfill_source, get_world_happiness_scores,
+                                  "staging_world_happiness_report", "happiness_score", label = "world happiness", priority = -backfill_idx))
+
+    # change the env var PROFILE_MODE (e.g. 'timing' or 'all') to profile every source into PROFILE_DIR
+    profiler = StageProfiler.from_env("web_logger")
+
+    # scraping all registered sources (CPI, WHR, ...) concurrently
+    run_web_sources(
+        max_workers = int(os.getenv("WEB_MAX_WORKERS", "4")),
+        per_domain_limit = int(os.getenv("WEB_PER_DOMAIN_LIMIT", "1")),
+        min_request_delay = float(os.getenv("WEB_MIN_REQUEST_DELAY", "1.0")),
+        max_parsing = int(os.getenv("WEB_MAX_PARSING", "2")),
+        force = force_refresh,
+        profiler = profiler,
+    )
+    profiler.finish()
 
     names = os.getenv("COUNTRIES_OF_INTEREST", "Austria, Germany").strip()
     start_year = os.getenv("START_YEAR_OF_INTEREST", "2000")
     end_year = os.getenv("END_YEAR_OF_INTEREST", "2024")
 
+    web_db = WebDB()
     if names and start_year and end_year:
         web_db.get_cpi_country_info(names, start_year, end_year)
     else:
         print("\n--- Printing CPI scores for the countries of interest: Not a single country of interest was given ^. .^₎⟆ ---")
-
-    # scraping world happiness info
-    # url found for WHR 2025 “Data for Figure 2.1” (https://www.worldhappiness.report/data-sharing/)
-    xlsx_url = "https://files.worldhappiness.report/WHR25_Data_Figure_2.1v3.xlsx"
-
-    world_happiness_rows = get_world_happiness_scores(xlsx_url)
-    web_db.add_data_to_staging_world_happiness_report(world_happiness_rows)
-
-    web_db.close_connection()
\ No newline at end of file
+    web_db.close_connection()
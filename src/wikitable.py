@@ -0,0 +1,153 @@
+# imports
+import re # part of python standard library
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.element import Tag
+import pandas as pd
+
+#######################################
+# Wikipedia table extraction engine
+#######################################
+_reference_pattern = re.compile(r"\[[^\]]{1,8}\]") # footnote markers such as [1], [a], [note 3]
+
+def parser_backend():
+    """use the (much faster) lxml parser when it is installed, otherwise python's built-in html.parser"""
+    try:
+        import lxml # noqa: F401 - optional dependency, only checked for availability
+        return "lxml"
+    except ImportError:
+        return "html.parser"
+
+_table_tag_pattern = re.compile(r"<(/?)table\b[^>]*>", re.IGNORECASE)
+
+def _wikitable_fragments(html: str):
+    """
+    cut the raw markup of every top-level wikitable out of the page with a cheap regex scan (nested tables stay inside their parent),
+    so that the html parser only ever sees the tables instead of the whole page
+    """
+    fragments, depth, start, is_wikitable = [], 0, 0, False
+    for match in _table_tag_pattern.finditer(html):
+        if not match.group(1): # opening tag
+            if depth == 0:
+                start, is_wikitable = match.start(), "wikitable" in match.group(0)
+            depth += 1
+        elif depth > 0: # closing tag
+            depth -= 1
+            if depth == 0 and is_wikitable:
+                fragments.append(html[start:match.end()])
+    return fragments
+
+def find_wikitables(html: bytes | str, header_filter: str | None = None, parser: str | None = None):
+    """
+    this function returns the wikitables of a page, parsing nothing but the tables themselves
+    :param html: raw page content
+    :param header_filter: only keep tables with a header cell containing this text (e.g. 'Nation')
+    :param parser: bs4 parser backend, default: parser_backend()
+    :return: list of wikitable Tags
+    """
+    if isinstance(html, bytes):
+        html = html.decode("utf-8", errors = "replace")
+    # tables which don't even contain the filter text anywhere are dropped before parsing
+    fragments = [f for f in _wikitable_fragments(html) if header_filter is None or header_filter in f.replace("&nbsp;", " ").replace("&#160;", " ")]
+    if not fragments:
+        return []
+
+    soup = BeautifulSoup("".join(fragments), parser or parser_backend(), parse_only = SoupStrainer("table"))
+    tables = [table for table in soup.find_all("table", recursive = False) or soup.find_all("table") if "wikitable" in (table.get("class") or [])]
+    if header_filter is None:
+        return tables
+    return [table for table in tables if any(header_filter in th.get_text().replace("\xa0", " ") for th in table.find_all("th", limit = 50))]
+
+def _span(cell: Tag, attribute: str):
+    """colspan / rowspan as int (wikipedia sometimes writes e.g. '2;' or leaves it empty)"""
+    value = cell.attrs.get(attribute)
+    if value is None: # fast path: most cells don't span
+        return 1
+    digits = re.match(r"\d+", str(value).strip())
+    return max(int(digits.group()), 1) if digits else 1
+
+def _table_rows(table: Tag):
+    """the <tr> rows of a table (directly or inside thead / tbody / tfoot), without descending into nested tables"""
+    for child in table.children:
+        if not isinstance(child, Tag):
+            continue
+        if child.name == "tr":
+            yield child
+        elif child.name in ("thead", "tbody", "tfoot"):
+            yield from (tr for tr in child.children if isinstance(tr, Tag) and tr.name == "tr")
+
+def _cell_text(cell: Tag, strip_references: bool):
+    text = cell.get_text(" ", strip = True)
+    if strip_references and "[" in text:
+        text = _reference_pattern.sub("", text).strip()
+    return text.replace("\xa0", " ")
+
+def extract_table(table: Tag, missing_markers = ("—", "–", "-", ""), strip_references: bool = True):
+    """
+    this function turns one html table into a DataFrame in a single pass over its rows
+    - rowspan / colspan are expanded, so every row has one value per grid column
+    - the leading rows made only of <th> cells become the header (a MultiIndex if there is more than one header row)
+    - rows are buffered as lists and handed to pandas once, column by column (no per-row DataFrame appends)
+    :param missing_markers: cell texts which mean 'no data' and become None
+    :return: DataFrame with the cell texts (str or None)
+    """
+    missing = set(missing_markers)
+    header_rows, data_rows = [], []
+    pending = {} # grid column -> [rows left, text] for cells spanning down from previous rows
+    width = 0
+
+    for tr in _table_rows(table):
+        cells = [cell for cell in tr.children if isinstance(cell, Tag) and cell.name in ("th", "td")]
+        row, col = [], 0
+        is_header = bool(cells) and all(cell.name == "th" for cell in cells)
+
+        for cell in cells:
+            while col in pending: # fill the grid columns still occupied by a rowspan from above
+                row.append(pending[col][1])
+                pending[col][0] -= 1
+                if pending[col][0] == 0:
+                    del pending[col]
+                col += 1
+
+            text = _cell_text(cell, strip_references)
+            rowspan = _span(cell, "rowspan")
+            for _ in range(_span(cell, "colspan")):
+                row.append(text)
+                if rowspan > 1:
+                    pending[col] = [rowspan - 1, text]
+                col += 1
+
+        for pending_col in sorted(c for c in pending if c >= col): # rowspans to the right of the last cell of this row
+            while col < pending_col:
+                row.append(None)
+                col += 1
+            row.append(pending[pending_col][1])
+            pending[pending_col][0] -= 1
+            if pending[pending_col][0] == 0:
+                del pending[pending_col]
+            col += 1
+
+        if not row:
+            continue
+        width = max(width, len(row))
+        if is_header and not data_rows:
+            header_rows.append(row)
+        elif not is_header: # repeated header rows inside the body are skipped
+            data_rows.append([None if value in missing else value for value in row])
+
+    # pad ragged rows, then build the frame column by column
+    for row in header_rows:
+        row.extend([""] * (width - len(row)))
+    for row in data_rows:
+        row.extend([None] * (width - len(row)))
+
+    columns = list(zip(*data_rows)) if data_rows else [()] * width
+    if len(header_rows) > 1:
+        column_index = pd.MultiIndex.from_arrays(header_rows)
+    elif header_rows:
+        column_index = pd.Index(header_rows[0])
+    else:
+        column_index = pd.RangeIndex(width)
+
+    df = pd.DataFrame({i: list(values) for i, values in enumerate(columns)}, columns = range(width))
+    df.columns = column_index
+    return df